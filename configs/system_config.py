@@ -51,6 +51,7 @@ CAMERA_CONFIG = {
     "FPS": 30,
     "JPEG_QUALITY": 85,
     "MAX_PACKET_SIZE": 1400,
+    "STREAM_CODEC": "h264",     # 视频流编码：h264（两端需安装 PyAV，缺失时回退 JPEG）/ jpeg
 }
 
 # ===== 音频配置 =====
@@ -58,7 +59,12 @@ AUDIO_CONFIG = {
     "RATE": 16000,
     "CHANNELS": 1,
     "CHUNK": 1024,
-    "RECORD_SECONDS": 5,
+    "RECORD_SECONDS": 5,        # 未启用VAD时的固定录音时长(秒)
+    "JITTER_BUFFER_MS": 120,    # 开发板流式播放的抖动缓冲深度(毫秒)
+    "VAD_ENABLED": True,        # 语音活动检测：去掉开头静音，说完即停止录音
+    "VAD_TRAILING_SILENCE_MS": 800,  # 结尾静音达到该时长判定说完
+    "VAD_NO_SPEECH_SECONDS": 5,      # 开始录音后该时间内没有说话即放弃
+    "MAX_RECORD_SECONDS": 15,        # 启用VAD时的录音时长上限(秒)
 }
 
 # ===== 系统配置 =====
@@ -74,6 +80,15 @@ AI_CONFIG = {
     "MODEL_PATH": "models/best.pt",  # YOLO模型路径
     "CONFIDENCE_THRESHOLD": 0.5,     # 置信度阈值
     "API_TIMEOUT": 30,               # API请求超时
+    # 推理后端: "auto"(优先 OpenVINO, 其次 ONNX Runtime) / "openvino" / "onnx" / "pytorch"
+    # 非 pytorch 后端首次加载 .pt 时自动导出并缓存在权重旁边
+    "INFERENCE_BACKEND": "auto",
+    "INFERENCE_THREADS": 0,          # CPU 推理线程数(intra-op)，0 表示由后端自行决定
+    "STREAM_REFRESH_MS": 100,        # 流式AI回复刷新界面的最小间隔(毫秒)
+    # 治疗建议缓存：疾病 + 置信度区间 + 提示词版本 + 模型 相同时直接复用已生成的建议
+    "ADVICE_CACHE_TTL_DAYS": 30,     # 缓存有效期(天)
+    "ADVICE_CACHE_MAX_ENTRIES": 500, # 缓存条目上限，超出按最近访问时间淘汰
+    "ADVICE_CONFIDENCE_BUCKET": 0.1, # 置信度区间宽度
 }
 
 # ===== 连接状态检测 =====
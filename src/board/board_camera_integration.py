@@ -15,6 +15,7 @@ import numpy as np
 import time
 import json
 import os
+import sys
 import threading
 from datetime import datetime
 import base64
@@ -36,6 +37,16 @@ SAVE_DIR = "/home/pi/medical_images"  # 图像保存目录
 MAX_PACKET_SIZE = 1400  # 最大数据包大小
 # ===================
 
+# 共享可靠传输模块：开发板上与本文件放在同一目录，在仓库中运行时从 src/utils 导入
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+sys.path.append(os.path.join(_BASE_DIR, '..', 'utils'))
+try:
+    from reliable_transport import ReliableSender
+    HAS_RELIABLE_TRANSPORT = True
+except ImportError:
+    HAS_RELIABLE_TRANSPORT = False
+    print("[警告] 未找到 reliable_transport 模块，图像分片将无重传发送")
+
 class CameraManager:
     """摄像头管理器"""
     
@@ -303,6 +314,8 @@ class NetworkManager:
         self.camera_sock = None
         self.diagnosis_sock = None
         self.command_sock = None
+        self.reliable_sender = None
+        self.request_sequence = 0
         self.init_sockets()
         
     def init_sockets(self):
@@ -320,6 +333,9 @@ class NetworkManager:
             # 命令控制套接字
             self.command_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             
+            if HAS_RELIABLE_TRANSPORT:
+                self.reliable_sender = ReliableSender(self.camera_sock, MAX_PACKET_SIZE)
+            
             print("[网络] 网络套接字初始化完成")
             return True
             
@@ -337,8 +353,11 @@ class NetworkManager:
             
             # 创建传输包
             timestamp = int(time.time() * 1000)
+            self.request_sequence += 1
+            request_id = "req_{}_{}".format(timestamp, self.request_sequence)
             header = {
                 "type": "diagnosis_request",
+                "request_id": request_id,
                 "timestamp": timestamp,
                 "image_size": len(img_data),
                 "width": image.shape[1],
@@ -349,20 +368,28 @@ class NetworkManager:
             header_data = json.dumps(header).encode('utf-8')
             self.command_sock.sendto(header_data, (PC_IP, COMMAND_PORT))
             
-            # 分片发送图像数据
+            # 分片发送图像数据（与PC端共享的包头格式，首包携带 request_id）
             total_packets = (len(img_data) + MAX_PACKET_SIZE - 1) // MAX_PACKET_SIZE
             
-            for i in range(total_packets):
-                start = i * MAX_PACKET_SIZE
-                end = min(start + MAX_PACKET_SIZE, len(img_data))
-                packet_data = img_data[start:end]
-                
-                # 包头：4字节包序号 + 4字节总包数 + 数据
-                packet_header = i.to_bytes(4, 'big') + total_packets.to_bytes(4, 'big')
-                packet = packet_header + packet_data
-                
-                self.camera_sock.sendto(packet, (PC_IP, CAMERA_PORT))
-                time.sleep(0.001)  # 小延迟避免网络拥塞
+            if self.reliable_sender:
+                if self.reliable_sender.send((PC_IP, CAMERA_PORT), img_data, request_id=request_id) is None:
+                    print("[错误] 图像发送失败: 分片重传超时")
+                    return None
+            else:
+                packet_id = hash(request_id) & 0xFFFFFFFF
+                request_info = request_id.encode('utf-8')
+                for i in range(total_packets):
+                    start = i * MAX_PACKET_SIZE
+                    end = min(start + MAX_PACKET_SIZE, len(img_data))
+                    
+                    # 包头：[4字节请求ID哈希][2字节包索引][2字节总包数][1字节标志位][数据]
+                    packet_header = (packet_id.to_bytes(4, 'big') + i.to_bytes(2, 'big') +
+                                     total_packets.to_bytes(2, 'big') + bytes([1 if i == total_packets - 1 else 0]))
+                    if i == 0:
+                        packet_header += len(request_info).to_bytes(2, 'big') + request_info
+                    
+                    self.camera_sock.sendto(packet_header + img_data[start:end], (PC_IP, CAMERA_PORT))
+                    time.sleep(0.001)  # 小延迟避免网络拥塞
             
             print("[发送] 图像已发送到PC端 (大小: {} 字节, 分片: {})".format(len(img_data), total_packets))
             return timestamp
@@ -17,8 +17,8 @@ import numpy as np
 import time
 import json
 import os
+import sys
 import threading
-import queue
 import base64
 import io
 import wave
@@ -56,6 +56,7 @@ try:
     CAMERA_FPS = CAMERA_CONFIG['FPS']
     JPEG_QUALITY = CAMERA_CONFIG['JPEG_QUALITY']
     MAX_PACKET_SIZE = CAMERA_CONFIG['MAX_PACKET_SIZE']
+    STREAM_CODEC = CAMERA_CONFIG.get('STREAM_CODEC', 'h264')
     
     # 音频配置
     if HAS_AUDIO:
@@ -63,6 +64,12 @@ try:
         CHANNELS = AUDIO_CONFIG['CHANNELS']
         RATE = AUDIO_CONFIG['RATE']
         CHUNK = AUDIO_CONFIG['CHUNK']
+    JITTER_BUFFER_MS = AUDIO_CONFIG.get('JITTER_BUFFER_MS', 120)
+    RECORD_SECONDS = AUDIO_CONFIG.get('RECORD_SECONDS', 5)
+    VAD_ENABLED = AUDIO_CONFIG.get('VAD_ENABLED', True)
+    VAD_TRAILING_SILENCE_MS = AUDIO_CONFIG.get('VAD_TRAILING_SILENCE_MS', 800)
+    VAD_NO_SPEECH_SECONDS = AUDIO_CONFIG.get('VAD_NO_SPEECH_SECONDS', 5)
+    MAX_RECORD_SECONDS = AUDIO_CONFIG.get('MAX_RECORD_SECONDS', 15)
     
     # 目录配置
     SAVE_DIR = SYSTEM_CONFIG['SAVE_DIR']
@@ -93,6 +100,7 @@ except ImportError:
     CAMERA_FPS = 30
     JPEG_QUALITY = 85
     MAX_PACKET_SIZE = 1400
+    STREAM_CODEC = "h264"       # 视频流编码：h264（两端需安装 PyAV，缺失时回退 JPEG）/ jpeg
 
     # 音频配置
     if HAS_AUDIO:
@@ -100,6 +108,12 @@ except ImportError:
         CHANNELS = 1
         RATE = 16000
         CHUNK = 1024
+    JITTER_BUFFER_MS = 120      # 流式播放抖动缓冲(毫秒)
+    RECORD_SECONDS = 5          # 未启用VAD时的固定录音时长
+    VAD_ENABLED = True          # 语音活动检测：说完即停止录音
+    VAD_TRAILING_SILENCE_MS = 800
+    VAD_NO_SPEECH_SECONDS = 5
+    MAX_RECORD_SECONDS = 15     # 启用VAD时的录音时长上限
 
     # 目录配置
     SAVE_DIR = "medical_images"
@@ -107,6 +121,47 @@ except ImportError:
     
     connection_manager = None
 
+# ===== 导入共享可靠传输模块 =====
+# 开发板上与本文件放在同一目录；在仓库中运行时从 src/utils 导入
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+sys.path.append(os.path.join(_BASE_DIR, '..', 'utils'))
+try:
+    from reliable_transport import ReliableSender
+    HAS_RELIABLE_TRANSPORT = True
+    print("[INFO] 可靠分片传输可用")
+except ImportError:
+    HAS_RELIABLE_TRANSPORT = False
+    print("[WARN] 未找到 reliable_transport 模块，图像分片将无重传发送")
+
+try:
+    from voice_protocol import (VoiceStreamSender, VoiceStreamReceiver, StreamPlayer,
+                                read_wav, RECV_BUFFER_BYTES, POLL_INTERVAL)
+    HAS_VOICE_PROTOCOL = True
+except ImportError:
+    HAS_VOICE_PROTOCOL = False
+    print("[WARN] 未找到 voice_protocol 模块，语音对话功能禁用")
+
+try:
+    from vad import VoiceActivityDetector
+    HAS_VAD = True
+except ImportError:
+    HAS_VAD = False
+    print("[WARN] 未找到 vad 模块，录音将使用固定时长")
+
+try:
+    from latency_optimizer import LatencyOptimizer, CAMERA_LEVELS, CAMERA_START_LEVEL
+    HAS_LATENCY_OPTIMIZER = True
+except ImportError:
+    HAS_LATENCY_OPTIMIZER = False
+    print("[WARN] 未找到 latency_optimizer 模块，视频流将使用固定质量与帧率")
+
+try:
+    from stream_codec import create_stream_encoder, parse_stream_control, REQUEST_KEYFRAME, REQUEST_JPEG, CODEC_JPEG
+    HAS_STREAM_CODEC = True
+except ImportError:
+    HAS_STREAM_CODEC = False
+    print("[WARN] 未找到 stream_codec 模块，视频流将使用 JPEG 编码")
+
 # ===== 摄像头管理器 =====
 class CameraThread(threading.Thread):
     """摄像头线程管理器"""
@@ -441,8 +496,7 @@ class AudioManager:
     def __init__(self):
         self.audio = None
         self.is_recording = False
-        self.is_playing = False
-        self.playback_queue = queue.Queue()
+        self.player = None
         
         if HAS_AUDIO:
             self.audio = pyaudio.PyAudio()
@@ -461,13 +515,18 @@ class AudioManager:
             
             self.input_device = None
             self.output_device = None
+            if HAS_VOICE_PROTOCOL:
+                self.player = StreamPlayer(self.audio, self.output_device, JITTER_BUFFER_MS)
             print("[成功] 音频设备初始化完成")
             
         except Exception as e:
             print(f"[错误] 音频设备初始化失败: {e}")
     
-    def start_recording(self, duration=5):
-        """开始录音"""
+    def start_recording(self, duration=None, on_voiced=None, use_vad=VAD_ENABLED and HAS_VAD):
+        """开始录音，返回WAV数据；on_voiced(pcm) 在录音过程中收到每段保留的音频，可边录边发送
+
+        启用VAD时 duration 为时长上限，未检测到说话返回 None
+        """
         if not HAS_AUDIO:
             print("[警告] 音频功能不可用")
             return None
@@ -475,9 +534,11 @@ class AudioManager:
         if self.is_recording:
             print("[警告] 正在录音中...")
             return None
+        if duration is None:
+            duration = MAX_RECORD_SECONDS if use_vad else RECORD_SECONDS
             
         try:
-            print(f"[录音] 开始录音 {duration} 秒...")
+            print(f"[录音] 开始录音（{'说完自动结束，最长' if use_vad else ''} {duration} 秒）...")
             self.is_recording = True
             
             stream = self.audio.open(
@@ -489,16 +550,38 @@ class AudioManager:
                 frames_per_buffer=CHUNK
             )
             
+            # VAD：去掉开头静音，说完（结尾静音达到设定时长）即停止，只保留语音段
+            vad = VoiceActivityDetector(RATE, VAD_TRAILING_SILENCE_MS) if use_vad else None
+            no_speech_chunks = int(RATE / CHUNK * VAD_NO_SPEECH_SECONDS)
             frames = []
-            for _ in range(0, int(RATE / CHUNK * duration)):
+            for i in range(0, int(RATE / CHUNK * duration)):
                 if not self.is_recording:
                     break
                 data = stream.read(CHUNK)
-                frames.append(data)
+                if vad is not None:
+                    data = vad.feed(data)
+                if data:
+                    frames.append(data)
+                    if on_voiced:
+                        on_voiced(data)
+                if vad is not None:
+                    if vad.ended:
+                        break
+                    if not vad.started and i >= no_speech_chunks:
+                        break
+            if vad is not None and vad.started:
+                rest = vad.flush()
+                if rest:
+                    frames.append(rest)
+                    if on_voiced:
+                        on_voiced(rest)
             
             stream.stop_stream()
             stream.close()
             self.is_recording = False
+            if not frames:
+                print("[提示] 未检测到说话")
+                return None
             
             # 生成WAV数据
             wav_buffer = io.BytesIO()
@@ -523,58 +606,26 @@ class AudioManager:
         print("[停止] 录音已停止")
     
     def play_audio(self, audio_data):
-        """播放音频"""
-        if not HAS_AUDIO:
+        """播放整段WAV音频"""
+        if not self.player:
             print("[警告] 音频功能不可用")
             return
             
         try:
-            self.playback_queue.put(audio_data)
-            
-            if not self.is_playing:
-                threading.Thread(target=self._playback_worker, daemon=True).start()
-                
+            self.player.play_wav(audio_data)
         except Exception as e:
             print(f"[错误] 音频播放失败: {e}")
     
-    def _playback_worker(self):
-        """音频播放工作线程"""
-        self.is_playing = True
-        
-        try:
-            while not self.playback_queue.empty():
-                audio_data = self.playback_queue.get()
-                
-                wav_buffer = io.BytesIO(audio_data)
-                with wave.open(wav_buffer, 'rb') as wf:
-                    stream = self.audio.open(
-                        format=self.audio.get_format_from_width(wf.getsampwidth()),
-                        channels=wf.getnchannels(),
-                        rate=wf.getframerate(),
-                        output=True,
-                        output_device_index=self.output_device
-                    )
-                    
-                    print("[播放] 开始播放语音...")
-                    data = wf.readframes(CHUNK)
-                    while data:
-                        stream.write(data)
-                        data = wf.readframes(CHUNK)
-                    
-                    stream.stop_stream()
-                    stream.close()
-                    
-                print("[完成] 语音播放完成")
-                
-        except Exception as e:
-            print(f"[错误] 播放失败: {e}")
-        finally:
-            self.is_playing = False
+    def play_frame(self, addr, frame):
+        """流式播放PC端语音帧（收到首帧即开始播放）"""
+        if self.player:
+            self.player.play_frame(addr, frame)
     
     def cleanup(self):
         """清理音频资源"""
         self.is_recording = False
-        self.is_playing = False
+        if self.player:
+            print(f"[音频] 播放统计: {self.player.format_stats()}")
         if self.audio:
             self.audio.terminate()
 
@@ -591,8 +642,20 @@ class NetworkManager:
         self.packet_sequence = 0
         self.received_packets = {}  # 用于重组分片数据
         self.is_streaming = False
-        self.stream_fps = 15  # 流传输帧率
+        self.stream_fps = 15  # 流传输帧率（无自适应时使用）
         self.last_stream_time = 0
+        # 视频流帧序号，PC端据序号间隔统计丢帧；每次启动从随机值开始，重启后的序号不会与
+        # PC端最近完成的分片ID（按 (IP, 包ID) 记录）重复而被当作重传丢弃
+        self.stream_sequence = int.from_bytes(os.urandom(4), 'big')
+        # PC端定期反馈丢帧/RTT/解码耗时，据此调整视频流的JPEG质量/分辨率/帧率
+        self.stream_optimizer = (LatencyOptimizer(CAMERA_LEVELS, CAMERA_START_LEVEL, name="摄像头流")
+                                 if HAS_LATENCY_OPTIMIZER else None)
+        # H.264 利用帧间冗余（眼底画面大部分时间几乎静止），没有 PyAV 时回退 JPEG
+        self.stream_encoder = (create_stream_encoder(STREAM_CODEC, self.stream_fps)
+                               if HAS_STREAM_CODEC else None)
+        self.reliable_sender = None
+        self.voice_sender = None
+        self.voice_receiver = None
         self.init_sockets()
         
     def init_sockets(self):
@@ -601,6 +664,11 @@ class NetworkManager:
             # 摄像头数据发送
             self.sockets['camera'] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.sockets['camera'].setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 8 * 1024 * 1024)
+            if self.stream_optimizer or self.stream_encoder:
+                # 绑定本地端口，PC端的视频流反馈与关键帧请求发回该套接字
+                self.sockets['camera'].bind(("0.0.0.0", 0))
+                self.sockets['camera'].settimeout(1.0)
+                threading.Thread(target=self._stream_feedback_worker, daemon=True).start()
             
             # 诊断结果接收
             self.sockets['diagnosis'] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -615,12 +683,21 @@ class NetworkManager:
                 self.sockets['voice_send'] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
                 self.sockets['voice_receive'] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
                 self.sockets['voice_receive'].bind(("0.0.0.0", VOICE_RECEIVE_PORT))
-                self.sockets['voice_receive'].settimeout(1.0)
+                self.sockets['voice_receive'].settimeout(POLL_INTERVAL if HAS_VOICE_PROTOCOL else 1.0)
                 self.sockets['voice_command'] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                if HAS_VOICE_PROTOCOL:
+                    self.sockets['voice_receive'].setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
+                    self.voice_sender = VoiceStreamSender(self.sockets['voice_send'])
             
             # 触摸屏控制
             self.sockets['touch'] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             
+            # 图像请求使用独立套接字可靠发送，ACK 回到该套接字，不与视频流混用
+            if HAS_RELIABLE_TRANSPORT:
+                self.sockets['image'] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.sockets['image'].setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 8 * 1024 * 1024)
+                self.reliable_sender = ReliableSender(self.sockets['image'], MAX_PACKET_SIZE)
+            
             # 启动心跳检测
             threading.Thread(target=self._heartbeat_worker, daemon=True).start()
             
@@ -642,6 +719,27 @@ class NetworkManager:
             except Exception as e:
                 print(f"[心跳] 心跳检测错误: {e}")
     
+    def _stream_feedback_worker(self):
+        """视频流反馈接收线程：回显令牌供PC端测RTT并更新视频流档位；处理关键帧/改用JPEG请求"""
+        sock = self.sockets['camera']
+        while self.is_running:
+            try:
+                data, addr = sock.recvfrom(64)
+                request = parse_stream_control(data) if self.stream_encoder else None
+                if request == REQUEST_KEYFRAME:
+                    self.stream_encoder.request_keyframe()
+                elif request == REQUEST_JPEG and self.stream_encoder.codec != CODEC_JPEG:
+                    print("[流传输] PC端无法解码 H.264，视频流改用 JPEG")
+                    self.stream_encoder = create_stream_encoder(CODEC_JPEG, self.stream_fps)
+                elif request is None and self.stream_optimizer:
+                    self.stream_optimizer.handle_control(data, addr, sock.sendto)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if self.is_running:
+                    print(f"[流传输] 反馈接收错误: {e}")
+                time.sleep(0.1)
+    
     def _send_heartbeat(self):
         """发送心跳包"""
         try:
@@ -714,20 +812,29 @@ class NetworkManager:
         
         # 控制帧率
         current_time = time.time()
-        if current_time - self.last_stream_time < (1.0 / self.stream_fps):
+        stream_fps = self.stream_optimizer.settings.fps if self.stream_optimizer else self.stream_fps
+        if current_time - self.last_stream_time < (1.0 / stream_fps):
             return True  # 跳过此帧
         
         self.last_stream_time = current_time
         
         try:
-            # 压缩图像
-            _, img_encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
-            img_data = img_encoded.tobytes()
-            
-            # 创建流传输包
-            timestamp = int(time.time() * 1000)
-            self.packet_sequence += 1
-            stream_id = f"stream_{timestamp}_{self.packet_sequence}"
+            # 压缩图像（自适应时按当前档位缩放并选择质量）
+            if self.stream_encoder:
+                settings = self.stream_optimizer.settings if self.stream_optimizer else None
+                img_data = (self.stream_encoder.encode(frame, settings.quality, settings.scale) if settings
+                            else self.stream_encoder.encode(frame))
+            elif self.stream_optimizer:
+                img_data, _ = self.stream_optimizer.optimize_frame_for_transmission(frame)
+            else:
+                _, img_encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
+                img_data = img_encoded.tobytes()
+            if not img_data:
+                return True  # 编码器暂未输出
+
+            # 流ID使用递增序号，PC端据序号间隔统计丢帧
+            self.stream_sequence = (self.stream_sequence + 1) & 0xFFFFFFFF or 1
+            packet_id = self.stream_sequence
             
             # 分片发送
             total_packets = (len(img_data) + MAX_PACKET_SIZE - 1) // MAX_PACKET_SIZE
@@ -737,8 +844,7 @@ class NetworkManager:
                 end = min(start + MAX_PACKET_SIZE, len(img_data))
                 packet_data = img_data[start:end]
                 
-                # 流传输包头：[4字节流ID哈希][2字节包索引][2字节总包数][1字节标志位][图像数据]
-                packet_id = hash(stream_id) & 0xFFFFFFFF
+                # 流传输包头：[4字节流序号][2字节包索引][2字节总包数][1字节标志位][图像数据]
                 packet_header = (
                     packet_id.to_bytes(4, 'big') +
                     i.to_bytes(2, 'big') +
@@ -812,33 +918,10 @@ class NetworkManager:
             # 等待PC端处理请求头
             time.sleep(0.1)
             
-            # 发送图像数据（简化版本，不分片）
-            if len(img_data) <= MAX_PACKET_SIZE:
-                # 小图像直接发送
-                packet = img_data
-                self.sockets['camera'].sendto(packet, (PC_IP, CAMERA_PORT))
-                print(f"[保存] 图像数据已发送 ({len(img_data)} 字节)")
-            else:
-                # 大图像分片发送
-                total_packets = (len(img_data) + MAX_PACKET_SIZE - 1) // MAX_PACKET_SIZE
-                print(f"[保存] 图像较大，分片发送: {total_packets} 包")
-                
-                for i in range(total_packets):
-                    start = i * MAX_PACKET_SIZE
-                    end = min(start + MAX_PACKET_SIZE, len(img_data))
-                    packet_data = img_data[start:end]
-                    
-                    # 简化的包头：包索引 + 总包数 + 数据
-                    packet_header = (
-                        i.to_bytes(2, 'big') +
-                        total_packets.to_bytes(2, 'big') +
-                        packet_data
-                    )
-                    
-                    self.sockets['camera'].sendto(packet_header, (PC_IP, CAMERA_PORT))
-                    
-                    if i < total_packets - 1:
-                        time.sleep(0.001)
+            # 发送图像数据（与诊断请求相同的分片格式，首包携带 request_id）
+            if not self._send_image_fragments(img_data, request_id):
+                print(f"[错误] 图像数据发送失败，request_id: {request_id}")
+                return None
             
             print(f"[保存] 图像保存请求完成，request_id: {request_id}")
             return request_id
@@ -888,31 +971,9 @@ class NetworkManager:
             if save_to_pc:
                 print(f"[保存] 图像将保存到PC端: {header['pc_save_path']}")
             
-            for i in range(total_packets):
-                start = i * MAX_PACKET_SIZE
-                end = min(start + MAX_PACKET_SIZE, len(img_data))
-                packet_data = img_data[start:end]
-                
-                # 改进的包头格式：[4字节请求ID哈希][2字节包索引][2字节总包数][1字节标志位][图像数据]
-                packet_id = hash(request_id) & 0xFFFFFFFF
-                packet_header = (
-                    packet_id.to_bytes(4, 'big') +
-                    i.to_bytes(2, 'big') +
-                    total_packets.to_bytes(2, 'big') +
-                    (1 if i == total_packets - 1 else 0).to_bytes(1, 'big')
-                )
-                packet = packet_header + packet_data
-                
-                # 在第一个包中包含request_id信息，便于PC端匹配
-                if i == 0:
-                    request_info = request_id.encode('utf-8')
-                    packet = packet_header + len(request_info).to_bytes(2, 'big') + request_info + packet_data
-                
-                self.sockets['camera'].sendto(packet, (PC_IP, CAMERA_PORT))
-                
-                # 动态调整发送间隔
-                if i < total_packets - 1:
-                    time.sleep(0.001)  # 1ms间隔
+            if not self._send_image_fragments(img_data, request_id):
+                print(f"[错误] 图像数据发送失败，请求ID: {request_id}")
+                return None
             
             print(f"[发送] 图像发送完成，请求ID: {request_id}")
             return request_id
@@ -921,6 +982,40 @@ class NetworkManager:
             print(f"[错误] 图像发送失败: {e}")
             return None
     
+    def _send_image_fragments(self, img_data, request_id):
+        """分片发送图像数据：优先选择重传可靠发送，模块不可用时退回无重传发送"""
+        if self.reliable_sender:
+            result = self.reliable_sender.send((PC_IP, CAMERA_PORT), img_data, request_id=request_id)
+            if result is None:
+                return False
+            print(f"[发送] 分片: {result['fragments']}, 重传: {result['retransmissions']}, "
+                  f"用时: {result['elapsed'] * 1000:.1f}ms")
+            return True
+        
+        # 无重传发送，包头格式：[4字节请求ID哈希][2字节包索引][2字节总包数][1字节标志位][图像数据]
+        total_packets = (len(img_data) + MAX_PACKET_SIZE - 1) // MAX_PACKET_SIZE
+        packet_id = hash(request_id) & 0xFFFFFFFF
+        for i in range(total_packets):
+            start = i * MAX_PACKET_SIZE
+            end = min(start + MAX_PACKET_SIZE, len(img_data))
+            packet_header = (
+                packet_id.to_bytes(4, 'big') +
+                i.to_bytes(2, 'big') +
+                total_packets.to_bytes(2, 'big') +
+                (1 if i == total_packets - 1 else 0).to_bytes(1, 'big')
+            )
+            
+            # 在第一个包中包含request_id信息，便于PC端匹配
+            if i == 0:
+                request_info = request_id.encode('utf-8')
+                packet_header += len(request_info).to_bytes(2, 'big') + request_info
+            
+            self.sockets['camera'].sendto(packet_header + img_data[start:end], (PC_IP, CAMERA_PORT))
+            
+            if i < total_packets - 1:
+                time.sleep(0.001)  # 1ms间隔
+        return True
+    
     def wait_for_diagnosis_result(self, request_id=None, timeout=30):
         """等待诊断结果"""
         try:
@@ -958,66 +1053,63 @@ class NetworkManager:
             return None
     
     def send_voice_data(self, audio_data, metadata=None):
-        """发送语音数据到PC端"""
-        if not HAS_AUDIO:
+        """以二进制语音流发送录音（WAV）到PC端，返回流ID"""
+        if not HAS_AUDIO or not self.voice_sender:
             return False
             
         try:
-            # 生成语音包ID
-            voice_id = f"voice_{int(time.time() * 1000)}"
-            
-            # 分片发送语音数据
-            max_packet_size = 8192
-            total_packets = (len(audio_data) + max_packet_size - 1) // max_packet_size
-            
-            # 发送语音头部信息
-            header = {
-                "type": "voice_data_start",
-                "voice_id": voice_id,
-                "timestamp": datetime.now().isoformat(),
-                "format": "wav",
-                "sample_rate": RATE,
-                "channels": CHANNELS,
-                "total_packets": total_packets,
-                "total_size": len(audio_data),
-                "metadata": metadata or {}
-            }
-            
-            header_data = json.dumps(header).encode('utf-8')
-            self.sockets['voice_send'].sendto(header_data, (PC_IP, VOICE_SEND_PORT))
-            
-            # 分片发送语音数据
-            for i in range(total_packets):
-                start = i * max_packet_size
-                end = min(start + max_packet_size, len(audio_data))
-                
-                packet_header = (
-                    voice_id.encode('utf-8')[:8].ljust(8, b'\x00') +  # 8字节语音ID
-                    i.to_bytes(2, 'big') +                            # 2字节包索引
-                    total_packets.to_bytes(2, 'big') +                # 2字节总包数
-                    (1 if i == total_packets - 1 else 0).to_bytes(1, 'big')  # 1字节标志位
-                )
-                packet_chunk = packet_header + audio_data[start:end]
-                
-                self.sockets['voice_send'].sendto(packet_chunk, (PC_IP, VOICE_SEND_PORT))
-                time.sleep(0.01)
-            
-            # 发送语音结束标记
-            end_marker = {
-                "type": "voice_data_end",
-                "voice_id": voice_id,
-                "timestamp": datetime.now().isoformat()
-            }
-            end_data = json.dumps(end_marker).encode('utf-8')
-            self.sockets['voice_send'].sendto(end_data, (PC_IP, VOICE_SEND_PORT))
+            pcm, sample_rate, sample_width, channels = read_wav(audio_data)
+            stream_id = self.voice_sender.send_stream(
+                (PC_IP, VOICE_SEND_PORT), pcm, sample_rate, sample_width, channels,
+                metadata={
+                    "type": "voice_data",
+                    "timestamp": datetime.now().isoformat(),
+                    "metadata": metadata or {}
+                }
+            )
             
-            print(f"[发送] 语音数据已发送到PC端 ({len(audio_data)} 字节, {total_packets} 包)")
-            return voice_id
+            print(f"[发送] 语音数据已发送到PC端 ({len(pcm)} 字节)")
+            return stream_id
             
         except Exception as e:
             print(f"[错误] 语音发送失败: {e}")
             return None
     
+    def open_voice_stream(self, metadata=None):
+        """打开一条发往PC端的语音流（录音时边录边 write，结束时 end），不可用时返回 None"""
+        if not self.voice_sender:
+            return None
+        return self.voice_sender.open_stream(
+            (PC_IP, VOICE_SEND_PORT), RATE, 2, CHANNELS,
+            metadata={
+                "type": "voice_data",
+                "timestamp": datetime.now().isoformat(),
+                "metadata": metadata or {}
+            }
+        )
+    
+    def start_voice_receiver(self, on_frame):
+        """启动PC端语音合成接收线程，on_frame(addr, frame) 按序收到每一帧"""
+        if 'voice_receive' not in self.sockets or not HAS_VOICE_PROTOCOL:
+            return
+        self.voice_receiver = VoiceStreamReceiver(on_frame)
+        threading.Thread(target=self._voice_receive_worker, daemon=True).start()
+    
+    def _voice_receive_worker(self):
+        """语音接收工作线程（同一端口上的JSON控制指令只记录日志）"""
+        sock = self.sockets['voice_receive']
+        while self.is_running:
+            try:
+                data, addr = sock.recvfrom(65535)
+                if not self.voice_receiver.handle_datagram(data, addr):
+                    print(f"[语音] 收到PC端控制指令 ({len(data)} 字节)")
+                self.voice_receiver.expire_stale()
+            except socket.timeout:
+                self.voice_receiver.expire_stale()
+            except Exception as e:
+                if self.is_running:
+                    print(f"[语音] 接收错误: {e}")
+    
     def send_voice_command(self, command, params=None):
         """发送语音控制命令"""
         if not HAS_AUDIO:
@@ -1576,26 +1668,25 @@ class TouchInterface:
         # 发送录音开始命令
         self.network_manager.send_voice_command("start_recording")
         
-        # 录音
-        audio_data = self.audio_manager.start_recording(duration=5)
+        # 边录音边发送语音段，说完即结束
+        metadata = {
+            "source": "board_microphone",
+            "purpose": "voice_chat"
+        }
+        stream = self.network_manager.open_voice_stream(metadata)
+        if stream is None:
+            print("[失败] 语音发送失败")
+            return
+        
+        audio_data = self.audio_manager.start_recording(on_voiced=stream.write)
+        stream.end()
         
         if audio_data:
-            # 发送语音数据
-            metadata = {
-                "source": "board_microphone",
-                "purpose": "voice_chat"
-            }
-            
-            success = self.network_manager.send_voice_data(audio_data, metadata)
-            
-            if success:
-                print("[成功] 语音已发送到PC端，等待回复...")
-                self.network_manager.send_voice_command("process_voice", {
-                    "action": "chat",
-                    "expect_response": True
-                })
-            else:
-                print("[失败] 语音发送失败")
+            print(f"[成功] 语音已发送到PC端 ({stream.audio_bytes} 字节)，等待回复...")
+            self.network_manager.send_voice_command("process_voice", {
+                "action": "chat",
+                "expect_response": True
+            })
         else:
             print("[失败] 录音失败")
     
@@ -1706,6 +1797,7 @@ class BoardMedicalSystem:
         if not self.network_manager.init_sockets():
             print("[错误] 网络初始化失败")
             return False
+        self.network_manager.start_voice_receiver(self.audio_manager.play_frame)
         
         # 测试网络连接
         print("[网络] 正在测试PC端连接...")
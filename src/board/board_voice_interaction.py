@@ -9,24 +9,34 @@
 4. 与摄像头功能协同工作
 """
 
+import os
+import sys
 import socket
 import threading
-import time
 import json
-import queue
 import numpy as np
 import pyaudio
 import wave
 import io
-import base64
 from datetime import datetime
 
+# 开发板上与本文件放在同一目录；在仓库中运行时从 src/utils 导入
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from voice_protocol import (VoiceStreamSender, VoiceStreamReceiver, StreamPlayer,
+                            read_wav, RECV_BUFFER_BYTES, POLL_INTERVAL)
+from vad import VoiceActivityDetector
+
 # 音频配置
 AUDIO_FORMAT = pyaudio.paInt16
 CHANNELS = 1
 RATE = 16000
 CHUNK = 1024
-RECORD_SECONDS = 5
+RECORD_SECONDS = 5          # 未启用VAD时的固定录音时长
+VAD_ENABLED = True          # 语音活动检测：说完即停止录音，只发送语音段
+VAD_TRAILING_SILENCE_MS = 800   # 结尾静音达到该时长判定说完
+VAD_NO_SPEECH_SECONDS = 5   # 开始录音后该时间内没有说话即放弃
+MAX_RECORD_SECONDS = 15     # 启用VAD时的录音时长上限
+JITTER_BUFFER_MS = 120      # 流式播放抖动缓冲(毫秒)，网络抖动大时调高
 
 # 网络配置  
 PC_IP = "172.20.10.3"
@@ -40,9 +50,8 @@ class AudioManager:
     def __init__(self):
         self.audio = pyaudio.PyAudio()
         self.is_recording = False
-        self.is_playing = False
         self.recording_thread = None
-        self.playback_queue = queue.Queue()
+        self.player = None
         
         # 初始化音频设备
         self.init_audio_devices()
@@ -59,20 +68,26 @@ class AudioManager:
             # 使用默认设备
             self.input_device = None  # 默认输入设备
             self.output_device = None # 默认输出设备
+            self.player = StreamPlayer(self.audio, self.output_device, JITTER_BUFFER_MS)
             
             print("[成功] 音频设备初始化完成")
             
         except Exception as e:
             print(f"[错误] 音频设备初始化失败: {e}")
     
-    def start_recording(self, duration=5):
-        """开始录音"""
+    def start_recording(self, duration=None, on_voiced=None, use_vad=VAD_ENABLED):
+        """开始录音，返回WAV数据；on_voiced(pcm) 在录音过程中收到每段保留的音频，可边录边发送
+
+        启用VAD时 duration 为时长上限，未检测到说话返回 None
+        """
         if self.is_recording:
             print("[警告] 正在录音中...")
             return None
+        if duration is None:
+            duration = MAX_RECORD_SECONDS if use_vad else RECORD_SECONDS
             
         try:
-            print(f"[录音] 开始录音 {duration} 秒...")
+            print(f"[录音] 开始录音（{'说完自动结束，最长' if use_vad else ''} {duration} 秒）...")
             self.is_recording = True
             
             # 打开音频流
@@ -85,17 +100,39 @@ class AudioManager:
                 frames_per_buffer=CHUNK
             )
             
+            # VAD：去掉开头静音，说完（结尾静音达到设定时长）即停止，只保留语音段
+            vad = VoiceActivityDetector(RATE, VAD_TRAILING_SILENCE_MS) if use_vad else None
+            no_speech_chunks = int(RATE / CHUNK * VAD_NO_SPEECH_SECONDS)
             frames = []
-            for _ in range(0, int(RATE / CHUNK * duration)):
+            for i in range(0, int(RATE / CHUNK * duration)):
                 if not self.is_recording:
                     break
                 data = stream.read(CHUNK)
-                frames.append(data)
+                if vad is not None:
+                    data = vad.feed(data)
+                if data:
+                    frames.append(data)
+                    if on_voiced:
+                        on_voiced(data)
+                if vad is not None:
+                    if vad.ended:
+                        break
+                    if not vad.started and i >= no_speech_chunks:
+                        break
+            if vad is not None and vad.started:
+                rest = vad.flush()
+                if rest:
+                    frames.append(rest)
+                    if on_voiced:
+                        on_voiced(rest)
             
             stream.stop_stream()
             stream.close()
             
             self.is_recording = False
+            if not frames:
+                print("[提示] 未检测到说话")
+                return None
             
             # 生成WAV数据
             wav_buffer = io.BytesIO()
@@ -120,58 +157,21 @@ class AudioManager:
         print("[停止] 录音已停止")
     
     def play_audio(self, audio_data):
-        """播放音频数据"""
+        """播放整段WAV音频"""
         try:
-            # 将音频数据放入播放队列
-            self.playback_queue.put(audio_data)
-            
-            if not self.is_playing:
-                threading.Thread(target=self._playback_worker, daemon=True).start()
-                
+            self.player.play_wav(audio_data)
         except Exception as e:
             print(f"[错误] 音频播放失败: {e}")
     
-    def _playback_worker(self):
-        """音频播放工作线程"""
-        self.is_playing = True
-        
-        try:
-            while not self.playback_queue.empty():
-                audio_data = self.playback_queue.get()
-                
-                # 解析WAV数据
-                wav_buffer = io.BytesIO(audio_data)
-                with wave.open(wav_buffer, 'rb') as wf:
-                    # 打开播放流
-                    stream = self.audio.open(
-                        format=self.audio.get_format_from_width(wf.getsampwidth()),
-                        channels=wf.getnchannels(),
-                        rate=wf.getframerate(),
-                        output=True,
-                        output_device_index=self.output_device
-                    )
-                    
-                    # 播放音频
-                    print("[播放] 开始播放语音...")
-                    data = wf.readframes(CHUNK)
-                    while data:
-                        stream.write(data)
-                        data = wf.readframes(CHUNK)
-                    
-                    stream.stop_stream()
-                    stream.close()
-                    
-                print("[完成] 语音播放完成")
-                
-        except Exception as e:
-            print(f"[错误] 播放失败: {e}")
-        finally:
-            self.is_playing = False
+    def play_frame(self, addr, frame):
+        """流式播放语音帧（收到首帧即开始播放）"""
+        self.player.play_frame(addr, frame)
     
     def cleanup(self):
         """清理资源"""
         self.is_recording = False
-        self.is_playing = False
+        if self.player:
+            print(f"[音频] 播放统计: {self.player.format_stats()}")
         if self.audio:
             self.audio.terminate()
 
@@ -186,6 +186,8 @@ class VoiceNetworkManager:
         self.voice_send_sock = None
         self.voice_receive_sock = None
         self.command_sock = None
+        self.voice_sender = None
+        self.voice_receiver = VoiceStreamReceiver(self.audio_manager.play_frame)
         
         self.init_network()
         
@@ -194,11 +196,13 @@ class VoiceNetworkManager:
         try:
             # 发送语音数据的套接字
             self.voice_send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.voice_sender = VoiceStreamSender(self.voice_send_sock)
             
             # 接收语音合成的套接字
             self.voice_receive_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.voice_receive_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
             self.voice_receive_sock.bind(("0.0.0.0", VOICE_RECEIVE_PORT))
-            self.voice_receive_sock.settimeout(1.0)
+            self.voice_receive_sock.settimeout(POLL_INTERVAL)
             
             # 命令控制套接字
             self.command_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -212,111 +216,64 @@ class VoiceNetworkManager:
             print(f"[错误] 语音网络初始化失败: {e}")
     
     def send_voice_to_pc(self, audio_data, metadata=None):
-        """发送语音数据到PC端"""
+        """以二进制语音流发送录音（WAV）到PC端"""
         try:
             if not audio_data:
                 return False
-                
-            # 编码音频数据
-            audio_b64 = base64.b64encode(audio_data).decode('utf-8')
-            
-            # 构造数据包
-            packet = {
-                "type": "voice_data",
-                "timestamp": datetime.now().isoformat(),
-                "audio_data": audio_b64,
-                "format": "wav",
-                "sample_rate": RATE,
-                "channels": CHANNELS,
-                "duration": len(audio_data) / (RATE * CHANNELS * 2),  # 估算时长
-                "metadata": metadata or {}
-            }
             
-            # 分片发送（音频数据可能较大）
-            packet_json = json.dumps(packet)
-            packet_bytes = packet_json.encode('utf-8')
-            
-            max_packet_size = 8192  # 8KB分片
-            total_packets = (len(packet_bytes) + max_packet_size - 1) // max_packet_size
-            
-            for i in range(total_packets):
-                start = i * max_packet_size
-                end = min(start + max_packet_size, len(packet_bytes))
-                
-                # 包头：4字节包序号 + 4字节总包数 + 数据
-                header = i.to_bytes(4, 'big') + total_packets.to_bytes(4, 'big')
-                packet_chunk = header + packet_bytes[start:end]
-                
-                self.voice_send_sock.sendto(packet_chunk, (PC_IP, VOICE_SEND_PORT))
-                time.sleep(0.01)  # 避免网络拥塞
+            pcm, sample_rate, sample_width, channels = read_wav(audio_data)
+            self.voice_sender.send_stream(
+                (PC_IP, VOICE_SEND_PORT), pcm, sample_rate, sample_width, channels,
+                metadata={
+                    "type": "voice_data",
+                    "timestamp": datetime.now().isoformat(),
+                    "duration": len(pcm) / (sample_rate * sample_width * channels),
+                    "metadata": metadata or {}
+                }
+            )
             
-            print(f"[发送] 语音数据已发送到PC端 ({len(audio_data)} 字节)")
+            print(f"[发送] 语音数据已发送到PC端 ({len(pcm)} 字节)")
             return True
             
         except Exception as e:
             print(f"[错误] 语音发送失败: {e}")
             return False
     
+    def open_voice_stream(self, metadata=None):
+        """打开一条发往PC端的语音流，录音时边录边 write，结束时 end"""
+        return self.voice_sender.open_stream(
+            (PC_IP, VOICE_SEND_PORT), RATE, 2, CHANNELS,
+            metadata={
+                "type": "voice_data",
+                "timestamp": datetime.now().isoformat(),
+                "metadata": metadata or {}
+            }
+        )
+    
     def voice_receive_worker(self):
         """接收PC端语音合成的工作线程"""
         print("[接收] 语音接收线程启动")
-        packet_buffer = {}
         
         while self.is_running:
             try:
-                data, addr = self.voice_receive_sock.recvfrom(8192 + 8)
-                
-                if len(data) < 8:
-                    continue
-                
-                # 解析包头
-                packet_id = int.from_bytes(data[0:4], 'big')
-                total_packets = int.from_bytes(data[4:8], 'big')
-                payload = data[8:]
-                
-                # 缓存分片
-                if total_packets not in packet_buffer:
-                    packet_buffer[total_packets] = {}
-                
-                packet_buffer[total_packets][packet_id] = payload
-                
-                # 检查是否接收完整
-                if len(packet_buffer[total_packets]) == total_packets:
-                    # 重组数据
-                    complete_data = b''.join([
-                        packet_buffer[total_packets][i] 
-                        for i in range(total_packets)
-                    ])
-                    
-                    # 处理完整的语音数据
-                    self.handle_received_voice(complete_data)
-                    
-                    # 清理缓存
-                    del packet_buffer[total_packets]
+                data, addr = self.voice_receive_sock.recvfrom(65535)
+                if not self.voice_receiver.handle_datagram(data, addr):
+                    self.handle_control_packet(data, addr)
+                self.voice_receiver.expire_stale()
                 
             except socket.timeout:
-                continue
+                self.voice_receiver.expire_stale()
             except Exception as e:
                 if self.is_running:
                     print(f"[错误] 语音接收错误: {e}")
     
-    def handle_received_voice(self, data):
-        """处理接收到的语音数据"""
+    def handle_control_packet(self, data, addr):
+        """同一端口上PC端发来的JSON控制指令（如语音唤醒）"""
         try:
-            # 解析JSON数据
             packet = json.loads(data.decode('utf-8'))
-            
-            if packet.get("type") == "tts_audio":
-                # 解码音频数据
-                audio_data = base64.b64decode(packet["audio_data"])
-                
-                print(f"[接收] 收到PC端语音合成 ({len(audio_data)} 字节)")
-                
-                # 播放音频
-                self.audio_manager.play_audio(audio_data)
-                
-        except Exception as e:
-            print(f"[错误] 语音数据处理失败: {e}")
+            print(f"[命令] 收到PC端指令: {packet.get('type')} {packet.get('command', '')}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            print(f"[警告] 无法识别的数据来自 {addr[0]}")
     
     def send_voice_command(self, command, params=None):
         """发送语音控制命令"""
@@ -391,27 +348,27 @@ class BoardVoiceInterface:
         # 发送开始录音命令
         self.network_manager.send_voice_command("start_recording")
         
-        # 录音
-        audio_data = self.audio_manager.start_recording(duration=5)
+        # 边录音边发送语音段，说完即结束
+        metadata = {
+            "source": "board_microphone",
+            "purpose": "voice_chat"
+        }
+        try:
+            stream = self.network_manager.open_voice_stream(metadata)
+        except Exception as e:
+            print(f"[失败] 语音发送失败: {e}")
+            return
+        
+        audio_data = self.audio_manager.start_recording(on_voiced=stream.write)
+        stream.end()
         
         if audio_data:
-            # 发送音频数据到PC端
-            metadata = {
-                "source": "board_microphone",
-                "purpose": "voice_chat"
-            }
-            
-            success = self.network_manager.send_voice_to_pc(audio_data, metadata)
-            
-            if success:
-                print("[成功] 语音已发送到PC端，等待回复...")
-                # 发送处理命令
-                self.network_manager.send_voice_command("process_voice", {
-                    "action": "chat",
-                    "expect_response": True
-                })
-            else:
-                print("[失败] 语音发送失败")
+            print(f"[成功] 语音已发送到PC端 ({stream.audio_bytes} 字节)，等待回复...")
+            # 发送处理命令
+            self.network_manager.send_voice_command("process_voice", {
+                "action": "chat",
+                "expect_response": True
+            })
         else:
             print("[失败] 录音失败")
     
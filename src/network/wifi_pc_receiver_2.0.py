@@ -1,8 +1,14 @@
+import os
+import sys
 import socket
 import cv2
-import numpy as np
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from screen_codec import (TileCompositor, FrameAssembler, parse_packet, hello_message, FLAG_KEYFRAME,
+                          MAX_HEADER_SIZE, HELLO_INTERVAL)
+from latency_optimizer import OptimizedReceiver, FEEDBACK_INTERVAL
+
 # ===== 核心配置（需修改为实际环境）=====
 PC_IP = "172.20.10.3"  # PC的IP地址（需与发送端一致）
 VIDEO_PORT = 5000       # 接收视频的端口（与PC端一致）
@@ -30,14 +36,13 @@ class FrameBuffer:
         self.last_display_time = 0  # 最后一次显示时间
         self.target_fps = 30
         self.frame_interval = 1.0 / self.target_fps  # 显示间隔
-        self.last_frame_seq = -1  # 最后处理的帧序号（防重复）
+        self.last_frame_seq = -1  # 最后处理的帧序号
 
     def update(self, frame, frame_seq):
-        """仅更新序号更大的帧（保证时序正确）"""
-        if frame_seq > self.last_frame_seq:
-            self.last_valid_frame = self.current_frame
-            self.current_frame = frame
-            self.last_frame_seq = frame_seq
+        """更新当前帧（FrameAssembler 只交付比上一帧更新的帧，序号回绕与发送端重启都已处理）"""
+        self.last_valid_frame = self.current_frame
+        self.current_frame = frame
+        self.last_frame_seq = frame_seq
 
     def should_display(self):
         """控制显示帧率（避免频繁刷新）"""
@@ -48,6 +53,8 @@ class FrameBuffer:
         return self.current_frame if self.current_frame is not None else self.last_valid_frame
 
 frame_buffer = FrameBuffer()
+compositor = TileCompositor()  # 持久帧缓冲：关键帧整帧替换，瓦片帧按坐标贴回
+reporter = OptimizedReceiver(FEEDBACK_INTERVAL)  # 向发送端反馈丢包/RTT/解码耗时，驱动自适应质量
 
 # 触摸事件相关全局变量（用于预测与节流）
 last_touch_pos = None  # 上一次触摸位置 (x,y)
@@ -116,10 +123,12 @@ def init_window():
     print("✅ 触摸屏控制已启用，可操作PC鼠标")
 
 # 解码并显示视频帧
-def decode_and_display(data, frame_seq):
+def decode_and_display(data, frame_seq, flags=FLAG_KEYFRAME):
     try:
-        # 解码JPEG数据
-        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        # 关键帧整帧解码，瓦片帧贴回帧缓冲（迟到的旧帧已被 FrameAssembler 丢弃）
+        start = time.perf_counter()
+        frame = compositor.apply(flags, data)
+        reporter.record_decode((time.perf_counter() - start) * 1000)
         if frame is not None:
             frame_buffer.update(frame, frame_seq)
             if not frame_buffer.window_initialized:
@@ -141,51 +150,51 @@ def decode_and_display(data, frame_seq):
 # 主循环
 try:
     print(f"等待PC视频流（端口{VIDEO_PORT}）...（按ESC退出）")
-    frame_buffers = {}  # 缓存分片数据包 {帧序号: {分片: 数据, ...}}
+    assembler = FrameAssembler()  # 分片重组：自动识别 v1/v2 包头
     last_clean_time = time.time()
+    last_hello_time = 0
     running = True
 
     while running:
         try:
+            # 定期通告支持的包头版本，发送端据此从 v1 切换到 v2（发送端重启后也能重新协商）
+            if time.time() - last_hello_time > HELLO_INTERVAL:
+                try:
+                    control_sock.sendto(hello_message(), (PC_IP, CONTROL_PORT))
+                except (BlockingIOError, OSError):
+                    pass
+                last_hello_time = time.time()
+
+            # 定期反馈接收统计；发送端回显令牌后据此测 RTT
+            if reporter.due():
+                try:
+                    control_sock.sendto(reporter.feedback(assembler.stats['frames'], assembler.stats['lost_frames'],
+                                                          assembler.stats['packets'], assembler.stats['lost_packets']),
+                                        (PC_IP, CONTROL_PORT))
+                except (BlockingIOError, OSError):
+                    pass
+            while reporter.waiting_echo:
+                try:
+                    reporter.on_control(control_sock.recvfrom(64)[0])
+                except (BlockingIOError, OSError):
+                    break
+
             # 接收视频数据包
-            data, addr = video_sock.recvfrom(MAX_PACKET_SIZE + 5)
-            if len(data) < 5:
+            data, addr = video_sock.recvfrom(MAX_PACKET_SIZE + MAX_HEADER_SIZE)
+            packet = parse_packet(data)
+            if packet is None:
                 continue  # 数据包不完整
 
-            # 解析包头：1B关键帧标记 + 2B帧序号 + 1B当前分片 + 1B总分片
-            keyframe_flag = data[0]
-            frame_seq = int.from_bytes(data[1:3], byteorder='big')
-            packet_idx = data[3]
-            total_packets = data[4]
-            payload = data[5:]
-
-            # 缓存分片
-            if frame_seq not in frame_buffers:
-                frame_buffers[frame_seq] = {
-                    'fragments': {}, 'timestamp': time.time(),
-                    'total_packets': total_packets
-                }
-            if 0 <= packet_idx < total_packets:
-                frame_buffers[frame_seq]['fragments'][packet_idx] = payload
-
-            # 所有分片接收完成后拼接
-            if len(frame_buffers[frame_seq]['fragments']) == total_packets:
-                # 按分片序号排序并拼接
-                sorted_fragments = [frame_buffers[frame_seq]['fragments'][i] 
-                                   for i in sorted(frame_buffers[frame_seq]['fragments'])]
-                frame_data = b''.join(sorted_fragments)
-                running = decode_and_display(frame_data, frame_seq)
-                del frame_buffers[frame_seq]  # 处理后删除缓存
+            # 所有分片接收完成后交付整帧
+            completed = assembler.add(packet)
+            if completed is not None:
+                flags, frame_seq, frame_data = completed
+                running = decode_and_display(frame_data, frame_seq, flags)
 
             # 定期清理过期帧（防止内存泄漏）
             if time.time() - last_clean_time > 1.0:
-                current_time = time.time()
-                # 删除超过1秒未接收完整的帧
-                to_delete = [seq for seq in frame_buffers 
-                           if current_time - frame_buffers[seq]['timestamp'] > 1.0]
-                for seq in to_delete:
-                    del frame_buffers[seq]
-                last_clean_time = current_time
+                assembler.expire()
+                last_clean_time = time.time()
 
         except socket.timeout:
             # 超时处理：刷新最后一帧（避免画面冻结）
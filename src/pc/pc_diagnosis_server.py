@@ -16,11 +16,19 @@ import json
 import threading
 import sys
 import os
+import bisect
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import queue
 
 # 添加主系统路径以导入诊断模块
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# 共享网络传输模块
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+
+from reliable_transport import FragmentReceiver
 
 # ===== 配置参数 =====
 SERVER_IP = "0.0.0.0"      # 服务器绑定IP
@@ -31,57 +39,97 @@ COMMAND_PORT = 5004        # 接收命令控制端口
 MAX_PACKET_SIZE = 1400     # 最大数据包大小
 DIAGNOSIS_TIMEOUT = 30     # 诊断超时时间(秒)
 MAX_CLIENTS = 5            # 最大同时连接客户端数
+
+MAX_BATCH_SIZE = 8         # 动态批处理最大批大小
+MAX_BATCH_WAIT = 0.01      # 凑批最长等待时间(秒)
+
+# asyncio 模式
+MAX_PENDING_TASKS = 32     # 待诊断队列上限，队列满时拒绝新请求（准入控制）
+INFERENCE_WORKERS = 1      # 推理线程数（DiagnosisEngine 的结果解析非线程安全，保持为1）
 # ===================
 
+class Histogram:
+    """分桶直方图（线程安全），用于统计队列深度、批大小和请求延迟"""
+    
+    def __init__(self, bounds):
+        self.bounds = list(bounds)             # 各桶上界（含），最后追加一个溢出桶
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+    
+    def record(self, value):
+        """记录一个样本"""
+        with self.lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.total += 1
+            self.sum += value
+            self.max = max(self.max, value)
+    
+    def percentile(self, p):
+        """返回第p百分位所在桶的上界（不超过实际最大值）"""
+        with self.lock:
+            if self.total == 0:
+                return 0.0
+            target = self.total * p / 100.0
+            cumulative = 0
+            for i, count in enumerate(self.counts):
+                cumulative += count
+                if cumulative >= target:
+                    return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+            return self.max
+    
+    def mean(self):
+        with self.lock:
+            return self.sum / self.total if self.total else 0.0
+    
+    def format_buckets(self):
+        """格式化为 '<=上界:次数' 列表，省略空桶"""
+        with self.lock:
+            parts = [f"<={bound}:{count}" for bound, count in zip(self.bounds, self.counts) if count]
+            if self.counts[-1]:
+                parts.append(f">{self.bounds[-1]}:{self.counts[-1]}")
+            return " ".join(parts) if parts else "无数据"
+
 class ImageBuffer:
-    """图像缓存管理器"""
+    """图像缓存管理器（分片重组 + 按 request_id 关联请求头）"""
     
-    def __init__(self):
-        self.buffers = {}  # {client_id: {packet_id: data, ...}}
-        self.metadata = {}  # {client_id: header_info}
+    def __init__(self, send_fn=None):
+        self.receiver = FragmentReceiver(send_fn=send_fn)  # 分片重组，对可靠分片回复ACK
+        self.metadata = {}  # {request_id: header_info}
         self.lock = threading.Lock()
         
-    def add_packet(self, client_addr, packet_id, total_packets, data):
-        """添加图像数据包"""
+    def receive_packet(self, sock):
+        """从套接字接收一个分片到复用缓冲区（recvfrom_into），返回 (数据视图, 地址)"""
+        return self.receiver.receive_into(sock)
+    
+    def add_packet(self, data, client_addr):
+        """添加图像分片，重组完成时返回 (request_id, image_data)，否则返回 None
+        
+        image_data 是重组缓冲区的 memoryview，可直接交给 np.frombuffer 解码。
+        """
         with self.lock:
-            client_id = f"{client_addr[0]}:{client_addr[1]}"
-            
-            if client_id not in self.buffers:
-                self.buffers[client_id] = {}
-                
-            self.buffers[client_id][packet_id] = data
-            
-            # 检查是否接收完整
-            if len(self.buffers[client_id]) == total_packets:
-                # 重组图像
-                sorted_packets = [self.buffers[client_id][i] for i in range(total_packets)]
-                image_data = b''.join(sorted_packets)
-                
-                # 清理缓存
-                del self.buffers[client_id]
-                
-                return image_data
-            
-            return None
+            frame = self.receiver.handle_datagram(data, client_addr)
+        
+        if frame:
+            return frame['request_id'], frame['data']
+        return None
     
-    def set_metadata(self, client_addr, metadata):
-        """设置图像元数据"""
+    def expire_stale(self):
+        """定时清理过期的残缺帧"""
         with self.lock:
-            client_id = f"{client_addr[0]}:{client_addr[1]}"
-            self.metadata[client_id] = metadata
+            return self.receiver.maybe_expire()
     
-    def get_metadata(self, client_addr):
-        """获取图像元数据"""
+    def set_metadata(self, request_id, metadata):
+        """设置图像元数据"""
         with self.lock:
-            client_id = f"{client_addr[0]}:{client_addr[1]}"
-            return self.metadata.get(client_id, {})
+            self.metadata[request_id] = metadata
     
-    def cleanup_client(self, client_addr):
-        """清理客户端数据"""
+    def pop_metadata(self, request_id):
+        """取出并移除图像元数据"""
         with self.lock:
-            client_id = f"{client_addr[0]}:{client_addr[1]}"
-            self.buffers.pop(client_id, None)
-            self.metadata.pop(client_id, None)
+            return self.metadata.pop(request_id, {})
 
 class DiagnosisEngine:
     """诊断引擎适配器"""
@@ -128,42 +176,44 @@ class DiagnosisEngine:
             self.processor = None
     
     def diagnose_image(self, image):
-        """诊断图像"""
+        """诊断单张图像"""
+        return self.diagnose_batch([image])[0]
+    
+    def diagnose_batch(self, images):
+        """批量诊断图像，返回与输入顺序一致的结果列表"""
         try:
             if self.detector and self.processor:
-                # 使用真实的诊断系统
-                results = self.detector.predict(image)
-                parsed_results = self.processor.parse_model_results(results)
-                
-                if parsed_results:
-                    disease_name = parsed_results.get('disease_name', '未知')
-                    confidence = parsed_results.get('confidence', 0.0)
-                    
-                    # 生成医疗建议
-                    advice = self.generate_medical_advice(disease_name, confidence)
-                    
-                    return {
-                        'success': True,
-                        'disease_name': disease_name,
-                        'confidence': float(confidence),
-                        'advice': advice,
-                        'emergency': confidence > 0.85 and disease_name != '正常',
-                        'timestamp': datetime.now().isoformat(),
-                        'model_info': '眼部疾病检测模型'
-                    }
-                else:
-                    return self.get_fallback_result()
+                # 使用真实的诊断系统：先查结果缓存，未命中的图像一次前向推理处理
+                return [
+                    self.build_result(*output) if output is not None else self.get_fallback_result()
+                    for output in self.detector.classify_batch(images)
+                ]
             else:
                 # 模拟诊断结果
-                return self.simulate_diagnosis(image)
+                return [self.simulate_diagnosis(image) for image in images]
                 
         except Exception as e:
             print(f"[错误] 诊断过程出错: {e}")
-            return {
+            return [{
                 'success': False,
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
-            }
+            } for _ in images]
+    
+    def build_result(self, disease_name, confidence):
+        """根据疾病名称和置信度构造诊断结果"""
+        # 生成医疗建议
+        advice = self.generate_medical_advice(disease_name, confidence)
+        
+        return {
+            'success': True,
+            'disease_name': disease_name,
+            'confidence': float(confidence),
+            'advice': advice,
+            'emergency': confidence > 0.85 and disease_name != '正常',
+            'timestamp': datetime.now().isoformat(),
+            'model_info': '眼部疾病检测模型'
+        }
     
     def simulate_diagnosis(self, image):
         """模拟诊断结果（当真实模型不可用时）"""
@@ -234,7 +284,7 @@ class DiagnosisServer:
     """诊断服务器主控制器"""
     
     def __init__(self):
-        self.image_buffer = ImageBuffer()
+        self.image_buffer = ImageBuffer(send_fn=self._send_ack)
         self.diagnosis_engine = DiagnosisEngine()
         self.diagnosis_queue = queue.Queue()
         self.is_running = False
@@ -252,6 +302,9 @@ class DiagnosisServer:
             'connected_clients': set(),
             'start_time': time.time()
         }
+        self.queue_depth_hist = Histogram([0, 1, 2, 4, 8, 16, 32, 64])
+        self.batch_size_hist = Histogram(range(1, MAX_BATCH_SIZE + 1))
+        self.latency_hist = Histogram([5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000])  # 毫秒
     
     def init_sockets(self):
         """初始化网络套接字"""
@@ -260,6 +313,7 @@ class DiagnosisServer:
             self.camera_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.camera_sock.bind((SERVER_IP, CAMERA_PORT))
             self.camera_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024 * 1024)
+            self.camera_sock.settimeout(1.0)  # 超时用于定时清理残缺帧
             
             # 诊断结果发送套接字
             self.diagnosis_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -308,38 +362,39 @@ class DiagnosisServer:
         
         while self.is_running:
             try:
-                data, addr = self.camera_sock.recvfrom(MAX_PACKET_SIZE + 10)
-                
-                if len(data) < 8:
-                    continue
-                
-                # 解析包头
-                packet_id = int.from_bytes(data[0:4], 'big')
-                total_packets = int.from_bytes(data[4:8], 'big')
-                payload = data[8:]
+                data, addr = self.image_buffer.receive_packet(self.camera_sock)
                 
-                # 重组图像
-                image_data = self.image_buffer.add_packet(addr, packet_id, total_packets, payload)
+                # 重组图像：[4字节请求ID哈希][2字节包索引][2字节总包数][1字节标志位][数据]
+                completed = self.image_buffer.add_packet(data, addr)
                 
-                if image_data:
+                if completed:
                     # 图像接收完成，加入诊断队列
-                    metadata = self.image_buffer.get_metadata(addr)
-                    
-                    task = {
-                        'client_addr': addr,
-                        'image_data': image_data,
-                        'metadata': metadata,
-                        'timestamp': time.time()
-                    }
-                    
-                    self.diagnosis_queue.put(task)
-                    self.stats['connected_clients'].add(addr[0])
-                    print(f"[图像] 收到来自 {addr[0]} 的图像 ({len(image_data)} 字节)")
+                    self.diagnosis_queue.put(self.make_task(addr, *completed))
                 
+            except socket.timeout:
+                # 空闲时定时清理过期的残缺帧
+                self.image_buffer.expire_stale()
             except Exception as e:
                 if self.is_running:
                     print(f"[错误] 摄像头数据处理错误: {e}")
     
+    def make_task(self, addr, request_id, image_data):
+        """为重组完成的图像创建诊断任务"""
+        self.stats['connected_clients'].add(addr[0])
+        print(f"[图像] 收到来自 {addr[0]} 的图像 ({len(image_data)} 字节)")
+        return {
+            'client_addr': addr,
+            'request_id': request_id,
+            'image_data': image_data,
+            'metadata': self.image_buffer.pop_metadata(request_id),
+            'timestamp': time.time()
+        }
+    
+    def _send_ack(self, ack_data, addr):
+        """向开发板回复分片ACK"""
+        if self.camera_sock:
+            self.camera_sock.sendto(ack_data, addr)
+    
     def command_handler(self):
         """处理命令控制"""
         print("[命令] 命令控制处理线程启动")
@@ -347,87 +402,133 @@ class DiagnosisServer:
         while self.is_running:
             try:
                 data, addr = self.command_sock.recvfrom(4096)
-                
-                try:
-                    command = json.loads(data.decode('utf-8'))
-                    
-                    if command.get('type') == 'diagnosis_request':
-                        # 保存图像元数据
-                        self.image_buffer.set_metadata(addr, command)
-                        self.stats['total_requests'] += 1
-                        print(f"[请求] 收到诊断请求 - 客户端: {addr[0]}")
-                    
-                except json.JSONDecodeError:
-                    print(f"[警告] 无效的命令格式来自 {addr[0]}")
+                self.handle_command(data, addr)
                 
             except Exception as e:
                 if self.is_running:
                     print(f"[错误] 命令处理错误: {e}")
     
+    def handle_command(self, data, addr):
+        """解析一条命令控制数据"""
+        try:
+            command = json.loads(data.decode('utf-8'))
+            
+            if command.get('type') == 'diagnosis_request':
+                # 保存图像元数据（按 request_id 与图像分片关联）
+                self.image_buffer.set_metadata(command.get('request_id'), command)
+                self.stats['total_requests'] += 1
+                print(f"[请求] 收到诊断请求 - 客户端: {addr[0]}")
+            
+        except json.JSONDecodeError:
+            print(f"[警告] 无效的命令格式来自 {addr[0]}")
+    
+    def _collect_batch(self):
+        """收集一批诊断任务：凑满 MAX_BATCH_SIZE 或首个任务到达后等待 MAX_BATCH_WAIT 秒"""
+        batch = [self.diagnosis_queue.get(timeout=1.0)]
+        self.queue_depth_hist.record(self.diagnosis_queue.qsize())
+        deadline = time.time() + MAX_BATCH_WAIT
+        
+        while len(batch) < MAX_BATCH_SIZE:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.diagnosis_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+    
     def diagnosis_worker(self):
-        """诊断工作线程"""
+        """诊断工作线程（动态批处理）"""
         print("[诊断] 诊断工作线程启动")
         
         while self.is_running:
             try:
-                # 从队列获取诊断任务
-                task = self.diagnosis_queue.get(timeout=1.0)
-                
-                client_addr = task['client_addr']
-                image_data = task['image_data']
-                
-                print(f"[检查] 开始诊断图像 - 客户端: {client_addr[0]}")
-                
-                # 解码图像
-                img_array = np.frombuffer(image_data, dtype=np.uint8)
-                image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-                
-                if image is not None:
-                    # 执行诊断
-                    start_time = time.time()
-                    diagnosis_result = self.diagnosis_engine.diagnose_image(image)
-                    diagnosis_time = time.time() - start_time
-                    
-                    # 添加诊断时间信息
-                    diagnosis_result['diagnosis_time'] = diagnosis_time
-                    diagnosis_result['server_info'] = {
-                        'server_ip': socket.gethostname(),
-                        'processed_at': datetime.now().isoformat()
-                    }
-                    
-                    # 发送结果
-                    self.send_diagnosis_result(client_addr, diagnosis_result)
-                    
-                    # 更新统计
-                    if diagnosis_result.get('success', False):
-                        self.stats['successful_diagnoses'] += 1
-                        print(f"[成功] 诊断完成 - {client_addr[0]} - 用时: {diagnosis_time:.2f}s")
-                    else:
-                        self.stats['failed_diagnoses'] += 1
-                        print(f"[错误] 诊断失败 - {client_addr[0]}")
-                
-                else:
-                    # 图像解码失败
-                    error_result = {
-                        'success': False,
-                        'error': '图像解码失败',
-                        'timestamp': datetime.now().isoformat()
-                    }
-                    self.send_diagnosis_result(client_addr, error_result)
-                    self.stats['failed_diagnoses'] += 1
-                    print(f"[错误] 图像解码失败 - {client_addr[0]}")
-                
-                self.diagnosis_queue.task_done()
-                
+                # 从队列收集一批诊断任务
+                batch = self._collect_batch()
             except queue.Empty:
                 continue
+            
+            try:
+                self.process_batch(batch)
             except Exception as e:
                 print(f"[错误] 诊断工作线程错误: {e}")
+            finally:
+                for _ in batch:
+                    self.diagnosis_queue.task_done()
     
-    def send_diagnosis_result(self, client_addr, result):
+    def process_batch(self, batch):
+        """解码并批量诊断一批任务，将结果分发回各客户端"""
+        decoded_tasks = []
+        images = []
+        
+        for task in batch:
+            client_addr = task['client_addr']
+            
+            # 解码图像
+            img_array = np.frombuffer(task['image_data'], dtype=np.uint8)
+            image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+            
+            if image is not None:
+                decoded_tasks.append(task)
+                images.append(image)
+            else:
+                # 图像解码失败
+                error_result = {
+                    'success': False,
+                    'error': '图像解码失败',
+                    'timestamp': datetime.now().isoformat()
+                }
+                self.send_diagnosis_result(client_addr, error_result, task.get('request_id'))
+                self.stats['failed_diagnoses'] += 1
+                self.latency_hist.record((time.time() - task['timestamp']) * 1000)
+                print(f"[错误] 图像解码失败 - {client_addr[0]}")
+        
+        if not images:
+            return
+        
+        print(f"[检查] 开始批量诊断 - 批大小: {len(images)}")
+        self.batch_size_hist.record(len(images))
+        
+        # 执行诊断
+        start_time = time.time()
+        diagnosis_results = self.diagnosis_engine.diagnose_batch(images)
+        diagnosis_time = time.time() - start_time
+        
+        for task, diagnosis_result in zip(decoded_tasks, diagnosis_results):
+            client_addr = task['client_addr']
+            
+            # 添加诊断时间信息
+            diagnosis_result['diagnosis_time'] = diagnosis_time
+            diagnosis_result['batch_size'] = len(images)
+            diagnosis_result['server_info'] = {
+                'server_ip': socket.gethostname(),
+                'processed_at': datetime.now().isoformat()
+            }
+            
+            # 发送结果
+            self.send_diagnosis_result(client_addr, diagnosis_result, task.get('request_id'))
+            self.latency_hist.record((time.time() - task['timestamp']) * 1000)
+            
+            # 更新统计
+            if diagnosis_result.get('success', False):
+                self.stats['successful_diagnoses'] += 1
+                print(f"[成功] 诊断完成 - {client_addr[0]} - 用时: {diagnosis_time:.2f}s")
+            else:
+                self.stats['failed_diagnoses'] += 1
+                print(f"[错误] 诊断失败 - {client_addr[0]}")
+    
+    def encode_result(self, result, request_id=None):
+        """序列化诊断结果，开发板按 type 和 request_id 匹配结果"""
+        result.setdefault('type', 'diagnosis_result' if result.get('success', False) else 'diagnosis_error')
+        result['request_id'] = request_id
+        return json.dumps(result, ensure_ascii=False).encode('utf-8')
+    
+    def send_diagnosis_result(self, client_addr, result, request_id=None):
         """发送诊断结果"""
         try:
-            result_data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+            result_data = self.encode_result(result, request_id)
             self.diagnosis_sock.sendto(result_data, (client_addr[0], DIAGNOSIS_PORT))
             print(f"[发送] 诊断结果已发送到 {client_addr[0]}")
             
@@ -439,30 +540,53 @@ class DiagnosisServer:
         while self.is_running:
             try:
                 time.sleep(30)  # 每30秒报告一次
-                
-                uptime = time.time() - self.stats['start_time']
-                hours = int(uptime // 3600)
-                minutes = int((uptime % 3600) // 60)
-                
-                print("\n" + "="*50)
-                print("[统计] 服务器运行状态")
-                print("="*50)
-                print(f"[时间]  运行时间: {hours:02d}:{minutes:02d}")
-                print(f"[请求] 总请求数: {self.stats['total_requests']}")
-                print(f"[成功] 成功诊断: {self.stats['successful_diagnoses']}")
-                print(f"[错误] 失败诊断: {self.stats['failed_diagnoses']}")
-                print(f"[连接] 连接设备: {len(self.stats['connected_clients'])}")
-                print(f"[等待] 待处理队列: {self.diagnosis_queue.qsize()}")
-                
-                if self.stats['total_requests'] > 0:
-                    success_rate = (self.stats['successful_diagnoses'] / self.stats['total_requests']) * 100
-                    print(f"[状态] 成功率: {success_rate:.1f}%")
-                
-                print("="*50 + "\n")
-                
+                self.print_stats()
             except Exception as e:
                 print(f"[错误] 统计报告错误: {e}")
     
+    def pending_tasks(self):
+        """返回待处理的诊断任务数"""
+        return self.diagnosis_queue.qsize()
+    
+    def print_stats(self):
+        """打印服务器运行状态"""
+        uptime = time.time() - self.stats['start_time']
+        hours = int(uptime // 3600)
+        minutes = int((uptime % 3600) // 60)
+        
+        print("\n" + "="*50)
+        print("[统计] 服务器运行状态")
+        print("="*50)
+        print(f"[时间]  运行时间: {hours:02d}:{minutes:02d}")
+        print(f"[请求] 总请求数: {self.stats['total_requests']}")
+        print(f"[成功] 成功诊断: {self.stats['successful_diagnoses']}")
+        print(f"[错误] 失败诊断: {self.stats['failed_diagnoses']}")
+        if 'rejected_requests' in self.stats:
+            print(f"[拒绝] 队列满拒绝: {self.stats['rejected_requests']}")
+        print(f"[连接] 连接设备: {len(self.stats['connected_clients'])}")
+        print(f"[等待] 待处理队列: {self.pending_tasks()}")
+        
+        if self.stats['total_requests'] > 0:
+            success_rate = (self.stats['successful_diagnoses'] / self.stats['total_requests']) * 100
+            print(f"[状态] 成功率: {success_rate:.1f}%")
+        
+        print(f"[队列] 队列深度分布: {self.queue_depth_hist.format_buckets()}")
+        print(f"[批处理] 批大小分布: {self.batch_size_hist.format_buckets()} "
+              f"(平均 {self.batch_size_hist.mean():.2f})")
+        print(f"[延迟] 请求延迟(ms): p50={self.latency_hist.percentile(50):.0f} "
+              f"p95={self.latency_hist.percentile(95):.0f} "
+              f"p99={self.latency_hist.percentile(99):.0f} "
+              f"max={self.latency_hist.max:.0f}")
+        print(f"[延迟] 延迟分布(ms): {self.latency_hist.format_buckets()}")
+        
+        detector = self.diagnosis_engine.detector
+        if detector is not None:
+            cache_stats = detector.result_cache.stats()
+            print(f"[缓存] 结果缓存命中: {cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']} "
+                  f"({cache_stats['hit_rate']:.1%}, 磁盘命中 {cache_stats['disk_hits']})")
+        
+        print("="*50 + "\n")
+    
     def shutdown(self):
         """关闭服务器"""
         print("\n[更新] 正在关闭服务器...")
@@ -475,6 +599,193 @@ class DiagnosisServer:
         
         print("[成功] 服务器已关闭")
 
+class AsyncDiagnosisServer(DiagnosisServer):
+    """asyncio 模式的诊断服务器
+    
+    摄像头、命令和诊断结果端口均为 DatagramProtocol 端点，由单个事件循环驱动；
+    推理在有界线程池中执行，待诊断队列满时直接向开发板返回繁忙错误。
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+        self.camera_transport = None
+        self.command_transport = None
+        self.diagnosis_transport = None
+        self.task_queue = None          # asyncio.Queue，需在事件循环中创建
+        self.inference_slots = None     # 限制同时执行的推理批次数
+        self.executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="diagnosis")
+        self.background_tasks = []
+        self.stats['rejected_requests'] = 0
+    
+    async def start_server_async(self):
+        """创建 UDP 端点并启动后台协程"""
+        print("[启动] 启动PC端医疗诊断服务器 (asyncio 模式)...")
+        self.loop = asyncio.get_running_loop()
+        self.task_queue = asyncio.Queue(maxsize=MAX_PENDING_TASKS)
+        self.inference_slots = asyncio.Semaphore(INFERENCE_WORKERS)
+        
+        try:
+            # 摄像头端点沿用大接收缓冲区
+            camera_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            camera_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024 * 1024)
+            camera_sock.bind((SERVER_IP, CAMERA_PORT))
+            self.camera_transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: _ServerDatagramProtocol(self.on_camera_datagram), sock=camera_sock)
+            
+            self.command_transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: _ServerDatagramProtocol(self.handle_command), local_addr=(SERVER_IP, COMMAND_PORT))
+            
+            self.diagnosis_transport, _ = await self.loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol, family=socket.AF_INET)
+        except Exception as e:
+            print(f"[错误] 网络初始化失败: {e}")
+            return False
+        
+        print("[网络] 服务器端点初始化完成")
+        print(f"   摄像头数据端口: {CAMERA_PORT}")
+        print(f"   诊断结果端口: {DIAGNOSIS_PORT}")
+        print(f"   命令控制端口: {COMMAND_PORT}")
+        print(f"   队列上限: {MAX_PENDING_TASKS}, 推理线程: {INFERENCE_WORKERS}")
+        
+        self.is_running = True
+        self.background_tasks = [
+            asyncio.ensure_future(self._batch_dispatcher()),
+            asyncio.ensure_future(self._housekeeping()),
+        ]
+        print("[成功] 服务器启动完成，等待开发板连接...")
+        return True
+    
+    async def serve_forever(self):
+        """启动服务器并运行直到被取消"""
+        if not await self.start_server_async():
+            print("[错误] 服务器启动失败")
+            return
+        print("[提示] 服务器运行中，按 Ctrl+C 停止")
+        try:
+            await asyncio.gather(*self.background_tasks)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            # 事件循环仍在运行，在此关闭端点；asyncio.run 返回后循环已关闭
+            self._close_endpoints()
+    
+    def on_camera_datagram(self, data, addr):
+        """摄像头分片到达：重组完成后做准入控制并入队"""
+        completed = self.image_buffer.add_packet(data, addr)
+        if not completed:
+            return
+        
+        task = self.make_task(addr, *completed)
+        try:
+            self.task_queue.put_nowait(task)
+        except asyncio.QueueFull:
+            # 队列饱和：立即拒绝，避免排队延迟无限增长
+            self.stats['rejected_requests'] += 1
+            self.stats['failed_diagnoses'] += 1
+            print(f"[拒绝] 待诊断队列已满 ({MAX_PENDING_TASKS})，拒绝来自 {addr[0]} 的请求")
+            self.send_diagnosis_result(addr, {
+                'success': False,
+                'error': '服务器繁忙，请稍后重试',
+                'busy': True,
+                'timestamp': datetime.now().isoformat()
+            }, task['request_id'])
+    
+    async def _batch_dispatcher(self):
+        """从队列凑批并提交到推理线程池"""
+        while self.is_running:
+            batch = [await self.task_queue.get()]
+            self.queue_depth_hist.record(self.task_queue.qsize())
+            deadline = self.loop.time() + MAX_BATCH_WAIT
+            
+            while len(batch) < MAX_BATCH_SIZE:
+                remaining = deadline - self.loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.task_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            # 推理线程全忙时在此等待，未取走的任务留在有界队列中形成背压
+            await self.inference_slots.acquire()
+            future = self.loop.run_in_executor(self.executor, self.process_batch, batch)
+            future.add_done_callback(self._on_batch_done)
+    
+    def _on_batch_done(self, future):
+        self.inference_slots.release()
+        if future.exception():
+            print(f"[错误] 批量诊断错误: {future.exception()}")
+    
+    async def _housekeeping(self):
+        """定时清理残缺帧并输出统计"""
+        last_report = time.time()
+        while self.is_running:
+            await asyncio.sleep(1.0)
+            self.image_buffer.expire_stale()
+            if time.time() - last_report >= 30:
+                last_report = time.time()
+                self.print_stats()
+    
+    def _send_ack(self, ack_data, addr):
+        """向开发板回复分片ACK（事件循环线程内调用）"""
+        if self.camera_transport:
+            self.camera_transport.sendto(ack_data, addr)
+    
+    def send_diagnosis_result(self, client_addr, result, request_id=None):
+        """发送诊断结果，可从推理线程调用"""
+        try:
+            result_data = self.encode_result(result, request_id)
+            self.loop.call_soon_threadsafe(
+                self.diagnosis_transport.sendto, result_data, (client_addr[0], DIAGNOSIS_PORT))
+            print(f"[发送] 诊断结果已发送到 {client_addr[0]}")
+        except Exception as e:
+            print(f"[错误] 发送诊断结果失败: {e}")
+    
+    def pending_tasks(self):
+        return self.task_queue.qsize() if self.task_queue else 0
+    
+    def _close_endpoints(self):
+        """取消后台协程并关闭端点与推理线程池（须在事件循环线程内调用）"""
+        self.is_running = False
+        for task in self.background_tasks:
+            task.cancel()
+        for transport in [self.camera_transport, self.command_transport, self.diagnosis_transport]:
+            if transport:
+                transport.close()
+        self.camera_transport = self.command_transport = self.diagnosis_transport = None
+        self.executor.shutdown(wait=False)
+    
+    def shutdown(self):
+        """关闭服务器，可从任意线程调用；实际清理由 serve_forever 在事件循环内完成"""
+        print("\n[更新] 正在关闭服务器...")
+        self.is_running = False
+        
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._close_endpoints)
+            except RuntimeError:
+                pass  # 事件循环已关闭，serve_forever 退出时已清理
+        
+        print("[成功] 服务器已关闭")
+
+
+class _ServerDatagramProtocol(asyncio.DatagramProtocol):
+    """把收到的数据报转交给回调"""
+    
+    def __init__(self, handler):
+        self.handler = handler
+    
+    def datagram_received(self, data, addr):
+        try:
+            self.handler(data, addr)
+        except Exception as e:
+            print(f"[错误] 数据处理错误: {e}")
+    
+    def error_received(self, exc):
+        print(f"[错误] 网络错误: {exc}")
+
+
 def main():
     """主函数"""
     # 设置控制台编码以支持Unicode
@@ -510,5 +821,35 @@ def main():
     finally:
         server.shutdown()
 
+def main_async():
+    """asyncio 模式主函数"""
+    if sys.platform == "win32":
+        try:
+            sys.stdout.reconfigure(encoding='utf-8')
+        except AttributeError:
+            pass
+    
+    print("[医院] PC端医疗诊断服务器 (asyncio)")
+    print("=" * 50)
+    
+    server = AsyncDiagnosisServer()
+    
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\n[取消] 收到停止信号")
+    except Exception as e:
+        print(f"[错误] 服务器错误: {e}")
+    finally:
+        server.shutdown()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="PC端医疗诊断服务器")
+    parser.add_argument('--mode', choices=['thread', 'asyncio'], default='thread',
+                        help="thread: 多线程阻塞收包（默认）; asyncio: 事件循环 + 有界推理线程池")
+    args = parser.parse_args()
+    
+    if args.mode == 'asyncio':
+        main_async()
+    else:
+        main()
\ No newline at end of file
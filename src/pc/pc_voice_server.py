@@ -7,6 +7,9 @@ PC端语音处理服务器
 2. 调用AI进行语音对话
 3. 语音合成并发送到开发板
 4. 与主诊断系统集成
+
+一轮对话按 识别 → AI → 合成 → 发送 四个阶段流水线处理：每个阶段有独立的工作线程和有界队列，
+语音边接收边识别，AI回复按句切分后立即进入合成，合成好的句子立即发送，多个开发板的对话可同时进行
 """
 
 import socket
@@ -14,11 +17,16 @@ import threading
 import time
 import json
 import queue
-import base64
 import io
 import wave
 import tempfile
 import os
+import re
+import shutil
+import itertools
+import subprocess
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 
 # 语音识别和合成
@@ -30,25 +38,219 @@ except ImportError:
     print("[警告] 语音识别库未安装，使用模拟模式")
     HAS_SPEECH = False
 
-# VOSK离线识别
-try:
-    import vosk
-    HAS_VOSK = True
-except ImportError:
+# VOSK离线识别（进程共享的模型与识别器池）
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from asr_service import ASRService, HAS_VOSK
+from voice_protocol import (VoiceStreamReceiver, VoiceStreamSender, read_wav, FLAG_END, FLAG_META,
+                            SAMPLE_WIDTHS, DEFAULT_SAMPLE_RATE, RECV_BUFFER_BYTES, POLL_INTERVAL)
+from llm_client import PRIORITY_VOICE
+if not HAS_VOSK:
     print("[警告] VOSK库未安装，使用在线识别")
-    HAS_VOSK = False
 
 # 网络配置
 VOICE_RECEIVE_PORT = 5005   # 接收开发板语音
 VOICE_SEND_PORT = 5006      # 发送语音到开发板
 COMMAND_PORT = 5007         # 语音命令控制
 
+# 音频配置
+VOSK_CHUNK_BYTES = 8000        # 送入Vosk的PCM块大小
+TTS_BACKEND_ORDER = ["espeak", "pyttsx3"]   # TTS后端优先级，可用环境变量 VOICE_TTS_BACKEND 指定
+TIMING_WINDOW = 200            # 分阶段耗时统计保留的最近轮数
+MIN_SENTENCE_CHARS = 4         # 短于该长度的句子并入前一句，减少合成调用次数
+MAX_SENTENCE_CHARS = 40        # 长于该长度的句子再按逗号切分，缩短首句合成时间
+
+# 流水线配置
+STAGE_WORKERS = {"识别": 2, "AI": 2, "合成": 2, "发送": 2}   # 各阶段工作线程数（可同时处理的对话轮数）
+STAGE_QUEUE_SIZE = 8           # 各阶段等待队列长度，识别队列满时新语音直接回绝
+TURN_QUEUE_SIZE = 16           # 轮内阶段间的句子/音频缓冲，满时上游等待下游
+TURN_TIMEOUT = 30.0            # 等待上游数据的最长时间(秒)，超时放弃本轮
+
+_SENTENCE_RE = re.compile(r'[^。！？!?；;\n]+[。！？!?；;\n]*')
+_CLAUSE_RE = re.compile(r'[^，,、：:]+[，,、：:]*')
+
+
+def pcm_to_wav(pcm, sample_rate, sample_width=2, channels=1):
+    """PCM 封装为 WAV 字节（开发板播放端按WAV解析）"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def split_sentences(text):
+    """按句切分回复文本，用于逐句合成、边合成边发送"""
+    sentences = []
+    for sentence in _SENTENCE_RE.findall(text):
+        parts = _CLAUSE_RE.findall(sentence) if len(sentence) > MAX_SENTENCE_CHARS else [sentence]
+        for part in parts:
+            part = part.strip()
+            if not part:
+                continue
+            if sentences and len(part) < MIN_SENTENCE_CHARS:
+                sentences[-1] += part
+            else:
+                sentences.append(part)
+    return sentences
+
+
+class SentenceStream:
+    """增量切句：AI回复逐段到达，凑满一句就交给合成，不必等整段回复"""
+    
+    def __init__(self):
+        self.buffer = ""
+    
+    def feed(self, delta):
+        """送入一段新文本，返回其中已完整的句子"""
+        self.buffer += delta
+        cut = max(self.buffer.rfind(c) for c in "。！？!?；;\n")
+        if cut < 0 and len(self.buffer) > MAX_SENTENCE_CHARS:
+            # 长句迟迟没有句号时按逗号先切出一段
+            cut = max(self.buffer.rfind(c) for c in "，,、：:")
+        if cut < 0 or len(self.buffer[:cut + 1].strip()) < MIN_SENTENCE_CHARS:
+            return []
+        complete, self.buffer = self.buffer[:cut + 1], self.buffer[cut + 1:]
+        return split_sentences(complete)
+    
+    def flush(self):
+        """回复结束，返回剩余文本"""
+        rest, self.buffer = self.buffer, ""
+        return split_sentences(rest)
+
+
+class StageTimer:
+    """语音链路分阶段耗时统计（解码 / 识别 / AI / 合成 / 发送）"""
+    
+    def __init__(self, window=TIMING_WINDOW):
+        self.samples = {}           # 阶段名 -> 最近若干轮耗时(ms)
+        self.window = window
+        self.lock = threading.Lock()
+    
+    @contextmanager
+    def stage(self, name, turn=None):
+        """计时上下文；turn 为本轮耗时字典，便于单轮打印"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000, turn)
+    
+    def record(self, name, elapsed, turn=None):
+        """记录一个耗时样本(ms)"""
+        with self.lock:
+            self.samples.setdefault(name, deque(maxlen=self.window)).append(elapsed)
+        if turn is not None:
+            turn[name] = turn.get(name, 0.0) + elapsed
+    
+    def summary(self):
+        """各阶段 p50/p95/平均 (ms)"""
+        result = {}
+        with self.lock:
+            for name, values in self.samples.items():
+                ordered = sorted(values)
+                result[name] = {
+                    'count': len(ordered),
+                    'p50': ordered[len(ordered) // 2],
+                    'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                    'mean': sum(ordered) / len(ordered),
+                }
+        return result
+    
+    @staticmethod
+    def format_turn(turn):
+        return " | ".join(f"{name} {ms:.0f}ms" for name, ms in turn.items())
+
+class VoiceTurn:
+    """一轮语音对话在流水线中的状态；阶段之间通过有界队列逐块/逐句传递"""
+    
+    _ids = itertools.count(1)
+    
+    def __init__(self, client_addr, sample_rate=DEFAULT_SAMPLE_RATE, sample_width=2):
+        self.id = next(VoiceTurn._ids)
+        self.client_addr = client_addr
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.metadata = {}
+        self.audio = queue.Queue()                         # 上行PCM块，None 表示说完（接收线程不能阻塞）
+        self.sentences = queue.Queue(TURN_QUEUE_SIZE)      # 待合成的句子，None 表示回复结束
+        self.speech = queue.Queue(TURN_QUEUE_SIZE)         # 待发送的 (PCM, 采样率, 采样宽度, 声道数)
+        self.timing = {}                                   # 本轮各阶段耗时(ms)
+        self.created = time.perf_counter()
+        self.speech_end = None                             # 收到说完（结束帧）的时刻
+        self.text = None
+        self.reply_started = False
+        self.speaking = False
+    
+    def read(self, source):
+        """依次取出 source 队列中的数据直到 None；上游超时未送达视为结束"""
+        while True:
+            try:
+                item = source.get(timeout=TURN_TIMEOUT)
+            except queue.Empty:
+                print(f"[警告] 第{self.id}轮等待上游数据超时")
+                return
+            if item is None:
+                return
+            yield item
+
+
+class TurnStage:
+    """流水线的一个阶段：有界等待队列 + 若干工作线程，每个工作线程一次处理一轮对话"""
+    
+    def __init__(self, name, handler, timer, workers=1, queue_size=STAGE_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.timer = timer
+        self.workers = workers
+        self.queue = queue.Queue(queue_size)
+        self.is_running = False
+        self.threads = []
+        self.stats = {'processed': 0, 'rejected': 0, 'errors': 0}
+    
+    def start(self):
+        self.is_running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+    
+    def stop(self):
+        self.is_running = False
+    
+    def submit(self, turn, block=True):
+        """提交一轮对话；block=False 且队列已满时返回 False"""
+        try:
+            self.queue.put((turn, time.perf_counter()), block=block, timeout=TURN_TIMEOUT if block else None)
+            return True
+        except queue.Full:
+            self.stats['rejected'] += 1
+            print(f"[警告] {self.name}阶段队列已满，放弃第{turn.id}轮")
+            return False
+    
+    def _worker(self):
+        while self.is_running:
+            try:
+                turn, queued = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            self.timer.record(f"{self.name}排队", (time.perf_counter() - queued) * 1000, turn.timing)
+            try:
+                self.handler(turn)
+                self.stats['processed'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"[错误] {self.name}阶段处理第{turn.id}轮失败: {e}")
+
+
 class VoiceRecognitionEngine:
     """语音识别引擎"""
     
     def __init__(self):
         self.recognizer = None
-        self.vosk_model = None
+        self.asr_service = None
         self.init_engines()
     
     def init_engines(self):
@@ -58,100 +260,97 @@ class VoiceRecognitionEngine:
                 self.recognizer = sr.Recognizer()
                 print("[语音] SpeechRecognition引擎初始化完成")
             
-            if HAS_VOSK:
-                # 尝试加载VOSK模型
-                model_paths = [
-                    "vosk-model-cn-0.22",
-                    "models/vosk-model-cn-0.22",
-                    "../vosk-model-cn-0.22"
-                ]
-                
-                for path in model_paths:
-                    if os.path.exists(path):
-                        try:
-                            self.vosk_model = vosk.Model(path)
-                            print(f"[语音] VOSK中文模型加载成功: {path}")
-                            break
-                        except Exception as e:
-                            print(f"[警告] VOSK模型加载失败: {e}")
+            # 共享VOSK模型在后台预加载，首个请求到达前即可就绪
+            self.asr_service = ASRService.get_instance()
+            if self.asr_service.is_available():
+                self.asr_service.preload()
+                print(f"[语音] VOSK中文模型后台加载: {self.asr_service.model_dir}")
                 
         except Exception as e:
             print(f"[错误] 语音引擎初始化失败: {e}")
     
-    def recognize_audio(self, audio_data):
-        """识别语音数据"""
+    def recognize_audio(self, audio_data, timer=None, turn=None, sample_rate=DEFAULT_SAMPLE_RATE):
+        """识别语音数据（WAV或裸PCM字节，全程在内存中处理；裸PCM按 sample_rate 解释）"""
+        timer = timer or StageTimer()
         try:
-            # 保存为临时WAV文件
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                tmp_file.write(audio_data)
-                tmp_path = tmp_file.name
+            with timer.stage("解码", turn):
+                pcm, sample_rate, sample_width, channels = read_wav(audio_data, sample_rate)
+            if channels != 1 or sample_width != 2:
+                print(f"[警告] 非16bit单声道音频 ({channels}声道, {sample_width * 8}bit)，识别效果可能下降")
+            
+            # 优先使用VOSK离线识别
+            if self.asr_service and self.asr_service.is_available():
+                with timer.stage("识别", turn):
+                    text = self._recognize_with_vosk(pcm, sample_rate)
+                if text:
+                    return text, "vosk"
             
-            try:
-                # 优先使用VOSK离线识别
-                if self.vosk_model:
-                    text = self._recognize_with_vosk(tmp_path)
-                    if text:
-                        return text, "vosk"
-                
-                # 备用在线识别
-                if self.recognizer:
-                    text = self._recognize_with_sr(tmp_path)
-                    if text:
-                        return text, "online"
-                
-                return None, "failed"
-                
-            finally:
-                # 清理临时文件
-                try:
-                    os.unlink(tmp_path)
-                except:
-                    pass
+            # 备用在线识别
+            if self.recognizer:
+                with timer.stage("在线识别", turn):
+                    text = self._recognize_with_sr(pcm, sample_rate, sample_width)
+                if text:
+                    return text, "online"
+            
+            return None, "failed"
                     
         except Exception as e:
             print(f"[错误] 语音识别失败: {e}")
             return None, "error"
     
-    def _recognize_with_vosk(self, audio_path):
-        """使用VOSK进行离线识别"""
+    def recognize_stream(self, chunks, sample_rate=DEFAULT_SAMPLE_RATE, sample_width=2, timer=None, turn=None):
+        """边接收边识别：chunks 逐块产出PCM，到达即送入VOSK流式会话，说完后只需取最终结果
+
+        "识别" 只计说完之后的收尾耗时；VOSK 无结果时用收齐的音频走在线识别
+        """
+        timer = timer or StageTimer()
+        session = None
+        if self.asr_service and self.asr_service.is_available():
+            session = self.asr_service.open_session(sample_rate)
+        pcm = bytearray()
+        text = None
         try:
-            import json as json_lib
-            
-            # 读取音频文件
-            with wave.open(audio_path, 'rb') as wf:
-                # 创建识别器
-                rec = vosk.KaldiRecognizer(self.vosk_model, wf.getframerate())
-                
-                # 处理音频数据
-                results = []
-                while True:
-                    data = wf.readframes(4000)
-                    if len(data) == 0:
-                        break
-                    
-                    if rec.AcceptWaveform(data):
-                        result = json_lib.loads(rec.Result())
-                        if result.get('text'):
-                            results.append(result['text'])
-                
-                # 获取最终结果
-                final_result = json_lib.loads(rec.FinalResult())
-                if final_result.get('text'):
-                    results.append(final_result['text'])
-                
-                # 合并结果
-                text = ' '.join(results).strip()
-                return text if text else None
+            for chunk in chunks:
+                pcm += chunk
+                if session is not None:
+                    session.feed(chunk)
+            if session is not None:
+                with timer.stage("识别", turn):
+                    text = session.finish()
+        except Exception as e:
+            print(f"[错误] VOSK识别失败: {e}")
+        finally:
+            if session is not None:
+                session.close()
+        if text:
+            return text, "vosk", len(pcm)
+        if pcm and self.recognizer:
+            with timer.stage("在线识别", turn):
+                text = self._recognize_with_sr(pcm, sample_rate, sample_width)
+            if text:
+                return text, "online", len(pcm)
+        return None, "failed", len(pcm)
+    
+    def _recognize_with_vosk(self, pcm, sample_rate):
+        """使用VOSK进行离线识别（从识别器池借出会话，按块零拷贝送入）"""
+        try:
+            session = self.asr_service.open_session(sample_rate)
+            if session is None:
+                return None
+            with session:
+                for i in range(0, len(pcm), VOSK_CHUNK_BYTES):
+                    session.feed(pcm[i:i + VOSK_CHUNK_BYTES])
+                text = session.finish()
+            return text if text else None
                 
         except Exception as e:
             print(f"[错误] VOSK识别失败: {e}")
             return None
     
-    def _recognize_with_sr(self, audio_path):
+    def _recognize_with_sr(self, pcm, sample_rate, sample_width):
         """使用SpeechRecognition进行在线识别"""
         try:
-            with sr.AudioFile(audio_path) as source:
-                audio = self.recognizer.record(source)
+            audio = sr.AudioData(bytes(pcm), sample_rate, sample_width)
             
             # 尝试多种识别引擎
             engines = [
@@ -177,67 +376,154 @@ class VoiceRecognitionEngine:
             print(f"[错误] 在线识别失败: {e}")
             return None
 
-class TextToSpeechEngine:
-    """文本转语音引擎"""
+class TTSBackend:
+    """TTS后端接口：synthesize(text) 返回 (PCM字节, 采样率, 采样宽度, 声道数)，失败返回 None"""
     
-    def __init__(self):
-        self.tts_engine = None
-        self.init_tts()
+    name = "base"
+    
+    def is_available(self):
+        return False
+    
+    def synthesize(self, text):
+        raise NotImplementedError
+
+
+class EspeakBackend(TTSBackend):
+    """espeak-ng 离线合成，WAV 直接从标准输出读回内存，不经过文件系统"""
+    
+    name = "espeak"
+    
+    def __init__(self, voice="cmn", speed=180):
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+        self.voice = voice
+        self.speed = speed
+    
+    def is_available(self):
+        return self.binary is not None
+    
+    def synthesize(self, text):
+        proc = subprocess.run(
+            [self.binary, "-v", self.voice, "-s", str(self.speed), "--stdout", text],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30
+        )
+        if proc.returncode != 0 or not proc.stdout:
+            return None
+        # espeak 通过管道输出时 WAV 头中的长度字段无效，按头部格式直接截取PCM
+        data = proc.stdout
+        channels = int.from_bytes(data[22:24], 'little')
+        sample_rate = int.from_bytes(data[24:28], 'little')
+        sample_width = int.from_bytes(data[34:36], 'little') // 8
+        offset = data.find(b'data', 36) + 8
+        return memoryview(data)[offset:], sample_rate, sample_width, channels
+
+
+class Pyttsx3Backend(TTSBackend):
+    """pyttsx3 合成（只支持输出到文件，临时文件优先放在内存文件系统 /dev/shm）"""
+    
+    name = "pyttsx3"
     
-    def init_tts(self):
-        """初始化TTS引擎"""
+    def __init__(self):
+        self.engine = None
+        self.tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        if not HAS_SPEECH:
+            return
         try:
-            if HAS_SPEECH:
-                self.tts_engine = pyttsx3.init()
-                if self.tts_engine:
-                    # 设置语音参数
-                    self.tts_engine.setProperty('rate', 180)  # 语速
-                    self.tts_engine.setProperty('volume', 0.8)  # 音量
-                    
-                    # 尝试设置中文语音
-                    voices = self.tts_engine.getProperty('voices')
-                    for voice in voices:
-                        if 'chinese' in voice.name.lower() or 'zh' in voice.id.lower():
-                            self.tts_engine.setProperty('voice', voice.id)
-                            break
-                    
-                    print("[语音] TTS引擎初始化完成")
-                
+            self.engine = pyttsx3.init()
+            # 设置语音参数
+            self.engine.setProperty('rate', 180)  # 语速
+            self.engine.setProperty('volume', 0.8)  # 音量
+            
+            # 尝试设置中文语音
+            voices = self.engine.getProperty('voices')
+            for voice in voices:
+                if 'chinese' in voice.name.lower() or 'zh' in voice.id.lower():
+                    self.engine.setProperty('voice', voice.id)
+                    break
         except Exception as e:
-            print(f"[错误] TTS引擎初始化失败: {e}")
+            print(f"[错误] pyttsx3初始化失败: {e}")
+            self.engine = None
     
-    def text_to_speech(self, text):
-        """文本转语音"""
+    def is_available(self):
+        return self.engine is not None
+    
+    def synthesize(self, text):
+        fd, tmp_path = tempfile.mkstemp(suffix='.wav', dir=self.tmp_dir)
+        os.close(fd)
         try:
-            if not self.tts_engine:
+            self.engine.save_to_file(text, tmp_path)
+            self.engine.runAndWait()
+            with open(tmp_path, 'rb') as f:
+                audio_data = f.read()
+            if not audio_data:
                 return None
-            
-            # 生成临时音频文件
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                tmp_path = tmp_file.name
-            
+            return read_wav(audio_data)
+        finally:
             try:
-                # 保存到文件
-                self.tts_engine.save_to_file(text, tmp_path)
-                self.tts_engine.runAndWait()
-                
-                # 读取生成的音频文件
-                with open(tmp_path, 'rb') as f:
-                    audio_data = f.read()
-                
-                print(f"[TTS] 语音合成完成: {len(audio_data)} 字节")
-                return audio_data
-                
-            finally:
-                # 清理临时文件
-                try:
-                    os.unlink(tmp_path)
-                except:
-                    pass
-                    
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+TTS_BACKENDS = {
+    EspeakBackend.name: EspeakBackend,
+    Pyttsx3Backend.name: Pyttsx3Backend,
+}
+
+
+class TextToSpeechEngine:
+    """文本转语音引擎（按优先级选择可用的TTS后端）"""
+    
+    def __init__(self, backend=None):
+        self.backend = None
+        self.init_tts(backend or os.getenv("VOICE_TTS_BACKEND"))
+    
+    def init_tts(self, preferred=None):
+        """初始化TTS引擎；preferred 可以是后端名称或 TTSBackend 实例"""
+        if isinstance(preferred, TTSBackend):
+            self.backend = preferred
+            print(f"[语音] TTS引擎初始化完成: {preferred.name}")
+            return
+        order = ([preferred] if preferred else []) + [name for name in TTS_BACKEND_ORDER if name != preferred]
+        for name in order:
+            backend_cls = TTS_BACKENDS.get(name)
+            if backend_cls is None:
+                print(f"[警告] 未知的TTS后端: {name}")
+                continue
+            try:
+                backend = backend_cls()
+                if backend.is_available():
+                    self.backend = backend
+                    print(f"[语音] TTS引擎初始化完成: {name}")
+                    return
+            except Exception as e:
+                print(f"[警告] TTS后端 {name} 不可用: {e}")
+        print("[警告] 没有可用的TTS后端")
+    
+    def synthesize_pcm(self, text):
+        """文本转PCM，返回 (PCM, 采样率, 采样宽度, 声道数) 或 None"""
+        if not self.backend:
+            return None
+        try:
+            return self.backend.synthesize(text)
         except Exception as e:
             print(f"[错误] 语音合成失败: {e}")
             return None
+    
+    def synthesize_stream(self, text):
+        """逐句合成，依次产出每句的 (PCM, 采样率, 采样宽度, 声道数)；合成失败的句子跳过"""
+        for sentence in split_sentences(text):
+            result = self.synthesize_pcm(sentence)
+            if result is not None:
+                yield result
+    
+    def text_to_speech(self, text):
+        """文本转语音，返回WAV字节"""
+        result = self.synthesize_pcm(text)
+        if result is None:
+            return None
+        audio_data = pcm_to_wav(*result)
+        print(f"[TTS] 语音合成完成: {len(audio_data)} 字节")
+        return audio_data
 
 class AIDialogManager:
     """AI对话管理器"""
@@ -269,12 +555,10 @@ class AIDialogManager:
         except Exception as e:
             print(f"[警告] AI对话初始化失败: {e}")
     
-    def get_ai_response(self, user_text):
-        """获取AI回复"""
-        try:
-            if self.deepseek_api:
-                # 构造医疗对话提示
-                prompt = f"""
+    @staticmethod
+    def _build_prompt(user_text):
+        """构造医疗对话提示"""
+        return f"""
 作为一个专业的AI医疗助手，请回答用户的问题。
 请提供准确、专业但易懂的医疗建议。
 如果涉及严重疾病，请建议用户就医。
@@ -283,8 +567,28 @@ class AIDialogManager:
 
 请用简洁、温和的语气回答，控制在100字以内。
 """
-                
-                response = self.deepseek_api.get_custom_advice(prompt)
+    
+    def stream_ai_response(self, user_text):
+        """逐段产出AI回复文本（DeepSeek 流式输出），供流水线边生成边切句合成"""
+        if not self.deepseek_api:
+            yield self._get_fallback_response(user_text)
+            return
+        produced = False
+        try:
+            for delta in self.deepseek_api.stream_custom_advice(self._build_prompt(user_text), fallback=False,
+                                                                priority=PRIORITY_VOICE):
+                produced = True
+                yield delta
+        except Exception as e:
+            print(f"[错误] AI回复获取失败: {e}")
+        if not produced:
+            yield self._get_fallback_response(user_text)
+    
+    def get_ai_response(self, user_text):
+        """获取AI回复"""
+        try:
+            if self.deepseek_api:
+                response = self.deepseek_api.get_custom_advice(self._build_prompt(user_text), priority=PRIORITY_VOICE)
                 
                 if response and "error" not in response.lower():
                     return response
@@ -327,9 +631,18 @@ class VoiceServer:
         self.voice_send_sock = None
         self.command_sock = None
         
-        # 处理队列
-        self.voice_queue = queue.Queue()
         self.is_running = True
+        self.timer = StageTimer()
+        
+        # 识别 → AI → 合成 → 发送 流水线
+        handlers = {"识别": self.run_recognition, "AI": self.run_ai, "合成": self.run_tts, "发送": self.run_send}
+        self.stages = {name: TurnStage(name, handler, self.timer, STAGE_WORKERS[name])
+                       for name, handler in handlers.items()}
+        
+        # 二进制语音流收发
+        self.voice_receiver = VoiceStreamReceiver(self.on_voice_frame)
+        self.voice_sender = None
+        self.incoming_turns = {}   # (地址, 流ID) -> 正在接收的对话轮，识别队列已满被回绝的为 None
         
         self.init_network()
     
@@ -338,11 +651,13 @@ class VoiceServer:
         try:
             # 接收语音数据
             self.voice_receive_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.voice_receive_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
             self.voice_receive_sock.bind(("0.0.0.0", VOICE_RECEIVE_PORT))
-            self.voice_receive_sock.settimeout(1.0)
+            self.voice_receive_sock.settimeout(POLL_INTERVAL)   # 按时跳过缺帧、收尾过期流
             
             # 发送语音数据
             self.voice_send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.voice_sender = VoiceStreamSender(self.voice_send_sock)
             
             # 命令控制
             self.command_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -361,11 +676,11 @@ class VoiceServer:
         """启动服务器"""
         print("[启动] PC端语音服务器启动中...")
         
-        # 启动处理线程
+        # 启动流水线各阶段和网络线程
+        self.start_stages()
         threads = [
             threading.Thread(target=self.voice_receive_worker, daemon=True),
-            threading.Thread(target=self.command_handler, daemon=True),
-            threading.Thread(target=self.voice_processor, daemon=True)
+            threading.Thread(target=self.command_handler, daemon=True)
         ]
         
         for thread in threads:
@@ -374,70 +689,52 @@ class VoiceServer:
         print("[成功] 语音服务器启动完成")
         return True
     
+    def start_stages(self):
+        """启动 识别 → AI → 合成 → 发送 各阶段的工作线程"""
+        for stage in self.stages.values():
+            stage.start()
+    
     def voice_receive_worker(self):
         """语音接收工作线程"""
         print("[接收] 语音接收线程启动")
-        packet_buffer = {}
         
         while self.is_running:
             try:
-                data, addr = self.voice_receive_sock.recvfrom(8192 + 8)
-                
-                if len(data) < 8:
-                    continue
-                
-                # 解析包头
-                packet_id = int.from_bytes(data[0:4], 'big')
-                total_packets = int.from_bytes(data[4:8], 'big')
-                payload = data[8:]
-                
-                # 缓存分片
-                if total_packets not in packet_buffer:
-                    packet_buffer[total_packets] = {}
-                
-                packet_buffer[total_packets][packet_id] = payload
-                
-                # 检查是否接收完整
-                if len(packet_buffer[total_packets]) == total_packets:
-                    # 重组数据
-                    complete_data = b''.join([
-                        packet_buffer[total_packets][i] 
-                        for i in range(total_packets)
-                    ])
-                    
-                    # 解析语音数据
-                    self.handle_voice_data(complete_data, addr)
-                    
-                    # 清理缓存
-                    del packet_buffer[total_packets]
+                data, addr = self.voice_receive_sock.recvfrom(65535)
+                if not self.voice_receiver.handle_datagram(data, addr):
+                    print(f"[警告] 非语音帧数据来自 {addr[0]}，已忽略")
+                self.voice_receiver.expire_stale()
                 
             except socket.timeout:
-                continue
+                self.voice_receiver.expire_stale()
             except Exception as e:
                 if self.is_running:
                     print(f"[错误] 语音接收错误: {e}")
     
-    def handle_voice_data(self, data, client_addr):
-        """处理接收到的语音数据"""
-        try:
-            # 解析JSON数据包
-            packet = json.loads(data.decode('utf-8'))
-            
-            if packet.get("type") == "voice_data":
-                # 解码音频数据
-                audio_data = base64.b64decode(packet["audio_data"])
-                
-                print(f"[接收] 收到语音数据 ({len(audio_data)} 字节) 来自 {client_addr[0]}")
-                
-                # 添加到处理队列
-                self.voice_queue.put({
-                    "audio_data": audio_data,
-                    "client_addr": client_addr,
-                    "metadata": packet.get("metadata", {})
-                })
-                
-        except Exception as e:
-            print(f"[错误] 语音数据处理失败: {e}")
+    def on_voice_frame(self, client_addr, frame):
+        """按序收到的语音帧：首帧即开启一轮对话进入识别阶段，之后的音频边收边送去识别"""
+        key = (client_addr, frame.stream_id)
+        if key not in self.incoming_turns:
+            turn = VoiceTurn(client_addr, frame.sample_rate, SAMPLE_WIDTHS.get(frame.codec, 2))
+            if not self.stages["识别"].submit(turn, block=False):
+                turn = None
+            self.incoming_turns[key] = turn
+        turn = self.incoming_turns[key]
+        
+        if turn is not None:
+            if frame.flags & FLAG_META:
+                try:
+                    turn.metadata = json.loads(frame.payload.decode('utf-8'))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    pass
+            elif frame.payload:
+                turn.audio.put(frame.payload)
+        
+        if frame.flags & FLAG_END:
+            del self.incoming_turns[key]
+            if turn is not None:
+                turn.speech_end = time.perf_counter()
+                turn.audio.put(None)
     
     def command_handler(self):
         """命令处理线程"""
@@ -482,113 +779,136 @@ class VoiceServer:
         except Exception as e:
             print(f"[错误] 命令处理失败: {e}")
     
-    def voice_processor(self):
-        """语音处理工作线程"""
-        print("[处理] 语音处理线程启动")
+    def run_recognition(self, turn):
+        """识别阶段：音频到达即送入识别，说完后把文本交给AI阶段"""
+        text, engine, audio_bytes = self.recognition_engine.recognize_stream(
+            turn.read(turn.audio), turn.sample_rate, turn.sample_width, self.timer, turn.timing)
+        if not audio_bytes:
+            return
+        print(f"[接收] 第{turn.id}轮语音 {audio_bytes} 字节 来自 {turn.client_addr[0]}")
         
-        while self.is_running:
-            try:
-                if not self.voice_queue.empty():
-                    voice_task = self.voice_queue.get()
-                    self.process_voice_recognition(voice_task)
-                else:
-                    time.sleep(0.1)
-                    
-            except Exception as e:
-                print(f"[错误] 语音处理错误: {e}")
+        if text:
+            print(f"[识别] 识别结果({engine}): {text}")
+            turn.text = text
+            self.stages["AI"].submit(turn)
+        else:
+            print("[失败] 语音识别失败")
+            self.say(turn, "抱歉，我没有听清楚，请重新说一遍。")
     
-    def process_voice_recognition(self, voice_task):
-        """处理语音识别"""
+    def run_ai(self, turn):
+        """AI阶段：回复按句切分，每凑满一句立即交给合成阶段"""
+        start = time.perf_counter()
+        splitter = SentenceStream()
+        reply = ""
+        for delta in self.ai_manager.stream_ai_response(turn.text):
+            reply += delta
+            for sentence in splitter.feed(delta):
+                self.put_sentence(turn, sentence)
+        for sentence in splitter.flush():
+            self.put_sentence(turn, sentence)
+        self.timer.record("AI", (time.perf_counter() - start) * 1000, turn.timing)
+        print(f"[AI] AI回复: {reply}")
+        self.end_reply(turn)
+    
+    def run_tts(self, turn):
+        """合成阶段：逐句合成，第一句合成完即交给发送阶段"""
+        for sentence in turn.read(turn.sentences):
+            with self.timer.stage("合成", turn.timing):
+                chunk = self.tts_engine.synthesize_pcm(sentence)
+            if chunk is None:
+                continue
+            if not turn.speaking:
+                turn.speaking = True
+                self.stages["发送"].submit(turn)
+            turn.speech.put(chunk, timeout=TURN_TIMEOUT)
+        if turn.speaking:
+            turn.speech.put(None, timeout=TURN_TIMEOUT)
+        else:
+            print("[警告] 语音合成失败")
+            self.finish_turn(turn)
+    
+    def run_send(self, turn):
+        """发送阶段：合成好的句子按序写入发往开发板的语音流"""
+        addr = (turn.client_addr[0], VOICE_SEND_PORT)
+        stream = None
+        sent_bytes = 0
         try:
-            audio_data = voice_task["audio_data"]
-            client_addr = voice_task["client_addr"]
-            
-            print("[识别] 开始语音识别...")
-            
-            # 语音识别
-            text, engine = self.recognition_engine.recognize_audio(audio_data)
-            
-            if text:
-                print(f"[识别] 识别结果({engine}): {text}")
-                
-                # 获取AI回复
-                ai_response = self.ai_manager.get_ai_response(text)
-                print(f"[AI] AI回复: {ai_response}")
-                
-                # 语音合成
-                tts_audio = self.tts_engine.text_to_speech(ai_response)
-                
-                if tts_audio:
-                    # 发送合成语音到开发板
-                    self.send_tts_to_board(tts_audio, client_addr)
-                else:
-                    print("[警告] 语音合成失败")
-            else:
-                print("[失败] 语音识别失败")
-                # 发送错误提示
-                error_msg = "抱歉，我没有听清楚，请重新说一遍。"
-                error_audio = self.tts_engine.text_to_speech(error_msg)
-                if error_audio:
-                    self.send_tts_to_board(error_audio, client_addr)
-                    
-        except Exception as e:
-            print(f"[错误] 语音识别处理失败: {e}")
+            for pcm, sample_rate, sample_width, channels in turn.read(turn.speech):
+                with self.timer.stage("发送", turn.timing):
+                    if stream is not None and (stream.sample_rate, stream.channels) != (sample_rate, channels):
+                        stream.end()
+                        stream = None
+                    if stream is None:
+                        stream = self.voice_sender.open_stream(
+                            addr, sample_rate, sample_width, channels,
+                            metadata={"type": "tts_audio", "timestamp": datetime.now().isoformat()}
+                        )
+                        if sent_bytes == 0:
+                            # 说完（或收到TTS请求）到开发板收到第一句的耗时
+                            since = turn.speech_end or turn.created
+                            self.timer.record("首句", (time.perf_counter() - since) * 1000, turn.timing)
+                    stream.write(pcm)
+                sent_bytes += len(pcm)
+        finally:
+            if stream is not None:
+                stream.end()
+            if sent_bytes:
+                print(f"[发送] TTS音频已发送到开发板 ({sent_bytes} 字节)")
+            self.finish_turn(turn)
+    
+    def put_sentence(self, turn, sentence):
+        """把一句回复交给合成阶段；本轮第一句时把本轮提交到合成阶段"""
+        if not turn.reply_started:
+            turn.reply_started = True
+            self.stages["合成"].submit(turn)
+        turn.sentences.put(sentence, timeout=TURN_TIMEOUT)
+    
+    def end_reply(self, turn):
+        """回复文本结束"""
+        if turn.reply_started:
+            turn.sentences.put(None, timeout=TURN_TIMEOUT)
+        else:
+            self.finish_turn(turn)
+    
+    def say(self, turn, text):
+        """不经AI，直接合成播报一段文本"""
+        for sentence in split_sentences(text):
+            self.put_sentence(turn, sentence)
+        self.end_reply(turn)
+    
+    def finish_turn(self, turn):
+        """一轮结束：记录总耗时并打印本轮各阶段耗时"""
+        self.timer.record("总计", (time.perf_counter() - (turn.speech_end or turn.created)) * 1000, turn.timing)
+        print(f"[耗时] 第{turn.id}轮: {StageTimer.format_turn(turn.timing)}")
     
     def process_tts_request(self, text, client_addr):
         """处理TTS请求"""
-        try:
-            print(f"[TTS] 处理文本转语音: {text}")
-            
-            audio_data = self.tts_engine.text_to_speech(text)
-            
-            if audio_data:
-                self.send_tts_to_board(audio_data, client_addr)
-            else:
-                print("[失败] 语音合成失败")
-                
-        except Exception as e:
-            print(f"[错误] TTS处理失败: {e}")
+        print(f"[TTS] 处理文本转语音: {text}")
+        self.say(VoiceTurn(client_addr), text)
     
-    def send_tts_to_board(self, audio_data, client_addr):
-        """发送TTS音频到开发板"""
-        try:
-            # 编码音频数据
-            audio_b64 = base64.b64encode(audio_data).decode('utf-8')
-            
-            # 构造数据包
-            packet = {
-                "type": "tts_audio",
-                "timestamp": datetime.now().isoformat(),
-                "audio_data": audio_b64,
-                "format": "wav"
-            }
-            
-            # 分片发送
-            packet_json = json.dumps(packet)
-            packet_bytes = packet_json.encode('utf-8')
-            
-            max_packet_size = 8192
-            total_packets = (len(packet_bytes) + max_packet_size - 1) // max_packet_size
-            
-            for i in range(total_packets):
-                start = i * max_packet_size
-                end = min(start + max_packet_size, len(packet_bytes))
-                
-                header = i.to_bytes(4, 'big') + total_packets.to_bytes(4, 'big')
-                packet_chunk = header + packet_bytes[start:end]
-                
-                self.voice_send_sock.sendto(packet_chunk, (client_addr[0], VOICE_SEND_PORT))
-                time.sleep(0.01)
-            
-            print(f"[发送] TTS音频已发送到开发板 ({len(audio_data)} 字节)")
-            
-        except Exception as e:
-            print(f"[错误] TTS发送失败: {e}")
+    def print_stats(self):
+        """打印各阶段耗时统计"""
+        stats = self.voice_receiver.stats
+        print(f"[统计] 语音帧: 接收 {stats['frames']}, 丢失 {stats['lost_frames']}, "
+              f"迟到 {stats['late_frames']}, 截断流 {stats['truncated_streams']}")
+        for stage in self.stages.values():
+            print(f"[统计] {stage.name}阶段: 完成 {stage.stats['processed']}, "
+                  f"回绝 {stage.stats['rejected']}, 出错 {stage.stats['errors']}")
+        summary = self.timer.summary()
+        if not summary:
+            return
+        print("[统计] 语音链路分阶段耗时(ms):")
+        for name, stat in summary.items():
+            print(f"   {name}: p50={stat['p50']:.0f} p95={stat['p95']:.0f} "
+                  f"平均={stat['mean']:.0f} (n={stat['count']})")
     
     def stop_server(self):
         """停止服务器"""
         print("[停止] 正在关闭语音服务器...")
         self.is_running = False
+        for stage in self.stages.values():
+            stage.stop()
+        self.print_stats()
         
         # 关闭套接字
         for sock in [self.voice_receive_sock, self.voice_send_sock, self.command_sock]:
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI 治疗建议缓存
+治疗建议的提示词只随 疾病名称 与 置信度区间 变化，DeepSeek 回复按
+(模型, 提示词模板版本, 疾病名称, 置信度区间) 缓存在 SQLite 中，同一疾病的重复诊断不再请求网络。
+由 visualization_test2.py 的 DeepSeekAPI 使用（进程内共享一个实例，见 get_advice_cache）
+
+用法:
+    cache = AdviceCache(ttl_days=30, max_entries=500, bucket_width=0.1)
+    advice = cache.get(model, template_version, disease_name, confidence)
+    if advice is None:
+        advice = request_advice(...)
+        cache.put(model, template_version, disease_name, confidence, advice)
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+
+class AdviceCache:
+    """AI治疗建议缓存（SQLite）
+
+    治疗建议的提示词只随 疾病名称 与 置信度 变化，以
+    疾病名称 + 置信度区间 + 提示词模板版本 + 模型 为键缓存 API 回复；
+    同一疾病的重复诊断直接返回缓存，不再请求网络。超过有效期的条目视为未命中，
+    条目数超出上限时按最近访问时间淘汰。使用一个长连接，所有访问都在 self.lock 内串行执行。
+    """
+
+    def __init__(self, ttl_days=30, max_entries=500, bucket_width=0.1, db_path=None):
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.bucket_width = bucket_width
+        if db_path is None:
+            db_dir = os.path.join(os.path.expanduser("~"), "EyeDiseaseDetectorHistory")
+            os.makedirs(db_dir, exist_ok=True)
+            db_path = os.path.join(db_dir, "advice_cache.db")
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.conn = None
+        self.enabled = self._init_db()
+
+    def _init_db(self):
+        try:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            with self.conn as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS advice (
+                        model TEXT NOT NULL,
+                        template_version INTEGER NOT NULL,
+                        disease_name TEXT NOT NULL,
+                        bucket INTEGER NOT NULL,
+                        advice TEXT NOT NULL,
+                        created REAL NOT NULL,
+                        last_access REAL NOT NULL,
+                        PRIMARY KEY (model, template_version, disease_name, bucket)
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_advice_last_access ON advice(last_access)")
+            return True
+        except sqlite3.Error as e:
+            print(f"[AdviceCache] 建议缓存不可用: {e}")
+            return False
+
+    def bucket(self, confidence):
+        """置信度所在区间的序号（区间宽度 bucket_width）"""
+        count = max(1, int(round(1 / self.bucket_width)))
+        return min(count - 1, max(0, int(float(confidence) * count)))
+
+    def bucket_range(self, confidence):
+        """置信度所在区间 (下限, 上限)，用于构建提示词"""
+        index = self.bucket(confidence)
+        return index * self.bucket_width, min(1.0, (index + 1) * self.bucket_width)
+
+    def get(self, model, template_version, disease_name, confidence, now=None):
+        """返回缓存的建议文本，未命中或已过期返回 None"""
+        if not self.enabled:
+            return None
+        key = (model, template_version, disease_name, self.bucket(confidence))
+        now = time.time() if now is None else now
+        with self.lock:
+            try:
+                with self.conn as conn:
+                    row = conn.execute(
+                        "SELECT advice, created FROM advice WHERE model = ? AND template_version = ? "
+                        "AND disease_name = ? AND bucket = ?", key
+                    ).fetchone()
+                    if row and now - row[1] > self.ttl:
+                        conn.execute("DELETE FROM advice WHERE model = ? AND template_version = ? "
+                                     "AND disease_name = ? AND bucket = ?", key)
+                        self.expired += 1
+                        row = None
+                    elif row:
+                        conn.execute("UPDATE advice SET last_access = ? WHERE model = ? AND template_version = ? "
+                                     "AND disease_name = ? AND bucket = ?", (now,) + key)
+            except sqlite3.Error as e:
+                print(f"[AdviceCache] 读取建议缓存失败: {e}")
+                row = None
+            if row:
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, model, template_version, disease_name, confidence, advice, now=None):
+        """写入一条 API 生成的建议"""
+        if not self.enabled or not advice:
+            return
+        now = time.time() if now is None else now
+        with self.lock:
+            try:
+                with self.conn as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO advice (model, template_version, disease_name, bucket, advice, "
+                        "created, last_access) VALUES (?,?,?,?,?,?,?)",
+                        (model, template_version, disease_name, self.bucket(confidence), advice, now, now)
+                    )
+                    self._trim(conn, now)
+            except sqlite3.Error as e:
+                print(f"[AdviceCache] 写入建议缓存失败: {e}")
+
+    def _trim(self, conn, now):
+        """删除过期条目，超出上限时按最近访问时间淘汰"""
+        conn.execute("DELETE FROM advice WHERE created < ?", (now - self.ttl,))
+        excess = conn.execute("SELECT COUNT(*) FROM advice").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM advice WHERE rowid IN "
+                "(SELECT rowid FROM advice ORDER BY last_access ASC LIMIT ?)", (excess,)
+            )
+
+    def close(self):
+        """关闭缓存连接"""
+        with self.lock:
+            self.enabled = False
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
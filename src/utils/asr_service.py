@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程级共享的 Vosk 离线语音识别服务
+- 模型在整个进程中只加载一次，可在启动时后台预热
+- KaldiRecognizer 按采样率池化复用（Reset 后归还），避免每次识别重新构图
+- 流式会话：音频到达即送入识别器，说话结束时只需取最终结果，无需再整段解码
+
+用法:
+    service = ASRService.get_instance()
+    service.preload()                       # 启动时后台加载
+    session = service.open_session(16000)   # 模型未就绪时返回 None
+    for chunk in audio_chunks:              # 何时停止录音由调用方的 VAD 决定
+        session.feed(chunk)                 # 返回 True 表示 Vosk 检测到一个分句结束
+    text = session.finish()
+"""
+
+import os
+import json
+import queue
+import threading
+
+try:
+    import vosk
+    HAS_VOSK = True
+except ImportError:
+    HAS_VOSK = False
+
+# ===== 配置参数 =====
+MODEL_NAMES = ["vosk-model-small-cn-0.22", "vosk-model-cn-0.22"]   # 按优先级搜索
+POOL_SIZE = 2              # 每个采样率保留的空闲识别器数量
+# ===================
+
+_PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+
+def find_model_dir(extra_dirs=None):
+    """按 VOSK_MODEL_PATH → 指定目录 → 工作目录 → 项目根目录 → models/ 的顺序查找模型目录"""
+    env_path = os.getenv("VOSK_MODEL_PATH", "")
+    if env_path and os.path.isdir(env_path):
+        return env_path
+    roots = list(extra_dirs or []) + [os.getcwd(), _PROJECT_ROOT, os.path.join(_PROJECT_ROOT, "models")]
+    for name in MODEL_NAMES:
+        for root in roots:
+            path = os.path.join(root, name)
+            if os.path.isdir(path):
+                return path
+    return None
+
+
+class StreamingSession:
+    """一次流式识别会话，持有一个从池中借出的识别器"""
+
+    def __init__(self, service, recognizer, sample_rate):
+        self.service = service
+        self.recognizer = recognizer
+        self.sample_rate = sample_rate
+        self.segments = []
+        self.closed = False
+
+    def feed(self, pcm_bytes):
+        """送入一段 16-bit 单声道 PCM，返回 True 表示 Vosk 检测到一句话结束"""
+        if self.recognizer.AcceptWaveform(bytes(pcm_bytes)):
+            text = json.loads(self.recognizer.Result()).get("text", "").strip()
+            if text:
+                self.segments.append(text)
+            return True
+        return False
+
+    def partial(self):
+        """当前未结束句子的中间结果"""
+        return json.loads(self.recognizer.PartialResult()).get("partial", "").strip()
+
+    def text(self):
+        """已结束句子的识别文本"""
+        return " ".join(self.segments).strip()
+
+    def finish(self):
+        """取最终结果并归还识别器"""
+        if self.closed:
+            return self.text()
+        text = json.loads(self.recognizer.FinalResult()).get("text", "").strip()
+        if text:
+            self.segments.append(text)
+        self.close()
+        return self.text()
+
+    def close(self):
+        """放弃本次会话并归还识别器"""
+        if not self.closed:
+            self.closed = True
+            self.service._release(self.recognizer, self.sample_rate)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ASRService:
+    """共享 Vosk 模型与识别器池（线程安全）"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        """进程内唯一实例"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self, model_dir=None, pool_size=POOL_SIZE):
+        self.model_dir = model_dir or (find_model_dir() if HAS_VOSK else None)
+        self.pool_size = pool_size
+        self.model = None
+        self.ready = threading.Event()       # 加载结束（无论成功与否）
+        self.load_lock = threading.Lock()
+        self.load_thread = None
+        self.pools = {}                      # 采样率 -> 空闲识别器队列
+        self.pools_lock = threading.Lock()
+        self.stats = {'sessions': 0, 'recognizers_created': 0, 'recognizers_reused': 0}
+
+    def is_available(self):
+        """Vosk 已安装且找到模型目录"""
+        return HAS_VOSK and self.model_dir is not None
+
+    def is_ready(self):
+        return self.model is not None
+
+    def preload(self):
+        """后台加载模型（幂等），返回加载完成事件"""
+        with self.load_lock:
+            if self.load_thread is None:
+                if not self.is_available():
+                    self.ready.set()
+                    return self.ready
+                self.load_thread = threading.Thread(target=self._load, daemon=True)
+                self.load_thread.start()
+        return self.ready
+
+    def wait_ready(self, timeout=None):
+        """等待模型加载，返回模型是否可用"""
+        self.preload().wait(timeout)
+        return self.model is not None
+
+    def _load(self):
+        try:
+            print(f"[ASR] 正在加载Vosk模型: {self.model_dir}")
+            vosk.SetLogLevel(-1)
+            self.model = vosk.Model(self.model_dir)
+            print("[ASR] Vosk模型加载完成")
+        except Exception as e:
+            print(f"[ASR] Vosk模型加载失败: {e}")
+            self.model = None
+        finally:
+            self.ready.set()
+
+    def open_session(self, sample_rate=16000, wait=None):
+        """借出识别器开始流式会话；模型不可用（或在 wait 秒内未加载完）时返回 None"""
+        if self.model is None and not self.wait_ready(wait):
+            return None
+        sample_rate = int(sample_rate)
+        with self.pools_lock:
+            pool = self.pools.setdefault(sample_rate, queue.LifoQueue())
+            recognizer = None
+            try:
+                recognizer = pool.get_nowait()
+                self.stats['recognizers_reused'] += 1
+            except queue.Empty:
+                self.stats['recognizers_created'] += 1
+            self.stats['sessions'] += 1
+        if recognizer is None:
+            recognizer = vosk.KaldiRecognizer(self.model, sample_rate)
+        return StreamingSession(self, recognizer, sample_rate)
+
+    def _release(self, recognizer, sample_rate):
+        try:
+            recognizer.Reset()
+        except Exception:
+            return  # 状态不确定的识别器直接丢弃
+        pool = self.pools.get(sample_rate)
+        if pool is not None and pool.qsize() < self.pool_size:
+            pool.put(recognizer)
+
+    def recognize(self, pcm_bytes, sample_rate=16000, chunk_size=8000, wait=None):
+        """整段 PCM 识别（内部仍按块流式送入），模型不可用时返回 None"""
+        session = self.open_session(sample_rate, wait=wait)
+        if session is None:
+            return None
+        try:
+            data = memoryview(pcm_bytes)
+            for i in range(0, len(data), chunk_size):
+                session.feed(data[i:i + chunk_size])
+            return session.finish()
+        finally:
+            session.close()
@@ -2,454 +2,447 @@
 # -*- coding: utf-8 -*-
 """
 延迟优化模块
-专门用于优化开发板触摸屏显示延迟问题
-包含多种优化策略和技术
+屏幕共享（wifi_pc_sender_* → wifi_pc_receiver_2.0.py）与开发板摄像头视频流
+（NetworkManager.send_stream_frame → BoardCameraReceiver）共享的闭环自适应控制：
+1. 接收端 OptimizedReceiver 统计到达/丢失的帧与分片、解码耗时，每 0.5 秒经控制通道发送一次反馈；
+   发送端收到反馈立即回显其中的令牌，接收端据此测得 RTT，放进下一次反馈
+2. 发送端 LatencyOptimizer 用 NetworkOptimizer 平滑丢包率与 RTT（RTT 高出最小 RTT 的部分即排队延迟），
+   AdaptiveQualityController 在 (JPEG质量, 分辨率缩放, 帧率) 档位表上移动：
+   丢包、排队延迟、接收端解码跟不上或发送端自身延迟过高时立即降档，持续良好一段时间才升一档；
+   升档后很快又拥塞说明带宽不够（探测失败），下一次升档要等更久
+3. FramePreprocessor 按当前档位缩放并整帧 JPEG 编码（摄像头流）；屏幕共享的瓦片编码在 screen_codec 中，
+   由发送流水线按档位设置质量、截屏缩放和帧率
+控制消息（与屏幕共享 HELLO 0x10 共用控制端口，鼠标指令首字节为 0x00~0x02）：
+  反馈 [0x11][4字节令牌][2字节RTT ms][2字节帧数][2字节丢帧数][4字节分片数][4字节丢失分片数]
+       [2字节解码耗时 p95，单位0.1ms][2字节统计区间 ms]
+  回显 [0x12][4字节令牌]
 """
 
 import cv2
-import numpy as np
 import time
-import threading
-import queue
+import struct
 import socket
-from collections import deque
-import math
+import threading
+from collections import deque, namedtuple
 
 # ===== 优化配置 =====
-# 帧率优化
-TARGET_FPS = 60              # 目标帧率
-MIN_FPS = 30                 # 最低帧率
-ADAPTIVE_QUALITY = True      # 自适应质量调整
-
-# 预测优化
-MOTION_PREDICTION = True     # 运动预测
-PREDICTION_FRAMES = 2        # 预测帧数
-PREDICTION_STRENGTH = 0.3    # 预测强度
-
-# 缓存优化
-FRAME_BUFFER_SIZE = 3        # 帧缓存大小
-DECODE_THREADS = 2           # 解码线程数
-
-# 网络优化
-PACKET_PRIORITIZATION = True # 数据包优先级
-ADAPTIVE_COMPRESSION = True  # 自适应压缩
+FEEDBACK_INTERVAL = 0.5      # 接收端反馈间隔(秒)
+
+# 档位表：(JPEG质量, 分辨率缩放, 帧率)，从好到差；拥塞时先降质量，再降帧率和分辨率
+SCREEN_LEVELS = ((85, 1.0, 30), (75, 1.0, 30), (65, 1.0, 30), (55, 0.75, 24),
+                 (50, 0.75, 20), (45, 0.5, 15), (40, 0.5, 10))
+SCREEN_START_LEVEL = 1       # 质量75、原分辨率、30fps（原固定设置）
+CAMERA_LEVELS = ((75, 1.0, 15), (60, 1.0, 15), (50, 0.75, 12), (45, 0.5, 10), (40, 0.5, 6))
+CAMERA_START_LEVEL = 1       # 质量60、15fps（原固定设置）
+
+# 降档/升档条件
+LOSS_HIGH = 0.05             # 丢包率超过即降档
+LOSS_SEVERE = 0.20           # 超过时一次降两档
+LOSS_LOW = 0.01              # 低于才算良好
+QUEUE_DELAY_HIGH = 80.0      # 排队延迟(ms)超过即降档
+DECODE_BUDGET = 0.8          # 接收端解码耗时超过帧间隔的该比例即降档（开发板CPU跟不上）
+SEND_LATENCY_FRAMES = 3      # 发送端采集到发完的延迟超过该帧数间隔即降档（PC端编码跟不上）
+DOWN_HOLD = 1.0              # 降档后至少间隔(秒)再降，等队列排空，避免一次拥塞连降多档
+UP_AFTER = 2.0               # 持续良好多久(秒)升一档
+UP_AFTER_MAX = 16.0          # 探测失败后升档等待的上限(秒)
+PROBE_WINDOW = 2.0           # 升档后该时间内出现拥塞视为探测失败
+EWMA_ALPHA = 0.5             # 丢包率/RTT 平滑系数
+RTT_BASE_WINDOW = 30.0       # 最小RTT的统计窗口(秒)
+RTT_BASE_MAX = 30.0          # 基准RTT上限(ms)：两端在同一局域网，首批样本已含排队时不把排队当成基准
+
+# 控制消息
+CONTROL_FEEDBACK = 0x11
+CONTROL_ECHO = 0x12
+FEEDBACK = struct.Struct('!BIHHHIIHH')
+ECHO = struct.Struct('!BI')
 # ===================
 
-class MotionPredictor:
-    """运动预测器 - 预测下一帧的显示位置"""
-    
-    def __init__(self, history_size=5):
-        self.history_size = history_size
-        self.position_history = deque(maxlen=history_size)
-        self.time_history = deque(maxlen=history_size)
-        
-    def add_position(self, x, y, timestamp=None):
-        """添加位置历史"""
-        if timestamp is None:
-            timestamp = time.time()
-            
-        self.position_history.append((x, y))
-        self.time_history.append(timestamp)
-    
-    def predict_position(self, future_time_offset):
-        """预测未来位置"""
-        if len(self.position_history) < 2:
-            return None
-            
-        # 计算平均速度
-        positions = list(self.position_history)
-        times = list(self.time_history)
-        
-        # 线性回归预测
-        if len(positions) >= 3:
-            # 使用最近3个点进行预测
-            recent_positions = positions[-3:]
-            recent_times = times[-3:]
-            
-            # 计算速度向量
-            vx = (recent_positions[-1][0] - recent_positions[0][0]) / (recent_times[-1] - recent_times[0])
-            vy = (recent_positions[-1][1] - recent_positions[0][1]) / (recent_times[-1] - recent_times[0])
-            
-            # 预测位置
-            last_pos = positions[-1]
-            predicted_x = last_pos[0] + vx * future_time_offset
-            predicted_y = last_pos[1] + vy * future_time_offset
-            
-            return (int(predicted_x), int(predicted_y))
-        
+StreamSettings = namedtuple('StreamSettings', 'quality scale fps')
+
+
+class StreamReport(namedtuple('StreamReport', 'rtt_ms frames lost_frames packets lost_packets decode_ms interval')):
+    """一次接收端反馈（计数均为该统计区间内的增量）"""
+    __slots__ = ()
+
+    @property
+    def loss(self):
+        """丢失率：分片丢失率与丢帧率取大者；区间内没有任何数据时返回 None"""
+        rates = []
+        if self.packets + self.lost_packets:
+            rates.append(self.lost_packets / (self.packets + self.lost_packets))
+        if self.frames + self.lost_frames:
+            rates.append(self.lost_frames / (self.frames + self.lost_frames))
+        return max(rates) if rates else None
+
+
+def feedback_message(token, report):
+    clamp = lambda value, bits: max(0, min(round(value), (1 << bits) - 1))
+    return FEEDBACK.pack(CONTROL_FEEDBACK, token & 0xFFFFFFFF, clamp(report.rtt_ms, 16),
+                         clamp(report.frames, 16), clamp(report.lost_frames, 16),
+                         clamp(report.packets, 32), clamp(report.lost_packets, 32),
+                         clamp(report.decode_ms * 10, 16), clamp(report.interval * 1000, 16))
+
+
+def parse_feedback(data):
+    """控制消息是反馈时返回 (令牌, StreamReport)，否则返回 None"""
+    if len(data) != FEEDBACK.size or data[0] != CONTROL_FEEDBACK:
+        return None
+    _, token, rtt_ms, frames, lost_frames, packets, lost_packets, decode, interval = FEEDBACK.unpack(data)
+    return token, StreamReport(rtt_ms, frames, lost_frames, packets, lost_packets, decode / 10, interval / 1000)
+
+
+def echo_message(token):
+    return ECHO.pack(CONTROL_ECHO, token)
+
+
+def parse_echo(data):
+    """控制消息是回显时返回令牌，否则返回 None"""
+    if len(data) != ECHO.size or data[0] != CONTROL_ECHO:
         return None
+    return ECHO.unpack(data)[1]
+
 
 class AdaptiveQualityController:
-    """自适应质量控制器"""
-    
-    def __init__(self):
-        self.current_quality = 75
-        self.min_quality = 30
-        self.max_quality = 95
+    """自适应质量控制器：在 (JPEG质量, 分辨率缩放, 帧率) 档位表上按网络与两端负载移动"""
+
+    def __init__(self, levels=SCREEN_LEVELS, level=SCREEN_START_LEVEL):
+        self.levels = levels
+        self.level = level
+        self.min_quality = min(q for q, _, _ in levels)
+        self.max_quality = max(q for q, _, _ in levels)
         self.fps_history = deque(maxlen=10)
         self.latency_history = deque(maxlen=10)
-        
+        self.last_down = float('-inf')
+        self.last_up = float('-inf')
+        self.good_since = None
+        self.up_after = UP_AFTER
+        self.probing = False            # 升档后尚未出现拥塞（每次探测最多加倍一次升档等待）
+        self.last_reason = ""
+        self.changes = 0
+
+    @property
+    def current_quality(self):
+        return self.levels[self.level][0]
+
+    @property
+    def scale(self):
+        return self.levels[self.level][1]
+
+    @property
+    def fps(self):
+        return self.levels[self.level][2]
+
     def update_metrics(self, fps, latency_ms):
-        """更新性能指标"""
+        """更新发送端本地指标（实际帧率、采集到发完的延迟）"""
         self.fps_history.append(fps)
         self.latency_history.append(latency_ms)
-        
+
     def get_optimal_quality(self):
-        """获取最优质量设置"""
-        if not self.fps_history or not self.latency_history:
-            return self.current_quality
-            
-        avg_fps = sum(self.fps_history) / len(self.fps_history)
-        avg_latency = sum(self.latency_history) / len(self.latency_history)
-        
-        # 根据FPS调整质量
-        if avg_fps < MIN_FPS:
-            # 帧率过低，降低质量
-            self.current_quality = max(self.min_quality, self.current_quality - 5)
-        elif avg_fps > TARGET_FPS * 0.9 and avg_latency < 50:
-            # 性能良好，可以提高质量
-            self.current_quality = min(self.max_quality, self.current_quality + 2)
-        
-        # 根据延迟调整质量
-        if avg_latency > 100:  # 延迟超过100ms
-            self.current_quality = max(self.min_quality, self.current_quality - 8)
-        elif avg_latency < 30:  # 延迟很低
-            self.current_quality = min(self.max_quality, self.current_quality + 3)
-            
+        """当前档位的 JPEG 质量"""
         return self.current_quality
 
+    def congestion_reasons(self, network, decode_ms):
+        """返回需要降档的原因列表（为空表示没有拥塞）"""
+        frame_ms = 1000.0 / self.fps
+        reasons = []
+        if network.packet_loss_rate > LOSS_HIGH:
+            reasons.append(f"丢包 {network.packet_loss_rate:.0%}")
+        if network.queue_delay > QUEUE_DELAY_HIGH:
+            reasons.append(f"排队延迟 {network.queue_delay:.0f}ms")
+        if decode_ms > DECODE_BUDGET * frame_ms:
+            reasons.append(f"接收端解码 {decode_ms:.0f}ms")
+        if self.latency_history:
+            send_latency = sum(self.latency_history) / len(self.latency_history)
+            if send_latency > SEND_LATENCY_FRAMES * frame_ms:
+                reasons.append(f"发送延迟 {send_latency:.0f}ms")
+        return reasons
+
+    def evaluate(self, network, decode_ms=0.0, now=None):
+        """根据最新的网络状态与解码耗时调整档位，档位变化时返回 True（原因见 last_reason）"""
+        now = time.monotonic() if now is None else now
+        reasons = self.congestion_reasons(network, decode_ms)
+        if reasons:
+            self.good_since = None
+            if self.probing and now - self.last_up < PROBE_WINDOW:
+                self.up_after = min(UP_AFTER_MAX, self.up_after * 2)   # 刚升档就拥塞：下次多等一会
+            self.probing = False
+            if now - self.last_down < DOWN_HOLD:
+                return False
+            step = 2 if network.packet_loss_rate > LOSS_SEVERE else 1
+            return self._move(step, now, "、".join(reasons))
+
+        if network.packet_loss_rate >= LOSS_LOW or network.queue_delay > QUEUE_DELAY_HIGH / 2:
+            self.good_since = None
+            return False
+        if self.good_since is None:
+            self.good_since = now
+        if now - self.last_up > UP_AFTER_MAX * 2:
+            self.up_after = UP_AFTER        # 长时间稳定，恢复正常的升档节奏
+        if self.level > 0 and now - self.good_since >= self.up_after:
+            self.good_since = now
+            return self._move(-1, now, f"持续良好 {self.up_after:.0f}s")
+        return False
+
+    def _move(self, step, now, reason):
+        level = max(0, min(len(self.levels) - 1, self.level + step))
+        if level == self.level:
+            return False
+        if step > 0:
+            self.last_down = now
+        else:
+            self.last_up = now
+        self.probing = step < 0
+        self.level = level
+        self.last_reason = reason
+        self.changes += 1
+        return True
+
 class FramePreprocessor:
-    """帧预处理器 - 优化帧数据减少传输延迟"""
-    
-    def __init__(self):
-        self.prev_frame = None
-        self.motion_areas = []
-        
-    def detect_motion_areas(self, current_frame):
-        """检测运动区域"""
-        if self.prev_frame is None:
-            self.prev_frame = current_frame.copy()
-            return [(0, 0, current_frame.shape[1], current_frame.shape[0])]  # 全屏
-        
-        # 计算帧差
-        diff = cv2.absdiff(current_frame, self.prev_frame)
-        gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-        
-        # 阈值处理
-        _, thresh = cv2.threshold(gray_diff, 30, 255, cv2.THRESH_BINARY)
-        
-        # 形态学操作连接相近区域
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        
-        # 查找轮廓
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        motion_areas = []
-        for contour in contours:
-            if cv2.contourArea(contour) > 500:  # 过滤小区域
-                x, y, w, h = cv2.boundingRect(contour)
-                # 扩展边界以包含更多上下文
-                x = max(0, x - 10)
-                y = max(0, y - 10)
-                w = min(current_frame.shape[1] - x, w + 20)
-                h = min(current_frame.shape[0] - y, h + 20)
-                motion_areas.append((x, y, w, h))
-        
-        # 如果没有检测到运动，返回小的中心区域
-        if not motion_areas:
-            h, w = current_frame.shape[:2]
-            motion_areas = [(w//4, h//4, w//2, h//2)]
-        
-        self.prev_frame = current_frame.copy()
-        self.motion_areas = motion_areas
-        return motion_areas
-    
+    """帧预处理器：按当前档位缩放并整帧 JPEG 编码（开发板摄像头流；屏幕共享只传变化瓦片，见 screen_codec）"""
+
     def create_optimized_frame(self, frame, quality_controller):
-        """创建优化的帧数据"""
-        motion_areas = self.detect_motion_areas(frame)
-        quality = quality_controller.get_optimal_quality()
-        
-        if len(motion_areas) == 1 and motion_areas[0] == (0, 0, frame.shape[1], frame.shape[0]):
-            # 全屏更新，直接压缩
-            encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
-            _, encoded = cv2.imencode('.jpg', frame, encode_params)
-            return encoded.tobytes(), 'full_frame'
-        else:
-            # 仅传输运动区域
-            motion_data = []
-            for x, y, w, h in motion_areas:
-                roi = frame[y:y+h, x:x+w]
-                encode_params = [cv2.IMWRITE_JPEG_QUALITY, min(quality + 10, 95)]  # 运动区域高质量
-                _, encoded = cv2.imencode('.jpg', roi, encode_params)
-                motion_data.append({
-                    'region': (x, y, w, h),
-                    'data': encoded.tobytes()
-                })
-            
-            return motion_data, 'motion_regions'
+        """返回 (JPEG数据, 'full_frame')"""
+        scale = quality_controller.scale
+        if scale < 1.0:
+            height, width = frame.shape[:2]
+            frame = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality_controller.current_quality])
+        if not ok:
+            raise ValueError("JPEG 编码失败")
+        return encoded.tobytes(), 'full_frame'
 
 class OptimizedReceiver:
-    """优化的接收器 - 在开发板端使用"""
-    
-    def __init__(self, display_size):
-        self.display_size = display_size
-        self.frame_buffer = None
-        self.motion_predictor = MotionPredictor()
-        self.decode_queue = queue.Queue(maxsize=FRAME_BUFFER_SIZE)
-        self.display_queue = queue.Queue(maxsize=2)
-        
-        # 启动解码线程
-        for i in range(DECODE_THREADS):
-            threading.Thread(target=self.decode_worker, daemon=True).start()
-        
-        # 启动显示线程
-        threading.Thread(target=self.display_worker, daemon=True).start()
-        
-    def decode_worker(self):
-        """解码工作线程"""
-        while True:
-            try:
-                frame_data, frame_type, timestamp = self.decode_queue.get(timeout=1.0)
-                
-                if frame_type == 'full_frame':
-                    # 完整帧解码
-                    img_array = np.frombuffer(frame_data, dtype=np.uint8)
-                    frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-                    
-                    if frame is not None:
-                        # 调整到显示尺寸
-                        if frame.shape[:2] != self.display_size:
-                            frame = cv2.resize(frame, self.display_size)
-                        self.frame_buffer = frame.copy()
-                        
-                elif frame_type == 'motion_regions':
-                    # 运动区域更新
-                    if self.frame_buffer is not None:
-                        for region_data in frame_data:
-                            x, y, w, h = region_data['region']
-                            img_array = np.frombuffer(region_data['data'], dtype=np.uint8)
-                            roi = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-                            
-                            if roi is not None:
-                                # 调整ROI尺寸
-                                roi_h, roi_w = roi.shape[:2]
-                                if (roi_w, roi_h) != (w, h):
-                                    roi = cv2.resize(roi, (w, h))
-                                
-                                # 更新缓冲区
-                                self.frame_buffer[y:y+h, x:x+w] = roi
-                
-                # 将处理好的帧放入显示队列
-                if self.frame_buffer is not None:
-                    self.display_queue.put((self.frame_buffer.copy(), timestamp))
-                
-                self.decode_queue.task_done()
-                
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"[错误] 解码错误: {e}")
-    
-    def display_worker(self):
-        """显示工作线程"""
-        last_display_time = 0
-        frame_interval = 1.0 / TARGET_FPS
-        
-        while True:
-            try:
-                frame, timestamp = self.display_queue.get(timeout=1.0)
-                
-                current_time = time.time()
-                
-                # 帧率控制
-                if current_time - last_display_time < frame_interval:
-                    time.sleep(frame_interval - (current_time - last_display_time))
-                
-                # 应用运动预测
-                if MOTION_PREDICTION:
-                    frame = self.apply_motion_prediction(frame, current_time)
-                
-                # 显示帧
-                cv2.imshow("Optimized Display", frame)
-                cv2.waitKey(1)
-                
-                last_display_time = time.time()
-                self.display_queue.task_done()
-                
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"[错误] 显示错误: {e}")
-    
-    def apply_motion_prediction(self, frame, current_time):
-        """应用运动预测"""
-        try:
-            # 预测未来位置（假设延迟为30ms）
-            future_offset = 0.03
-            predicted_pos = self.motion_predictor.predict_position(future_offset)
-            
-            if predicted_pos:
-                # 基于预测调整帧（简单的位移补偿）
-                px, py = predicted_pos
-                h, w = frame.shape[:2]
-                
-                # 计算位移量（限制在合理范围内）
-                offset_x = max(-10, min(10, px - w//2))
-                offset_y = max(-10, min(10, py - h//2))
-                
-                # 应用微小的位移补偿
-                if abs(offset_x) > 1 or abs(offset_y) > 1:
-                    M = np.float32([[1, 0, offset_x], [0, 1, offset_y]])
-                    frame = cv2.warpAffine(frame, M, (w, h), borderMode=cv2.BORDER_REPLICATE)
-            
-            return frame
-            
-        except Exception as e:
-            print(f"[警告] 运动预测失败: {e}")
-            return frame
-    
-    def add_frame_data(self, frame_data, frame_type):
-        """添加帧数据到处理队列"""
-        try:
-            timestamp = time.time()
-            self.decode_queue.put((frame_data, frame_type, timestamp), block=False)
-        except queue.Full:
-            # 队列满时丢弃最老的帧
-            try:
-                self.decode_queue.get(block=False)
-                self.decode_queue.put((frame_data, frame_type, timestamp), block=False)
-            except queue.Empty:
-                pass
+    """接收端反馈：统计到达/丢失与解码耗时，每 FEEDBACK_INTERVAL 生成一条反馈；发送端回显令牌后测得 RTT"""
+
+    def __init__(self, interval=FEEDBACK_INTERVAL):
+        self.interval = interval
+        self.last_feedback = float('-inf')
+        self.previous = (0, 0, 0, 0)          # 上次反馈时的累计 (帧, 丢帧, 分片, 丢失分片)
+        self.decode_samples = []
+        self.rtt_ms = 0.0
+        self.sent_tokens = {}                 # 令牌 -> 发送时刻，等待回显
+        self.next_token = 1
+        self.stats = {'feedback': 0, 'echoes': 0}
+
+    def record_decode(self, elapsed_ms):
+        """记录一帧的解码/合成耗时(ms)"""
+        self.decode_samples.append(elapsed_ms)
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return now - self.last_feedback >= self.interval
+
+    @property
+    def waiting_echo(self):
+        return bool(self.sent_tokens)
+
+    def feedback(self, frames, lost_frames=0, packets=0, lost_packets=0, now=None):
+        """由累计计数生成一条反馈消息（计数按与上次反馈的差值发送）"""
+        now = time.monotonic() if now is None else now
+        current = (frames, lost_frames, packets, lost_packets)
+        deltas = [max(0, c - p) for c, p in zip(current, self.previous)]
+        samples = sorted(self.decode_samples)
+        decode_ms = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0
+        interval = min(now - self.last_feedback, 60.0) if self.stats['feedback'] else self.interval
+        report = StreamReport(self.rtt_ms, *deltas, decode_ms, interval)
+
+        token = self.next_token
+        self.next_token = (self.next_token + 1) & 0xFFFFFFFF or 1
+        self.sent_tokens[token] = now
+        if len(self.sent_tokens) > 8:             # 回显丢失的令牌不无限累积
+            self.sent_tokens.pop(next(iter(self.sent_tokens)))
+        self.previous = current
+        self.decode_samples = []
+        self.last_feedback = now
+        self.stats['feedback'] += 1
+        return feedback_message(token, report)
+
+    def on_control(self, data, now=None):
+        """处理发送端的回显，更新 RTT；不是回显时返回 False"""
+        token = parse_echo(data)
+        if token is None:
+            return False
+        sent = self.sent_tokens.pop(token, None)
+        if sent is not None:
+            now = time.monotonic() if now is None else now
+            self.rtt_ms = (now - sent) * 1000
+            self.stats['echoes'] += 1
+        return True
 
 class NetworkOptimizer:
-    """网络优化器"""
-    
+    """网络状态估计：平滑丢包率与 RTT，最近一段时间的最小 RTT（不超过 RTT_BASE_MAX）作为无排队时的基准"""
+
     def __init__(self):
         self.packet_loss_rate = 0.0
         self.rtt = 0.0
         self.bandwidth_mbps = 0.0
-        
-    def optimize_transmission_params(self):
-        """优化传输参数"""
-        params = {
-            'packet_size': MAX_PACKET_SIZE,
-            'send_interval': 0.001,  # 发送间隔
-            'compression_level': 75,
-            'redundancy': False
-        }
-        
-        # 根据网络状况调整参数
-        if self.packet_loss_rate > 0.05:  # 丢包率超过5%
-            params['redundancy'] = True  # 启用冗余传输
-            params['packet_size'] = int(MAX_PACKET_SIZE * 0.8)  # 减小包大小
-        
-        if self.rtt > 100:  # RTT超过100ms
-            params['send_interval'] = 0.0005  # 减少发送间隔
-            params['compression_level'] = 60  # 降低压缩质量换取速度
-        
-        return params
-    
-    def update_network_stats(self, packet_loss, rtt, bandwidth):
-        """更新网络统计"""
-        self.packet_loss_rate = packet_loss
-        self.rtt = rtt
-        self.bandwidth_mbps = bandwidth
+        self.rtt_samples = deque()            # (时刻, RTT)，用于最小 RTT
+        self.base_rtt = 0.0
+
+    @property
+    def queue_delay(self):
+        """RTT 高出基准的部分(ms)，反映链路缓冲中的排队"""
+        return max(0.0, self.rtt - self.base_rtt) if self.rtt else 0.0
+
+    def update_network_stats(self, packet_loss, rtt, bandwidth=None, now=None):
+        """更新网络统计；packet_loss 为 None（区间内没有数据）或 rtt 为 0（尚未测得）时保留原值"""
+        now = time.monotonic() if now is None else now
+        if packet_loss is not None:
+            self.packet_loss_rate += EWMA_ALPHA * (packet_loss - self.packet_loss_rate)
+        if rtt:
+            self.rtt = rtt if not self.rtt else self.rtt + EWMA_ALPHA * (rtt - self.rtt)
+            self.rtt_samples.append((now, rtt))
+            while self.rtt_samples and now - self.rtt_samples[0][0] > RTT_BASE_WINDOW:
+                self.rtt_samples.popleft()
+            self.base_rtt = min(RTT_BASE_MAX, min(sample for _, sample in self.rtt_samples))
+        if bandwidth is not None:
+            self.bandwidth_mbps = bandwidth
 
 class LatencyOptimizer:
-    """主延迟优化器"""
-    
-    def __init__(self):
-        self.quality_controller = AdaptiveQualityController()
+    """主延迟优化器（发送端）：处理接收端反馈，给出当前的质量/缩放/帧率"""
+
+    def __init__(self, levels=SCREEN_LEVELS, level=SCREEN_START_LEVEL, name="视频流"):
+        self.name = name
+        self.quality_controller = AdaptiveQualityController(levels, level)
         self.frame_preprocessor = FramePreprocessor()
         self.network_optimizer = NetworkOptimizer()
-        
+        self.lock = threading.Lock()
+
         # 性能统计
         self.stats = {
             'frames_processed': 0,
             'avg_processing_time': 0.0,
             'avg_compression_ratio': 0.0,
+            'feedback': 0,
             'start_time': time.time()
         }
-    
+        self.last_report = None
+
+    @property
+    def settings(self):
+        qc = self.quality_controller
+        return StreamSettings(qc.current_quality, qc.scale, qc.fps)
+
+    def handle_control(self, data, addr=None, reply=None, now=None):
+        """控制消息是接收端反馈时：立即回显令牌（接收端据此测 RTT）并更新档位，返回 True"""
+        parsed = parse_feedback(data)
+        if parsed is None:
+            return False
+        token, report = parsed
+        if reply is not None:
+            try:
+                reply(echo_message(token), addr)
+            except OSError:
+                pass
+        self.on_feedback(report, now)
+        return True
+
+    def on_feedback(self, report, now=None):
+        """应用一次反馈，档位变化时返回 True"""
+        with self.lock:
+            self.last_report = report
+            self.stats['feedback'] += 1
+            self.network_optimizer.update_network_stats(report.loss, report.rtt_ms, now=now)
+            changed = self.quality_controller.evaluate(self.network_optimizer, report.decode_ms, now)
+        if changed:
+            quality, scale, fps = self.settings
+            print(f"\n[自适应] {self.name}: {self.quality_controller.last_reason} → "
+                  f"质量 {quality} / 缩放 {scale:g} / {fps}fps")
+        return changed
+
     def optimize_frame_for_transmission(self, frame):
-        """为传输优化帧"""
+        """按当前档位缩放并编码整帧，返回 (JPEG数据, 'full_frame')"""
         start_time = time.time()
-        
-        # 获取优化的帧数据
+
         frame_data, frame_type = self.frame_preprocessor.create_optimized_frame(
             frame, self.quality_controller)
-        
+
         # 更新统计
         processing_time = time.time() - start_time
-        self.stats['frames_processed'] += 1
-        self.stats['avg_processing_time'] = (
-            (self.stats['avg_processing_time'] * (self.stats['frames_processed'] - 1) + processing_time) /
-            self.stats['frames_processed']
-        )
-        
+        n = self.stats['frames_processed'] = self.stats['frames_processed'] + 1
+        self.stats['avg_processing_time'] += (processing_time - self.stats['avg_processing_time']) / n
+        self.stats['avg_compression_ratio'] += (frame.nbytes / max(1, len(frame_data)) -
+                                                self.stats['avg_compression_ratio']) / n
+
         return frame_data, frame_type
-    
-    def update_performance_metrics(self, fps, latency_ms, packet_loss=0.0, rtt=0.0, bandwidth=0.0):
-        """更新性能指标"""
-        self.quality_controller.update_metrics(fps, latency_ms)
-        self.network_optimizer.update_network_stats(packet_loss, rtt, bandwidth)
-    
+
+    def update_performance_metrics(self, fps, latency_ms, packet_loss=None, rtt=0.0, bandwidth=None):
+        """更新发送端本地指标（以及可选的网络统计）"""
+        with self.lock:
+            self.quality_controller.update_metrics(fps, latency_ms)
+            if packet_loss is not None or rtt or bandwidth is not None:
+                self.network_optimizer.update_network_stats(packet_loss, rtt, bandwidth)
+
+    def format_status(self):
+        """一行状态：当前档位与网络估计"""
+        quality, scale, fps = self.settings
+        net = self.network_optimizer
+        return (f"质量 {quality} / 缩放 {scale:g} / {fps}fps | 反馈丢包 {net.packet_loss_rate:.1%} | "
+                f"RTT {net.rtt:.0f}ms (排队 {net.queue_delay:.0f}ms)")
+
     def get_optimization_report(self):
         """获取优化报告"""
         uptime = time.time() - self.stats['start_time']
-        
+        quality, scale, fps = self.settings
+
         return {
             'uptime_seconds': uptime,
             'frames_processed': self.stats['frames_processed'],
             'avg_processing_time_ms': self.stats['avg_processing_time'] * 1000,
-            'current_quality': self.quality_controller.current_quality,
+            'avg_compression_ratio': self.stats['avg_compression_ratio'],
+            'current_quality': quality,
+            'scale': scale,
+            'fps': fps,
+            'level_changes': self.quality_controller.changes,
+            'feedback': self.stats['feedback'],
+            'packet_loss_rate': self.network_optimizer.packet_loss_rate,
+            'rtt_ms': self.network_optimizer.rtt,
             'fps_history': list(self.quality_controller.fps_history),
             'latency_history': list(self.quality_controller.latency_history)
         }
 
 # 使用示例函数
-def create_optimized_sender(target_ip, target_port):
+def create_optimized_sender(target_ip, target_port, levels=SCREEN_LEVELS, level=SCREEN_START_LEVEL):
     """创建优化的发送端"""
-    optimizer = LatencyOptimizer()
+    optimizer = LatencyOptimizer(levels, level)
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    
+
     # 配置socket缓冲区
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 8 * 1024 * 1024)
-    
+
     return optimizer, sock
 
-def create_optimized_receiver(display_width, display_height):
-    """创建优化的接收端"""
-    receiver = OptimizedReceiver((display_width, display_height))
-    return receiver
+def create_optimized_receiver(interval=FEEDBACK_INTERVAL):
+    """创建优化的接收端（反馈统计）"""
+    return OptimizedReceiver(interval)
 
 if __name__ == "__main__":
     print("[启动] 延迟优化模块")
     print("=" * 40)
     print("功能:")
-    print("- 运动预测补偿")
-    print("- 自适应质量控制")
-    print("- 智能区域更新")
-    print("- 多线程解码显示")
-    print("- 网络参数优化")
+    print("- 接收端反馈丢包/RTT/解码耗时")
+    print("- 质量/分辨率/帧率闭环自适应")
     print("=" * 40)
-    
-    # 创建优化器实例
-    optimizer = LatencyOptimizer()
-    
-    # 模拟性能数据
-    import random
-    for i in range(10):
-        fps = random.uniform(25, 35)
-        latency = random.uniform(40, 120)
-        optimizer.update_performance_metrics(fps, latency)
-        
-        print(f"帧 {i+1}: FPS={fps:.1f}, 延迟={latency:.1f}ms, 质量={optimizer.quality_controller.get_optimal_quality()}")
-    
+
+    # 模拟一段会话：良好 → 带宽不足（丢包、排队） → 恢复
+    optimizer = LatencyOptimizer(name="模拟")
+    receiver = OptimizedReceiver()
+    frames = packets = lost = 0
+    for i in range(40):
+        now = i * FEEDBACK_INTERVAL
+        congested = 10 <= i < 20
+        frames += 15
+        packets += 300
+        lost += 60 if congested else 0
+        message = receiver.feedback(frames, 0, packets - lost, lost, now=now)
+        optimizer.handle_control(message, reply=lambda data, addr: receiver.on_control(
+            data, now=now + (0.12 if congested else 0.01)), now=now)
+        print(f"{now:4.1f}s {'拥塞' if congested else '正常'}: {optimizer.format_status()}")
+
     # 显示优化报告
     report = optimizer.get_optimization_report()
-    print(f"\n[统计] 优化报告:")
-    print(f"处理帧数: {report['frames_processed']}")
-    print(f"平均处理时间: {report['avg_processing_time_ms']:.2f}ms")
+    print("\n[统计] 优化报告:")
+    print(f"反馈次数: {report['feedback']}")
+    print(f"档位变化: {report['level_changes']}")
     print(f"当前质量: {report['current_quality']}")
@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型 HTTP 客户端（DeepSeek / OpenAI 兼容的 chat/completions 接口）
+- 进程共享一个 requests.Session，连接池保持长连接，后续请求不再重新 TCP/TLS 握手
+- 流式输出（SSE）：回复逐段产出，界面可以边生成边显示
+- 记录首字延迟（TTFT）与总耗时，可打印最近若干次请求的分位数
+- 摘要前置的回复格式：一次请求同时得到语音播报摘要与详细回答，摘要在流式输出的第一行就绪
+- 统一调度（LLMDispatcher）：令牌桶限速、并发上限、按优先级排队（开发板语音 > 界面提问 > 后台补全），
+  收到 429 时暂停整个令牌桶；429/5xx/网络错误由客户端统一退避重试，调用方不再各自循环重试
+- 相同请求合并：完全相同的请求正在进行时，后来者不再发请求，直接共享其结果（流式请求逐段共享）；
+  同一线程内嵌套发起的相同请求不合并（否则会等待自己），跟随等待有上限
+
+用法:
+    client = LLMClient.get_instance()
+    response = client.post(endpoint, api_key, payload)          # 整段返回，requests.Response
+    stream = client.stream(endpoint, api_key, payload, priority=PRIORITY_VOICE)   # 流式
+    for delta in stream:
+        show(delta)
+    print(stream.ttft_ms, stream.total_ms)
+"""
+
+import json
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ===== 配置参数 =====
+POOL_CONNECTIONS = 4         # 连接池按主机缓存的数量
+POOL_MAXSIZE = 8             # 每个主机保持的最大连接数（并发请求数）
+STREAM_TIMEOUT = (10, 60)    # 流式请求 (连接, 两段数据之间) 超时(秒)
+METRICS_WINDOW = 200         # 延迟统计保留的最近请求数
+
+# 调度：所有进程内的大模型请求共用一个令牌桶和并发上限
+RATE_PER_SECOND = 2.0        # 令牌桶补充速度（平均每秒发出的请求数）
+RATE_BURST = 4               # 令牌桶容量（允许的突发请求数）
+MAX_CONCURRENCY = 4          # 同时进行中的请求上限（不超过 POOL_MAXSIZE）
+QUEUE_TIMEOUT = 60           # 排队等待上限(秒)，超时抛出 LLMError
+FOLLOW_TIMEOUT = 180         # 跟随进行中相同请求的等待上限(秒)，超时抛出 LLMError
+MAX_RETRIES = 2              # 429/5xx/超时/连接错误的重试次数（流式请求只在尚未输出时重试）
+RETRY_BASE_DELAY = 1.0       # 重试退避 RETRY_BASE_DELAY * 2^n 秒
+RETRY_MAX_DELAY = 10.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+PRIORITY_VOICE = 0           # 开发板语音对话：用户在等播报
+PRIORITY_INTERACTIVE = 1     # 界面上的提问、点击生成建议
+PRIORITY_BACKGROUND = 2      # 历史记录补全建议等后台请求
+PRIORITY_NAMES = {PRIORITY_VOICE: "语音", PRIORITY_INTERACTIVE: "交互", PRIORITY_BACKGROUND: "后台"}
+
+SUMMARY_PREFIX = "语音摘要："
+SUMMARY_INSTRUCTION = (f"回答的第一行以“{SUMMARY_PREFIX}”开头，用不超过100字概括核心建议，适合直接朗读；"
+                       "从第二行开始给出详细回答。")
+# ===================
+
+
+class LLMError(Exception):
+    """请求失败；status_code 为 HTTP 状态码（网络错误时为 None）"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def iter_sse_data(lines):
+    """从 SSE 字节行中取出每个事件的 data 内容（多行 data 以换行拼接）"""
+    data = []
+    for line in lines:
+        line = line.decode('utf-8') if isinstance(line, bytes) else line
+        line = line.rstrip('\r')
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+        elif line.startswith('data:'):
+            data.append(line[5:].lstrip(' '))
+        # 以 ':' 开头的注释行（心跳）和其他字段忽略
+    if data:
+        yield "\n".join(data)
+
+
+def parse_delta(data):
+    """取出一个流式分块中的回复文本"""
+    chunk = json.loads(data)
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+class SummaryFirstReply:
+    """解析 SUMMARY_INSTRUCTION 格式的流式回复：第一行是语音摘要，其后是详细回答
+
+    模型没有按格式输出时 summary 为 None，body 为完整回复（由调用方自行提取摘要）
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.summary = None
+        self.decided = False         # 是否已判定首行是不是摘要
+
+    def feed(self, delta):
+        """送入一段回复；摘要行刚好完整时返回摘要，否则返回 None"""
+        self.text += delta
+        if self.decided:
+            return None
+        head = self.text.lstrip()
+        if not (head.startswith(SUMMARY_PREFIX) or SUMMARY_PREFIX.startswith(head)):
+            self.decided = True
+            return None
+        if "\n" in head:
+            self.decided = True
+            self.summary = head.split("\n", 1)[0][len(SUMMARY_PREFIX):].strip()
+            return self.summary
+        return None
+
+    def finish(self):
+        """回复结束；只有摘要一行时也取出摘要，返回 summary"""
+        if not self.decided and self.text.lstrip().startswith(SUMMARY_PREFIX):
+            self.summary = self.text.lstrip()[len(SUMMARY_PREFIX):].strip()
+        self.decided = True
+        return self.summary
+
+    @property
+    def body(self):
+        """详细回答（去掉摘要行）；摘要行尚未判定时为空"""
+        if not self.decided:
+            return ""
+        if self.summary is None:
+            return self.text
+        parts = self.text.lstrip().split("\n", 1)
+        return parts[1].lstrip("\n") if len(parts) > 1 else ""
+
+
+def percentiles(values):
+    """p50、p95、平均 (ms)"""
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'mean': sum(ordered) / len(ordered),
+    }
+
+
+def retry_delay(attempt, response=None):
+    """第 attempt 次重试前的等待时间；429 带 Retry-After 时以服务端为准"""
+    if response is not None:
+        try:
+            return min(float(response.headers.get("Retry-After")), RETRY_MAX_DELAY * 3)
+        except (TypeError, ValueError):
+            pass
+    return min(RETRY_BASE_DELAY * (2 ** (attempt - 1)), RETRY_MAX_DELAY)
+
+
+class LLMDispatcher:
+    """请求调度：令牌桶限速 + 并发上限 + 按优先级排队
+
+    每次发出 HTTP 请求前在 slot(priority) 中排队：队首（优先级数值最小、同级先到先得）在并发未满且
+    令牌桶有令牌时放行。throttle() 清空令牌并暂停放行，收到 429 后排队中的请求一起等待
+    """
+
+    def __init__(self, rate=RATE_PER_SECOND, burst=RATE_BURST, max_concurrency=MAX_CONCURRENCY,
+                 queue_timeout=QUEUE_TIMEOUT):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.running = 0
+        self.waiting = []            # 堆：(优先级, 到达序号)
+        self.order = itertools.count()
+        self.cond = threading.Condition()
+        self.waits = {p: deque(maxlen=METRICS_WINDOW) for p in PRIORITY_NAMES}
+        self.stats = {"dispatched": 0, "throttled": 0, "timeouts": 0}
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _ready_in(self, ticket):
+        """ticket 还需等待的秒数：0 表示可以放行，None 表示等待其他请求结束或出队"""
+        if self.waiting[0] != ticket or self.running >= self.max_concurrency:
+            return None
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE):
+        """排队直到放行，返回排队耗时(ms)；超过 queue_timeout 抛出 LLMError"""
+        ticket = (priority, next(self.order))
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    delay = self._ready_in(ticket)
+                    if delay == 0:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise LLMError(f"大模型请求排队超过 {self.queue_timeout}s")
+                    self.cond.wait(remaining if delay is None else min(delay, remaining))
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()       # 新的队首可能已经可以放行
+            self.tokens -= 1
+            self.running += 1
+            self.stats["dispatched"] += 1
+            waited = (time.monotonic() - start) * 1000
+            self.waits.setdefault(priority, deque(maxlen=METRICS_WINDOW)).append(waited)
+        return waited
+
+    def release(self):
+        with self.cond:
+            self.running -= 1
+            self.cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_INTERACTIVE):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def throttle(self, seconds):
+        """服务端限流：清空令牌并暂停放行 seconds 秒"""
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.stats["throttled"] += 1
+            self.cond.notify_all()
+
+    def summary(self):
+        """各优先级排队耗时的 p50、p95、平均 (ms)"""
+        with self.cond:
+            return {PRIORITY_NAMES.get(p, str(p)): percentiles(values)
+                    for p, values in sorted(self.waits.items()) if values}
+
+
+class InFlight:
+    """进行中的请求；相同请求的后来者等待它结束（流式请求逐段跟随）并共享结果"""
+
+    def __init__(self):
+        self.owner = threading.get_ident()      # 发出请求的线程，它自己不能再跟随这个请求
+        self.cond = threading.Condition()
+        self.deltas = []
+        self.done = False
+        self.result = None
+        self.error = None
+
+    def publish(self, delta):
+        with self.cond:
+            self.deltas.append(delta)
+            self.cond.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.cond:
+            self.result = result
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+    def _wait_until(self, ready, deadline):
+        """已持有 self.cond；等到 ready() 成立，超过 deadline 抛出 LLMError"""
+        while not ready():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMError("等待进行中的相同请求超时")
+            self.cond.wait(remaining)
+
+    def wait(self, timeout=FOLLOW_TIMEOUT):
+        """整段请求：等待结果，失败时抛出同一个异常"""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            self._wait_until(lambda: self.done, deadline)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def follow(self, timeout=FOLLOW_TIMEOUT):
+        """流式请求：依次产出已收到和后续到达的片段；整个请求超过 timeout 秒仍未结束时抛出 LLMError"""
+        deadline = time.monotonic() + timeout
+        index = 0
+        while True:
+            with self.cond:
+                self._wait_until(lambda: index < len(self.deltas) or self.done, deadline)
+                fresh = self.deltas[index:]
+                done = self.done
+            yield from fresh
+            index += len(fresh)
+            if done:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class ChatStream:
+    """一次流式请求：迭代得到回复文本片段，结束后可读取延迟指标"""
+
+    def __init__(self, client, endpoint, headers, payload, timeout, priority=PRIORITY_INTERACTIVE):
+        self.client = client
+        self.endpoint = endpoint
+        self.headers = headers
+        self.payload = payload
+        self.timeout = timeout
+        self.priority = priority
+        self.ttft_ms = None          # 发出请求（含排队）到收到第一个字的耗时
+        self.total_ms = None         # 发出请求到回复结束的耗时
+        self.text = ""
+        self.coalesced = False       # 是否跟随了进行中的相同请求
+
+    def __iter__(self):
+        start = time.perf_counter()
+        shared, leader = self.client.join(self.endpoint, self.headers, self.payload)
+        self.coalesced = not leader
+        error = LLMError("流式请求已中断")
+        try:
+            for delta in (self._request() if leader else shared.follow(self.client.follow_timeout)):
+                if self.ttft_ms is None:
+                    self.ttft_ms = (time.perf_counter() - start) * 1000
+                    self.client.record("ttft", self.ttft_ms)
+                self.text += delta
+                if leader:
+                    shared.publish(delta)
+                yield delta
+            if not self.text:
+                # 返回 200 但没有任何内容：按失败处理，调用方走备用回复（此时也没有首字延迟可记录）
+                if leader:
+                    self.client.record_error()
+                raise LLMError("API返回了空回复")
+            error = None
+        except LLMError as e:
+            error = e
+            raise
+        finally:
+            if leader:
+                self.client.leave(self.endpoint, self.headers, self.payload, shared, error=error)
+        self.total_ms = (time.perf_counter() - start) * 1000
+        self.client.record("total", self.total_ms)
+
+    def _request(self):
+        """发出请求并逐段产出；尚未输出任何内容时按统一策略重试（退避在让出并发名额后进行）"""
+        client = self.client
+        for attempt in range(client.max_retries + 1):
+            if attempt:
+                client.count("retries")
+            retry_response = None
+            try:
+                with client.dispatcher.slot(self.priority):
+                    client.count("requests")
+                    with client.session.post(self.endpoint, headers=self.headers, json=self.payload,
+                                             timeout=self.timeout, stream=True) as response:
+                        if response.status_code != 200:
+                            client.record_error()
+                            if response.status_code not in RETRY_STATUS or attempt == client.max_retries:
+                                raise LLMError(f"API请求失败: {response.status_code} - {response.text[:200]}",
+                                               response.status_code)
+                            retry_response = response
+                        else:
+                            # 按字节读取再以 UTF-8 解码，避免 text/event-stream 被按 ISO-8859-1 解码成乱码
+                            # 读到 [DONE] 后继续读完响应体，连接才能归还连接池
+                            for data in iter_sse_data(response.iter_lines()):
+                                if data == "[DONE]":
+                                    continue
+                                delta = parse_delta(data)
+                                if delta:
+                                    yield delta
+                            return
+            except requests.exceptions.RequestException as e:
+                client.record_error()
+                if self.text or attempt == client.max_retries or isinstance(e, requests.exceptions.SSLError):
+                    raise LLMError(f"网络请求错误: {e}") from e
+            client.backoff(attempt + 1, retry_response)
+
+
+class LLMClient:
+    """进程共享的大模型客户端（长连接池 + 流式输出 + 统一调度与重试 + 相同请求合并 + 延迟统计）"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, dispatcher=None,
+                 max_retries=MAX_RETRIES, follow_timeout=FOLLOW_TIMEOUT):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.dispatcher = dispatcher or LLMDispatcher()
+        self.max_retries = max_retries
+        self.follow_timeout = follow_timeout
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.samples = {"ttft": deque(maxlen=METRICS_WINDOW), "total": deque(maxlen=METRICS_WINDOW)}
+        self.stats = {"requests": 0, "errors": 0, "retries": 0, "coalesced": 0}
+
+    @staticmethod
+    def build_headers(api_key, extra=None):
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key.strip()}",
+        }
+        headers.update(extra or {})
+        return headers
+
+    @staticmethod
+    def request_key(endpoint, headers, payload):
+        """相同接口、密钥和请求体视为同一请求"""
+        return (endpoint, headers.get("Authorization"), json.dumps(payload, sort_keys=True, ensure_ascii=False))
+
+    def join(self, endpoint, headers, payload):
+        """登记请求，返回 (InFlight, 是否由本次调用真正发出)；已有相同请求进行中时跟随它
+
+        进行中的请求由本线程发出时（如在它的流式输出里嵌套发起相同请求），跟随会等待自己而死锁，
+        此时单独发出请求，且不替换已登记的请求
+        """
+        key = self.request_key(endpoint, headers, payload)
+        with self.lock:
+            shared = self.inflight.get(key)
+            if shared is None:
+                shared = self.inflight[key] = InFlight()
+                return shared, True
+            if shared.owner == threading.get_ident():
+                return InFlight(), True
+            self.stats["coalesced"] += 1      # 已持有 self.lock
+            return shared, False
+
+    def leave(self, endpoint, headers, payload, shared, result=None, error=None):
+        key = self.request_key(endpoint, headers, payload)
+        with self.lock:
+            if self.inflight.get(key) is shared:
+                del self.inflight[key]
+        shared.finish(result, error)
+
+    def backoff(self, attempt, response=None):
+        """重试前等待；429 时暂停整个令牌桶，由调度器统一放行而不是各自睡眠"""
+        delay = retry_delay(attempt, response)
+        if response is not None and response.status_code == 429:
+            self.dispatcher.throttle(delay)
+        else:
+            time.sleep(delay)
+
+    def post(self, endpoint, api_key, payload, timeout=30, headers=None, priority=PRIORITY_INTERACTIVE):
+        """整段返回的请求，返回 requests.Response（由调用方按状态码处理）
+
+        429/5xx/超时/连接错误自动退避重试 max_retries 次，仍失败时返回最后的响应或抛出最后的异常
+        """
+        headers = self.build_headers(api_key, headers)
+        payload = dict(payload, stream=False)
+        shared, leader = self.join(endpoint, headers, payload)
+        if not leader:
+            return shared.wait(self.follow_timeout)
+        try:
+            response = self._post(endpoint, headers, payload, timeout, priority)
+        except Exception as e:
+            self.leave(endpoint, headers, payload, shared, error=e)
+            raise
+        self.leave(endpoint, headers, payload, shared, result=response)
+        return response
+
+    def _post(self, endpoint, headers, payload, timeout, priority):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.count("retries")
+            with self.dispatcher.slot(priority):
+                self.count("requests")
+                start = time.perf_counter()
+                try:
+                    response = self.session.post(endpoint, headers=headers, json=payload, timeout=timeout)
+                except requests.exceptions.SSLError:
+                    self.record_error()
+                    raise
+                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                    self.record_error()
+                    if attempt == self.max_retries:
+                        raise
+                    response = None
+            if response is None:
+                self.backoff(attempt + 1)
+                continue
+            if response.status_code == 200:
+                self.record("total", (time.perf_counter() - start) * 1000)
+                return response
+            self.record_error()
+            if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                return response
+            self.backoff(attempt + 1, response)
+        return response
+
+    def stream(self, endpoint, api_key, payload, timeout=STREAM_TIMEOUT, headers=None,
+               priority=PRIORITY_INTERACTIVE):
+        """流式请求，返回 ChatStream；迭代时才排队并发出请求，失败抛出 LLMError"""
+        headers = self.build_headers(api_key, dict({"Accept": "text/event-stream"}, **(headers or {})))
+        return ChatStream(self, endpoint, headers, dict(payload, stream=True), timeout, priority)
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def record(self, name, elapsed):
+        with self.lock:
+            self.samples[name].append(elapsed)
+
+    def record_error(self):
+        with self.lock:
+            self.stats["errors"] += 1
+
+    def summary(self):
+        """首字延迟 / 总耗时的 p50、p95、平均 (ms)"""
+        with self.lock:
+            return {name: percentiles(values) for name, values in self.samples.items() if values}
+
+    def format_summary(self):
+        labels = {"ttft": "首字", "total": "总耗时"}
+        parts = [f"{labels[name]} p50={stat['p50']:.0f}ms p95={stat['p95']:.0f}ms"
+                 for name, stat in self.summary().items()]
+        parts += [f"{name}排队 p95={stat['p95']:.0f}ms" for name, stat in self.dispatcher.summary().items()]
+        line = (f"请求 {self.stats['requests']} 次, 失败 {self.stats['errors']} 次, 重试 {self.stats['retries']} 次, "
+                f"合并 {self.stats['coalesced']} 次, 限流 {self.dispatcher.stats['throttled']} 次")
+        return line + ("; " + "; ".join(parts) if parts else "")
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可靠UDP分片传输模块
+开发板与PC端共享的图像分片收发实现
+功能：
+1. 按请求编号分片，包头与原有格式兼容：
+   [4字节包ID][2字节包索引][2字节总包数][1字节标志位][数据]
+   首包可携带 [2字节长度][request_id] 前缀
+2. 接收端按位图回复ACK，发送端只重传缺失的分片（选择重传）
+3. 发送端使用拥塞窗口 + 节拍发送，代替固定的 time.sleep 间隔
+4. 未设置可靠标志位的旧版分片照常重组，只是不回复ACK
+5. 接收端为每个请求预分配一块缓冲区，recvfrom_into 复用接收缓冲区，
+   重组结果以 memoryview 交给 cv2.imdecode，过期的残缺帧定时清理
+"""
+
+import socket
+import time
+import zlib
+from collections import OrderedDict
+
+# ===== 传输配置 =====
+MAX_PACKET_SIZE = 1400       # 每个分片的最大数据长度
+HEADER_SIZE = 9              # 分片包头长度
+
+FLAG_LAST = 0x01             # 最后一个分片
+FLAG_RELIABLE = 0x02         # 发送端需要ACK
+FLAG_ACK_REQ = 0x04          # 请求接收端立即回复ACK（窗口末尾/探测包）
+FLAG_HAS_ID = 0x08           # 首包携带 request_id 前缀
+
+ACK_MAGIC = 0xAC             # ACK 控制包首字节
+
+INITIAL_WINDOW = 16          # 初始拥塞窗口（分片数）
+MIN_WINDOW = 2               # 最小拥塞窗口
+MAX_WINDOW = 256             # 最大拥塞窗口
+INITIAL_RTO = 0.2            # 初始重传超时(秒)
+MIN_RTO = 0.02               # 最小重传超时(秒)
+MAX_RTO = 1.0                # 最大重传超时(秒)
+MAX_TIMEOUTS = 8             # 连续超时次数上限，超过视为发送失败
+PACING_SLACK = 0.001         # 节拍领先超过该值(秒)才休眠，避免频繁的小睡眠
+
+RECV_BUFFER_SIZE = 65536     # 接收缓冲区大小（UDP数据报上限）
+FRAME_TIMEOUT = 5.0          # 残缺帧超过该时间(秒)未收到新分片即丢弃
+SWEEP_INTERVAL = 1.0         # 过期清理的最小间隔(秒)
+MAX_PENDING_FRAMES = 64      # 同时重组的请求数上限，超出时淘汰最旧的
+MAX_FRAME_BYTES = 32 * 1024 * 1024  # 单帧预分配上限，防止异常包头导致超大分配
+# ===================
+
+
+def packet_id_for(request_id):
+    """由 request_id 计算稳定的32位包ID（不受进程哈希随机化影响）"""
+    return zlib.crc32(request_id.encode('utf-8')) & 0xFFFFFFFF
+
+
+def build_fragments(packet_id, payload, request_id=None, reliable=True, max_payload=MAX_PACKET_SIZE):
+    """将数据切分为带包头的分片列表（bytearray，便于发送时改写标志位）"""
+    total_packets = max(1, (len(payload) + max_payload - 1) // max_payload)
+    if total_packets > 0xFFFF:
+        raise ValueError(f"数据过大，分片数 {total_packets} 超过上限 65535")
+
+    view = memoryview(payload)
+    fragments = []
+    for i in range(total_packets):
+        flags = 0
+        if i == total_packets - 1:
+            flags |= FLAG_LAST
+        if reliable:
+            flags |= FLAG_RELIABLE
+
+        prefix = b''
+        if i == 0 and request_id:
+            request_info = request_id.encode('utf-8')
+            prefix = len(request_info).to_bytes(2, 'big') + request_info
+            flags |= FLAG_HAS_ID
+
+        fragment = bytearray(
+            packet_id.to_bytes(4, 'big') +
+            i.to_bytes(2, 'big') +
+            total_packets.to_bytes(2, 'big') +
+            bytes([flags])
+        )
+        fragment += prefix
+        fragment += view[i * max_payload:(i + 1) * max_payload]
+        fragments.append(fragment)
+
+    return fragments
+
+
+def parse_header(data):
+    """解析分片包头，返回 (packet_id, packet_index, total_packets, flags)"""
+    return (
+        int.from_bytes(data[0:4], 'big'),
+        int.from_bytes(data[4:6], 'big'),
+        int.from_bytes(data[6:8], 'big'),
+        data[8]
+    )
+
+
+def build_ack(packet_id, total_packets, bitmap):
+    """构造ACK包：[0xAC][4字节包ID][2字节总包数][接收位图]"""
+    return bytes([ACK_MAGIC]) + packet_id.to_bytes(4, 'big') + total_packets.to_bytes(2, 'big') + bytes(bitmap)
+
+
+def parse_ack(data):
+    """解析ACK包，返回 (packet_id, total_packets, bitmap)，非ACK包返回 None"""
+    if len(data) < 7 or data[0] != ACK_MAGIC:
+        return None
+    packet_id = int.from_bytes(data[1:5], 'big')
+    total_packets = int.from_bytes(data[5:7], 'big')
+    bitmap = data[7:]
+    if len(bitmap) < (total_packets + 7) // 8:
+        return None
+    return packet_id, total_packets, bitmap
+
+
+def bitmap_has(bitmap, index):
+    """判断位图中第 index 位是否已置位"""
+    return bool(bitmap[index >> 3] & (1 << (index & 7)))
+
+
+class ReliableSender:
+    """选择重传分片发送器（拥塞窗口 + 节拍发送）"""
+
+    def __init__(self, sock, max_payload=MAX_PACKET_SIZE):
+        self.sock = sock
+        self.max_payload = max_payload
+        self.cwnd = INITIAL_WINDOW
+        self.ssthresh = MAX_WINDOW
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = INITIAL_RTO
+
+        # 累计统计
+        self.stats = {
+            'requests': 0,
+            'failed_requests': 0,
+            'fragments_sent': 0,
+            'retransmissions': 0,
+            'timeouts': 0,
+        }
+
+    def send(self, addr, payload, request_id=None, packet_id=None):
+        """可靠发送一条请求的数据，全部分片确认后返回统计信息，失败返回 None"""
+        if packet_id is None:
+            packet_id = packet_id_for(request_id) if request_id else packet_id_for(f"{time.time()}")
+
+        fragments = build_fragments(packet_id, payload, request_id, True, self.max_payload)
+        total_packets = len(fragments)
+        unacked = list(range(total_packets))
+        sent_count = [0] * total_packets
+        timeouts = 0
+        start_time = time.time()
+        self.stats['requests'] += 1
+
+        old_timeout = self.sock.gettimeout()
+        try:
+            while unacked:
+                window = unacked[:max(MIN_WINDOW, int(self.cwnd))]
+                send_time = self._send_window(addr, fragments, window, sent_count)
+
+                acked = self._wait_for_ack(packet_id, send_time)
+                if acked is None:
+                    # 超时：窗口减半并指数退避，下一轮从最早未确认分片开始探测
+                    timeouts += 1
+                    self.stats['timeouts'] += 1
+                    self.ssthresh = max(MIN_WINDOW, int(self.cwnd) // 2)
+                    self.cwnd = MIN_WINDOW
+                    self.rto = min(MAX_RTO, self.rto * 2)
+                    if timeouts > MAX_TIMEOUTS:
+                        self.stats['failed_requests'] += 1
+                        print(f"[传输] 请求 {request_id or packet_id} 连续超时，发送失败")
+                        return None
+                    continue
+
+                timeouts = 0
+                window_lost = any(not bitmap_has(acked, i) for i in window)
+                unacked = [i for i in unacked if not bitmap_has(acked, i)]
+
+                if window_lost:
+                    # 丢包：乘性减小
+                    self.ssthresh = max(MIN_WINDOW, int(self.cwnd) // 2)
+                    self.cwnd = self.ssthresh
+                elif self.cwnd < self.ssthresh:
+                    # 慢启动
+                    self.cwnd = min(MAX_WINDOW, self.cwnd * 2)
+                else:
+                    # 拥塞避免：加性增大
+                    self.cwnd = min(MAX_WINDOW, self.cwnd + 1)
+        finally:
+            self.sock.settimeout(old_timeout)
+
+        retransmissions = sum(sent_count) - total_packets
+        self.stats['fragments_sent'] += sum(sent_count)
+        self.stats['retransmissions'] += retransmissions
+        return {
+            'packet_id': packet_id,
+            'fragments': total_packets,
+            'retransmissions': retransmissions,
+            'elapsed': time.time() - start_time,
+        }
+
+    def _send_window(self, addr, fragments, window, sent_count):
+        """按节拍发送一个窗口的分片，窗口末尾分片请求ACK，返回发送完成时间"""
+        # 在一个平滑RTT内均匀发出整个窗口
+        interval = (self.srtt or 0.0) / max(1, len(window))
+        next_send = time.time()
+
+        for n, index in enumerate(window):
+            fragment = fragments[index]
+            flags = fragment[8]
+            if n == len(window) - 1:
+                fragment[8] = flags | FLAG_ACK_REQ
+
+            ahead = next_send - time.time()
+            if ahead > PACING_SLACK:
+                time.sleep(ahead)
+
+            self.sock.sendto(fragment, addr)
+            fragment[8] = flags
+            sent_count[index] += 1
+            next_send += interval
+
+        return time.time()
+
+    def _wait_for_ack(self, packet_id, send_time):
+        """等待指定包ID的ACK，返回接收位图，超时返回 None"""
+        deadline = send_time + self.rto
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            self.sock.settimeout(remaining)
+            try:
+                data, _ = self.sock.recvfrom(MAX_PACKET_SIZE + HEADER_SIZE)
+            except socket.timeout:
+                return None
+
+            ack = parse_ack(data)
+            if ack is None or ack[0] != packet_id:
+                continue  # 过期或无关的ACK
+
+            self._update_rtt(time.time() - send_time)
+            return ack[2]
+
+    def _update_rtt(self, sample):
+        """按 Jacobson/Karels 算法更新平滑RTT和重传超时"""
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+
+class FragmentReceiver:
+    """分片重组接收器，对可靠分片回复位图ACK"""
+
+    def __init__(self, send_fn=None, max_payload=MAX_PACKET_SIZE, completed_history=256):
+        self.send_fn = send_fn                 # send_fn(data, addr)，用于回复ACK
+        self.max_payload = max_payload         # 非末尾分片的数据长度，决定分片在缓冲区中的偏移
+        self.frames = OrderedDict()            # {(ip, packet_id): 重组状态}，按创建顺序
+        self.completed = OrderedDict()         # 最近完成的 (ip, packet_id) -> total_packets
+        self.completed_history = completed_history
+        self.last_sweep = time.time()
+
+        # 复用的接收缓冲区，避免每个数据报分配新的 bytes
+        self.recv_buffer = bytearray(RECV_BUFFER_SIZE)
+        self.recv_view = memoryview(self.recv_buffer)
+
+        self.stats = {
+            'fragments_received': 0,
+            'duplicate_fragments': 0,
+            'malformed_fragments': 0,
+            'frames_completed': 0,
+            'frames_expired': 0,
+            'acks_sent': 0,
+        }
+
+    def receive_into(self, sock):
+        """用 recvfrom_into 把一个数据报收进复用缓冲区，返回 (数据视图, 地址)
+
+        返回的视图在下一次调用前有效，handle_datagram 会把分片复制进对应帧的缓冲区。
+        """
+        nbytes, addr = sock.recvfrom_into(self.recv_buffer)
+        return self.recv_view[:nbytes], addr
+
+    def handle_datagram(self, data, addr):
+        """处理一个分片，重组完成时返回 {'packet_id', 'request_id', 'data', 'addr'}，否则返回 None
+
+        data 可以是 bytes 或 memoryview；返回的 'data' 是指向该帧缓冲区的 memoryview，
+        可直接交给 np.frombuffer / cv2.imdecode，无需再拷贝。
+        """
+        self.maybe_expire()
+
+        if len(data) < HEADER_SIZE:
+            return None
+
+        packet_id, packet_index, total_packets, flags = parse_header(data)
+        if total_packets == 0 or packet_index >= total_packets:
+            return None
+
+        self.stats['fragments_received'] += 1
+        key = (addr[0], packet_id)
+        reliable = bool(flags & FLAG_RELIABLE)
+
+        # 已完成请求的重传分片（ACK丢失）：直接回复全量ACK
+        if key in self.completed:
+            self.stats['duplicate_fragments'] += 1
+            if reliable:
+                self._send_ack(packet_id, total_packets, self._full_bitmap(total_packets), addr)
+            return None
+
+        frame = self.frames.get(key)
+        if frame is None:
+            frame = self._new_frame(key, total_packets)
+            if frame is None:
+                return None
+
+        payload = data[HEADER_SIZE:]
+        if packet_index == 0:
+            payload = self._strip_request_id(frame, payload, flags)
+
+        if frame['bitmap'][packet_index >> 3] & (1 << (packet_index & 7)):
+            self.stats['duplicate_fragments'] += 1
+        elif not self._store_fragment(frame, packet_index, payload):
+            self.stats['malformed_fragments'] += 1
+            return None
+
+        frame['last_seen'] = time.time()
+
+        if frame['received'] == total_packets:
+            del self.frames[key]
+            self._mark_completed(key, total_packets)
+            self.stats['frames_completed'] += 1
+            if reliable:
+                self._send_ack(packet_id, total_packets, frame['bitmap'], addr)
+            return {
+                'packet_id': packet_id,
+                'request_id': frame['request_id'],
+                'data': frame['view'][:frame['length']],
+                'addr': addr,
+            }
+
+        if reliable and flags & FLAG_ACK_REQ:
+            self._send_ack(packet_id, total_packets, frame['bitmap'], addr)
+        return None
+
+    def pending_count(self):
+        """返回正在重组的请求数"""
+        return len(self.frames)
+
+    def maybe_expire(self):
+        """距上次清理超过 SWEEP_INTERVAL 时清理过期残缺帧，供接收循环定时调用"""
+        now = time.time()
+        if now - self.last_sweep >= SWEEP_INTERVAL:
+            self.last_sweep = now
+            return self.expire_stale(now)
+        return 0
+
+    def expire_stale(self, now=None, timeout=FRAME_TIMEOUT):
+        """丢弃超过 timeout 秒未收到新分片的残缺帧，返回丢弃数量"""
+        now = time.time() if now is None else now
+        stale = [key for key, frame in self.frames.items() if now - frame['last_seen'] > timeout]
+        for key in stale:
+            del self.frames[key]
+        if stale:
+            self.stats['frames_expired'] += len(stale)
+            print(f"[传输] 清理 {len(stale)} 个超时未完成的分片帧")
+        return len(stale)
+
+    def _new_frame(self, key, total_packets):
+        """为新请求按 total_packets * max_payload 预分配重组缓冲区"""
+        capacity = total_packets * self.max_payload
+        if capacity > MAX_FRAME_BYTES:
+            self.stats['malformed_fragments'] += 1
+            return None
+
+        while len(self.frames) >= MAX_PENDING_FRAMES:
+            self.frames.popitem(last=False)
+            self.stats['frames_expired'] += 1
+
+        buffer = bytearray(capacity)
+        now = time.time()
+        frame = {
+            'total_packets': total_packets,
+            'buffer': buffer,
+            'view': memoryview(buffer),
+            'length': capacity,
+            'bitmap': bytearray((total_packets + 7) // 8),
+            'received': 0,
+            'request_id': None,
+            'first_seen': now,
+            'last_seen': now,
+        }
+        self.frames[key] = frame
+        return frame
+
+    def _store_fragment(self, frame, packet_index, payload):
+        """把分片数据复制到帧缓冲区的对应偏移处，并在位图中登记"""
+        size = len(payload)
+        is_last = packet_index == frame['total_packets'] - 1
+        # 非末尾分片长度必须等于 max_payload，否则偏移无法对齐
+        if size > self.max_payload or (not is_last and size != self.max_payload):
+            return False
+
+        offset = packet_index * self.max_payload
+        frame['view'][offset:offset + size] = payload
+        if is_last:
+            frame['length'] = offset + size
+
+        frame['bitmap'][packet_index >> 3] |= 1 << (packet_index & 7)
+        frame['received'] += 1
+        return True
+
+    def _strip_request_id(self, frame, payload, flags):
+        """从首包中取出 request_id 前缀"""
+        if flags & FLAG_HAS_ID:
+            has_id = True
+        else:
+            # 旧版发送端没有 FLAG_HAS_ID，按长度字段试探（JPEG数据以 0xFFD8 开头，长度必然越界；
+            # H.264 码流以 00 00 起始码开头，长度为 0，旧版的 request_id 不会为空）
+            request_id_len = int.from_bytes(payload[0:2], 'big') if len(payload) >= 2 else 0
+            has_id = 0 < request_id_len <= len(payload) - 2
+
+        if not has_id:
+            return payload
+
+        request_id_len = int.from_bytes(payload[0:2], 'big')
+        try:
+            frame['request_id'] = bytes(payload[2:2 + request_id_len]).decode('utf-8')
+        except UnicodeDecodeError:
+            return payload
+        return payload[2 + request_id_len:]
+
+    def _mark_completed(self, key, total_packets):
+        self.completed[key] = total_packets
+        while len(self.completed) > self.completed_history:
+            self.completed.popitem(last=False)
+
+    def _full_bitmap(self, total_packets):
+        bitmap = bytearray(b'\xff' * ((total_packets + 7) // 8))
+        if total_packets % 8:
+            bitmap[-1] = (1 << (total_packets % 8)) - 1
+        return bitmap
+
+    def _send_ack(self, packet_id, total_packets, bitmap, addr):
+        if self.send_fn is None:
+            return
+        try:
+            self.send_fn(build_ack(packet_id, total_packets, bitmap), addr)
+            self.stats['acks_sent'] += 1
+        except OSError as e:
+            print(f"[传输] ACK发送失败: {e}")
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+屏幕共享瓦片编码
+PC端发送程序（wifi_pc_sender_*）与开发板接收程序（wifi_pc_receiver_2.0.py）共享
+功能：
+1. 发送端把画面划分为固定大小的瓦片，整帧差分后用 NumPy 按瓦片归约得到变化瓦片
+   （屏幕内容没有噪声，逐像素比较即可，不再需要 Canny 边缘检测）
+2. 每行中相邻的变化瓦片合并为一个矩形，只对这些矩形做 JPEG 编码，画面不变时不发送任何数据
+3. 定期（以及变化面积过大时）发送完整关键帧：负载就是整帧 JPEG，旧版接收端也能显示；
+   瓦片帧丢失导致的画面残缺最多持续一个关键帧间隔
+4. 接收端维护持久帧缓冲，关键帧整帧替换，瓦片帧按坐标贴回
+5. 分片包头有两个版本，接收端按包内容自动识别，发送端按协商结果选择：
+   v1（旧版 5 字节）：[1字节标志位][2字节帧序号][1字节分片索引][1字节总分片数]
+       一帧最多 255 片（约 357KB），帧序号 65536 后回绕
+   v2（16 字节）：[2字节魔数 'SC'][1字节版本][1字节标志位][4字节会话ID][4字节帧ID][2字节分片索引][2字节总分片数]
+       一帧最多 65535 片，帧ID 32 位，会话ID 随发送端每次启动随机生成，发送端重启后接收端立即跟上
+   协商：接收端定期向控制端口发送 HELLO [0x10][支持的最高版本]，发送端从 v1 开始，收到后切换到双方都支持的最高版本，
+   因此新发送端仍能驱动旧接收端
+
+帧负载格式：
+  关键帧（FLAG_KEYFRAME）：整帧 JPEG
+  瓦片帧（FLAG_TILES）：[2字节宽][2字节高][2字节瓦片边长][2字节矩形数]
+                        每个矩形 [2字节瓦片列][2字节瓦片行][2字节瓦片数][4字节JPEG长度][JPEG]
+"""
+
+import time
+import random
+import struct
+from collections import namedtuple
+
+import numpy as np
+import cv2
+
+# ===== 编码配置 =====
+TILE_SIZE = 64               # 瓦片边长(像素)
+JPEG_QUALITY = 75
+KEYFRAME_SECONDS = 2.0       # 定期发送完整关键帧的间隔(秒)，用于丢包恢复
+FULL_FRAME_RATIO = 0.5       # 变化瓦片超过该比例时直接发送关键帧（整帧编码比大量小矩形更省）
+
+FLAG_KEYFRAME = 0x01         # 包头标志位：完整关键帧（与旧版关键帧标记兼容）
+FLAG_TILES = 0x02            # 包头标志位：瓦片帧
+
+MAX_PACKET_SIZE = 1400       # 每个分片的最大负载字节数
+WIRE_V1 = 1
+WIRE_V2 = 2
+WIRE_VERSION = WIRE_V2       # 本端支持的最高包头版本
+FRAME_TIMEOUT = 1.0          # 分片不全的帧超过该时间(秒)即丢弃
+HELLO_INTERVAL = 2.0         # 接收端发送 HELLO 的间隔(秒)
+CONTROL_HELLO = 0x10         # 控制端口消息类型：版本协商
+# ===================
+
+TILE_HEADER = struct.Struct('!HHHH')
+RECT_HEADER = struct.Struct('!HHHI')
+
+WIRE_MAGIC = b'SC'
+V1_HEADER = struct.Struct('!BHBB')
+V2_HEADER = struct.Struct('!2sBBIIHH')
+V1_MAX_FRAGMENTS = 0xFF
+V2_MAX_FRAGMENTS = 0xFFFF
+MAX_HEADER_SIZE = V2_HEADER.size
+SEQ_BITS = {WIRE_V1: 16, WIRE_V2: 32}
+
+ScreenPacket = namedtuple('ScreenPacket', 'version flags session frame_id index total payload')
+
+
+def new_session_id():
+    return random.getrandbits(32)
+
+
+def packetize(flags, frame_id, data, version=WIRE_V2, session=0, max_payload=MAX_PACKET_SIZE):
+    """把一帧负载切成数据报；超过该版本的分片上限时抛出 ValueError"""
+    total = max(1, -(-len(data) // max_payload))
+    limit = V2_MAX_FRAGMENTS if version >= WIRE_V2 else V1_MAX_FRAGMENTS
+    if total > limit:
+        raise ValueError(f"帧负载 {len(data)} 字节需要 {total} 个分片，超过 v{version} 包头上限 {limit}")
+    packets = []
+    for index in range(total):
+        payload = data[index * max_payload:(index + 1) * max_payload]
+        if version >= WIRE_V2:
+            header = V2_HEADER.pack(WIRE_MAGIC, WIRE_V2, flags, session, frame_id & 0xFFFFFFFF, index, total)
+        else:
+            header = V1_HEADER.pack(flags, frame_id & 0xFFFF, index, total)
+        packets.append(header + payload)
+    return packets
+
+
+def parse_packet(data):
+    """解析一个数据报（自动识别 v1/v2），包头不完整或版本不支持时返回 None"""
+    if data[:2] == WIRE_MAGIC:
+        if len(data) < V2_HEADER.size:
+            return None
+        _, version, flags, session, frame_id, index, total = V2_HEADER.unpack_from(data)
+        if version != WIRE_V2:
+            return None
+        return ScreenPacket(WIRE_V2, flags, session, frame_id, index, total, data[V2_HEADER.size:])
+    if len(data) < V1_HEADER.size:
+        return None
+    flags, frame_id, index, total = V1_HEADER.unpack_from(data)
+    return ScreenPacket(WIRE_V1, flags, None, frame_id, index, total, data[V1_HEADER.size:])
+
+
+def seq_newer(a, b, bits):
+    """序号 a 是否比 b 新（按回绕比较，差值小于半个序号空间视为更新）"""
+    half = 1 << (bits - 1)
+    return 0 < (a - b) % (1 << bits) < half
+
+
+def hello_message(version=WIRE_VERSION):
+    return bytes([CONTROL_HELLO, version])
+
+
+def parse_hello(data):
+    """控制消息是 HELLO 时返回对端支持的最高版本，否则返回 None"""
+    if len(data) == 2 and data[0] == CONTROL_HELLO:
+        return data[1]
+    return None
+
+
+class FrameAssembler:
+    """接收端分片重组：按 (版本, 会话, 帧ID) 缓存分片，只交付比上一帧更新的完整帧
+
+    发送端重启（v2 会话ID变化）时重新开始计数；v1 帧序号按回绕比较。
+    丢失统计供接收端反馈使用：lost_frames 为帧ID的空缺（整帧未交付），
+    lost_packets 为被丢弃的残缺帧中缺少的分片数
+    """
+
+    def __init__(self, timeout=FRAME_TIMEOUT):
+        self.timeout = timeout
+        self.pending = {}
+        self.last = None             # 最后交付的 (版本, 会话, 帧ID)
+        self.stats = {"frames": 0, "stale": 0, "expired": 0, "packets": 0, "lost_frames": 0, "lost_packets": 0}
+
+    def _is_stale(self, packet):
+        if self.last is None:
+            return False
+        version, session, frame_id = self.last
+        if (packet.version, packet.session) != (version, session):
+            return False             # 新的发送端会话
+        return not seq_newer(packet.frame_id, frame_id, SEQ_BITS[packet.version])
+
+    def add(self, packet, now=None):
+        """加入一个分片，帧完整时返回 (标志位, 帧ID, 负载)，否则返回 None"""
+        now = time.monotonic() if now is None else now
+        if not 0 <= packet.index < packet.total or self._is_stale(packet):
+            return None
+        key = (packet.version, packet.session, packet.frame_id)
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.pending[key] = {'fragments': {}, 'time': now, 'total': packet.total,
+                                         'flags': packet.flags}
+        if packet.index not in entry['fragments']:
+            self.stats["packets"] += 1
+        entry['fragments'][packet.index] = packet.payload
+        if len(entry['fragments']) < entry['total']:
+            return None
+        del self.pending[key]
+        if self.last is not None and self.last[:2] == key[:2]:
+            gap = (key[2] - self.last[2]) % (1 << SEQ_BITS[key[0]]) - 1
+            self.stats["lost_frames"] += gap
+        self.last = key
+        self.stats["frames"] += 1
+        # 更早的未完成帧即使补齐也已过期
+        for other in [k for k in self.pending if k[:2] == key[:2] and
+                      not seq_newer(k[2], key[2], SEQ_BITS[key[0]])]:
+            self._discard(other)
+            self.stats["stale"] += 1
+        fragments = entry['fragments']
+        return entry['flags'], packet.frame_id, b''.join(fragments[i] for i in range(entry['total']))
+
+    def expire(self, now=None):
+        """丢弃超时仍不完整的帧"""
+        now = time.monotonic() if now is None else now
+        for key in [k for k, entry in self.pending.items() if now - entry['time'] > self.timeout]:
+            self._discard(key)
+            self.stats["expired"] += 1
+
+    def _discard(self, key):
+        entry = self.pending.pop(key)
+        self.stats["lost_packets"] += entry['total'] - len(entry['fragments'])
+
+
+def dirty_tile_mask(frame, reference, tile_size=TILE_SIZE):
+    """返回 (行数, 列数) 的布尔数组，标记与参考帧不同的瓦片
+
+    先按瓦片高度对行取最大值，再按瓦片宽度（含通道）取最大值，1080p 约 3ms
+    """
+    height, width = frame.shape[:2]
+    channels = frame.shape[2] if frame.ndim == 3 else 1
+    rows, cols = -(-height // tile_size), -(-width // tile_size)
+    diff = cv2.absdiff(frame, reference).reshape(height, width * channels)
+    if (rows * tile_size, cols * tile_size) != (height, width):
+        diff = np.pad(diff, ((0, rows * tile_size - height), (0, (cols * tile_size - width) * channels)))
+    row_max = diff.reshape(rows, tile_size, -1).max(axis=1)
+    return row_max.reshape(rows, cols, tile_size * channels).max(axis=2) > 0
+
+
+def dirty_runs(mask):
+    """把每行连续的变化瓦片合并，产出 (瓦片行, 起始列, 瓦片数)"""
+    for row in np.flatnonzero(mask.any(axis=1)):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], mask[row].view(np.int8), [0]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            yield int(row), int(start), int(end - start)
+
+
+class TileEncoder:
+    """发送端：只编码变化区域，定期插入关键帧"""
+
+    def __init__(self, tile_size=TILE_SIZE, jpeg_quality=JPEG_QUALITY, keyframe_seconds=KEYFRAME_SECONDS,
+                 full_frame_ratio=FULL_FRAME_RATIO):
+        self.tile_size = tile_size
+        self.jpeg_quality = jpeg_quality
+        self.keyframe_seconds = keyframe_seconds
+        self.full_frame_ratio = full_frame_ratio
+        self.reference = None        # 接收端当前应有的画面
+        self.last_keyframe = 0.0
+        self.stats = {"keyframes": 0, "tile_frames": 0, "unchanged": 0, "tiles": 0, "bytes": 0}
+
+    def _jpeg(self, image):
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("JPEG 编码失败")
+        return encoded.tobytes()
+
+    def request_keyframe(self):
+        """下一帧强制发送关键帧"""
+        self.last_keyframe = 0.0
+
+    def encode(self, frame, now=None):
+        """编码一帧，返回 (标志位, 负载)；画面没有变化时返回 None
+
+        frame 应为连续内存的 BGR 图像：mss 截图用 cv2.cvtColor(BGRA2BGR) 转换（约 1ms），
+        切片得到的 [:, :, :3] 视图做差分和复制都要慢一个数量级
+        """
+        job = self.plan(frame, now)
+        if job is None:
+            return None
+        flags, payload = self.compress(job)
+        self.stats["bytes"] += len(payload)
+        return flags, payload
+
+    def plan(self, frame, now=None):
+        """编码的串行部分：与参考帧比较、决定关键帧/瓦片帧并更新参考帧，返回待压缩的任务；画面没有变化时返回 None
+
+        瓦片帧是相对上一帧的增量，plan 必须按采集顺序逐帧调用；返回的任务互不依赖，
+        可以交给多个线程并行 compress（cv2.imencode 会释放 GIL）
+        """
+        now = time.monotonic() if now is None else now
+        if not frame.flags['C_CONTIGUOUS']:
+            frame = np.ascontiguousarray(frame)
+        keyframe = (self.reference is None or self.reference.shape != frame.shape
+                    or now - self.last_keyframe >= self.keyframe_seconds)
+        mask = None
+        if not keyframe:
+            mask = dirty_tile_mask(frame, self.reference, self.tile_size)
+            dirty = int(np.count_nonzero(mask))
+            if not dirty:
+                self.stats["unchanged"] += 1
+                return None
+            keyframe = dirty > mask.size * self.full_frame_ratio
+
+        if keyframe:
+            mask = None
+            self.last_keyframe = now
+            self.stats["keyframes"] += 1
+        else:
+            self.stats["tile_frames"] += 1
+            self.stats["tiles"] += dirty
+        self.reference = frame.copy()
+        return self.reference, mask
+
+    def compress(self, job):
+        """编码的并行部分：对 plan 返回的任务做 JPEG 压缩，返回 (标志位, 负载)"""
+        frame, mask = job
+        if mask is None:
+            return FLAG_KEYFRAME, self._jpeg(frame)
+        return FLAG_TILES, self._encode_tiles(frame, mask)
+
+    def _encode_tiles(self, frame, mask):
+        height, width = frame.shape[:2]
+        t = self.tile_size
+        parts = []
+        for row, col, count in dirty_runs(mask):
+            jpeg = self._jpeg(frame[row * t:(row + 1) * t, col * t:(col + count) * t])
+            parts.append(RECT_HEADER.pack(col, row, count, len(jpeg)))
+            parts.append(jpeg)
+        return TILE_HEADER.pack(width, height, t, len(parts) // 2) + b''.join(parts)
+
+
+class ScreenSender:
+    """发送端：瓦片编码 + 按协商的包头版本分片"""
+
+    def __init__(self, encoder, max_payload=MAX_PACKET_SIZE):
+        self.encoder = encoder
+        self.max_payload = max_payload
+        self.version = WIRE_V1       # 收到接收端 HELLO 之前按旧版包头发送，兼容旧接收端
+        self.session = new_session_id()
+        self.frame_id = 0
+        self.oversize = 0            # 超过当前版本分片上限而无法发送的帧数
+
+    def on_control(self, data):
+        """处理控制端口消息；是 HELLO 时按双方最高共同版本切换，返回 True"""
+        version = parse_hello(data)
+        if version is None:
+            return False
+        version = max(WIRE_V1, min(version, WIRE_VERSION))
+        if version != self.version:
+            print(f"[协商] 接收端支持 v{data[1]}，改用 v{version} 包头")
+            self.version = version
+            self.encoder.request_keyframe()
+        return True
+
+    def encode(self, frame):
+        """编码一帧并分片，返回数据报列表（画面不变时为空）"""
+        job = self.encoder.plan(frame)
+        if job is None:
+            return []
+        return self.packetize(*self.encoder.compress(job))
+
+    def packetize(self, flags, data):
+        """按当前协商的版本给一帧负载分配帧ID并分片；多线程压缩时必须按 plan 的顺序调用"""
+        self.encoder.stats["bytes"] += len(data)
+        self.frame_id += 1
+        try:
+            return packetize(flags, self.frame_id, data, self.version, self.session, self.max_payload)
+        except ValueError as e:
+            self.oversize += 1
+            if self.oversize == 1:
+                print(f"\n[警告] {e}（接收端升级并协商 v2 后即可发送）")
+            return []
+
+
+class TileCompositor:
+    """接收端：持久帧缓冲，关键帧整帧替换，瓦片帧按坐标贴回"""
+
+    def __init__(self):
+        self.frame = None
+        self.stats = {"keyframes": 0, "tile_frames": 0, "waiting_keyframe": 0, "errors": 0}
+
+    def apply(self, flags, data):
+        """应用一帧负载，返回更新后的帧缓冲；无法应用（解码失败或尚无关键帧）时返回 None"""
+        if not flags & FLAG_TILES:
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                self.stats["errors"] += 1
+                return None
+            self.frame = frame
+            self.stats["keyframes"] += 1
+            return self.frame
+
+        width, height, t, count = TILE_HEADER.unpack_from(data)
+        if self.frame is None or self.frame.shape[:2] != (height, width):
+            self.stats["waiting_keyframe"] += 1
+            return None
+        offset = TILE_HEADER.size
+        for _ in range(count):
+            col, row, tiles, length = RECT_HEADER.unpack_from(data, offset)
+            offset += RECT_HEADER.size
+            rect = cv2.imdecode(np.frombuffer(data, dtype=np.uint8, count=length, offset=offset), cv2.IMREAD_COLOR)
+            offset += length
+            if rect is None:
+                self.stats["errors"] += 1
+                continue
+            y, x = row * t, col * t
+            self.frame[y:y + rect.shape[0], x:x + rect.shape[1]] = rect
+        self.stats["tile_frames"] += 1
+        return self.frame
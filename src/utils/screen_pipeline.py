@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+屏幕共享发送流水线
+PC端发送程序（wifi_pc_sender_*）共享，把 采集 → 编码 → 发送 拆成三个阶段并行运行：
+1. 采集线程按目标帧率截屏，放入有界的帧队列；编码跟不上时丢弃队列里最旧的帧，
+   而不是让画面在队列中排队、延迟越积越大（被丢弃的帧还没有参与差分，丢掉不影响接收端画面）
+2. 编码线程池：变化检测（TileEncoder.plan，约 3ms）在锁内按采集顺序串行执行，
+   JPEG 压缩（TileEncoder.compress，耗时的部分）在锁外并行，连续几帧可以同时压缩
+3. 发送线程按帧序号重新排序后分片发送（瓦片帧是增量，必须按顺序到达），并按带宽上限均匀发包，
+   避免关键帧的几百个分片瞬间灌满 WiFi 发送缓冲造成成批丢包
+已做变化检测、尚未发完的帧数有上限：发送跟不上（带宽受限）时编码线程不再取新帧，
+帧留在采集队列里被更新的帧替换，积压只表现为丢帧而不是延迟（已编码的瓦片帧是增量，不能丢）
+统计：采集/发送帧率、丢帧数、采集到发完的延迟与压缩耗时（p50/p95）、带宽、发送失败数，每次 snapshot() 后清零
+自适应：传入 LatencyOptimizer 后，控制端口收到的接收端反馈经 on_control 交给优化器，
+按其档位调整 JPEG 质量、截屏缩放与采集帧率（帧率不超过启动时的目标帧率）
+"""
+
+import os
+import time
+import heapq
+import queue
+import threading
+from collections import deque
+
+import numpy as np
+import cv2
+
+from screen_codec import FLAG_KEYFRAME
+from latency_optimizer import FEEDBACK
+
+# ===== 流水线配置 =====
+ENCODE_WORKERS = min(3, os.cpu_count() or 1)   # 并行压缩的线程数
+CAPTURE_QUEUE_SIZE = 1      # 等待编码的帧数上限，超出时丢弃最旧的帧（1 即只保留最新一帧）
+PACE_MBPS = 40.0            # 发送带宽上限(Mbps)，None 表示不限速
+PACE_BURST = 0.002          # 允许的突发发送量(秒)，小于此的等待不 sleep，减少线程切换
+STATS_WINDOW = 300          # 延迟统计保留的最近样本数
+# ===================
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+class ScreenGrabber:
+    """截屏：mss 实例在首次调用的线程（采集线程）中创建，Windows 下 mss 不能跨线程使用"""
+
+    def __init__(self, width, height, scale=1.0):
+        self.monitor = {"top": 0, "left": 0, "width": width, "height": height}
+        self.full_size = (width, height)
+        self.size = self.full_size
+        self.sct = None
+        self.set_scale(scale)
+
+    def set_scale(self, scale):
+        """设置输出分辨率缩放（尺寸取偶数；尺寸变化后的第一帧会作为关键帧发送）"""
+        width, height = self.full_size
+        self.size = (max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2))
+
+    def __call__(self):
+        if self.sct is None:
+            import mss
+            self.sct = mss.mss()
+        screen = self.sct.grab(self.monitor)
+        # cvtColor 得到连续内存的 BGR 帧，瓦片差分比切片视图快得多
+        frame = cv2.cvtColor(np.frombuffer(screen.bgra, dtype=np.uint8).reshape(
+            screen.height, screen.width, 4), cv2.COLOR_BGRA2BGR)
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
+
+
+class ScreenPipeline:
+    """采集线程 + 编码线程池 + 发送线程
+
+    capture() 返回一帧连续内存的 BGR 图像（只在采集线程中调用，可带 close() 方法，退出时在同一线程调用）；
+    send(packet) 发送一个数据报，失败时抛出异常
+    """
+
+    def __init__(self, sender, capture, send, fps=30, workers=ENCODE_WORKERS, pace_mbps=PACE_MBPS,
+                 capture_queue_size=CAPTURE_QUEUE_SIZE, max_in_flight=None, optimizer=None):
+        self.sender = sender                     # ScreenSender：变化检测/压缩/分片
+        self.capture = capture
+        self.send = send
+        self.max_fps = fps
+        self.frame_interval = 1.0 / fps
+        self.optimizer = optimizer               # LatencyOptimizer：接收端反馈驱动的质量/缩放/帧率
+        self.workers = max(1, workers)
+        self.pace_bps = pace_mbps * 1e6 if pace_mbps else None
+        self.frames = queue.Queue(capture_queue_size)      # (采集时刻, 帧)
+        self.encoded = queue.Queue()                       # (帧序号, 采集时刻, 标志位, 负载)，负载为 None 表示压缩失败
+        # 已做变化检测、尚未发完的帧数上限（压缩中 + 等待发送）；默认至少 2，单线程压缩时也能与发送重叠
+        self.in_flight = threading.Semaphore(max_in_flight or max(2, self.workers))
+        self.plan_lock = threading.Lock()
+        self.next_seq = 0
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.next_send_time = 0.0
+        self.stats_lock = threading.Lock()
+        self.latency = deque(maxlen=STATS_WINDOW)          # 采集到最后一个分片发出(ms)
+        self.encode_ms = deque(maxlen=STATS_WINDOW)        # 单帧压缩耗时(ms)
+        self.totals = {"send_errors": 0, "keyframe_errors": 0}
+        self._reset_interval()
+
+    def _reset_interval(self):
+        self.interval = {"start": time.perf_counter(), "captured": 0, "dropped": 0, "sent_frames": 0,
+                         "bytes": 0, "packets": 0, "send_errors": 0}
+
+    def _count(self, name, value=1):
+        with self.stats_lock:
+            self.interval[name] += value
+
+    # ----- 生命周期 -----
+    def start(self):
+        targets = [("screen-capture", self._capture_loop), ("screen-send", self._send_loop)]
+        targets += [(f"screen-encode-{i}", self._encode_loop) for i in range(self.workers)]
+        for name, target in targets:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self, timeout=1.0):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def is_alive(self):
+        return all(thread.is_alive() for thread in self.threads)
+
+    # ----- 控制消息与自适应 -----
+    def on_control(self, data, addr=None, reply=None):
+        """处理控制端口消息（HELLO 版本协商、接收端反馈），已处理时返回 True；鼠标指令等返回 False"""
+        if self.sender.on_control(data):
+            return True
+        if self.optimizer is None or len(data) != FEEDBACK.size:
+            return False
+        # 发送端自身的延迟（采集到发完）也参与决策：PC 编码跟不上时同样降档
+        with self.stats_lock:
+            latency = _percentile(self.latency, 0.5)
+            elapsed = max(1e-6, time.perf_counter() - self.interval["start"])
+            fps = self.interval["sent_frames"] / elapsed
+        self.optimizer.update_performance_metrics(fps, latency)
+        if not self.optimizer.handle_control(data, addr, reply):
+            return False
+        self.apply_settings(self.optimizer.settings)
+        return True
+
+    def apply_settings(self, settings):
+        """应用 (质量, 缩放, 帧率)；质量对下一次压缩生效，缩放与帧率对下一次截屏生效"""
+        self.sender.encoder.jpeg_quality = settings.quality
+        set_scale = getattr(self.capture, "set_scale", None)
+        if set_scale:
+            set_scale(settings.scale)
+        self.frame_interval = 1.0 / min(self.max_fps, settings.fps)
+
+    # ----- 采集 -----
+    def _capture_loop(self):
+        next_frame_time = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                delay = next_frame_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                # 落后一帧以上时不追赶，从当前时刻重新计时（追赶只会连续采到几乎相同的画面）
+                next_frame_time = max(next_frame_time + self.frame_interval, time.perf_counter())
+                try:
+                    frame = self.capture()
+                except Exception as e:
+                    print(f"\n[错误] 屏幕采集失败: {e}")
+                    time.sleep(0.5)
+                    continue
+                self._offer((time.perf_counter(), frame))
+        finally:
+            close = getattr(self.capture, "close", None)
+            if close:
+                close()
+
+    def _offer(self, item):
+        """放入帧队列；已满时丢弃最旧的帧"""
+        self._count("captured")
+        while True:
+            try:
+                self.frames.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self._count("dropped")
+                except queue.Empty:
+                    pass
+
+    # ----- 编码 -----
+    def _encode_loop(self):
+        while not self.stop_event.is_set():
+            # 发送积压时在这里等待，不取新帧（采集队列里的帧会被更新的帧替换）
+            if not self.in_flight.acquire(timeout=0.1):
+                continue
+            # 取帧与变化检测在同一把锁内，保证 plan 的顺序就是采集顺序、帧序号连续
+            with self.plan_lock:
+                try:
+                    captured, frame = self.frames.get(timeout=0.1)
+                except queue.Empty:
+                    self.in_flight.release()
+                    continue
+                job = self.sender.encoder.plan(frame)
+                if job is None:
+                    self.in_flight.release()
+                    continue
+                seq = self.next_seq
+                self.next_seq += 1
+
+            start = time.perf_counter()
+            try:
+                flags, payload = self.sender.encoder.compress(job)
+            except Exception as e:
+                print(f"\n[错误] 帧压缩失败: {e}")
+                flags, payload = 0, None
+            elapsed = (time.perf_counter() - start) * 1000
+            with self.stats_lock:
+                self.encode_ms.append(elapsed)
+            # 序号已分配，结果必须交给发送线程（否则发送线程会一直等这个序号）
+            self.encoded.put((seq, captured, flags, payload))
+
+    # ----- 发送 -----
+    def _send_loop(self):
+        pending = []            # 按帧序号排序的已编码帧（并行压缩完成的顺序不固定）
+        expected = 0
+        while not self.stop_event.is_set():
+            try:
+                heapq.heappush(pending, self.encoded.get(timeout=0.1))
+            except queue.Empty:
+                continue
+            while pending and pending[0][0] == expected:
+                _, captured, flags, payload = heapq.heappop(pending)
+                expected += 1
+                if payload is None:
+                    self.sender.encoder.request_keyframe()   # 丢了一个增量帧，尽快用关键帧恢复
+                else:
+                    self._send_frame(captured, flags, payload)
+                self.in_flight.release()
+
+    def _send_frame(self, captured, flags, payload):
+        packets = self.sender.packetize(flags, payload)
+        sent_bytes = 0
+        for packet in packets:
+            self._pace(len(packet))
+            try:
+                self.send(packet)
+                sent_bytes += len(packet)
+            except Exception:
+                with self.stats_lock:
+                    self.interval["send_errors"] += 1
+                    self.totals["send_errors"] += 1
+                    if flags & FLAG_KEYFRAME:
+                        self.totals["keyframe_errors"] += 1
+                        if self.totals["keyframe_errors"] == 1 or self.totals["keyframe_errors"] % 100 == 0:
+                            print(f"\n[警告] 关键帧丢包（累计{self.totals['keyframe_errors']}次）")
+        if not packets:
+            return
+        with self.stats_lock:
+            self.interval["sent_frames"] += 1
+            self.interval["bytes"] += sent_bytes
+            self.interval["packets"] += len(packets)
+            self.latency.append((time.perf_counter() - captured) * 1000)
+
+    def _pace(self, size):
+        """按带宽上限均匀发包：累计的发送时间超出突发量时才 sleep"""
+        if not self.pace_bps:
+            return
+        now = time.perf_counter()
+        self.next_send_time = max(self.next_send_time, now - PACE_BURST) + size * 8 / self.pace_bps
+        delay = self.next_send_time - now
+        if delay > PACE_BURST:
+            time.sleep(delay - PACE_BURST)
+
+    # ----- 统计 -----
+    def snapshot(self):
+        """返回自上次调用以来的统计，并开始新的统计区间"""
+        with self.stats_lock:
+            interval, latency, encode_ms = self.interval, list(self.latency), list(self.encode_ms)
+            self._reset_interval()
+            self.latency.clear()
+            self.encode_ms.clear()
+            send_errors_total = self.totals["send_errors"]
+        elapsed = max(1e-6, time.perf_counter() - interval["start"])
+        return {
+            "capture_fps": interval["captured"] / elapsed,
+            "send_fps": interval["sent_frames"] / elapsed,
+            "dropped": interval["dropped"],
+            "latency_p50": _percentile(latency, 0.5),
+            "latency_p95": _percentile(latency, 0.95),
+            "encode_p50": _percentile(encode_ms, 0.5),
+            "mbps": interval["bytes"] * 8 / elapsed / 1e6,
+            "packets": interval["packets"],
+            "send_errors": interval["send_errors"],
+            "loss_rate": interval["send_errors"] / max(1, interval["packets"]) * 100,
+            "send_errors_total": send_errors_total,
+        }
+
+    def format_stats(self, snapshot=None):
+        """一行状态：帧率、延迟、带宽、丢帧与发送失败"""
+        s = snapshot or self.snapshot()
+        tiles = self.sender.encoder.stats
+        return (f"[状态] FPS: 采集 {s['capture_fps']:.1f} / 发送 {s['send_fps']:.1f} | "
+                f"延迟: p50 {s['latency_p50']:.0f}ms p95 {s['latency_p95']:.0f}ms (压缩 {s['encode_p50']:.0f}ms) | "
+                f"带宽: {s['mbps']:.2f} Mbps | 丢帧: {s['dropped']} | 丢包率: {s['loss_rate']:.1f}% | "
+                f"模式: 瓦片JPEG v{self.sender.version} × {self.workers}线程 | "
+                f"关键帧 {tiles['keyframes']} / 瓦片帧 {tiles['tile_frames']} / 静止 {tiles['unchanged']}"
+                + (f" | {self.optimizer.format_status()}" if self.optimizer else ""))
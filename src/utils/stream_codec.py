@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+开发板摄像头视频流编解码
+开发板（NetworkManager.send_stream_frame）与 PC（BoardCameraReceiver）共享。
+眼底相机画面大部分时间几乎静止，逐帧独立 JPEG 没有利用帧间冗余；安装 PyAV 时改用
+H.264 软件编码（x264 ultrafast + zerolatency：无 B 帧、无前瞻，编码一帧立即输出一帧），
+未安装时回退到 JPEG。
+线路格式不变（仍是 9 字节分片包头 + 整帧负载），接收端按负载开头识别：
+JPEG 以 FF D8 开头，H.264 为 Annex B 码流（00 00 01 起始码），SPS/PPS 随每个关键帧发送，
+接收端中途启动也能从下一个关键帧开始解码。
+丢帧后 H.264 解码器等待关键帧，并经摄像头套接字向开发板请求关键帧；
+PC 没有 PyAV 时请求开发板改用 JPEG。
+流序号由开发板逐帧递增（每次启动从随机值开始，避免与 PC 端最近完成的分片 ID 重复），
+接收端按序号统计丢帧、丢弃迟到的旧帧，流中断或序号大幅跳变时视为开发板重启重新计数
+"""
+
+import time
+import struct
+from fractions import Fraction
+
+import cv2
+import numpy as np
+
+try:
+    import av
+    HAS_AV = True
+except ImportError:
+    HAS_AV = False
+
+# ===== 配置 =====
+CODEC_JPEG = "jpeg"
+CODEC_H264 = "h264"
+JPEG_QUALITY = 60            # 原视频流的 JPEG 质量
+KEYFRAME_SECONDS = 2.0       # H.264 关键帧间隔(秒)，丢包后最迟在该时间内恢复
+H264_PRESET = "ultrafast"    # 开发板 CPU 有限，用最快的预设
+KEYFRAME_REQUEST_INTERVAL = 0.5  # 接收端请求关键帧的最小间隔(秒)
+STREAM_IDLE_RESET = 2.0      # 视频流中断超过该时间(秒)后重新开始按序号排序（开发板可能已重启）
+STREAM_MAX_GAP = 1000        # 流序号前后跳变超过该帧数视为开发板重启后的新一轮序号
+
+# 接收端 → 开发板的控制消息（与 latency_optimizer 的反馈 0x11 / 回显 0x12 共用摄像头套接字）
+CONTROL_STREAM = 0x13
+REQUEST_KEYFRAME = 1
+REQUEST_JPEG = 2
+STREAM_CONTROL = struct.Struct('!BB')
+# ===============
+
+JPEG_MAGIC = b'\xff\xd8'
+NAL_IDR = 5
+
+
+def quality_to_crf(quality):
+    """把 JPEG 质量档位（40~85）粗略换算成 x264 CRF（35~17），数值越小画质越好"""
+    return int(round(min(51, max(0, 51 - 0.4 * quality))))
+
+
+def stream_control_message(request):
+    return STREAM_CONTROL.pack(CONTROL_STREAM, request)
+
+
+def parse_stream_control(data):
+    """是视频流控制消息时返回请求类型，否则返回 None"""
+    if len(data) != STREAM_CONTROL.size or data[0] != CONTROL_STREAM:
+        return None
+    return data[1]
+
+
+def _scaled(frame, scale):
+    if scale == 1.0:
+        return frame
+    height, width = frame.shape[:2]
+    size = (max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def is_h264_keyframe(data):
+    """Annex B 码流中是否包含 IDR 片"""
+    start = data.find(b'\x00\x00\x01')
+    while start != -1 and start + 3 < len(data):
+        if data[start + 3] & 0x1F == NAL_IDR:
+            return True
+        start = data.find(b'\x00\x00\x01', start + 3)
+    return False
+
+
+class JpegStreamEncoder:
+    """逐帧独立 JPEG"""
+
+    codec = CODEC_JPEG
+
+    def __init__(self, fps=15):
+        self.stats = {"frames": 0, "keyframes": 0, "bytes": 0}
+
+    def request_keyframe(self):
+        """JPEG 每帧都是关键帧"""
+
+    def encode(self, frame, quality=JPEG_QUALITY, scale=1.0):
+        ok, encoded = cv2.imencode('.jpg', _scaled(frame, scale), [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        if not ok:
+            raise ValueError("JPEG 编码失败")
+        data = encoded.tobytes()
+        self.stats["frames"] += 1
+        self.stats["keyframes"] += 1
+        self.stats["bytes"] += len(data)
+        return data
+
+    def close(self):
+        pass
+
+
+class H264StreamEncoder:
+    """x264 低延迟编码：分辨率或质量变化时重建编码器（新编码器从关键帧开始）"""
+
+    codec = CODEC_H264
+
+    def __init__(self, fps=15, keyframe_seconds=KEYFRAME_SECONDS, preset=H264_PRESET):
+        if not HAS_AV:
+            raise ImportError("H.264 编码需要 PyAV（pip install av）")
+        self.fps = fps
+        self.keyframe_seconds = keyframe_seconds
+        self.preset = preset
+        self.context = None
+        self.config = None           # (宽, 高, CRF)
+        self.start = None
+        self.force_keyframe = False
+        self.stats = {"frames": 0, "keyframes": 0, "bytes": 0}
+
+    def _open(self, width, height, crf):
+        context = av.CodecContext.create('libx264', 'w')
+        context.width, context.height = width, height
+        context.pix_fmt = 'yuv420p'
+        context.time_base = Fraction(1, 1000)
+        context.framerate = Fraction(self.fps, 1)
+        context.gop_size = max(1, int(self.keyframe_seconds * self.fps))
+        context.max_b_frames = 0
+        context.options = {'preset': self.preset, 'tune': 'zerolatency', 'crf': str(crf)}
+        self.context = context
+        self.config = (width, height, crf)
+        self.start = time.monotonic()
+
+    def request_keyframe(self):
+        """下一帧强制编码为关键帧（接收端丢帧后请求）"""
+        self.force_keyframe = True
+
+    def encode(self, frame, quality=JPEG_QUALITY, scale=1.0):
+        """编码一帧，返回 Annex B 码流（zerolatency 下每帧立即输出）"""
+        frame = _scaled(frame, scale)
+        height, width = frame.shape[:2]
+        config = (width, height, quality_to_crf(quality))
+        if config != self.config:
+            self._open(*config)
+        video_frame = av.VideoFrame.from_ndarray(frame, format='bgr24')
+        video_frame.pts = int((time.monotonic() - self.start) * 1000)
+        if self.force_keyframe:
+            video_frame.pict_type = av.video.frame.PictureType.I
+            self.force_keyframe = False
+        packets = self.context.encode(video_frame)
+        data = b''.join(bytes(packet) for packet in packets)
+        self.stats["frames"] += 1
+        self.stats["keyframes"] += sum(1 for packet in packets if packet.is_keyframe)
+        self.stats["bytes"] += len(data)
+        return data
+
+    def close(self):
+        self.context = None
+        self.config = None
+
+
+def create_stream_encoder(codec=CODEC_H264, fps=15):
+    """按配置创建编码器；要求 H.264 但没有 PyAV 时回退到 JPEG"""
+    if codec == CODEC_H264:
+        if HAS_AV:
+            return H264StreamEncoder(fps)
+        print("[WARN] 未安装 PyAV，视频流回退为 JPEG 编码")
+    return JpegStreamEncoder(fps)
+
+
+class StreamDecoder:
+    """接收端：按负载识别 JPEG / H.264 并解码为 BGR 图像
+
+    H.264 帧必须按顺序解码；调用方发现丢帧或乱序时调用 lost()，之后跳过非关键帧，
+    needs_keyframe 为 True 期间应向发送端请求关键帧
+    """
+
+    def __init__(self):
+        self.context = None
+        self.needs_keyframe = False
+        self.stats = {"jpeg": 0, "h264": 0, "skipped": 0, "errors": 0, "unsupported": 0}
+
+    def lost(self):
+        """前面有帧丢失，H.264 参考链已断"""
+        if self.context is not None:
+            self.needs_keyframe = True
+
+    def decode(self, data):
+        """解码一帧负载，返回图像；尚不能显示（等待关键帧、解码失败、不支持 H.264）时返回 None"""
+        if data[:2] == JPEG_MAGIC:
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self.stats["jpeg" if image is not None else "errors"] += 1
+            return image
+        if not HAS_AV:
+            self.stats["unsupported"] += 1
+            return None
+
+        data = bytes(data)
+        keyframe = is_h264_keyframe(data)
+        if self.context is None or (self.needs_keyframe and keyframe):
+            if not keyframe:
+                self.needs_keyframe = True  # 中途加入或参考链已断，请求关键帧
+                self.stats["skipped"] += 1
+                return None
+            self.context = av.CodecContext.create('h264', 'r')
+            self.needs_keyframe = False
+        elif self.needs_keyframe:
+            self.stats["skipped"] += 1
+            return None
+
+        try:
+            frames = self.context.decode(av.Packet(data))
+        except av.error.FFmpegError:
+            self.stats["errors"] += 1
+            self.needs_keyframe = True
+            return None
+        if not frames:
+            return None
+        self.stats["h264"] += 1
+        return frames[-1].to_ndarray(format='bgr24')
+
+
+class StreamSequence:
+    """接收端：按开发板递增的流序号统计收到/丢失的帧，识别迟到的旧帧与开发板重启
+
+    accept() 返回 False 表示迟到的旧帧，应丢弃（H.264 不能乱序解码）；
+    返回 True 后 broken 表示与上一帧之间不连续（丢帧或新一轮序号），H.264 解码器应等待关键帧
+    """
+
+    def __init__(self, idle_reset=STREAM_IDLE_RESET, max_gap=STREAM_MAX_GAP):
+        self.idle_reset = idle_reset
+        self.max_gap = max_gap
+        self.last_id = None
+        self.last_time = 0
+        self.broken = False
+        self.frames = 0
+        self.lost_frames = 0
+        self.restarts = 0
+
+    def accept(self, stream_id, now=None):
+        """登记一帧的流序号，迟到的旧帧返回 False"""
+        now = time.time() if now is None else now
+        self.broken = False
+        if self.last_id is not None:
+            gap = (stream_id - self.last_id) & 0xFFFFFFFF
+            behind = (self.last_id - stream_id) & 0xFFFFFFFF
+            if now - self.last_time > self.idle_reset or (gap > self.max_gap and behind > self.max_gap):
+                # 流中断过，或序号大幅跳变（开发板重启后从新的随机值开始）：新一轮序号，不计丢帧
+                self.restarts += 1
+                self.broken = True
+            elif behind <= self.max_gap:
+                return False            # 重复或迟到的旧帧
+            else:
+                self.lost_frames += gap - 1
+                self.broken = gap != 1
+        self.last_id = stream_id
+        self.last_time = now
+        self.frames += 1
+        return True
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语音活动检测（VAD）
+开发板录音与PC端麦克风识别共用的语音起止检测
+功能：
+1. 按 30ms 帧判决语音/非语音：安装了 webrtcvad 时使用 WebRTC VAD，
+   否则使用 短时能量 + 过零率（自适应噪声底）
+2. 起止状态机：连续语音达到 START_MS 判定开始说话，开头静音只保留 PRE_ROLL_MS；
+   开始说话后连续静音达到 trailing_silence_ms 判定说完
+3. feed() 只返回语音段（含少量前导与结尾静音），调用方可边录边发送，说完即停止录音
+
+仅支持 16bit 单声道 PCM。
+
+用法:
+    vad = VoiceActivityDetector(16000)
+    while not vad.ended:
+        voiced = vad.feed(stream.read(1024))
+        if voiced:
+            send(voiced)
+"""
+
+import math
+from array import array
+from collections import deque
+
+try:
+    import webrtcvad
+    HAS_WEBRTCVAD = True
+except ImportError:
+    HAS_WEBRTCVAD = False
+
+# ===== VAD配置 =====
+FRAME_MS = 30                # 判决帧长（WebRTC VAD 支持 10/20/30ms）
+START_MS = 90                # 连续语音达到该时长才判定开始说话（滤除按键、咳嗽等脉冲）
+TRAILING_SILENCE_MS = 800    # 开始说话后连续静音达到该时长判定说完
+PRE_ROLL_MS = 300            # 开始说话前保留的音频，避免切掉首字
+WEBRTC_AGGRESSIVENESS = 2    # WebRTC VAD 激进程度 0~3
+
+MIN_NOISE_DB = 20.0          # 噪声底下限，防止数字静音把门限拉得过低
+SPEECH_MARGIN_DB = 10.0      # 能量高于噪声底该值判为语音
+FRICATIVE_MARGIN_DB = 5.0    # 清辅音：能量高于噪声底该值且过零率高也判为语音
+FRICATIVE_ZCR = 0.3          # 清辅音的过零率下限
+NOISE_ADAPT = 0.05           # 非语音帧上调噪声底的速度（下降时立即跟随）
+# ===================
+
+
+def frame_energy_db(samples):
+    """帧能量(dB)，16bit 满幅正弦约 87dB"""
+    if not samples:
+        return 0.0
+    rms = math.sqrt(sum(s * s for s in samples) / len(samples))
+    return 20 * math.log10(rms + 1.0)
+
+
+def zero_crossing_rate(samples):
+    """过零率：相邻采样符号变化的比例"""
+    if len(samples) < 2:
+        return 0.0
+    crossings = sum(1 for a, b in zip(samples, samples[1:]) if (a < 0) != (b < 0))
+    return crossings / (len(samples) - 1)
+
+
+class VoiceActivityDetector:
+    """逐帧语音判决 + 说话起止状态机"""
+
+    def __init__(self, sample_rate=16000, trailing_silence_ms=TRAILING_SILENCE_MS, start_ms=START_MS,
+                 pre_roll_ms=PRE_ROLL_MS, frame_ms=FRAME_MS, backend='auto'):
+        """backend: 'auto'（有 webrtcvad 则用）/ 'webrtc' / 'energy'"""
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.end_frames = max(1, trailing_silence_ms // frame_ms)
+        self.pre_roll = deque(maxlen=max(1, pre_roll_ms // frame_ms))
+
+        self.webrtc = None
+        if backend in ('auto', 'webrtc') and HAS_WEBRTCVAD and frame_ms in (10, 20, 30) \
+                and sample_rate in (8000, 16000, 32000, 48000):
+            self.webrtc = webrtcvad.Vad(WEBRTC_AGGRESSIVENESS)
+        elif backend == 'webrtc':
+            print("[VAD] webrtcvad 不可用，改用能量/过零率检测")
+        self.backend = 'webrtc' if self.webrtc else 'energy'
+
+        self.buffer = bytearray()
+        self.noise_db = None
+        self.started = False
+        self.ended = False
+        self.speech_run = 0
+        self.silence_run = 0
+        self.stats = {'frames': 0, 'speech_frames': 0, 'voiced_bytes': 0, 'trimmed_bytes': 0}
+
+    @property
+    def speech_start_ms(self):
+        """判定开始说话的时刻（相对录音开始，含前导保留）"""
+        return self.stats['trimmed_bytes'] * 1000 // (self.sample_rate * 2)
+
+    def is_speech(self, frame):
+        """单帧判决"""
+        if self.webrtc:
+            return self.webrtc.is_speech(bytes(frame), self.sample_rate)
+
+        samples = array('h', bytes(frame))
+        energy = frame_energy_db(samples)
+        if self.noise_db is None:
+            # 录音开头通常是环境噪声；即使一开口就说话，字间停顿也会立即把噪声底拉下来
+            self.noise_db = max(MIN_NOISE_DB, energy)
+        margin = energy - self.noise_db
+        speech = margin > SPEECH_MARGIN_DB or (
+            margin > FRICATIVE_MARGIN_DB and zero_crossing_rate(samples) > FRICATIVE_ZCR)
+        if energy < self.noise_db:
+            self.noise_db = max(MIN_NOISE_DB, energy)
+        elif not speech:
+            self.noise_db += NOISE_ADAPT * (energy - self.noise_db)
+        return speech
+
+    def feed(self, pcm):
+        """送入任意长度的PCM，返回其中应保留的语音段（可能为空）"""
+        if self.ended:
+            return b''
+        self.buffer += pcm
+        output = bytearray()
+        while len(self.buffer) >= self.frame_bytes and not self.ended:
+            frame = bytes(self.buffer[:self.frame_bytes])
+            del self.buffer[:self.frame_bytes]
+            self._process(frame, output)
+        self.stats['voiced_bytes'] += len(output)
+        return bytes(output)
+
+    def flush(self):
+        """录音结束时调用，返回缓冲中剩余的不足一帧的语音"""
+        if not self.started or self.ended:
+            return b''
+        rest = bytes(self.buffer)
+        self.buffer.clear()
+        self.stats['voiced_bytes'] += len(rest)
+        return rest
+
+    def _process(self, frame, output):
+        self.stats['frames'] += 1
+        speech = self.is_speech(frame)
+        if speech:
+            self.stats['speech_frames'] += 1
+
+        if not self.started:
+            if len(self.pre_roll) == self.pre_roll.maxlen:
+                self.stats['trimmed_bytes'] += len(self.pre_roll[0])
+            self.pre_roll.append(frame)
+            self.speech_run = self.speech_run + 1 if speech else 0
+            if self.speech_run >= self.start_frames:
+                self.started = True
+                for buffered in self.pre_roll:
+                    output += buffered
+                self.pre_roll.clear()
+            return
+
+        output += frame
+        self.silence_run = 0 if speech else self.silence_run + 1
+        if self.silence_run >= self.end_frames:
+            self.ended = True
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语音二进制分帧协议
+开发板与PC端共享的语音流收发实现（替代 JSON + base64 的整段传输）
+功能：
+1. 每个UDP数据报是一帧，固定18字节包头 + 原始PCM负载：
+   [2字节魔数 'VF'][1字节版本][1字节标志位][1字节编码][1字节声道数]
+   [4字节流ID][4字节帧序号][4字节采样率][负载]
+2. 流的首帧可以是元数据帧（FLAG_META，负载为UTF-8 JSON），末帧带 FLAG_END
+3. 发送端按实时播放速率的倍数节拍发送，开头一小段不限速，接收端收到首帧即可开始播放
+4. 接收端按 (地址, 流ID) 重排乱序帧，缺帧等待超过 REORDER_WAIT 即视为丢失并跳过，
+   长时间无新帧的流补发结束帧，保证消费方总能收到 FLAG_END
+5. StreamPlayer：基于 pyaudio 的流式播放器（抖动缓冲 + 欠载统计），开发板两套语音程序共用
+"""
+
+import io
+import json
+import wave
+import time
+import queue
+import random
+import struct
+import threading
+from collections import namedtuple, OrderedDict, deque
+
+# ===== 协议配置 =====
+MAGIC = b'VF'
+VERSION = 1
+HEADER = struct.Struct('!2sBBBBIII')
+HEADER_SIZE = HEADER.size    # 18字节
+FRAME_PAYLOAD = 1280         # 每帧PCM字节数（16kHz/16bit单声道为40ms），包头+负载小于以太网MTU
+
+FLAG_END = 0x01              # 流的最后一帧
+FLAG_META = 0x02             # 元数据帧（负载为JSON）
+
+CODEC_PCM16 = 1              # 16bit 有符号小端PCM
+CODEC_PCM8 = 2               # 8bit 无符号PCM
+CODEC_OPUS = 3               # 预留，暂未实现编解码
+SAMPLE_WIDTHS = {CODEC_PCM16: 2, CODEC_PCM8: 1}
+
+DEFAULT_SAMPLE_RATE = 16000  # 无WAV头的裸PCM按 16kHz/16bit/单声道 处理
+SEND_PACE = 8.0              # 发送速率上限：实时播放速率的倍数
+SEND_BURST = 1.0             # 开头不限速发送的音频时长(秒)
+RECV_BUFFER_BYTES = 1024 * 1024  # 建议的接收套接字缓冲区大小
+REORDER_WAIT = 0.05          # 缺帧最多等待该时间(秒)，超时即视为丢失并跳过
+MAX_REORDER = 64             # 缺帧后最多缓存的后续帧数，超过立即跳过缺失帧
+STREAM_TIMEOUT = 3.0         # 流超过该时间(秒)无新帧即视为结束
+POLL_INTERVAL = 0.05         # 接收线程的套接字超时，保证按时跳过缺帧和收尾过期流
+COMPLETED_HISTORY = 256      # 记住最近结束的流，丢弃其迟到的帧
+PLAYBACK_IDLE = 1.0          # 播放线程空闲该时间(秒)后退出
+JITTER_BUFFER_MS = 120       # 播放端抖动缓冲深度(毫秒)：起播和欠载后都先缓冲到该深度
+# ===================
+
+VoiceFrame = namedtuple('VoiceFrame', 'stream_id seq flags codec channels sample_rate payload')
+
+
+def new_stream_id():
+    """随机32位流ID（开发板与PC端各自生成，冲突概率可忽略）"""
+    return random.getrandbits(32)
+
+
+def codec_for_width(sample_width):
+    for codec, width in SAMPLE_WIDTHS.items():
+        if width == sample_width:
+            return codec
+    raise ValueError(f"不支持的采样宽度: {sample_width}")
+
+
+def is_voice_frame(data):
+    return len(data) >= HEADER_SIZE and data[:2] == MAGIC
+
+
+def encode_frame(stream_id, seq, payload, sample_rate, codec=CODEC_PCM16, channels=1, flags=0):
+    """编码一帧"""
+    return HEADER.pack(MAGIC, VERSION, flags, codec, channels, stream_id, seq, sample_rate) + bytes(payload)
+
+
+def decode_frame(data):
+    """解码一帧，非本协议或版本不符时返回 None"""
+    if not is_voice_frame(data):
+        return None
+    magic, version, flags, codec, channels, stream_id, seq, sample_rate = HEADER.unpack_from(data)
+    if version != VERSION:
+        return None
+    return VoiceFrame(stream_id, seq, flags, codec, channels, sample_rate, bytes(data[HEADER_SIZE:]))
+
+
+def read_wav(audio_data, sample_rate=DEFAULT_SAMPLE_RATE):
+    """在内存中解析WAV，返回 (PCM memoryview, 采样率, 采样宽度, 声道数)；非WAV按裸PCM处理"""
+    if audio_data[:4] != b'RIFF':
+        return memoryview(audio_data), sample_rate, 2, 1
+    with wave.open(io.BytesIO(audio_data), 'rb') as wf:
+        pcm = wf.readframes(wf.getnframes())
+        return memoryview(pcm), wf.getframerate(), wf.getsampwidth(), wf.getnchannels()
+
+
+class OutgoingStream:
+    """一条正在发送的语音流，可分多次 write，最后 end"""
+
+    def __init__(self, sender, addr, sample_rate, sample_width, channels, metadata=None):
+        self.sender = sender
+        self.addr = addr
+        self.stream_id = new_stream_id()
+        self.sample_rate = sample_rate
+        self.codec = codec_for_width(sample_width)
+        self.channels = channels
+        self.bytes_per_second = sample_rate * sample_width * channels
+        self.seq = 0
+        self.audio_bytes = 0
+        self.start_time = None
+        self.closed = False
+        if metadata:
+            self._send(json.dumps(metadata, ensure_ascii=False).encode('utf-8'), FLAG_META)
+
+    def write(self, pcm):
+        """发送一段PCM，按 FRAME_PAYLOAD 切帧并节拍发送"""
+        view = memoryview(pcm)
+        for i in range(0, len(view), FRAME_PAYLOAD):
+            chunk = view[i:i + FRAME_PAYLOAD]
+            self._pace()
+            self._send(chunk, 0)
+            self.audio_bytes += len(chunk)
+
+    def end(self):
+        """发送结束帧"""
+        if not self.closed:
+            self.closed = True
+            self._send(b'', FLAG_END)
+            self.sender.stats['streams'] += 1
+
+    def _pace(self):
+        if self.start_time is None:
+            self.start_time = time.time()
+        if self.sender.pace <= 0:
+            return
+        audio_seconds = self.audio_bytes / self.bytes_per_second
+        if audio_seconds <= self.sender.burst:
+            return
+        target = self.start_time + (audio_seconds - self.sender.burst) / self.sender.pace
+        delay = target - time.time()
+        if delay > 0.001:
+            time.sleep(delay)
+
+    def _send(self, payload, flags):
+        frame = encode_frame(self.stream_id, self.seq, payload, self.sample_rate,
+                             self.codec, self.channels, flags)
+        self.sender.sock.sendto(frame, self.addr)
+        self.seq += 1
+        self.sender.stats['frames_sent'] += 1
+        self.sender.stats['bytes_sent'] += len(frame)
+
+
+class VoiceStreamSender:
+    """语音流发送端"""
+
+    def __init__(self, sock, pace=SEND_PACE, burst=SEND_BURST):
+        self.sock = sock
+        self.pace = pace              # <=0 表示不限速
+        self.burst = burst
+        self.stats = {'streams': 0, 'frames_sent': 0, 'bytes_sent': 0}
+
+    def open_stream(self, addr, sample_rate, sample_width=2, channels=1, metadata=None):
+        return OutgoingStream(self, addr, sample_rate, sample_width, channels, metadata)
+
+    def send_stream(self, addr, pcm, sample_rate, sample_width=2, channels=1, metadata=None):
+        """整段PCM作为一条流发送，返回流ID"""
+        stream = self.open_stream(addr, sample_rate, sample_width, channels, metadata)
+        stream.write(pcm)
+        stream.end()
+        return stream.stream_id
+
+
+class _IncomingStream:
+    __slots__ = ('next_seq', 'pending', 'last_active', 'gap_since', 'template')
+
+    def __init__(self, frame):
+        self.next_seq = 0
+        self.pending = {}
+        self.last_active = time.time()
+        self.gap_since = None             # 当前缺帧开始等待的时间
+        self.template = frame
+
+
+class VoiceStreamReceiver:
+    """语音流接收端：乱序重排、丢帧跳过，按序回调 on_frame(addr, frame)"""
+
+    def __init__(self, on_frame, reorder_wait=REORDER_WAIT, max_reorder=MAX_REORDER,
+                 stream_timeout=STREAM_TIMEOUT, completed_history=COMPLETED_HISTORY):
+        self.on_frame = on_frame
+        self.reorder_wait = reorder_wait
+        self.max_reorder = max_reorder
+        self.stream_timeout = stream_timeout
+        self.completed_history = completed_history
+        self.streams = {}                 # (addr, stream_id) -> _IncomingStream
+        self.completed = OrderedDict()    # 最近结束的流
+        self.lock = threading.Lock()
+        self.stats = {'frames': 0, 'lost_frames': 0, 'late_frames': 0, 'truncated_streams': 0}
+
+    def handle_datagram(self, data, addr):
+        """处理一个数据报，非语音帧返回 False（由调用方按其它协议处理）"""
+        frame = decode_frame(data)
+        if frame is None:
+            return False
+        key = (addr, frame.stream_id)
+        ready = ()
+        with self.lock:
+            self.stats['frames'] += 1
+            if key in self.completed:
+                self.stats['late_frames'] += 1
+                return True
+            stream = self.streams.get(key)
+            if stream is None:
+                stream = self.streams[key] = _IncomingStream(frame)
+            stream.last_active = time.time()
+            if frame.seq < stream.next_seq:
+                self.stats['late_frames'] += 1
+                return True
+            stream.pending[frame.seq] = frame
+            ready = self._drain(key, stream, stream.last_active, force=False)
+        for item in ready:
+            self.on_frame(addr, item)
+        return True
+
+    def expire_stale(self, now=None):
+        """跳过等待超时的缺帧；结束长时间无新帧的流（交付剩余帧并补发结束帧）"""
+        now = now or time.time()
+        ready = []
+        with self.lock:
+            for key, stream in list(self.streams.items()):
+                force = now - stream.last_active > self.stream_timeout
+                if force or stream.pending:
+                    ready.extend((key[0], frame) for frame in self._drain(key, stream, now, force))
+        for addr, item in ready:
+            self.on_frame(addr, item)
+
+    def _drain(self, key, stream, now, force):
+        """返回可按序交付的帧；force 时跳过所有缺口直到流结束"""
+        ready = []
+        while True:
+            frame = stream.pending.pop(stream.next_seq, None)
+            if frame is None:
+                if not stream.pending:
+                    break
+                if stream.gap_since is None:
+                    stream.gap_since = now
+                if (not force and len(stream.pending) <= self.max_reorder
+                        and now - stream.gap_since < self.reorder_wait):
+                    break
+                skip_to = min(stream.pending)
+                self.stats['lost_frames'] += skip_to - stream.next_seq
+                stream.next_seq = skip_to
+                stream.gap_since = None
+                continue
+            stream.next_seq += 1
+            stream.gap_since = None
+            ready.append(frame)
+            if frame.flags & FLAG_END:
+                self._finish(key)
+                return ready
+        if force:
+            # 结束帧丢失：补一个空的结束帧，消费方据此收尾
+            template = stream.template
+            self.stats['truncated_streams'] += 1
+            ready.append(template._replace(seq=stream.next_seq, flags=FLAG_END, payload=b''))
+            self._finish(key)
+        return ready
+
+    def _finish(self, key):
+        self.streams.pop(key, None)
+        self.completed[key] = True
+        while len(self.completed) > self.completed_history:
+            self.completed.popitem(last=False)
+
+
+class StreamPlayer:
+    """开发板流式播放器（带抖动缓冲）：缓冲到 buffer_ms 即开始播放，也兼容整段WAV
+
+    播放中若设备已播完已写入的音频而新帧仍未到达，记为一次欠载，
+    之后重新缓冲到 buffer_ms 再继续输出，避免断续的爆音。
+    """
+
+    def __init__(self, audio, output_device=None, buffer_ms=JITTER_BUFFER_MS):
+        self.audio = audio                # pyaudio.PyAudio 实例
+        self.output_device = output_device
+        self.buffer_ms = buffer_ms
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.is_playing = False
+        self.stream = None
+        self.stream_params = None
+        self.jitter = deque()             # 等待写入设备的PCM
+        self.buffered = 0
+        self.buffering = True
+        self.bytes_per_second = 0
+        self.play_deadline = 0.0          # 已写入的音频预计播完的时间
+        self.first_frame_time = None
+        self.stats = {'streams': 0, 'frames': 0, 'underruns': 0, 'startup_ms': 0.0}
+
+    def play_frame(self, addr, frame):
+        """VoiceStreamReceiver 的回调"""
+        self._enqueue(frame)
+
+    def play_wav(self, wav_data):
+        self._enqueue(wav_data)
+
+    def format_stats(self):
+        return (f"语音流 {self.stats['streams']}, 帧 {self.stats['frames']}, "
+                f"欠载 {self.stats['underruns']}, 最近起播延迟 {self.stats['startup_ms']:.0f}ms")
+
+    def _enqueue(self, item):
+        with self.lock:
+            self.queue.put(item)
+            if not self.is_playing:
+                self.is_playing = True
+                threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=PLAYBACK_IDLE)
+                except queue.Empty:
+                    with self.lock:
+                        if self.queue.empty():
+                            self.is_playing = False
+                            return
+                    continue
+                if isinstance(item, VoiceFrame):
+                    self._play_frame(item)
+                else:
+                    self._close_stream()
+                    self._play_wav(item)
+        except Exception as e:
+            print(f"[错误] 播放失败: {e}")
+            with self.lock:
+                self.is_playing = False
+        finally:
+            self._close_stream()
+
+    def _play_frame(self, frame):
+        if frame.flags & FLAG_META:
+            return
+        if frame.payload:
+            self.stats['frames'] += 1
+            params = (SAMPLE_WIDTHS.get(frame.codec, 2), frame.channels, frame.sample_rate)
+            if self.stream is None or params != self.stream_params:
+                self._open_stream(*params)
+                self.stats['streams'] += 1
+                self.first_frame_time = time.time()
+                self.buffering = True
+            elif not self.buffering and time.time() > self.play_deadline:
+                self.stats['underruns'] += 1
+                self.buffering = True
+            self.jitter.append(frame.payload)
+            self.buffered += len(frame.payload)
+            if not self.buffering or self.buffered >= self.bytes_per_second * self.buffer_ms / 1000:
+                self._flush()
+        if frame.flags & FLAG_END and self.stream is not None:
+            self._flush()
+            self._close_stream()
+            print("[完成] 语音播放完成")
+
+    def _flush(self):
+        """把抖动缓冲中的音频写入设备（设备缓冲满时 write 阻塞，天然按实时节拍）"""
+        now = time.time()
+        if self.buffering:
+            self.buffering = False
+            self.play_deadline = max(self.play_deadline, now)
+            if self.first_frame_time is not None:
+                self.stats['startup_ms'] = (now - self.first_frame_time) * 1000
+                self.first_frame_time = None
+                print("[播放] 开始播放语音...")
+        while self.jitter:
+            data = self.jitter.popleft()
+            self.stream.write(data)
+            self.play_deadline += len(data) / self.bytes_per_second
+        self.buffered = 0
+
+    def _play_wav(self, wav_data):
+        with wave.open(io.BytesIO(wav_data), 'rb') as wf:
+            self._open_stream(wf.getsampwidth(), wf.getnchannels(), wf.getframerate())
+            print("[播放] 开始播放语音...")
+            data = wf.readframes(1024)
+            while data:
+                self.stream.write(data)
+                data = wf.readframes(1024)
+        self._close_stream()
+        print("[完成] 语音播放完成")
+
+    def _open_stream(self, sample_width, channels, sample_rate):
+        self._close_stream()
+        self.stream = self.audio.open(
+            format=self.audio.get_format_from_width(sample_width),
+            channels=channels,
+            rate=sample_rate,
+            output=True,
+            output_device_index=self.output_device
+        )
+        self.stream_params = (sample_width, channels, sample_rate)
+        self.bytes_per_second = sample_width * channels * sample_rate
+        self.play_deadline = 0.0
+        self.jitter.clear()
+        self.buffered = 0
+
+    def _close_stream(self):
+        if self.stream is not None:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception:
+                pass
+            self.stream = None
+            self.stream_params = None
+            self.jitter.clear()
+            self.buffered = 0
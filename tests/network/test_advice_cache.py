@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI 治疗建议缓存测试
+验证置信度区间边界、有效期过期（计数并删除条目）、超出上限时按最近访问时间淘汰，以及命中率统计
+用法: python tests/network/test_advice_cache.py
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'utils'))
+
+from advice_cache import AdviceCache
+
+MODEL, VERSION = "deepseek-chat", 1
+DAY = 86400
+
+
+def make_cache(**kwargs):
+    return AdviceCache(db_path=os.path.join(tempfile.mkdtemp(), "advice_cache.db"), **kwargs)
+
+
+def rows(cache):
+    return cache.conn.execute("SELECT disease_name, bucket FROM advice ORDER BY disease_name").fetchall()
+
+
+def test_bucket_boundaries():
+    """置信度 0.0 落在第一个区间，0.95 与 1.0 都落在最后一个区间 [0.9, 1.0]"""
+    cache = make_cache(bucket_width=0.1)
+    assert cache.bucket(0.0) == 0 and cache.bucket_range(0.0) == (0.0, 0.1)
+    assert cache.bucket(0.95) == cache.bucket(1.0) == 9
+    low, high = cache.bucket_range(1.0)
+    assert abs(low - 0.9) < 1e-9 and high == 1.0
+    assert cache.bucket(0.8999) == 8
+
+    cache.put(MODEL, VERSION, "AMD", 0.95, "建议A")
+    assert cache.get(MODEL, VERSION, "AMD", 1.0) == "建议A"            # 同一区间共享
+    assert cache.get(MODEL, VERSION, "AMD", 0.85) is None
+    assert cache.get(MODEL, VERSION + 1, "AMD", 0.95) is None          # 模板版本不同不命中
+    cache.close()
+
+
+def test_ttl_expiry():
+    """超过有效期的条目视为未命中，计入 expired 并从数据库删除"""
+    cache = make_cache(ttl_days=1)
+    cache.put(MODEL, VERSION, "Glaucoma", 0.6, "建议G", now=0.0)
+    assert cache.get(MODEL, VERSION, "Glaucoma", 0.6, now=DAY - 1) == "建议G"
+    assert cache.get(MODEL, VERSION, "Glaucoma", 0.6, now=DAY + 1) is None
+    assert cache.expired == 1 and rows(cache) == []
+    cache.close()
+
+
+def test_trim_evicts_least_recently_accessed():
+    """超出上限时淘汰最久未访问的条目，刚被读取的旧条目保留"""
+    cache = make_cache(max_entries=2)
+    cache.put(MODEL, VERSION, "A", 0.5, "a", now=100.0)
+    cache.put(MODEL, VERSION, "B", 0.5, "b", now=200.0)
+    assert cache.get(MODEL, VERSION, "A", 0.5, now=300.0) == "a"      # A 最近被访问
+    cache.put(MODEL, VERSION, "C", 0.5, "c", now=400.0)
+    assert [name for name, _ in rows(cache)] == ["A", "C"]
+    cache.close()
+
+
+def test_hit_rate():
+    """命中率 = 命中 / (命中 + 未命中)，空内容不写入缓存"""
+    cache = make_cache()
+    assert cache.stats()['hit_rate'] == 0.0
+    cache.put(MODEL, VERSION, "Myopia", 0.7, "")
+    assert cache.get(MODEL, VERSION, "Myopia", 0.7) is None
+    cache.put(MODEL, VERSION, "Myopia", 0.7, "建议M")
+    for _ in range(3):
+        assert cache.get(MODEL, VERSION, "Myopia", 0.7) == "建议M"
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expired']) == (3, 1, 0)
+    assert stats['hit_rate'] == 0.75
+    cache.close()
+
+
+def main():
+    for test in (test_bucket_boundaries, test_ttl_expiry, test_trim_evicts_least_recently_accessed, test_hit_rate):
+        test()
+        print(f"[通过] {test.__doc__.strip()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应视频流测试
+验证接收端反馈/回显的往返与 RTT 测量、档位控制器遇拥塞降档与持续良好后升档（探测失败退避）、
+FrameAssembler 的丢帧/丢包统计，以及屏幕共享流水线收到反馈后应用新的质量/缩放/帧率
+用法: python tests/network/test_latency_optimizer.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'utils'))
+
+from latency_optimizer import (LatencyOptimizer, OptimizedReceiver, AdaptiveQualityController, NetworkOptimizer,
+                               parse_feedback, SCREEN_LEVELS, SCREEN_START_LEVEL, UP_AFTER, UP_AFTER_MAX)
+from screen_codec import FrameAssembler, ScreenSender, TileEncoder, packetize, parse_packet, FLAG_KEYFRAME
+from screen_pipeline import ScreenPipeline
+
+
+def test_feedback_echo_round_trip():
+    """反馈消息携带区间增量，发送端回显令牌后接收端测得 RTT"""
+    receiver, optimizer = OptimizedReceiver(interval=0.5), LatencyOptimizer()
+    receiver.record_decode(4.0)
+    message = receiver.feedback(30, 2, 600, 10, now=10.0)
+    token, report = parse_feedback(message)
+    assert (report.frames, report.lost_frames, report.packets, report.lost_packets) == (30, 2, 600, 10)
+    assert report.decode_ms == 4.0 and abs(report.loss - 2 / 32) < 1e-9
+
+    replies = []
+    assert optimizer.handle_control(message, ("board", 1), lambda data, addr: replies.append((data, addr)))
+    assert len(replies) == 1 and replies[0][1] == ("board", 1)
+    assert receiver.waiting_echo
+    assert receiver.on_control(replies[0][0], now=10.04)
+    assert abs(receiver.rtt_ms - 40) < 1e-6 and not receiver.waiting_echo
+
+    # 第二次反馈只报告增量，并带上测得的 RTT
+    _, report = parse_feedback(receiver.feedback(45, 2, 900, 10, now=10.5))
+    assert (report.frames, report.lost_frames, report.packets, report.lost_packets) == (15, 0, 300, 0)
+    assert report.rtt_ms == 40
+    assert not optimizer.handle_control(b'\x00\x01\x02\x03\x04')   # 鼠标指令不是反馈
+
+
+def test_controller_steps_down_and_probes_up():
+    """丢包时降档，严重丢包一次降两档；持续良好后升档，升档后立即拥塞则加倍升档等待"""
+    controller, network = AdaptiveQualityController(SCREEN_LEVELS, SCREEN_START_LEVEL), NetworkOptimizer()
+    network.packet_loss_rate = 0.1
+    assert controller.evaluate(network, now=0.0) and controller.level == SCREEN_START_LEVEL + 1
+    assert not controller.evaluate(network, now=0.5)                 # DOWN_HOLD 内不连降
+    network.packet_loss_rate = 0.3
+    assert controller.evaluate(network, now=1.5) and controller.level == SCREEN_START_LEVEL + 3
+
+    network.packet_loss_rate = 0.0
+    level = controller.level
+    assert not controller.evaluate(network, now=2.0)
+    assert controller.evaluate(network, now=2.0 + UP_AFTER) and controller.level == level - 1
+    network.packet_loss_rate = 0.1                                   # 探测失败
+    assert controller.evaluate(network, now=2.5 + UP_AFTER) and controller.level == level
+    assert controller.up_after == 2 * UP_AFTER <= UP_AFTER_MAX
+
+    decode_bound = AdaptiveQualityController()
+    assert decode_bound.evaluate(NetworkOptimizer(), decode_ms=40.0, now=0.0)   # 30fps 帧间隔只有 33ms
+
+
+def test_failed_probe_backs_off_once():
+    """一次探测失败后探测窗口内持续拥塞，升档等待只加倍一次"""
+    controller, network = AdaptiveQualityController(SCREEN_LEVELS, SCREEN_START_LEVEL + 2), NetworkOptimizer()
+    assert not controller.evaluate(network, now=0.0)
+    assert controller.evaluate(network, now=UP_AFTER)                # 升档探测
+    network.packet_loss_rate = 0.1
+    for now in (0.5, 1.0, 1.5):
+        controller.evaluate(network, now=UP_AFTER + now)
+    assert controller.up_after == 2 * UP_AFTER
+
+
+def test_assembler_counts_losses():
+    """帧序号间隔计为丢帧，过期的残缺帧计入丢失分片"""
+    assembler = FrameAssembler()
+    for frame_id in (1, 2, 5):
+        for packet in packetize(FLAG_KEYFRAME, frame_id, b'x' * 3000, max_payload=1000):
+            assembler.add(parse_packet(packet), now=0)
+    partial = packetize(FLAG_KEYFRAME, 6, b'x' * 3000, max_payload=1000)
+    assembler.add(parse_packet(partial[0]), now=0)
+    assembler.expire(now=10)
+    stats = assembler.stats
+    assert stats["frames"] == 3 and stats["lost_frames"] == 2
+    assert stats["packets"] == 10 and stats["lost_packets"] == 2
+
+
+def test_pipeline_applies_feedback():
+    """流水线收到高丢包反馈后降低 JPEG 质量，并把新的缩放与帧率交给采集端"""
+
+    class Capture:
+        scale = 1.0
+
+        def __call__(self):
+            return np.zeros((48, 64, 3), dtype=np.uint8)
+
+        def set_scale(self, scale):
+            self.scale = scale
+
+    optimizer = LatencyOptimizer(((75, 1.0, 30), (50, 0.5, 15)), 0)
+    capture, sender = Capture(), ScreenSender(TileEncoder())
+    pipeline = ScreenPipeline(sender, capture, lambda packet: None, fps=30, optimizer=optimizer)
+    pipeline.apply_settings(optimizer.settings)
+    assert sender.encoder.jpeg_quality == 75 and abs(pipeline.frame_interval - 1 / 30) < 1e-9
+
+    reporter, echoes = OptimizedReceiver(), []
+    assert pipeline.on_control(reporter.feedback(10, 5, 100, 50), ("board", 1), lambda data, addr: echoes.append(data))
+    assert echoes and sender.encoder.jpeg_quality == 50 and capture.scale == 0.5
+    assert abs(pipeline.frame_interval - 1 / 15) < 1e-9
+    assert not pipeline.on_control(b'\x00\x00\x10\x00\x10')          # 鼠标指令交回调用方处理
+    assert "质量 50" in pipeline.format_stats()
+
+
+def main():
+    for test in (test_feedback_echo_round_trip, test_controller_steps_down_and_probes_up,
+                 test_failed_probe_backs_off_once, test_assembler_counts_losses, test_pipeline_applies_feedback):
+        test()
+        print(f"[通过] {test.__doc__.strip()}")
+
+
+if __name__ == "__main__":
+    main()
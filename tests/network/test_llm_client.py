@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型客户端测试
+在本地启动一个模拟 DeepSeek chat/completions 接口的 HTTP 服务（支持整段返回和 SSE 流式输出），
+验证 LLMClient 的长连接复用、流式解析、首字延迟统计、错误处理，以及调度器的限速、优先级、相同请求合并与统一重试，
+并与每次新建连接的 requests.post 比较耗时、与各自请求比较突发提问时实际发出的请求数
+用法: python tests/network/test_llm_client.py [--requests 20] [--chunks 20] [--chunk-delay 0.02] [--burst 12]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'utils'))
+
+from llm_client import (LLMClient, LLMDispatcher, LLMError, SummaryFirstReply, iter_sse_data,
+                        PRIORITY_VOICE, PRIORITY_BACKGROUND)
+
+REPLY = ["建议", "注意用眼卫生，", "避免长时间", "看屏幕。", "如症状加重", "请及时就医。"]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """模拟 chat/completions：stream=true 时按 SSE 分块输出，否则整段返回"""
+
+    protocol_version = "HTTP/1.1"      # 支持长连接
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        server.connections.add(self.client_address)
+        server.requests += 1
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.headers.get("Authorization") != "Bearer test-key":
+            self._send_json(401, {"error": {"message": "invalid api key"}})
+            return
+        if server.failures:
+            self._send_json(server.failures.pop(0), {"error": {"message": "busy"}}, {"Retry-After": "0.1"})
+            return
+        time.sleep(server.first_delay)
+        if not body.get("stream"):
+            time.sleep(server.chunk_delay * max(0, len(server.reply) - 1))     # 整段返回同样要等生成完
+            self._send_json(200, {"choices": [{"message": {"content": "".join(server.reply)}}]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk(": keep-alive\n\n")
+        self._write_chunk('data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n')
+        for i, text in enumerate(server.reply):
+            if i:
+                time.sleep(server.chunk_delay)
+            event = {"choices": [{"delta": {"content": text}}]}
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server(reply=REPLY, first_delay=0.05, chunk_delay=0.02):
+    """启动模拟服务，返回 (server, endpoint)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.connections = set()
+    server.requests = 0
+    server.failures = []             # 依次先返回这些错误状态码
+    server.reply = reply
+    server.first_delay = first_delay
+    server.chunk_delay = chunk_delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+
+PAYLOAD = {"model": "deepseek-chat", "messages": [{"role": "user", "content": "眼睛干涩怎么办"}]}
+
+
+def test_sse_parsing():
+    """多行 data 拼接，注释行与空事件忽略"""
+    lines = [b": ping", b"", b"data: a", b"data: b", b"", "data: [DONE]".encode(), b""]
+    assert list(iter_sse_data(lines)) == ["a\nb", "[DONE]"]
+
+
+def test_summary_first_reply():
+    """摘要行完整时立即取出，详细回答不含摘要行；未按格式输出时整段作为回答"""
+    reply = SummaryFirstReply()
+    assert reply.feed("语音") is None and reply.body == ""
+    assert reply.feed("摘要：多休息，") is None
+    assert reply.feed("少看屏幕。\n## 详细") == "多休息，少看屏幕。"
+    reply.feed("建议")
+    assert reply.body == "## 详细建议"
+
+    plain = SummaryFirstReply()
+    plain.feed("建议多休息。")
+    assert plain.finish() is None and plain.body == "建议多休息。"
+
+
+def test_stream_yields_incrementally():
+    """流式回复逐段到达，首字延迟明显小于总耗时，文本为 UTF-8 中文"""
+    server, endpoint = start_server(chunk_delay=0.05)
+    client = LLMClient()
+    stream = client.stream(endpoint, "test-key", PAYLOAD)
+    arrivals = []
+    for delta in stream:
+        arrivals.append((time.perf_counter(), delta))
+    assert [delta for _, delta in arrivals] == REPLY
+    assert stream.text == "".join(REPLY)
+    assert stream.ttft_ms < stream.total_ms - 150
+    assert arrivals[-1][0] - arrivals[0][0] >= 0.2
+    assert set(client.summary()) == {"ttft", "total"}
+    server.shutdown()
+
+
+def test_session_reuses_connection():
+    """连续请求（整段与流式混合）复用同一条长连接"""
+    server, endpoint = start_server(first_delay=0, chunk_delay=0)
+    client = LLMClient()
+    for _ in range(3):
+        response = client.post(endpoint, "test-key", PAYLOAD)
+        assert response.json()["choices"][0]["message"]["content"] == "".join(REPLY)
+        assert "".join(client.stream(endpoint, "test-key", PAYLOAD)) == "".join(REPLY)
+    assert len(server.connections) == 1
+    server.shutdown()
+
+
+def test_stream_error_status():
+    """非200状态码抛出带状态码的 LLMError，并计入失败次数"""
+    server, endpoint = start_server()
+    client = LLMClient()
+    try:
+        list(client.stream(endpoint, "wrong-key", PAYLOAD))
+        assert False, "应当抛出 LLMError"
+    except LLMError as e:
+        assert e.status_code == 401
+    assert client.post(endpoint, "wrong-key", PAYLOAD).status_code == 401
+    assert client.stats["errors"] == 2
+    server.shutdown()
+
+
+def test_empty_stream_raises():
+    """返回 200 但没有内容增量时抛出 LLMError，不记录首字延迟"""
+    server, endpoint = start_server(reply=[])
+    client = LLMClient()
+    stream = client.stream(endpoint, "test-key", PAYLOAD)
+    try:
+        list(stream)
+        assert False, "应当抛出 LLMError"
+    except LLMError as e:
+        assert e.status_code is None
+    assert stream.ttft_ms is None and stream.text == ""
+    assert client.stats["errors"] == 1 and "ttft" not in client.summary()
+    server.shutdown()
+
+
+def test_identical_requests_to_followcoalesced():
+    """相同请求同时进行时只发出一次，流式跟随者也逐段拿到完整回复"""
+    server, endpoint = start_server(first_delay=0.1)
+    client = LLMClient()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append("".join(client.stream(endpoint, "test-key", PAYLOAD))))
+               for _ in range(3)]
+    threads += [threading.Thread(target=lambda: results.append(
+        client.post(endpoint, "test-key", PAYLOAD).json()["choices"][0]["message"]["content"])) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["".join(REPLY)] * 5
+    assert server.requests == 2 and client.stats["coalesced"] == 3
+    server.shutdown()
+
+
+def test_nested_identical_stream_not_coalesced():
+    """同一线程在流式输出中嵌套发起相同请求时单独发出，不会等待自己而死锁"""
+    server, endpoint = start_server(first_delay=0, chunk_delay=0.02)
+    client = LLMClient()
+    results = []
+
+    def outer():
+        text = ""
+        for delta in client.stream(endpoint, "test-key", PAYLOAD):
+            if not text:
+                results.append("".join(client.stream(endpoint, "test-key", PAYLOAD)))
+            text += delta
+        results.append(text)
+
+    thread = threading.Thread(target=outer, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive(), "嵌套的相同请求死锁"
+    assert results == ["".join(REPLY)] * 2
+    assert server.requests == 2 and client.stats["coalesced"] == 0 and not client.inflight
+    server.shutdown()
+
+
+def test_follow_timeout():
+    """跟随的相同请求迟迟不结束时，跟随者超时抛出 LLMError"""
+    server, endpoint = start_server(first_delay=1.0)
+    client = LLMClient(follow_timeout=0.3)
+    requests_to_follow = (lambda: list(client.stream(endpoint, "test-key", PAYLOAD)),
+                 lambda: client.post(endpoint, "test-key", PAYLOAD))
+    leaders = [threading.Thread(target=request) for request in requests_to_follow]
+    for leader in leaders:
+        leader.start()
+    time.sleep(0.1)
+    start = time.perf_counter()
+    for follow in requests_to_follow:
+        try:
+            follow()
+            assert False, "应当抛出 LLMError"
+        except LLMError as e:
+            assert "超时" in str(e)
+    assert time.perf_counter() - start < 0.9 and client.stats["coalesced"] == 2
+    for leader in leaders:
+        leader.join()
+    server.shutdown()
+
+
+def test_dispatcher_priority_and_rate():
+    """并发已满时语音请求先于先到的后台请求放行；令牌桶限制平均速率"""
+    dispatcher = LLMDispatcher(rate=100, burst=5, max_concurrency=1)
+    order = []
+
+    def request(priority, name):
+        with dispatcher.slot(priority):
+            order.append(name)
+
+    dispatcher.acquire()
+    threads = [threading.Thread(target=request, args=(PRIORITY_BACKGROUND, "后台"))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=request, args=(PRIORITY_VOICE, "语音")))
+    threads[1].start()
+    time.sleep(0.05)
+    dispatcher.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["语音", "后台"]
+
+    limited = LLMDispatcher(rate=20, burst=1, max_concurrency=4)
+    start = time.monotonic()
+    for _ in range(5):
+        with limited.slot():
+            pass
+    assert time.monotonic() - start >= 0.18
+
+
+def test_retry_and_throttle():
+    """429/503 由客户端统一重试，429 暂停整个令牌桶"""
+    server, endpoint = start_server(first_delay=0)
+    server.failures = [429, 503]
+    client = LLMClient()
+    response = client.post(endpoint, "test-key", PAYLOAD)
+    assert response.status_code == 200
+    assert client.stats["retries"] == 2 and client.dispatcher.stats["throttled"] == 1
+
+    server.failures = [503]
+    assert "".join(client.stream(endpoint, "test-key", PAYLOAD)) == "".join(REPLY)
+    assert server.requests == 5
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大模型客户端测试")
+    parser.add_argument('--requests', type=int, default=20, help="请求次数")
+    parser.add_argument('--chunks', type=int, default=20, help="每次回复的流式分块数")
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help="分块之间的生成耗时(秒)")
+    parser.add_argument('--first-delay', type=float, default=0.2, help="首个分块前的生成耗时(秒)")
+    parser.add_argument('--burst', type=int, default=12, help="突发提问数（其中一半是相同问题）")
+    args = parser.parse_args()
+
+    reply = [f"第{i}段。" for i in range(args.chunks)]
+    server, endpoint = start_server(reply, args.first_delay, args.chunk_delay)
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        requests.post(endpoint, headers={"Authorization": "Bearer test-key"}, json=PAYLOAD, timeout=30)
+    legacy = (time.perf_counter() - start) * 1000 / args.requests
+    legacy_connections = len(server.connections)
+
+    server.connections.clear()
+    client = LLMClient(dispatcher=LLMDispatcher(rate=1000, burst=1000))     # 只比较连接复用，不限速
+    for _ in range(args.requests):
+        for _ in client.stream(endpoint, "test-key", PAYLOAD):
+            pass
+    summary = client.summary()
+
+    print(f"[测试] {args.requests} 次请求, 每次 {args.chunks} 段, 首段前 {args.first_delay * 1000:.0f}ms, "
+          f"段间 {args.chunk_delay * 1000:.0f}ms")
+    print(f"[结果] requests.post 整段返回: 平均 {legacy:.0f}ms 后才能显示, 建立连接 {legacy_connections} 次")
+    print(f"[结果] LLMClient 流式: 首字 p50={summary['ttft']['p50']:.0f}ms, "
+          f"总耗时 p50={summary['total']['p50']:.0f}ms, 建立连接 {len(server.connections)} 次")
+    print(f"[结果] {client.format_summary()}")
+
+    # 突发：多个开发板和界面同时提问，一半问题相同
+    server.requests = 0
+    burst_client = LLMClient()
+    payloads = [dict(PAYLOAD, messages=[{"role": "user", "content": f"问题{i if i % 2 else 0}"}])
+                for i in range(args.burst)]
+    threads = [threading.Thread(target=lambda p=p, i=i: list(burst_client.stream(
+        endpoint, "test-key", p, priority=PRIORITY_VOICE if i % 3 == 0 else PRIORITY_BACKGROUND)))
+        for i, p in enumerate(payloads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"[结果] 突发 {args.burst} 个提问: 实际请求 {server.requests} 次, "
+          f"耗时 {(time.perf_counter() - start) * 1000:.0f}ms; {burst_client.format_summary()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
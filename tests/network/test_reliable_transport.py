@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可靠UDP分片传输测试
+在可配置丢包/乱序的本地回环替身上测试 ReliableSender / FragmentReceiver，
+并统计吞吐量与尾延迟
+用法: python tests/network/test_reliable_transport.py [--loss 0.05] [--reorder 0.05] [--requests 50]
+"""
+
+import os
+import sys
+import time
+import heapq
+import random
+import socket
+import argparse
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'utils'))
+
+from reliable_transport import ReliableSender, FragmentReceiver
+
+
+class LossyLoopback:
+    """内存中的UDP回环替身，支持丢包、乱序和固定单向延迟"""
+
+    def __init__(self, loss=0.0, reorder=0.0, delay=0.0005, seed=0):
+        self.loss = loss
+        self.reorder = reorder
+        self.delay = delay
+        self.random = random.Random(seed)
+        self.endpoints = {}
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.dropped = 0
+
+    def endpoint(self, addr):
+        sock = FakeSocket(self, addr)
+        self.endpoints[addr] = sock
+        return sock
+
+    def deliver(self, data, src, dst):
+        with self.lock:
+            self.sent += 1
+            if self.random.random() < self.loss:
+                self.dropped += 1
+                return
+            delay = self.delay
+            if self.random.random() < self.reorder:
+                delay += self.delay * self.random.randint(2, 8)
+        self.endpoints[dst].enqueue(time.time() + delay, bytes(data), src)
+
+
+class FakeSocket:
+    """实现 sendto / recvfrom / settimeout / gettimeout 的最小套接字替身"""
+
+    def __init__(self, channel, addr):
+        self.channel = channel
+        self.addr = addr
+        self.timeout = None
+        self.inbox = []
+        self.counter = 0
+        self.cond = threading.Condition()
+
+    def enqueue(self, deliver_at, data, src):
+        with self.cond:
+            self.counter += 1
+            heapq.heappush(self.inbox, (deliver_at, self.counter, data, src))
+            self.cond.notify()
+
+    def sendto(self, data, addr):
+        self.channel.deliver(data, self.addr, addr)
+        return len(data)
+
+    def recvfrom(self, bufsize):
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        with self.cond:
+            while True:
+                now = time.time()
+                if self.inbox and self.inbox[0][0] <= now:
+                    _, _, data, src = heapq.heappop(self.inbox)
+                    return data[:bufsize], src
+                wait = self.inbox[0][0] - now if self.inbox else None
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise socket.timeout("timed out")
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.cond.wait(wait)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def gettimeout(self):
+        return self.timeout
+
+
+def run_transfer(loss=0.0, reorder=0.0, requests=20, payload_size=60 * 1024, seed=0):
+    """在回环替身上发送若干请求，返回 (收到的数据列表, 发送的数据列表, 延迟列表, 发送器, 接收器, 信道)"""
+    channel = LossyLoopback(loss=loss, reorder=reorder, seed=seed)
+    board = channel.endpoint(('127.0.0.2', 40000))
+    pc = channel.endpoint(('127.0.0.1', 5002))
+    pc.settimeout(0.05)
+
+    receiver = FragmentReceiver(send_fn=pc.sendto)
+    sender = ReliableSender(board)
+    received = []
+    running = True
+
+    def receive_loop():
+        while running:
+            try:
+                data, addr = pc.recvfrom(2048)
+            except socket.timeout:
+                continue
+            frame = receiver.handle_datagram(data, addr)
+            if frame:
+                received.append(frame)
+
+    thread = threading.Thread(target=receive_loop, daemon=True)
+    thread.start()
+
+    rng = random.Random(seed)
+    payloads = []
+    latencies = []
+    for n in range(requests):
+        payload = rng.randbytes(payload_size)
+        payloads.append(payload)
+        start = time.time()
+        result = sender.send(pc.addr, payload, request_id=f"req_{seed}_{n}")
+        assert result is not None, "发送失败"
+        latencies.append(time.time() - start)
+
+    # 等待最后一个请求在接收端完成重组
+    deadline = time.time() + 2.0
+    while len(received) < requests and time.time() < deadline:
+        time.sleep(0.01)
+    running = False
+    thread.join(timeout=1.0)
+    return received, payloads, latencies, sender, receiver, channel
+
+
+def test_lossless_delivery():
+    """无丢包时所有请求完整送达且无重传"""
+    received, payloads, _, sender, _, _ = run_transfer(requests=5)
+    assert [f['data'] for f in received] == payloads
+    assert [f['request_id'] for f in received] == [f"req_0_{n}" for n in range(5)]
+    assert sender.stats['retransmissions'] == 0
+
+
+def test_delivery_under_loss_and_reorder():
+    """丢包+乱序时通过选择重传仍完整送达"""
+    received, payloads, _, sender, _, channel = run_transfer(loss=0.1, reorder=0.1, requests=5, seed=1)
+    assert channel.dropped > 0
+    assert sorted(bytes(f['data']) for f in received) == sorted(payloads)
+    assert sender.stats['retransmissions'] > 0
+    # 选择重传：重传量应远小于整包重发
+    assert sender.stats['retransmissions'] < sender.stats['fragments_sent'] / 2
+
+
+def test_legacy_fragments_without_ack():
+    """旧版（无可靠标志位）分片照常重组，且接收端不回复ACK；不带 request_id 的 H.264 视频流帧原样交付"""
+    from reliable_transport import build_fragments
+    acks = []
+    receiver = FragmentReceiver(send_fn=lambda data, addr: acks.append(data))
+    payload = b'\xff\xd8' + bytes(5000)
+    frame = None
+    for fragment in build_fragments(1234, payload, request_id="req_legacy", reliable=False):
+        frame = receiver.handle_datagram(bytes(fragment), ('127.0.0.2', 40000)) or frame
+    assert frame['data'] == payload
+    assert frame['request_id'] == "req_legacy"
+    assert acks == []
+
+    # H.264 码流以 00 00 00 01 起始码开头，不能被当作长度为 0 的 request_id 前缀
+    h264 = b'\x00\x00\x00\x01\x67' + bytes(3000)
+    for fragment in build_fragments(1235, h264, reliable=False):
+        frame = receiver.handle_datagram(bytes(fragment), ('127.0.0.2', 40000)) or frame
+    assert frame['data'] == h264 and frame['request_id'] is None
+
+
+def test_stale_frames_expire():
+    """残缺帧超时后被清理，缓冲不会无限增长"""
+    from reliable_transport import build_fragments
+    receiver = FragmentReceiver()
+    fragments = build_fragments(99, bytes(10000), request_id="req_partial")
+    receiver.handle_datagram(bytes(fragments[0]), ('127.0.0.2', 40000))
+    assert receiver.pending_count() == 1
+    assert receiver.expire_stale(now=time.time() + 60) == 1
+    assert receiver.pending_count() == 0
+
+
+def test_receive_into_real_socket():
+    """通过真实回环套接字用 recvfrom_into 接收并重组"""
+    from reliable_transport import build_fragments
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.bind(('127.0.0.1', 0))
+    rx.settimeout(1.0)
+    receiver = FragmentReceiver()
+    payload = bytes(range(256)) * 20
+    try:
+        for fragment in build_fragments(7, payload, request_id="req_udp", reliable=False):
+            tx.sendto(fragment, rx.getsockname())
+        frame = None
+        while frame is None:
+            data, addr = receiver.receive_into(rx)
+            frame = receiver.handle_datagram(data, addr)
+        assert isinstance(frame['data'], memoryview)
+        assert frame['data'] == payload
+    finally:
+        rx.close()
+        tx.close()
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="可靠UDP分片传输吞吐量/尾延迟测试")
+    parser.add_argument('--loss', type=float, default=0.05, help="丢包率")
+    parser.add_argument('--reorder', type=float, default=0.05, help="乱序率")
+    parser.add_argument('--requests', type=int, default=50, help="请求数")
+    parser.add_argument('--size', type=int, default=60 * 1024, help="单个请求字节数")
+    args = parser.parse_args()
+
+    print(f"[测试] 丢包率 {args.loss:.0%}, 乱序率 {args.reorder:.0%}, {args.requests} 个 {args.size} 字节请求")
+    start = time.time()
+    received, payloads, latencies, sender, receiver, channel = run_transfer(
+        args.loss, args.reorder, args.requests, args.size)
+    elapsed = time.time() - start
+
+    intact = sum(1 for f in received if f['data'] in payloads)
+    print(f"[结果] 完整送达: {intact}/{len(payloads)}")
+    print(f"[结果] 吞吐量: {len(payloads) * args.size / elapsed / 1024 / 1024:.2f} MB/s")
+    print(f"[结果] 延迟(ms): p50={percentile(latencies, 50) * 1000:.1f} "
+          f"p95={percentile(latencies, 95) * 1000:.1f} p99={percentile(latencies, 99) * 1000:.1f}")
+    print(f"[结果] 信道丢弃: {channel.dropped}/{channel.sent}, "
+          f"重传分片: {sender.stats['retransmissions']}, 超时: {sender.stats['timeouts']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+屏幕共享瓦片编码测试
+验证变化瓦片检测（含不整除的边缘瓦片）、局部编码与接收端合成、定期关键帧与丢帧后的恢复，
+以及 v1/v2 包头的分片上限、版本协商、乱序重组、序号回绕与发送端重启
+用法: python tests/network/test_screen_codec.py
+"""
+
+import os
+import sys
+import random
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'utils'))
+
+from screen_codec import (TileEncoder, TileCompositor, ScreenSender, FrameAssembler, dirty_tile_mask, dirty_runs,
+                          packetize, parse_packet, hello_message, FLAG_KEYFRAME, FLAG_TILES, WIRE_V1, WIRE_V2)
+
+
+def make_screen(height=300, width=500):
+    """平滑渐变背景的“界面”，JPEG 误差小且稳定"""
+    y, x = np.mgrid[0:height, 0:width]
+    screen = np.stack([(x * 255 // width), (y * 255 // height), np.full_like(x, 128)], axis=2)
+    return screen.astype(np.uint8)
+
+
+def test_dirty_mask_and_runs():
+    """只标记变化的瓦片，最右/最下不满一块的瓦片也能检测到"""
+    base = make_screen()
+    frame = base.copy()
+    frame[10, 70] = 0                 # 第0行第1列
+    frame[299, 499] = 0               # 最后一行最后一列（边缘瓦片）
+    frame[100, 200:330] = 0           # 第1行第3~5列
+    mask = dirty_tile_mask(frame, base, 64)
+    assert mask.shape == (5, 8)
+    assert sorted(map(tuple, np.argwhere(mask))) == [(0, 1), (1, 3), (1, 4), (1, 5), (4, 7)]
+    assert list(dirty_runs(mask)) == [(0, 1, 1), (1, 3, 3), (4, 7, 1)]
+
+
+def test_tile_frames_composite():
+    """静止画面不发送；局部变化只发变化区域，接收端合成结果与发送端一致（JPEG 误差内）"""
+    encoder = TileEncoder(tile_size=64, keyframe_seconds=10)
+    compositor = TileCompositor()
+    base = make_screen()
+    flags, keyframe = encoder.encode(base, now=0)
+    assert flags == FLAG_KEYFRAME
+    compositor.apply(flags, keyframe)
+    assert encoder.encode(base.copy(), now=0.1) is None
+
+    frame = base.copy()
+    frame[130:150, 140:260] = (0, 0, 255)
+    before = compositor.frame.copy()
+    flags, payload = encoder.encode(frame, now=0.2)
+    assert flags == FLAG_TILES and len(payload) < len(keyframe) / 3
+    result = compositor.apply(flags, payload)
+    assert np.abs(result.astype(int) - frame).mean() < 2
+    untouched = ~np.repeat(np.repeat(dirty_tile_mask(frame, base, 64), 64, 0), 64, 1)[:300, :500]
+    assert (result[untouched] == before[untouched]).all()
+
+
+def test_keyframes_and_recovery():
+    """丢失瓦片帧后接收端画面残缺，下一个定期关键帧恢复；尚无关键帧时瓦片帧被忽略"""
+    encoder = TileEncoder(tile_size=32, keyframe_seconds=1.0)
+    compositor = TileCompositor()
+    frame = make_screen()
+    compositor.apply(*encoder.encode(frame, now=0))
+
+    frame[0:20, 0:20] = 255
+    lost = encoder.encode(frame, now=0.5)         # 这一帧丢失
+    assert lost[0] == FLAG_TILES
+    assert encoder.encode(frame, now=0.6) is None
+    flags, payload = encoder.encode(frame, now=1.0)
+    assert flags == FLAG_KEYFRAME
+    assert np.abs(compositor.apply(flags, payload).astype(int) - frame).mean() < 2
+
+    late_joiner = TileCompositor()
+    frame[200:210, 0:10] = 0
+    assert late_joiner.apply(*encoder.encode(frame, now=1.1)) is None
+    assert late_joiner.stats["waiting_keyframe"] == 1
+
+
+def test_large_change_sends_keyframe():
+    """大面积变化（切换页面）直接发送关键帧"""
+    encoder = TileEncoder(tile_size=64, keyframe_seconds=10, full_frame_ratio=0.5)
+    encoder.encode(make_screen(), now=0)
+    flags, _ = encoder.encode(255 - make_screen(), now=0.1)
+    assert flags == FLAG_KEYFRAME
+
+
+def test_fragment_limits():
+    """v1 最多 255 片；v2 能发送约 1MB 的帧（4K 高质量关键帧）"""
+    big = bytes(1024 * 1024)
+    try:
+        packetize(FLAG_KEYFRAME, 1, big, WIRE_V1)
+        assert False, "v1 应当拒绝超过 255 片的帧"
+    except ValueError:
+        pass
+    packets = packetize(FLAG_KEYFRAME, 70000, big, WIRE_V2, session=7)
+    assert len(packets) == 749
+    first = parse_packet(packets[0])
+    assert (first.version, first.flags, first.session, first.frame_id, first.total) == \
+        (WIRE_V2, FLAG_KEYFRAME, 7, 70000, 749)
+    old = parse_packet(packetize(FLAG_TILES, 70000, b"abc", WIRE_V1)[0])
+    assert (old.version, old.flags, old.frame_id, old.payload) == (WIRE_V1, FLAG_TILES, 70000 % 65536, b"abc")
+
+
+def test_assembler_reorder_and_stale():
+    """乱序分片能重组；比已交付帧更旧的帧（含其未完成分片）被丢弃"""
+    assembler = FrameAssembler()
+    data = bytes(range(256)) * 40
+    packets = [parse_packet(p) for p in packetize(FLAG_KEYFRAME, 5, data, WIRE_V2, 1, max_payload=1000)]
+    random.Random(0).shuffle(packets)
+    results = [assembler.add(p, now=0) for p in packets]
+    assert results[-1] == (FLAG_KEYFRAME, 5, data) and results[:-1] == [None] * (len(packets) - 1)
+    assert assembler.add(parse_packet(packetize(FLAG_TILES, 4, b"old", WIRE_V2, 1)[0]), now=0) is None
+    assert assembler.add(parse_packet(packetize(FLAG_TILES, 6, b"new", WIRE_V2, 1)[0]), now=0)[2] == b"new"
+
+
+def test_assembler_wraparound_and_restart():
+    """v1 序号 65535 之后回绕到 0 仍被接收；v2 发送端重启（新会话）后帧ID从头开始也被接收"""
+    assembler = FrameAssembler()
+    for frame_id in (65534, 65535, 65536, 65537):
+        assert assembler.add(parse_packet(packetize(FLAG_TILES, frame_id, b"x", WIRE_V1)[0]), now=0)
+    assert assembler.add(parse_packet(packetize(FLAG_TILES, 1000, b"x", WIRE_V2, session=1)[0]), now=0)
+    assert assembler.add(parse_packet(packetize(FLAG_TILES, 1, b"x", WIRE_V2, session=2)[0]), now=0)
+    assert assembler.add(parse_packet(packetize(FLAG_TILES, 1, b"x", WIRE_V2, session=2)[0]), now=0) is None
+
+
+def test_sender_negotiation():
+    """发送端从 v1 开始，大帧无法发送；收到 HELLO 后改用 v2 并立即补发关键帧"""
+    sender = ScreenSender(TileEncoder(tile_size=64, jpeg_quality=100), max_payload=100)
+    noise = np.repeat(np.random.default_rng(0).integers(0, 255, (300, 500, 1), dtype=np.uint8), 3, axis=2)
+    assert sender.encode(noise) == [] and sender.oversize == 1
+    assert not sender.on_control(b"\x01\x00\x10\x00\x20")          # 鼠标指令不是 HELLO
+    assert sender.on_control(hello_message(WIRE_V1)) and sender.version == WIRE_V1
+    assert sender.on_control(hello_message(9)) and sender.version == WIRE_V2
+    packets = sender.encode(noise)
+    assert len(packets) > 255 and parse_packet(packets[0]).flags == FLAG_KEYFRAME
+
+    assembler = FrameAssembler()
+    flags, _, data = [assembler.add(parse_packet(p), now=0) for p in packets][-1]
+    assert np.abs(TileCompositor().apply(flags, data).astype(int) - noise).mean() < 2
+
+
+def main():
+    for test in (test_dirty_mask_and_runs, test_tile_frames_composite, test_keyframes_and_recovery,
+                 test_large_change_sends_keyframe, test_fragment_limits, test_assembler_reorder_and_stale,
+                 test_assembler_wraparound_and_restart, test_sender_negotiation):
+        test()
+        print(f"[通过] {test.__doc__.strip()}")
+
+
+if __name__ == "__main__":
+    main()
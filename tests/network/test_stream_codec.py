@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+摄像头视频流编解码测试
+验证没有 PyAV 时回退 JPEG、H.264 逐帧立即输出且静止画面码率远低于 JPEG、丢帧后等待并请求关键帧、
+自适应缩放后重建编码器、接收端不支持 H.264 时请求改用 JPEG，以及按流序号统计丢帧并识别开发板重启
+（H.264 相关测试需要 PyAV：pip install av，未安装时跳过）
+用法: python tests/network/test_stream_codec.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'utils'))
+
+import stream_codec
+from stream_codec import (create_stream_encoder, StreamDecoder, StreamSequence, JpegStreamEncoder, H264StreamEncoder,
+                          stream_control_message, parse_stream_control, REQUEST_KEYFRAME, REQUEST_JPEG)
+
+
+def fundus_frames(count, height=240, width=320, seed=0):
+    """近似静止的眼底画面：固定的圆形视盘与血管，每帧叠加传感器噪声和 1 像素抖动"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:height, :width]
+    disc = ((yy - height / 2) ** 2 + (xx - width / 2) ** 2) < (min(height, width) * 0.45) ** 2
+    base = np.zeros((height, width, 3), dtype=np.float32)
+    base[disc] = (40, 90, 200)
+    for i in range(6):
+        base[np.abs(yy - height / 2 - (xx - width / 2) * np.tan(i)) < 2] *= 0.5
+    frames = []
+    for _ in range(count):
+        shifted = np.roll(base, tuple(rng.integers(-1, 2, 2)), axis=(0, 1))
+        frames.append(np.clip(shifted + rng.normal(0, 2, base.shape), 0, 255).astype(np.uint8))
+    return frames
+
+
+def skip_without_av():
+    if not stream_codec.HAS_AV:
+        print("[跳过] 未安装 PyAV")
+        return True
+    return False
+
+
+def test_fallback_to_jpeg():
+    """没有 PyAV 时要求 H.264 也回退为 JPEG，接收端照常解码"""
+    has_av = stream_codec.HAS_AV
+    stream_codec.HAS_AV = False
+    try:
+        encoder = create_stream_encoder("h264")
+        assert isinstance(encoder, JpegStreamEncoder)
+        frame = fundus_frames(1)[0]
+        image = StreamDecoder().decode(memoryview(encoder.encode(frame)))
+        assert image.shape == frame.shape and np.abs(image.astype(int) - frame).mean() < 6
+    finally:
+        stream_codec.HAS_AV = has_av
+
+
+def test_h264_immediate_output_and_bitrate():
+    """H.264 每编码一帧立即可解码出一帧，静止画面的码流不到 JPEG 的三分之一"""
+    if skip_without_av():
+        return
+    frames = fundus_frames(30)
+    h264, jpeg, decoder = H264StreamEncoder(fps=15), JpegStreamEncoder(), StreamDecoder()
+    for frame in frames:
+        image = decoder.decode(h264.encode(frame))
+        assert image is not None and np.abs(image.astype(int) - frame).mean() < 6
+        jpeg.encode(frame)
+    assert h264.stats["keyframes"] == 1
+    assert h264.stats["bytes"] * 3 < jpeg.stats["bytes"]
+
+
+def test_h264_waits_for_keyframe_after_loss():
+    """丢帧后跳过非关键帧并要求关键帧，发送端补发关键帧后恢复"""
+    if skip_without_av():
+        return
+    frames = fundus_frames(12)
+    encoder, decoder = H264StreamEncoder(fps=15), StreamDecoder()
+    for frame in frames[:4]:
+        assert decoder.decode(encoder.encode(frame)) is not None
+    encoder.encode(frames[4])                      # 这一帧丢失
+    decoder.lost()
+    assert decoder.decode(encoder.encode(frames[5])) is None and decoder.needs_keyframe
+    encoder.request_keyframe()
+    assert decoder.decode(encoder.encode(frames[6])) is not None and not decoder.needs_keyframe
+    assert decoder.decode(encoder.encode(frames[7])) is not None
+
+    late = StreamDecoder()                          # 接收端中途启动：从关键帧开始
+    assert late.decode(encoder.encode(frames[8])) is None and late.needs_keyframe
+    encoder.request_keyframe()
+    assert late.decode(encoder.encode(frames[9])) is not None
+
+
+def test_h264_follows_adaptive_scale():
+    """自适应缩放后编码器以关键帧重新开始，接收端输出新的分辨率"""
+    if skip_without_av():
+        return
+    frames = fundus_frames(4)
+    encoder, decoder = H264StreamEncoder(fps=15), StreamDecoder()
+    assert decoder.decode(encoder.encode(frames[0], quality=75)).shape == (240, 320, 3)
+    assert decoder.decode(encoder.encode(frames[1], quality=45, scale=0.5)).shape == (120, 160, 3)
+    assert encoder.stats["keyframes"] == 2
+
+
+def test_unsupported_requests_jpeg():
+    """接收端没有 PyAV 时 H.264 帧无法显示，控制消息请求开发板改用 JPEG"""
+    if skip_without_av():
+        return
+    data = H264StreamEncoder(fps=15).encode(fundus_frames(1)[0])
+    decoder = StreamDecoder()
+    stream_codec.HAS_AV = False
+    try:
+        assert decoder.decode(data) is None and decoder.stats["unsupported"] == 1
+    finally:
+        stream_codec.HAS_AV = True
+    assert parse_stream_control(stream_control_message(REQUEST_JPEG)) == REQUEST_JPEG
+    assert parse_stream_control(stream_control_message(REQUEST_KEYFRAME)) == REQUEST_KEYFRAME
+    assert parse_stream_control(b'\x11' + b'\x00' * 26) is None
+
+
+def test_stream_sequence_counts_loss_and_drops_late():
+    """按流序号统计丢帧，迟到或重复的旧帧丢弃，不连续时要求 H.264 等待关键帧"""
+    sequence = StreamSequence()
+    assert sequence.accept(100, now=0.0) and not sequence.broken
+    assert sequence.accept(101, now=0.1) and not sequence.broken
+    assert sequence.accept(104, now=0.2) and sequence.broken
+    assert not sequence.accept(103, now=0.3) and not sequence.accept(104, now=0.3)
+    assert sequence.accept(105, now=0.4) and not sequence.broken
+    assert (sequence.frames, sequence.lost_frames) == (4, 2)
+
+    wrapped = StreamSequence()
+    assert wrapped.accept(0xFFFFFFFF, now=0.0) and wrapped.accept(0, now=0.1) and not wrapped.broken
+
+
+def test_stream_sequence_board_restart():
+    """开发板重启后序号从头开始：流中断超过 2 秒或序号大幅倒退时作为新一轮序号接收，不计丢帧"""
+    sequence = StreamSequence()
+    for i in range(5000, 5010):
+        assert sequence.accept(i, now=(i - 5000) * 0.1)
+    # 重启后从 1 开始（旧版开发板），中断 3 秒：不再被当作迟到帧全部丢弃
+    assert sequence.accept(1, now=4.0) and sequence.broken and sequence.restarts == 1
+    assert sequence.accept(2, now=4.1) and not sequence.broken
+    # 未察觉中断（重启很快）但序号大幅倒退，或跳到新的随机起点
+    assert sequence.accept(0x7FFF0000, now=4.2) and sequence.restarts == 2
+    assert sequence.accept(0x10000, now=4.3) and sequence.restarts == 3
+    assert sequence.accept(0x10001, now=4.4) and not sequence.broken
+    assert (sequence.frames, sequence.lost_frames) == (15, 0)
+
+
+def main():
+    for test in (test_fallback_to_jpeg, test_h264_immediate_output_and_bitrate,
+                 test_h264_waits_for_keyframe_after_loss, test_h264_follows_adaptive_scale,
+                 test_unsupported_requests_jpeg, test_stream_sequence_counts_loss_and_drops_late,
+                 test_stream_sequence_board_restart):
+        test()
+        print(f"[通过] {test.__doc__.strip()}")
+
+
+if __name__ == "__main__":
+    main()
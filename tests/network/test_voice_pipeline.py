@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PC端语音流水线测试
+用替身识别/AI/合成引擎和记录发送内容的替身发送器驱动 VoiceServer 的 识别 → AI → 合成 → 发送 流水线，
+验证增量切句、各阶段重叠（AI回复未结束时第一句已发出）以及多个开发板的对话并行处理
+用法: python tests/network/test_voice_pipeline.py [--boards 3] [--sentences 4]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'pc'))
+
+from pc_voice_server import VoiceServer, SentenceStream, TTSBackend, TextToSpeechEngine, split_sentences
+from voice_protocol import encode_frame, decode_frame, FLAG_END, FLAG_META
+
+RATE = 16000
+SENTENCE = "请注意用眼卫生，按时休息。"
+
+
+class FakeRecognizer:
+    """按收到的音频字节数返回识别文本"""
+
+    def recognize_stream(self, chunks, sample_rate, sample_width, timer=None, turn=None):
+        audio = sum(len(chunk) for chunk in chunks)
+        return (f"问题{audio}", "fake", audio) if audio else (None, "failed", 0)
+
+
+class FakeAI:
+    """逐句产出回复，每句之间模拟生成耗时"""
+
+    def __init__(self, sentences=3, delay=0.1):
+        self.sentences = sentences
+        self.delay = delay
+        self.finished = {}
+
+    def stream_ai_response(self, text):
+        for _ in range(self.sentences):
+            time.sleep(self.delay)
+            yield SENTENCE[:6]
+            yield SENTENCE[6:]
+        self.finished[text] = time.time()
+
+
+class FakeTTS(TTSBackend):
+    name = "fake"
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+
+    def synthesize(self, text):
+        time.sleep(self.delay)
+        return bytes(320 * len(text)), RATE, 2, 1
+
+
+class FakeStream:
+    def __init__(self, sender, addr):
+        self.sender = sender
+        self.addr = addr
+        self.sample_rate = RATE
+        self.channels = 1
+
+    def write(self, pcm):
+        self.sender.writes.append((self.addr, time.time(), len(pcm)))
+
+    def end(self):
+        self.sender.ended.append(self.addr)
+
+
+class FakeSender:
+    def __init__(self):
+        self.writes = []
+        self.ended = []
+
+    def open_stream(self, addr, sample_rate, sample_width, channels, metadata=None):
+        return FakeStream(self, addr)
+
+
+class PipelineServer(VoiceServer):
+    """不绑定端口的 VoiceServer，识别/AI/合成/发送换成替身"""
+
+    def __init__(self, ai):
+        super().__init__()
+        self.recognition_engine = FakeRecognizer()
+        self.ai_manager = ai
+        self.tts_engine = TextToSpeechEngine(FakeTTS())
+
+    def init_network(self):
+        self.voice_sender = FakeSender()
+
+
+def upload(server, addr, stream_id, audio_bytes):
+    """模拟开发板上传一段语音"""
+    frames = [encode_frame(stream_id, 0, b'{"type": "voice_data"}', RATE, flags=FLAG_META)]
+    for seq, offset in enumerate(range(0, audio_bytes, 1280), start=1):
+        frames.append(encode_frame(stream_id, seq, bytes(min(1280, audio_bytes - offset)), RATE))
+    frames.append(encode_frame(stream_id, len(frames), b'', RATE, flags=FLAG_END))
+    for data in frames:
+        server.on_voice_frame(addr, decode_frame(data))
+
+
+def run_turns(boards=1, sentences=3, ai_delay=0.1):
+    """各开发板同时说一句话，返回 (服务器, 替身AI, 开始上传的时刻)"""
+    ai = FakeAI(sentences, ai_delay)
+    server = PipelineServer(ai)
+    server.start_stages()
+    start = time.time()
+    for i in range(boards):
+        upload(server, (f"127.0.0.{i + 1}", 5005), i + 1, 6400 + i)
+    deadline = time.time() + 10
+    while len(server.voice_sender.ended) < boards and time.time() < deadline:
+        time.sleep(0.01)
+    for stage in server.stages.values():
+        stage.stop()
+    return server, ai, start
+
+
+def test_sentence_stream_matches_split():
+    """增量切句与整段切句结果一致，且句号到达前不输出"""
+    text = "您好！眼睛干涩可能与长时间用眼有关，建议多休息。如果持续不适，请及时就医。"
+    splitter = SentenceStream()
+    sentences = []
+    for i in range(0, len(text), 3):
+        sentences += splitter.feed(text[i:i + 3])
+    sentences += splitter.flush()
+    assert sentences == split_sentences(text)
+    assert SentenceStream().feed("眼睛干涩") == []
+
+
+def test_first_sentence_sent_before_reply_finishes():
+    """AI回复还在生成时第一句已经合成并发出"""
+    server, ai, _ = run_turns(sentences=4, ai_delay=0.1)
+    writes = server.voice_sender.writes
+    assert len(writes) == 4
+    assert writes[0][1] < ai.finished["问题6400"]
+    assert "首句" in server.timer.summary()
+
+
+def test_boards_processed_concurrently():
+    """两个开发板的对话并行处理，总耗时接近单轮而不是两轮之和"""
+    server, ai, start = run_turns(boards=2, sentences=3, ai_delay=0.1)
+    assert sorted(server.voice_sender.ended) == [("127.0.0.1", 5006), ("127.0.0.2", 5006)]
+    elapsed = max(t for _, t, _ in server.voice_sender.writes) - start
+    assert elapsed < 0.3 * 2 + 0.15 * 2
+
+
+def test_empty_upload_is_ignored():
+    """没有音频的语音流（未检测到说话）不产生回复"""
+    ai = FakeAI()
+    server = PipelineServer(ai)
+    server.start_stages()
+    upload(server, ("127.0.0.1", 5005), 1, 0)
+    time.sleep(0.2)
+    assert not server.voice_sender.writes
+    assert not ai.finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PC端语音流水线测试")
+    parser.add_argument('--boards', type=int, default=3, help="同时说话的开发板数量")
+    parser.add_argument('--sentences', type=int, default=4, help="每轮AI回复的句数")
+    parser.add_argument('--ai-delay', type=float, default=0.2, help="AI生成每句的耗时(秒)")
+    args = parser.parse_args()
+
+    server, ai, start = run_turns(args.boards, args.sentences, args.ai_delay)
+    first = min(t for _, t, _ in server.voice_sender.writes) - start
+    last = max(t for _, t, _ in server.voice_sender.writes) - start
+    serial = args.boards * args.sentences * (args.ai_delay + FakeTTS().delay)
+    print(f"[测试] {args.boards} 个开发板同时说话, 每轮回复 {args.sentences} 句")
+    print(f"[结果] 首句发出 {first * 1000:.0f}ms, 全部发完 {last * 1000:.0f}ms "
+          f"(逐轮串行且整段合成约需 {serial * 1000:.0f}ms)")
+    server.print_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语音二进制分帧协议测试
+在可配置丢包/乱序的本地回环替身上测试 VoiceStreamSender / VoiceStreamReceiver，
+用模拟输出设备测试 StreamPlayer 的抖动缓冲与欠载统计，
+并与旧版 JSON+base64 传输比较线上字节数和首帧到达时间
+用法: python tests/network/test_voice_protocol.py [--loss 0.02] [--reorder 0.05] [--seconds 5]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import random
+import argparse
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'utils'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from voice_protocol import (VoiceStreamSender, VoiceStreamReceiver, StreamPlayer, encode_frame,
+                            decode_frame, FLAG_END, FLAG_META, HEADER_SIZE)
+from test_reliable_transport import LossyLoopback
+
+RATE = 16000
+
+
+def run_stream(loss=0.0, reorder=0.0, seconds=2.0, pace=0, seed=0):
+    """通过回环替身发送一条语音流，返回 (接收的帧列表, 原始PCM, 首帧到达耗时, 接收器, 信道)"""
+    channel = LossyLoopback(loss=loss, reorder=reorder, seed=seed)
+    pc = channel.endpoint(('127.0.0.1', 40000))
+    board = channel.endpoint(('127.0.0.2', 5006))
+    board.settimeout(0.05)
+
+    frames = []
+    first_frame = []
+    done = threading.Event()
+
+    def on_frame(addr, frame):
+        if not first_frame:
+            first_frame.append(time.time())
+        frames.append(frame)
+        if frame.flags & FLAG_END:
+            done.set()
+
+    receiver = VoiceStreamReceiver(on_frame)
+
+    def receive_loop():
+        while not done.is_set():
+            try:
+                data, addr = board.recvfrom(65535)
+                receiver.handle_datagram(data, addr)
+            except socket.timeout:
+                pass
+            receiver.expire_stale()
+
+    thread = threading.Thread(target=receive_loop, daemon=True)
+    thread.start()
+
+    pcm = random.Random(seed).randbytes(int(RATE * 2 * seconds))
+    sender = VoiceStreamSender(pc, pace=pace)
+    start = time.time()
+    sender.send_stream(board.addr, pcm, RATE, metadata={"type": "tts_audio"})
+    done.wait(5.0)
+    thread.join(timeout=1.0)
+    first_latency = first_frame[0] - start if first_frame else None
+    return frames, pcm, first_latency, receiver, channel
+
+
+def audio_of(frames):
+    return b''.join(f.payload for f in frames if not f.flags & FLAG_META)
+
+
+def test_frame_roundtrip():
+    """编码/解码往返一致，非本协议数据返回 None"""
+    data = encode_frame(0xDEADBEEF, 7, b'\x01\x02', 22050, channels=2, flags=FLAG_END)
+    frame = decode_frame(data)
+    assert len(data) == HEADER_SIZE + 2
+    assert (frame.stream_id, frame.seq, frame.sample_rate, frame.channels, frame.payload) == \
+        (0xDEADBEEF, 7, 22050, 2, b'\x01\x02')
+    assert frame.flags & FLAG_END
+    assert decode_frame(b'{"type": "pc_control"}') is None
+
+
+def test_lossless_stream():
+    """无丢包时按序完整送达，首帧为元数据、末帧为结束帧"""
+    frames, pcm, _, receiver, _ = run_stream(seconds=1.0)
+    assert frames[0].flags & FLAG_META
+    assert json.loads(frames[0].payload)["type"] == "tts_audio"
+    assert frames[-1].flags & FLAG_END
+    assert [f.seq for f in frames] == list(range(len(frames)))
+    assert audio_of(frames) == pcm
+    assert receiver.stats['lost_frames'] == 0
+
+
+def test_reorder_without_loss():
+    """仅乱序时重排后完整送达"""
+    frames, pcm, _, receiver, channel = run_stream(reorder=0.2, seconds=1.0, seed=2)
+    assert audio_of(frames) == pcm
+    assert receiver.stats['lost_frames'] == 0
+
+
+def test_loss_skips_and_terminates():
+    """丢包时跳过缺失帧且流一定以结束帧收尾"""
+    frames, pcm, _, receiver, channel = run_stream(loss=0.1, seconds=2.0, seed=3)
+    assert channel.dropped > 0
+    assert frames and frames[-1].flags & FLAG_END
+    seqs = [f.seq for f in frames]
+    assert seqs == sorted(seqs)
+    assert len(audio_of(frames)) < len(pcm)
+
+
+def test_late_frames_dropped():
+    """流结束后迟到的帧被丢弃，不会重新开启一条流"""
+    delivered = []
+    receiver = VoiceStreamReceiver(lambda addr, frame: delivered.append(frame))
+    addr = ('127.0.0.1', 40000)
+    receiver.handle_datagram(encode_frame(1, 0, b'ab', RATE), addr)
+    receiver.handle_datagram(encode_frame(1, 1, b'', RATE, flags=FLAG_END), addr)
+    receiver.handle_datagram(encode_frame(1, 0, b'ab', RATE), addr)
+    assert len(delivered) == 2
+    assert receiver.stats['late_frames'] == 1
+    assert not receiver.streams
+
+
+class FakeOutput:
+    """模拟 pyaudio 输出流：设备缓冲 40ms，缓冲满时 write 按实时速率阻塞"""
+
+    def __init__(self, bytes_per_second, device_buffer=0.04):
+        self.bytes_per_second = bytes_per_second
+        self.device_buffer = device_buffer
+        self.clock = 0.0              # 已写入音频播完的时间
+        self.written = bytearray()
+        self.first_write = None
+
+    def write(self, data):
+        now = time.time()
+        if self.first_write is None:
+            self.first_write = now
+        self.written += data
+        self.clock = max(self.clock, now) + len(data) / self.bytes_per_second
+        ahead = self.clock - now - self.device_buffer
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeAudio:
+    def __init__(self):
+        self.streams = []
+
+    def get_format_from_width(self, width):
+        return width
+
+    def open(self, format, channels, rate, output, output_device_index):
+        stream = FakeOutput(format * channels * rate)
+        self.streams.append(stream)
+        return stream
+
+
+def feed_player(player, gaps, frame_bytes=640):
+    """按 gaps（每帧到达前的等待秒数）向播放器送入一条 16kHz 语音流"""
+    for seq, gap in enumerate(gaps):
+        time.sleep(gap)
+        player.play_frame(None, decode_frame(encode_frame(1, seq, bytes(frame_bytes), RATE)))
+    player.play_frame(None, decode_frame(encode_frame(1, len(gaps), b'', RATE, flags=FLAG_END)))
+    deadline = time.time() + 5
+    while player.is_playing and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_player_buffers_before_output():
+    """起播前先缓冲到 buffer_ms，帧按时到达时没有欠载"""
+    audio = FakeAudio()
+    player = StreamPlayer(audio, buffer_ms=60)
+    start = time.time()
+    feed_player(player, [0.02] * 10)        # 每20ms到达20ms音频
+    assert audio.streams[0].first_write - start >= 0.05
+    assert len(audio.streams[0].written) == 640 * 10
+    assert player.stats['underruns'] == 0
+
+
+def test_player_counts_underrun():
+    """帧到达中断超过已缓冲时长时记一次欠载并重新缓冲"""
+    audio = FakeAudio()
+    player = StreamPlayer(audio, buffer_ms=40)
+    feed_player(player, [0.0, 0.0, 0.0, 0.3, 0.0, 0.0])
+    assert player.stats['underruns'] == 1
+    assert len(audio.streams[0].written) == 640 * 6
+
+
+def legacy_wire_bytes(pcm):
+    """旧版 JSON+base64 传输的线上字节数（8KB分片，每片8字节包头）"""
+    packet = json.dumps({"type": "tts_audio", "timestamp": "2025-01-01T00:00:00",
+                         "audio_data": base64.b64encode(pcm).decode('utf-8'), "format": "wav"})
+    payload = len(packet.encode('utf-8'))
+    chunks = (payload + 8191) // 8192
+    return payload + chunks * 8, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="语音二进制分帧协议测试")
+    parser.add_argument('--loss', type=float, default=0.02, help="丢包率")
+    parser.add_argument('--reorder', type=float, default=0.05, help="乱序率")
+    parser.add_argument('--seconds', type=float, default=5.0, help="音频时长(秒)")
+    parser.add_argument('--pace', type=float, default=8.0, help="发送速率上限（实时速率的倍数）")
+    args = parser.parse_args()
+
+    frames, pcm, first_latency, receiver, channel = run_stream(
+        args.loss, args.reorder, args.seconds, args.pace)
+    wire = sum(HEADER_SIZE + len(f.payload) for f in frames)
+    legacy_bytes, legacy_chunks = legacy_wire_bytes(pcm)
+
+    print(f"[测试] {args.seconds}s 音频 ({len(pcm)} 字节), 丢包率 {args.loss:.0%}, 乱序率 {args.reorder:.0%}")
+    print(f"[结果] 二进制分帧: 约 {wire} 字节上线, 首帧到达 {first_latency * 1000:.1f}ms 后即可播放")
+    print(f"[结果] 旧版JSON+base64: {legacy_bytes} 字节 ({legacy_bytes / len(pcm) - 1:+.0%}), "
+          f"{legacy_chunks} 片 × 10ms 间隔, 需全部收齐才能播放 (≥{legacy_chunks * 10}ms)")
+    print(f"[结果] 信道丢弃: {channel.dropped}/{channel.sent}, 跳过帧: {receiver.stats['lost_frames']}, "
+          f"截断流: {receiver.stats['truncated_streams']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+屏幕共享自适应质量基准测试
+把一段会话画面回放到模拟的 WiFi 链路上，比较：
+  - 固定：原设置（JPEG质量75、原分辨率、30fps）
+  - 自适应：接收端每 0.5s 反馈丢包/RTT/解码耗时，发送端按 latency_optimizer 的档位表调整质量/缩放/帧率
+链路模型（虚拟时间）：限速 + 尾部丢弃的有限缓冲 + 固定单向时延；回显与视频同向排队，
+所以接收端测得的 RTT 包含缓冲中的排队延迟。编码/解码耗时不计入虚拟时间
+统计 接收端实际帧率、丢帧率（已发送但未完整收到的帧）、采集到完整收到的延迟 p50/p95、平均质量与缩放
+
+会话画面：--session 指定录屏视频（循环回放），否则使用 benchmark_screen_tiles 的合成诊断界面，
+叠加一块开发板摄像头实时预览（有纹理、每帧都在变化），每 3 秒切换一次页面（整屏变化）
+
+用法:
+  python tests/scripts/benchmark_adaptive_stream.py [--session 录屏.mp4] [--seconds 20] [--bandwidths 40,12,6,3]
+"""
+
+import io
+import os
+import sys
+import heapq
+import argparse
+import contextlib
+
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src', 'utils'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'tests', 'scripts'))
+
+from screen_codec import (TileEncoder, TileCompositor, ScreenSender, FrameAssembler, parse_packet, WIRE_V2,
+                          MAX_PACKET_SIZE)
+from latency_optimizer import (LatencyOptimizer, OptimizedReceiver, StreamSettings, FEEDBACK_INTERVAL,
+                               SCREEN_LEVELS, SCREEN_START_LEVEL)
+from benchmark_screen_tiles import gui_session
+
+SOURCE_FPS = 30
+PAGE_SECONDS = 3.0
+FIXED = StreamSettings(75, 1.0, 30)
+
+
+class Session:
+    """按时间取会话画面：录屏视频或合成界面（定期切换页面）"""
+
+    def __init__(self, path, width, height, seconds):
+        self.frames = []
+        if path:
+            cap = cv2.VideoCapture(path)
+            while len(self.frames) < seconds * SOURCE_FPS:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                self.frames.append(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+            cap.release()
+            if not self.frames:
+                raise SystemExit(f"[错误] 无法读取录屏: {path}")
+        else:
+            per_page = int(PAGE_SECONDS * SOURCE_FPS)
+            page = 0
+            while len(self.frames) < seconds * SOURCE_FPS:
+                self.frames.extend(gui_session(width, height, per_page, SOURCE_FPS, seed=page % 3))
+                page += 1
+            self._add_preview(width, height)
+
+    def _add_preview(self, width, height):
+        """左上角叠加摄像头预览：模糊噪声纹理，每帧平移并轻微变亮变暗"""
+        rng = np.random.default_rng(7)
+        h, w = height * 2 // 5, width * 2 // 5
+        texture = cv2.GaussianBlur(rng.integers(0, 255, (h, w * 2, 3)).astype(np.float32), (0, 0), 2.5)
+        texture = cv2.normalize(texture, None, 20, 235, cv2.NORM_MINMAX)
+        for i, frame in enumerate(self.frames):
+            frame = self.frames[i] = frame.copy()
+            shift = (i * 6) % w
+            gain = 1.0 + 0.05 * np.sin(i / 5)
+            frame[height // 10:height // 10 + h, width // 20:width // 20 + w] = \
+                np.clip(texture[:, shift:shift + w] * gain, 0, 255).astype(np.uint8)
+
+    def at(self, t):
+        return self.frames[int(t * SOURCE_FPS) % len(self.frames)]
+
+
+class Link:
+    """单向链路：bandwidth(t) 限速，缓冲超过 queue_bytes 时丢弃新到的包"""
+
+    def __init__(self, bandwidth, queue_bytes, delay):
+        self.bandwidth = bandwidth
+        self.queue_bytes = queue_bytes
+        self.delay = delay
+        self.free_at = 0.0
+        self.sent = self.dropped = 0
+
+    def send(self, t, size):
+        """返回到达时刻，被丢弃时返回 None"""
+        rate = self.bandwidth(t) * 1e6 / 8
+        if max(0.0, self.free_at - t) * rate + size > self.queue_bytes:
+            self.dropped += 1
+            return None
+        self.free_at = max(t, self.free_at) + size / rate
+        self.sent += 1
+        return self.free_at + self.delay
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def run(session, bandwidth, args, adaptive):
+    """在虚拟时间上运行一次会话，返回统计"""
+    link = Link(bandwidth, args.queue_kb * 1024, args.delay / 1000)
+    encoder = TileEncoder()
+    sender = ScreenSender(encoder, MAX_PACKET_SIZE)
+    sender.version = WIRE_V2
+    optimizer = LatencyOptimizer(SCREEN_LEVELS, SCREEN_START_LEVEL, name="模拟") if adaptive else None
+    assembler, compositor, reporter = FrameAssembler(), TileCompositor(), OptimizedReceiver(FEEDBACK_INTERVAL)
+
+    events, order = [], 0
+
+    def schedule(t, kind, data=None):
+        nonlocal order
+        order += 1
+        heapq.heappush(events, (t, order, kind, data))
+
+    schedule(0.0, "capture")
+    schedule(FEEDBACK_INTERVAL, "feedback")
+    captured_at, latency, settings_log = {}, [], []
+    delivered = 0
+    while events:
+        t, _, kind, data = heapq.heappop(events)
+        if t > args.seconds:
+            break
+        if kind == "capture":
+            settings = optimizer.settings if optimizer else FIXED
+            settings_log.append(settings)
+            frame = session.at(t)
+            if settings.scale != 1.0:
+                height, width = frame.shape[:2]
+                frame = cv2.resize(frame, (int(width * settings.scale) // 2 * 2, int(height * settings.scale) // 2 * 2),
+                                   interpolation=cv2.INTER_AREA)
+            encoder.jpeg_quality = settings.quality
+            job = encoder.plan(frame, now=t)
+            if job is not None:
+                for packet in sender.packetize(*encoder.compress(job)):
+                    arrival = link.send(t, len(packet))
+                    if arrival is not None:
+                        schedule(arrival, "packet", packet)
+                captured_at[sender.frame_id] = t
+            schedule(t + 1.0 / settings.fps, "capture")
+        elif kind == "packet":
+            packet = parse_packet(data)
+            if packet is None:
+                continue  # 回显
+            completed = assembler.add(packet, now=t)
+            if completed is not None:
+                flags, frame_id, payload = completed
+                start = cv2.getTickCount()
+                if compositor.apply(flags, payload) is not None:
+                    delivered += 1
+                    latency.append((t - captured_at.pop(frame_id, t)) * 1000)
+                reporter.record_decode((cv2.getTickCount() - start) * 1000 / cv2.getTickFrequency())
+        elif kind == "echo":
+            reporter.on_control(data, now=t)
+        elif kind == "feedback":
+            assembler.expire(now=t)
+            stats = assembler.stats
+            message = reporter.feedback(stats["frames"], stats["lost_frames"], stats["packets"], stats["lost_packets"],
+                                        now=t)
+            if optimizer:
+                schedule(t + link.delay, "control", message)   # 上行方向不拥塞
+            schedule(t + FEEDBACK_INTERVAL, "feedback")
+        elif kind == "control":
+            def reply(echo, addr, sent=t):
+                arrival = link.send(sent, len(echo))       # 回显与视频同向排队
+                if arrival is not None:
+                    schedule(arrival, "echo", echo)
+            with contextlib.redirect_stdout(io.StringIO()):
+                optimizer.handle_control(data, None, reply, now=t)
+
+    return {
+        "fps": delivered / args.seconds,
+        "loss": 1 - delivered / max(1, sender.frame_id),
+        "packet_loss": link.dropped / max(1, link.sent + link.dropped),
+        "p50": percentile(latency, 0.5),
+        "p95": percentile(latency, 0.95),
+        "quality": sum(s.quality for s in settings_log) / max(1, len(settings_log)),
+        "scale": sum(s.scale for s in settings_log) / max(1, len(settings_log)),
+        "changes": optimizer.quality_controller.changes if optimizer else 0,
+    }
+
+
+def report(label, result):
+    print(f"[结果] {label}: 收到 {result['fps']:.1f} fps, 丢帧 {result['loss']:.0%} (丢包 {result['packet_loss']:.0%}), "
+          f"延迟 p50 {result['p50']:.0f}ms p95 {result['p95']:.0f}ms, "
+          f"平均质量 {result['quality']:.0f} / 缩放 {result['scale']:.2f}"
+          + (f", 换档 {result['changes']} 次" if result['changes'] else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="屏幕共享自适应质量基准测试")
+    parser.add_argument('--session', help="录屏视频路径（默认使用合成诊断界面）")
+    parser.add_argument('--seconds', type=float, default=20, help="每个场景的会话时长(秒)")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--bandwidths', default="40,12,6,3", help="固定带宽场景(Mbps)，逗号分隔")
+    parser.add_argument('--step', default="30,5", help="带宽突变场景：前半段,后半段(Mbps)；留空跳过")
+    parser.add_argument('--queue-kb', type=int, default=256, help="链路缓冲大小(KB)")
+    parser.add_argument('--delay', type=float, default=5, help="单向基础时延(ms)")
+    args = parser.parse_args()
+
+    session = Session(args.session, args.width, args.height, args.seconds)
+    print(f"[测试] 会话 {args.session or '合成诊断界面'}, {args.width}x{args.height}, {args.seconds:g}s, "
+          f"缓冲 {args.queue_kb}KB, 单向时延 {args.delay:g}ms")
+
+    scenarios = [(f"{float(b):g} Mbps", lambda t, b=float(b): b) for b in args.bandwidths.split(",") if b]
+    if args.step:
+        before, after = (float(b) for b in args.step.split(","))
+        scenarios.append((f"{before:g}→{after:g} Mbps",
+                          lambda t: before if t < args.seconds / 2 else after))
+
+    for name, bandwidth in scenarios:
+        fixed = run(session, bandwidth, args, adaptive=False)
+        adaptive = run(session, bandwidth, args, adaptive=True)
+        print(f"[测试] 链路 {name}")
+        report("固定", fixed)
+        report("自适应", adaptive)
+        print(f"[对比] 丢帧 {fixed['loss']:.0%} → {adaptive['loss']:.0%}, "
+              f"延迟 p95 {fixed['p95']:.0f} → {adaptive['p95']:.0f}ms, "
+              f"收到帧率 {fixed['fps']:.1f} → {adaptive['fps']:.1f} fps")
+
+
+if __name__ == "__main__":
+    main()
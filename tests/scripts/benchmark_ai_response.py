@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+医疗问答回复延迟基准测试
+在本地模拟 DeepSeek 接口（tests/network/test_llm_client.py 中的替身服务，首字前与每段之间有生成耗时，整段返回同样要等生成完）上比较：
+  - 旧流程：整段请求详细回答 → 再整段请求一次语音摘要（短回复） → 进度条停顿 0.3s + 0.2s → 显示并播报
+  - 新流程：一次流式请求，首行即语音摘要（就绪即播报），详细回答边生成边显示，结束即完成
+统计 摘要可播报 / 首次显示回答 / 回答完成 三个时刻
+
+用法:
+  python tests/scripts/benchmark_ai_response.py [--rounds 5] [--first-delay 0.5] [--chunks 40] [--chunk-delay 0.03]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src', 'utils'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'tests', 'network'))
+
+from llm_client import LLMClient, SummaryFirstReply, SUMMARY_PREFIX
+from test_llm_client import start_server
+
+LEGACY_PAUSES = 0.3 + 0.2        # 旧流程请求结束后的进度条停顿
+
+
+SUMMARY = ["可能是视疲劳，", "建议多休息，症状加重请及时就医。"]
+
+
+def make_reply(chunks):
+    body = [f"{i + 1}. 详细建议内容第{i + 1}段。\n" for i in range(chunks)]
+    return [SUMMARY_PREFIX + SUMMARY[0], SUMMARY[1] + "\n"] + body
+
+
+def legacy_round(client, endpoints, payload):
+    """旧流程：详细回答与摘要两次整段请求 + 固定停顿；摘要与回答同时在最后才可用"""
+    start = time.perf_counter()
+    client.post(endpoints["answer"], "test-key", payload).json()
+    client.post(endpoints["summary"], "test-key", payload).json()
+    time.sleep(LEGACY_PAUSES)
+    done = time.perf_counter() - start
+    return done, done, done
+
+
+def streaming_round(client, endpoints, payload):
+    """新流程：一次流式请求，首行摘要就绪即可播报"""
+    start = time.perf_counter()
+    reply = SummaryFirstReply()
+    summary_at = first_body_at = None
+    for delta in client.stream(endpoints["answer"], "test-key", payload):
+        if reply.feed(delta) and summary_at is None:
+            summary_at = time.perf_counter() - start
+        if reply.body and first_body_at is None:
+            first_body_at = time.perf_counter() - start
+    reply.finish()
+    done = time.perf_counter() - start
+    return summary_at or done, first_body_at or done, done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="医疗问答回复延迟基准测试")
+    parser.add_argument('--rounds', type=int, default=5, help="每种流程的提问次数")
+    parser.add_argument('--first-delay', type=float, default=0.5, help="模拟接口首字前的耗时(秒)")
+    parser.add_argument('--chunks', type=int, default=40, help="详细回答的段数")
+    parser.add_argument('--chunk-delay', type=float, default=0.03, help="模拟接口每段的生成耗时(秒)")
+    args = parser.parse_args()
+
+    server, answer = start_server(make_reply(args.chunks), args.first_delay, args.chunk_delay)
+    summary_server, summary = start_server(SUMMARY, args.first_delay, args.chunk_delay)
+    endpoints = {"answer": answer, "summary": summary}
+    payload = {"model": "deepseek-chat", "messages": [{"role": "user", "content": "眼睛干涩怎么办"}]}
+    client = LLMClient()
+
+    print(f"[测试] 模拟接口: 首字前 {args.first_delay * 1000:.0f}ms, 回答 {args.chunks} 段 × "
+          f"{args.chunk_delay * 1000:.0f}ms, 每种流程 {args.rounds} 次")
+    results = {}
+    for name, run in (("旧流程(两次请求+停顿)", legacy_round), ("新流程(一次流式请求)", streaming_round)):
+        rounds = [run(client, endpoints, payload) for _ in range(args.rounds)]
+        averages = [sum(r[i] for r in rounds) / len(rounds) * 1000 for i in range(3)]
+        results[name] = averages
+        print(f"[结果] {name}: 摘要可播报 {averages[0]:.0f}ms, 首次显示回答 {averages[1]:.0f}ms, "
+              f"回答完成 {averages[2]:.0f}ms")
+
+    legacy, streaming = results.values()
+    print(f"[对比] 摘要播报提前 {legacy[0] - streaming[0]:.0f}ms, 首次显示提前 {legacy[1] - streaming[1]:.0f}ms, "
+          f"完成提前 {legacy[2] - streaming[2]:.0f}ms ({1 - streaming[2] / legacy[2]:.0%})")
+    server.shutdown()
+    summary_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+开发板摄像头视频流编码基准测试
+按视频流的实际路径在本机 UDP 上回放眼底相机画面：编码 → 9 字节包头分片 → FragmentReceiver 重组 →
+StreamDecoder 解码，比较：
+  - JPEG：原方案，逐帧独立 JPEG（质量 60）
+  - H.264：src/utils/stream_codec.py，x264 ultrafast + zerolatency（需要 PyAV）
+统计 码率、编码/解码耗时 p50/p95、采集到解码完成的延迟 p50/p95（不含摄像头曝光与显示刷新）、
+实际显示帧率与画质 PSNR；--loss 模拟随机丢包，H.264 丢帧后经控制消息请求关键帧恢复
+
+用法:
+  python tests/scripts/benchmark_camera_codec.py [--video 眼底录像.mp4] [--seconds 10] [--fps 15] [--loss 0.01]
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src', 'utils'))
+
+import stream_codec
+from stream_codec import (create_stream_encoder, StreamDecoder, stream_control_message, parse_stream_control,
+                          REQUEST_KEYFRAME, KEYFRAME_REQUEST_INTERVAL, CODEC_JPEG, CODEC_H264, JPEG_QUALITY)
+from reliable_transport import build_fragments, FragmentReceiver, MAX_PACKET_SIZE
+
+
+def fundus_session(width, height, count, fps, seed=0):
+    """合成眼底相机画面：视盘与血管基本静止，叠加传感器噪声、轻微抖动，每 4 秒一次眼动（画面平移）"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:height * 2, :width * 2]
+    cy, cx = height, width
+    base = np.full((height * 2, width * 2, 3), 8, dtype=np.float32)
+    retina = ((yy - cy) ** 2 + (xx - cx) ** 2) < (min(height, width) * 0.9) ** 2
+    base[retina] = (30, 70, 170)
+    texture = cv2.GaussianBlur(rng.normal(0, 12, base.shape).astype(np.float32), (0, 0), 4)
+    base[retina] += texture[retina]
+    for angle in np.linspace(0, np.pi, 9):
+        direction = (np.cos(angle), np.sin(angle))
+        for sign in (-1, 1):
+            end = (int(cx + sign * direction[0] * width), int(cy + sign * direction[1] * height))
+            cv2.line(base, (cx, cy), end, (20, 30, 90), 3, cv2.LINE_AA)
+    cv2.circle(base, (cx + width // 6, cy), min(height, width) // 10, (150, 210, 240), -1, cv2.LINE_AA)
+
+    offset = np.zeros(2)
+    for i in range(count):
+        if i % int(4 * fps) == int(2 * fps):
+            offset = rng.uniform(-30, 30, 2)
+        jitter = offset + rng.normal(0, 0.5, 2)
+        y, x = int(height / 2 + jitter[0]), int(width / 2 + jitter[1])
+        frame = base[y:y + height, x:x + width] + rng.normal(0, 2, (height, width, 3))
+        yield np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def load_frames(args):
+    if not args.video:
+        return list(fundus_session(args.width, args.height, int(args.seconds * args.fps), args.fps))
+    cap = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.seconds * args.fps:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(cv2.resize(frame, (args.width, args.height), interpolation=cv2.INTER_AREA))
+    cap.release()
+    if not frames:
+        raise SystemExit(f"[错误] 无法读取录像: {args.video}")
+    return frames
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2)
+    return 99.0 if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def run(codec, frames, args):
+    """开发板发送线程 + PC 接收线程，按 fps 实时回放"""
+    board = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    board.bind(("127.0.0.1", 0))
+    board.setblocking(False)
+    pc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    pc.bind(("127.0.0.1", 0))
+    pc.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    pc.settimeout(0.2)
+
+    encoder = create_stream_encoder(codec, args.fps)
+    rng = np.random.default_rng(1)
+    captured = {}                  # 流序号 -> (采集时刻, 原始帧)
+    encode_ms, sent_bytes = [], 0
+    done = threading.Event()
+
+    def sender():
+        nonlocal sent_bytes
+        next_time = time.perf_counter()
+        for seq, frame in enumerate(frames, 1):
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+            next_time += 1.0 / args.fps
+            try:
+                while True:
+                    if parse_stream_control(board.recv(64)) == REQUEST_KEYFRAME:
+                        encoder.request_keyframe()
+            except BlockingIOError:
+                pass
+            start = time.perf_counter()
+            captured[seq] = (start, frame)
+            data = encoder.encode(frame, args.quality)
+            encode_ms.append((time.perf_counter() - start) * 1000)
+            sent_bytes += len(data)
+            for fragment in build_fragments(seq, data, reliable=False, max_payload=MAX_PACKET_SIZE):
+                if rng.random() >= args.loss:
+                    board.sendto(fragment, pc.getsockname())
+        time.sleep(0.3)
+        done.set()
+
+    thread = threading.Thread(target=sender, daemon=True)
+    start_time = time.perf_counter()
+    thread.start()
+
+    receiver, decoder = FragmentReceiver(), StreamDecoder()
+    latency, decode_ms, quality = [], [], []
+    last_seq, last_request, shown = None, 0.0, 0
+    while not done.is_set():
+        try:
+            data, addr = receiver.receive_into(pc)
+        except socket.timeout:
+            continue
+        frame = receiver.handle_datagram(data, addr)
+        if frame is None:
+            continue
+        seq = frame['packet_id']
+        if last_seq is not None and seq != last_seq + 1:
+            if seq <= last_seq:
+                continue
+            decoder.lost()
+        last_seq = seq
+        start = time.perf_counter()
+        image = decoder.decode(frame['data'])
+        now = time.perf_counter()
+        decode_ms.append((now - start) * 1000)
+        if image is None:
+            if decoder.needs_keyframe and now - last_request >= KEYFRAME_REQUEST_INTERVAL:
+                pc.sendto(stream_control_message(REQUEST_KEYFRAME), addr)
+                last_request = now
+            continue
+        shown += 1
+        captured_at, original = captured.pop(seq)
+        latency.append((now - captured_at) * 1000)
+        quality.append(psnr(image, original))
+    thread.join()
+    elapsed = time.perf_counter() - start_time
+    board.close()
+    pc.close()
+    duration = len(frames) / args.fps
+    return {
+        "codec": encoder.codec,
+        "kbps": sent_bytes * 8 / duration / 1000,
+        "kb_per_frame": sent_bytes / len(frames) / 1024,
+        "keyframes": encoder.stats["keyframes"],
+        "encode_p50": percentile(encode_ms, 0.5), "encode_p95": percentile(encode_ms, 0.95),
+        "decode_p50": percentile(decode_ms, 0.5), "decode_p95": percentile(decode_ms, 0.95),
+        "latency_p50": percentile(latency, 0.5), "latency_p95": percentile(latency, 0.95),
+        "shown_fps": shown / duration,
+        "psnr": float(np.mean(quality)) if quality else 0.0,
+        "elapsed": elapsed,
+    }
+
+
+def report(result):
+    name = "H.264" if result["codec"] == CODEC_H264 else "JPEG"
+    print(f"[结果] {name}: 码率 {result['kbps']:.0f} kbps ({result['kb_per_frame']:.1f} KB/帧, 关键帧 {result['keyframes']}), "
+          f"编码 p50 {result['encode_p50']:.1f}ms p95 {result['encode_p95']:.1f}ms, "
+          f"解码 p50 {result['decode_p50']:.1f}ms p95 {result['decode_p95']:.1f}ms")
+    print(f"       采集到解码延迟 p50 {result['latency_p50']:.1f}ms p95 {result['latency_p95']:.1f}ms, "
+          f"显示 {result['shown_fps']:.1f} fps, PSNR {result['psnr']:.1f} dB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="开发板摄像头视频流编码基准测试")
+    parser.add_argument('--video', help="眼底录像路径（默认使用合成画面）")
+    parser.add_argument('--seconds', type=float, default=10, help="回放时长(秒)")
+    parser.add_argument('--fps', type=int, default=15, help="视频流帧率（原 stream_fps）")
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--quality', type=int, default=JPEG_QUALITY, help="质量档位（H.264 换算为 CRF）")
+    parser.add_argument('--loss', type=float, default=0.0, help="随机丢弃分片的比例")
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    print(f"[测试] {args.video or '合成眼底画面'}, {args.width}x{args.height}, {args.fps}fps, {len(frames)} 帧, "
+          f"质量 {args.quality}, 丢包 {args.loss:.0%} (CPU {os.cpu_count()} 核)")
+    results = [run(CODEC_JPEG, frames, args)]
+    if stream_codec.HAS_AV:
+        results.append(run(CODEC_H264, frames, args))
+    else:
+        print("[跳过] 未安装 PyAV，无法测试 H.264（pip install av）")
+    for result in results:
+        report(result)
+    if len(results) == 2:
+        jpeg, h264 = results
+        print(f"[对比] 码率 {jpeg['kbps']:.0f} → {h264['kbps']:.0f} kbps ({jpeg['kbps'] / max(h264['kbps'], 1e-6):.1f}x), "
+              f"延迟 p50 {jpeg['latency_p50']:.1f} → {h264['latency_p50']:.1f}ms, "
+              f"PSNR {jpeg['psnr']:.1f} → {h264['psnr']:.1f} dB")
+
+
+if __name__ == "__main__":
+    main()
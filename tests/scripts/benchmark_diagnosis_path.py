@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+开发板→PC端诊断链路压测脚本
+模拟 N 块开发板，按 NetworkManager.send_image_for_diagnosis 的线上格式发送请求：
+  1. 诊断请求头(JSON) → COMMAND_PORT
+  2. 分片JPEG(可靠分片，首包携带 request_id) → CAMERA_PORT
+  3. 在 DIAGNOSIS_PORT 等待 type=diagnosis_result 且 request_id 匹配的结果
+统计 请求→结果 延迟的 p50/p95/p99、吞吐量、CPU时间和分片重传率（重传分片数 / 发送分片数），并写入JSON便于回归对比
+CPU时间取进程 time.process_time() 差值；进程内服务器的CPU = 进程总量 - 各模拟开发板线程的 time.thread_time()
+
+每块模拟开发板使用独立的回环地址 127.0.0.{k}，这样各自都能绑定 DIAGNOSIS_PORT 接收结果。
+
+用法:
+  # 在进程内启动 pc_diagnosis_server（多线程 / asyncio 模式）并压测
+  python tests/scripts/benchmark_diagnosis_path.py --boards 4 --requests 50 --target server --server-mode asyncio
+  # 压测已在本机运行的服务（如 visualization_test2.py 的 BoardCameraReceiver）
+  python tests/scripts/benchmark_diagnosis_path.py --boards 2 --target external
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import random
+import socket
+import argparse
+import threading
+from datetime import datetime
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.append(os.path.join(ROOT_DIR, 'src', 'utils'))
+sys.path.append(os.path.join(ROOT_DIR, 'src', 'pc'))
+
+from reliable_transport import ReliableSender
+
+# ===== 默认配置（与 system_config.py 一致）=====
+CAMERA_PORT = 5002
+DIAGNOSIS_PORT = 5003
+COMMAND_PORT = 5004
+HEADER_DELAY = 0.1          # 开发板发送请求头后等待的时间(秒)
+RESULT_TIMEOUT = 30         # 单个请求等待结果的超时(秒)
+IMAGE_DIR = os.path.join(ROOT_DIR, 'data', 'eyes_val')
+# ===================
+
+
+def load_images(image_dir, limit=200):
+    """读取验证集JPEG原始字节（与开发板 cv2.imencode 输出同为JPEG）"""
+    paths = sorted(glob.glob(os.path.join(image_dir, '**', '*.jpg'), recursive=True))[:limit]
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append((os.path.basename(path), f.read()))
+    if not images:
+        raise RuntimeError(f"未在 {image_dir} 找到JPEG图像")
+    return images
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class SimulatedBoard(threading.Thread):
+    """一块模拟开发板：闭环发送诊断请求并等待结果"""
+
+    def __init__(self, board_index, pc_ip, images, requests, header_delay, think_time, seed):
+        super().__init__(daemon=True)
+        self.board_index = board_index
+        self.board_ip = f"127.0.0.{board_index + 2}"
+        self.pc_ip = pc_ip
+        self.images = images
+        self.requests = requests
+        self.header_delay = header_delay
+        self.think_time = think_time
+        self.random = random.Random(seed)
+        self.latencies = []
+        self.send_times = []
+        self.timeouts = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.cpu_time = 0.0
+
+        self.command_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.command_sock.bind((self.board_ip, 0))
+        self.image_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.image_sock.bind((self.board_ip, 0))
+        self.result_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.result_sock.bind((self.board_ip, DIAGNOSIS_PORT))
+        self.sender = ReliableSender(self.image_sock)
+
+    def run(self):
+        cpu_start = time.thread_time()
+        try:
+            self._run_requests()
+        finally:
+            self.cpu_time = time.thread_time() - cpu_start
+
+    def _run_requests(self):
+        for n in range(self.requests):
+            name, img_data = self.random.choice(self.images)
+            timestamp = int(time.time() * 1000)
+            request_id = f"req_{timestamp}_{self.board_index}_{n}"
+            header = {
+                "type": "diagnosis_request",
+                "request_id": request_id,
+                "timestamp": timestamp,
+                "image_size": len(img_data),
+                "width": 512,
+                "height": 512,
+                "total_packets": 0,
+                "compression_quality": 85,
+                "save_to_pc": False,
+                "pc_save_path": ""
+            }
+
+            start = time.time()
+            self.command_sock.sendto(json.dumps(header).encode('utf-8'), (self.pc_ip, COMMAND_PORT))
+            time.sleep(self.header_delay)
+
+            send_start = time.time()
+            if self.sender.send((self.pc_ip, CAMERA_PORT), img_data, request_id=request_id) is None:
+                self.errors += 1
+                continue
+            self.send_times.append(time.time() - send_start)
+            self.bytes_sent += len(img_data)
+
+            result = self._wait_for_result(request_id, start + RESULT_TIMEOUT)
+            if result is None:
+                self.timeouts += 1
+            elif result.get('type') == 'diagnosis_result':
+                self.latencies.append(time.time() - start)
+            else:
+                self.errors += 1
+
+            if self.think_time:
+                time.sleep(self.think_time)
+
+    def _wait_for_result(self, request_id, deadline):
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            self.result_sock.settimeout(remaining)
+            try:
+                data, _ = self.result_sock.recvfrom(65535)
+            except socket.timeout:
+                return None
+            try:
+                result = json.loads(data.decode('utf-8'))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                continue
+            if result.get('request_id') == request_id:
+                return result
+
+    def close(self):
+        for sock in [self.command_sock, self.image_sock, self.result_sock]:
+            sock.close()
+
+
+def start_inprocess_server(mode):
+    """在当前进程启动 pc_diagnosis_server"""
+    import asyncio
+    import pc_diagnosis_server as server_module
+
+    server_module.CAMERA_PORT = CAMERA_PORT
+    server_module.COMMAND_PORT = COMMAND_PORT
+    server_module.DIAGNOSIS_PORT = DIAGNOSIS_PORT
+
+    if mode == 'asyncio':
+        server = server_module.AsyncDiagnosisServer()
+        threading.Thread(target=lambda: asyncio.run(server.serve_forever()), daemon=True).start()
+    else:
+        server = server_module.DiagnosisServer()
+        if not server.start_server():
+            raise RuntimeError("诊断服务器启动失败")
+    time.sleep(1.0)
+    return server
+
+
+def run_benchmark(args):
+    images = load_images(args.image_dir)
+    print(f"[压测] 载入 {len(images)} 张图像，模拟 {args.boards} 块开发板，每块 {args.requests} 个请求")
+
+    server = None
+    if args.target == 'server':
+        server = start_inprocess_server(args.server_mode)
+
+    boards = [
+        SimulatedBoard(k, args.pc_ip, images, args.requests, args.header_delay, args.think_time, args.seed + k)
+        for k in range(args.boards)
+    ]
+
+    start = time.time()
+    cpu_start = time.process_time()
+    for board in boards:
+        board.start()
+    for board in boards:
+        board.join()
+    elapsed = time.time() - start
+    process_cpu = time.process_time() - cpu_start
+
+    for board in boards:
+        board.close()
+    if server:
+        server.shutdown()
+
+    latencies = [lat for board in boards for lat in board.latencies]
+    send_times = [t for board in boards for t in board.send_times]
+    fragments_sent = sum(board.sender.stats['fragments_sent'] for board in boards)
+    retransmissions = sum(board.sender.stats['retransmissions'] for board in boards)
+    total_requests = args.boards * args.requests
+    boards_cpu = sum(board.cpu_time for board in boards)
+    # 外部服务在其他进程中运行，无法从这里统计其CPU
+    server_cpu = max(0.0, process_cpu - boards_cpu) if server else None
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'boards': args.boards,
+            'requests_per_board': args.requests,
+            'target': args.target,
+            'server_mode': args.server_mode if args.target == 'server' else None,
+            'header_delay': args.header_delay,
+            'think_time': args.think_time,
+        },
+        'requests': total_requests,
+        'completed': len(latencies),
+        'timeouts': sum(board.timeouts for board in boards),
+        'errors': sum(board.errors for board in boards),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'upload_mbps': round(sum(board.bytes_sent for board in boards) * 8 / elapsed / 1e6, 2) if elapsed else 0,
+        'latency_ms': {
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(max(latencies) if latencies else None),
+            'mean': ms(sum(latencies) / len(latencies) if latencies else None),
+        },
+        'cpu': {
+            'process_s': round(process_cpu, 3),
+            'boards_s': round(boards_cpu, 3),
+            'server_s': round(server_cpu, 3) if server_cpu is not None else None,
+            'server_percent': round(server_cpu / elapsed * 100, 1) if server_cpu is not None and elapsed else None,
+            'server_ms_per_request': ms(server_cpu / len(latencies)) if server_cpu is not None and latencies else None,
+        },
+        'send_ms': {
+            'p50': ms(percentile(send_times, 50)),
+            'p99': ms(percentile(send_times, 99)),
+        },
+        'fragments': {
+            'sent': fragments_sent,
+            'retransmitted': retransmissions,
+            'retransmit_ratio': round(retransmissions / fragments_sent, 4) if fragments_sent else 0.0,
+        },
+    }
+    return report
+
+
+def main():
+    global CAMERA_PORT, DIAGNOSIS_PORT, COMMAND_PORT
+
+    parser = argparse.ArgumentParser(description="开发板→PC端诊断链路压测")
+    parser.add_argument('--boards', type=int, default=4, help="模拟开发板数量")
+    parser.add_argument('--requests', type=int, default=25, help="每块开发板的请求数")
+    parser.add_argument('--target', choices=['server', 'external'], default='server',
+                        help="server: 进程内启动 pc_diagnosis_server; external: 压测已运行的服务（如GUI）")
+    parser.add_argument('--server-mode', choices=['thread', 'asyncio'], default='thread', help="进程内服务器模式")
+    parser.add_argument('--pc-ip', default='127.0.0.1', help="PC端地址")
+    parser.add_argument('--camera-port', type=int, default=CAMERA_PORT)
+    parser.add_argument('--command-port', type=int, default=COMMAND_PORT)
+    parser.add_argument('--diagnosis-port', type=int, default=DIAGNOSIS_PORT)
+    parser.add_argument('--header-delay', type=float, default=HEADER_DELAY, help="请求头与图像之间的等待(秒)")
+    parser.add_argument('--think-time', type=float, default=0.0, help="每块开发板两次请求之间的间隔(秒)")
+    parser.add_argument('--image-dir', default=IMAGE_DIR)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_diagnosis.json', help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    CAMERA_PORT, COMMAND_PORT, DIAGNOSIS_PORT = args.camera_port, args.command_port, args.diagnosis_port
+
+    report = run_benchmark(args)
+
+    print("=" * 50)
+    print(f"[结果] 完成 {report['completed']}/{report['requests']} "
+          f"(超时 {report['timeouts']}, 错误 {report['errors']})")
+    print(f"[结果] 吞吐量: {report['throughput_rps']} 次/秒, 上行 {report['upload_mbps']} Mbit/s")
+    latency = report['latency_ms']
+    print(f"[结果] 延迟(ms): p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}")
+    cpu = report['cpu']
+    if cpu['server_s'] is not None:
+        print(f"[结果] CPU: 服务器 {cpu['server_s']}s ({cpu['server_percent']}% 单核, "
+              f"{cpu['server_ms_per_request']} ms/请求), 模拟开发板 {cpu['boards_s']}s")
+    else:
+        print(f"[结果] CPU: 本进程(模拟开发板) {cpu['process_s']}s，外部服务请用系统工具统计")
+    print(f"[结果] 分片: 发送 {report['fragments']['sent']}, 重传 {report['fragments']['retransmitted']} "
+          f"(重传率 {report['fragments']['retransmit_ratio']:.2%})")
+    print("=" * 50)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[保存] 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
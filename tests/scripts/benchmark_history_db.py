@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史记录数据库写入基准测试
+比较旧实现（每条记录新建连接、单独提交、回滚日志模式）与 HistoryDB（WAL 长连接 + 写线程组提交）：
+  - 旧实现逐条 add
+  - HistoryDB 逐条 add（单线程 / 多线程并发）
+  - HistoryDB.add_many 批量插入
+在临时目录中进行，不影响用户的历史记录
+
+用法:
+  python tests/scripts/benchmark_history_db.py --rows 100000 --baseline-rows 2000
+"""
+
+import os
+import sys
+import time
+import uuid
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from visualization_test2 import HistoryDB
+
+
+def make_rows(count, prefix):
+    return [
+        (f"{prefix}_{uuid.uuid4()}", "2025-01-01 12:00:00", f"images/{prefix}_{i}.jpg", "Normal", 0.9123)
+        for i in range(count)
+    ]
+
+
+def legacy_add(db_path, rows):
+    """旧版 HistoryDB.add：每条记录一个连接、一次提交"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                record_id TEXT UNIQUE NOT NULL,
+                timestamp TEXT NOT NULL,
+                image_path TEXT,
+                disease_name TEXT NOT NULL,
+                confidence REAL NOT NULL,
+                advice TEXT
+            )
+        """)
+    for row in rows:
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO records (record_id, timestamp, image_path, disease_name, confidence) VALUES (?,?,?,?,?)",
+                row
+            )
+            conn.commit()
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"[{label:24s}] {count:>7d} 行, 用时 {elapsed:8.3f} 秒, {count / elapsed:>10.0f} 行/秒")
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HistoryDB 写入吞吐量基准测试")
+    parser.add_argument('--rows', type=int, default=100000, help="add_many 批量插入的行数")
+    parser.add_argument('--baseline-rows', type=int, default=2000, help="逐条写入测试的行数（旧实现很慢）")
+    parser.add_argument('--threads', type=int, default=8, help="并发 add 的线程数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = timed("旧实现 逐条add", args.baseline_rows,
+                         lambda: legacy_add(os.path.join(tmp, "legacy.db"), make_rows(args.baseline_rows, "legacy")))
+
+        db = HistoryDB(os.path.join(tmp, "history.db"))
+        rows = make_rows(args.baseline_rows, "single")
+        timed("HistoryDB 逐条add", args.baseline_rows, lambda: [db.add(*row) for row in rows])
+
+        per_thread = args.baseline_rows // args.threads
+        thread_rows = [make_rows(per_thread, f"t{k}") for k in range(args.threads)]
+
+        def concurrent_add():
+            threads = [threading.Thread(target=lambda rs=rs: [db.add(*row) for row in rs]) for rs in thread_rows]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        timed(f"HistoryDB {args.threads}线程add", per_thread * args.threads, concurrent_add)
+
+        bulk_rows = make_rows(args.rows, "bulk")
+        bulk = timed("HistoryDB add_many", args.rows, lambda: db.add_many(bulk_rows))
+        db.close()
+
+    print(f"[结果] add_many 相对旧实现提升 {bulk / baseline:.0f} 倍")
+
+
+if __name__ == "__main__":
+    main()
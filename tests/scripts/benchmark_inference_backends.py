@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理后端基准测试
+在 data/eyes_val 上比较 PyTorch(.pt) / ONNX Runtime / OpenVINO 三种 CPU 后端：
+  - 单张图像延迟 p50/p95/p99
+  - 批量推理吞吐量（张/秒）
+  - 与 PyTorch 结果的 top-1 一致率
+直接调用 EyeDiseaseDetector.predict_batch，绕过结果缓存
+
+用法:
+  python tests/scripts/benchmark_inference_backends.py --model models/custom/AKConv_best_moudle/best.pt
+  python tests/scripts/benchmark_inference_backends.py --backends pytorch onnx --threads 4 --batch 8
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'configs'))
+
+import cv2
+from visualization_test2 import EyeDiseaseDetector
+
+DEFAULT_MODEL = os.path.join(ROOT_DIR, 'models', 'custom', 'AKConv_best_moudle', 'best.pt')
+IMAGE_DIR = os.path.join(ROOT_DIR, 'data', 'eyes_val')
+
+
+def load_images(image_dir, limit):
+    paths = sorted(glob.glob(os.path.join(image_dir, '**', '*.jpg'), recursive=True))[:limit]
+    images = [cv2.imread(path) for path in paths]
+    return [image for image in images if image is not None]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def benchmark_backend(backend, model_path, images, threads, batch_size, warmup):
+    detector = EyeDiseaseDetector(backend=backend, num_threads=threads)
+    if not detector.load_model(model_path) or detector.active_backend != backend:
+        print(f"[跳过] {backend} 后端不可用（实际加载: {detector.active_backend}）")
+        return None, None
+
+    for image in images[:warmup]:
+        detector.predict_batch([image])
+
+    # 单张延迟
+    latencies = []
+    predictions = []
+    for image in images:
+        start = time.perf_counter()
+        results = detector.predict_batch([image])
+        latencies.append(time.perf_counter() - start)
+        predictions.append(detector.top1(results[0]) if results else None)
+
+    # 批量吞吐量
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        detector.predict_batch(images[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+
+    report = {
+        'backend': backend,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p95': round(percentile(latencies, 95) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2),
+            'mean': round(sum(latencies) / len(latencies) * 1000, 2),
+        },
+        'throughput_ips': round(len(images) / elapsed, 2),
+    }
+    return report, predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU 推理后端基准测试")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help=".pt 权重路径")
+    parser.add_argument('--backends', nargs='+', default=['pytorch', 'onnx', 'openvino'],
+                        choices=['pytorch', 'onnx', 'openvino'])
+    parser.add_argument('--threads', type=int, default=0, help="intra-op 线程数，0 为后端默认")
+    parser.add_argument('--batch', type=int, default=8, help="吞吐量测试的批大小")
+    parser.add_argument('--images', type=int, default=200, help="最多使用的图像数")
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--image-dir', default=IMAGE_DIR)
+    parser.add_argument('--output', default='bench_backends.json', help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir, args.images)
+    if not images:
+        print(f"[错误] 未在 {args.image_dir} 找到图像")
+        return
+    print(f"[测试] 模型: {args.model}, {len(images)} 张图像, 线程数: {args.threads or '默认'}, 批大小: {args.batch}")
+
+    reports = []
+    reference = None
+    for backend in args.backends:
+        report, predictions = benchmark_backend(
+            backend, args.model, images, args.threads, args.batch, args.warmup)
+        if report is None:
+            continue
+        if reference is None:
+            reference = predictions
+        else:
+            same = sum(1 for a, b in zip(reference, predictions) if a and b and a[0] == b[0])
+            report['top1_agreement'] = round(same / len(images), 4)
+        reports.append(report)
+
+        latency = report['latency_ms']
+        print(f"[{backend:8s}] 延迟(ms): p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} "
+              f"| 吞吐量: {report['throughput_ips']} 张/秒"
+              + (f" | top-1 一致率: {report['top1_agreement']:.2%}" if 'top1_agreement' in report else ""))
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'model': args.model, 'threads': args.threads, 'batch': args.batch,
+                   'images': len(images), 'results': reports}, f, ensure_ascii=False, indent=2)
+    print(f"[保存] 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+屏幕共享发送流水线基准测试
+把合成画面经本机 UDP 发送出去，比较：
+  - 串行：原 main() 循环，同一线程内 采集 → 变化检测 → JPEG → 逐包发送
+  - 流水线：src/utils/screen_pipeline.py，采集/并行压缩/发送三级流水线
+场景：
+  gui    诊断界面（逐字输出、进度条、鼠标，变化区域小）
+  scroll 整屏滚动（每帧都是关键帧，压缩最重）
+统计 实际发送帧率、采集到发完的延迟 p50/p95、带宽与丢帧数
+
+用法:
+  python tests/scripts/benchmark_screen_pipeline.py [--scene scroll] [--seconds 5] [--fps 60] [--workers 3]
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import itertools
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src', 'utils'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'tests', 'scripts'))
+
+from screen_codec import TileEncoder, ScreenSender
+from screen_pipeline import ScreenPipeline, ENCODE_WORKERS
+from benchmark_screen_tiles import gui_session
+
+
+def scene_frames(scene, width, height, fps):
+    """按场景无限产出画面"""
+    if scene == "gui":
+        while True:
+            yield from gui_session(width, height, fps * 60, fps)
+    base = next(gui_session(width, height, 1, fps))
+    for i in itertools.count():
+        yield np.ascontiguousarray(np.roll(base, i * 8, axis=0))
+
+
+class Capture:
+    """按需取下一帧画面，模拟截屏"""
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def __call__(self):
+        return next(self.frames)
+
+
+def open_socket():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024 * 1024)
+    receiver.setblocking(False)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 8 * 1024 * 1024)
+    return sender, receiver
+
+
+def drain(receiver):
+    try:
+        while True:
+            receiver.recv(65536)
+    except (BlockingIOError, OSError):
+        pass
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def run_serial(args, capture, sender_sock, receiver):
+    """原 main() 循环：目标帧率控制 + 串行编码发送"""
+    sender = ScreenSender(TileEncoder())
+    address = receiver.getsockname()
+    frame_interval = 1.0 / args.fps
+    sent, total, latency = 0, 0, []
+    start = next_frame_time = time.perf_counter()
+    while time.perf_counter() - start < args.seconds:
+        delay = next_frame_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        next_frame_time += frame_interval
+        captured = time.perf_counter()
+        packets = sender.encode(capture())
+        for i, packet in enumerate(packets):
+            sender_sock.sendto(packet, address)
+            total += len(packet)
+            if len(packet) > 1000 and i % 2 == 0:
+                time.sleep(0.0005)
+            if i % 64 == 0:
+                drain(receiver)
+        if packets:
+            sent += 1
+            latency.append((time.perf_counter() - captured) * 1000)
+        drain(receiver)
+    elapsed = time.perf_counter() - start
+    print(f"[结果] 串行: 发送 {sent / elapsed:.1f} fps, 延迟 p50 {percentile(latency, 0.5):.0f}ms "
+          f"p95 {percentile(latency, 0.95):.0f}ms, 带宽 {total * 8 / elapsed / 1e6:.1f} Mbps")
+    return sent / elapsed
+
+
+def run_pipeline(args, capture, sender_sock, receiver):
+    address = receiver.getsockname()
+    pipeline = ScreenPipeline(ScreenSender(TileEncoder()), capture, lambda packet: sender_sock.sendto(packet, address),
+                              fps=args.fps, workers=args.workers, pace_mbps=args.pace or None)
+    pipeline.start()
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.seconds:
+        drain(receiver)
+        time.sleep(0.002)
+    stats = pipeline.snapshot()
+    pipeline.stop()
+    print(f"[结果] 流水线({args.workers}线程压缩): 发送 {stats['send_fps']:.1f} fps "
+          f"(采集 {stats['capture_fps']:.1f}, 丢帧 {stats['dropped']}), "
+          f"延迟 p50 {stats['latency_p50']:.0f}ms p95 {stats['latency_p95']:.0f}ms, 压缩 p50 {stats['encode_p50']:.0f}ms, "
+          f"带宽 {stats['mbps']:.1f} Mbps")
+    return stats["send_fps"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="屏幕共享发送流水线基准测试")
+    parser.add_argument('--scene', choices=("gui", "scroll"), default="scroll", help="画面场景")
+    parser.add_argument('--seconds', type=float, default=5, help="每种方案的运行时长(秒)")
+    parser.add_argument('--fps', type=int, default=60, help="目标采集帧率")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--workers', type=int, default=ENCODE_WORKERS, help="流水线压缩线程数")
+    parser.add_argument('--pace', type=float, default=0, help="流水线发送限速(Mbps)，0 表示不限速")
+    args = parser.parse_args()
+
+    print(f"[测试] 场景 {args.scene}, {args.width}x{args.height}, 目标 {args.fps}fps, 每种方案 {args.seconds}s "
+          f"(CPU {os.cpu_count()} 核)")
+    sender_sock, receiver = open_socket()
+    serial_fps = run_serial(args, Capture(scene_frames(args.scene, args.width, args.height, args.fps)),
+                            sender_sock, receiver)
+    pipeline_fps = run_pipeline(args, Capture(scene_frames(args.scene, args.width, args.height, args.fps)),
+                                sender_sock, receiver)
+    print(f"[对比] 发送帧率 {serial_fps:.1f} → {pipeline_fps:.1f} fps ({pipeline_fps / max(serial_fps, 1e-6):.1f}x)")
+    sender_sock.close()
+    receiver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+屏幕共享编码基准测试
+用合成的诊断界面会话（静态面板 + 逐字出现的AI回复 + 进度条 + 移动的鼠标 + 每秒刷新的时钟）比较：
+  - 旧方案：灰度/Canny 边缘整帧变化检测，变化超过阈值即整帧 JPEG（每发送 15 帧强制一次）
+  - 瓦片方案：src/utils/screen_codec.py，只编码变化瓦片，定期完整关键帧
+  - 整帧 JPEG（任何变化都发送）：画面同样及时的对照
+统计 每帧编码耗时（含变化检测，瓦片方案含接收端合成）、平均带宽，以及接收端画面与原画面的误差
+（旧方案的 2% 阈值会吞掉光标、逐字输出这类小变化，强制发送的计数也只在发送后递增，画面长时间过期）
+
+用法:
+  python tests/scripts/benchmark_screen_tiles.py [--seconds 10] [--fps 30] [--width 1920] [--height 1080]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import cv2
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src', 'utils'))
+
+from screen_codec import TileEncoder, TileCompositor
+
+LEGACY_DIFF_THRESHOLD = 0.02
+LEGACY_KEYFRAME_INTERVAL = 15
+STALE_PIXELS = 50            # 与原画面相差超过 64 灰度级的像素多于该数时记为画面过期（JPEG 误差达不到）
+
+
+class LegacyEncoder:
+    """wifi_pc_sender_2.0.py 原来的变化检测 + 整帧编码"""
+
+    def __init__(self, quality=75):
+        self.quality = quality
+        self.prev_frame = None
+        self.frame_counter = 0
+
+    def changed(self, frame):
+        if self.prev_frame is None:
+            return True
+        gray_current = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray_prev = cv2.cvtColor(self.prev_frame, cv2.COLOR_BGR2GRAY)
+        edge_diff = cv2.absdiff(cv2.Canny(gray_current, 50, 150), cv2.Canny(gray_prev, 50, 150))
+        combined_diff = cv2.bitwise_or(cv2.absdiff(gray_current, gray_prev), edge_diff)
+        change_ratio = np.count_nonzero(combined_diff) / gray_current.size
+        return self.frame_counter % LEGACY_KEYFRAME_INTERVAL == 0 or change_ratio > LEGACY_DIFF_THRESHOLD
+
+    def encode(self, frame):
+        if not self.changed(frame):
+            return None
+        _, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality,
+                                                  cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+        self.prev_frame = frame.copy()
+        self.frame_counter += 1
+        return encoded.tobytes()
+
+
+def gui_session(width, height, frames, fps, seed=0):
+    """逐帧产出合成的界面画面"""
+    rng = np.random.default_rng(seed)
+    base = np.full((height, width, 3), (46, 38, 30), dtype=np.uint8)
+    panels = [(0.02, 0.08, 0.45, 0.9), (0.5, 0.08, 0.98, 0.55), (0.5, 0.6, 0.98, 0.9)]
+    for x0, y0, x1, y1 in panels:
+        x0, x1, y0, y1 = int(x0 * width), int(x1 * width), int(y0 * height), int(y1 * height)
+        base[y0:y1, x0:x1] = (65, 52, 42)
+        # “文字”：随机的短横条
+        for line in range(y0 + 20, y1 - 20, 28):
+            for word in range(x0 + 20, x1 - 80, 90):
+                if rng.random() < 0.7:
+                    base[line:line + 12, word:word + int(rng.integers(30, 80))] = (220, 220, 220)
+    image = base.copy()
+    chat_x0, chat_y0 = int(0.52 * width), int(0.62 * height)
+    chat_cols = max(1, (int(0.44 * width)) // 14)
+    for i in range(frames):
+        frame = image
+        # AI 回复逐字出现（每帧 1 个字）
+        row, col = divmod(i, chat_cols)
+        y, x = chat_y0 + (row % 8) * 28, chat_x0 + col * 14
+        frame[y:y + 14, x:x + 10] = (255, 230, 120)
+        # 进度条
+        bar = int(0.9 * width * (i % (fps * 5)) / (fps * 5))
+        frame[int(0.93 * height):int(0.95 * height), int(0.05 * width):int(0.05 * width) + bar] = (80, 200, 80)
+        if i % (fps * 5) == 0:
+            frame[int(0.93 * height):int(0.95 * height)] = base[int(0.93 * height):int(0.95 * height)]
+        # 时钟每秒刷新
+        if i % fps == 0:
+            for digit in range(6):
+                x = width - 200 + digit * 30
+                frame[10:40, x:x + 20] = base[10:40, x:x + 20]
+                frame[10:10 + int(rng.integers(10, 30)), x:x + 20] = (200, 200, 255)
+        # 鼠标
+        out = frame.copy()
+        cx, cy = int((i * 7) % (width - 20)), int(height / 2 + 200 * np.sin(i / 20))
+        out[cy:cy + 16, cx:cx + 10] = (255, 255, 255)
+        yield out
+
+
+def run(name, encode, frames, fps, show):
+    """encode(frame) 返回负载或 None；show() 返回接收端当前画面，用于统计画面误差（不计入编码耗时）"""
+    total_bytes, sent, encode_ms, errors, stale = 0, 0, [], [], 0
+    for frame in frames:
+        start = time.perf_counter()
+        payload = encode(frame)
+        encode_ms.append((time.perf_counter() - start) * 1000)
+        if payload:
+            total_bytes += len(payload)
+            sent += 1
+        diff = np.abs(show().astype(np.int16) - frame)
+        errors.append(float(diff.mean()))
+        stale += np.count_nonzero((diff > 64).any(axis=2)) > STALE_PIXELS
+    seconds = len(encode_ms) / fps
+    encode_ms.sort()
+    print(f"[结果] {name}: 编码 p50={encode_ms[len(encode_ms) // 2]:.1f}ms "
+          f"p95={encode_ms[int(len(encode_ms) * 0.95)]:.1f}ms, 发送 {sent}/{len(encode_ms)} 帧, "
+          f"带宽 {total_bytes * 8 / seconds / 1e6:.2f} Mbps, 接收端画面误差 平均 {np.mean(errors):.2f} 灰度级"
+          f"（画面过期 {stale} 帧）")
+    return total_bytes
+
+
+def legacy_run(name, encoder, args, count):
+    shown = {}
+
+    def encode(frame):
+        payload = encoder.encode(frame)
+        if payload:
+            shown['frame'] = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+        return payload
+
+    return run(name, encode, gui_session(args.width, args.height, count, args.fps), args.fps,
+               lambda: shown['frame'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="屏幕共享编码基准测试")
+    parser.add_argument('--seconds', type=float, default=10, help="模拟会话时长(秒)")
+    parser.add_argument('--fps', type=int, default=30, help="采集帧率")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    args = parser.parse_args()
+
+    count = int(args.seconds * args.fps)
+    print(f"[测试] {args.width}x{args.height}, {count} 帧 @ {args.fps}fps（合成诊断界面会话）")
+    # 旧方案的阈值会吞掉光标、逐字输出这类小变化；同时给出“任何变化都整帧发送”作为画面同样及时的对照
+    legacy_run("旧方案(边缘检测+整帧JPEG)", LegacyEncoder(), args, count)
+    global LEGACY_DIFF_THRESHOLD
+    LEGACY_DIFF_THRESHOLD = 0.0
+    full_bytes = legacy_run("整帧JPEG(任何变化都发送)", LegacyEncoder(), args, count)
+
+    encoder = TileEncoder()
+    compositor = TileCompositor()
+    clock = iter(i / args.fps for i in range(count))
+
+    def encode_tiles(frame):
+        encoded = encoder.encode(frame, now=next(clock))
+        if encoded is None:
+            return None
+        compositor.apply(*encoded)
+        return encoded[1]
+
+    tile_bytes = run("瓦片方案", encode_tiles, gui_session(args.width, args.height, count, args.fps), args.fps,
+                     lambda: compositor.frame)
+    print(f"[结果] 瓦片方案: 关键帧 {encoder.stats['keyframes']}, 瓦片帧 {encoder.stats['tile_frames']}, "
+          f"静止 {encoder.stats['unchanged']}, 平均每帧 {encoder.stats['tiles'] / max(1, encoder.stats['tile_frames']):.1f} 个瓦片")
+    print(f"[对比] 与整帧JPEG相比带宽减少 {1 - tile_bytes / full_bytes:.0%}")
+
+
+if __name__ == "__main__":
+    main()
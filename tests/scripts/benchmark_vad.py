@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语音活动检测（VAD）基准测试
+按开发板录音的方式（1024 采样一块）把录音片段送入 VoiceActivityDetector，与固定时长录音比较：
+  - 上传字节：固定时长录音全部上传 vs 只上传语音段
+  - 录音结束时间：固定时长 vs 检测到说完即停止（节省的等待时间）
+  - 起止检测误差：与片段标注的语音起止比较
+  - CPU 耗时：每秒音频的检测开销
+安装了 webrtcvad 时同时比较 WebRTC 与能量/过零率两种后端
+
+片段目录中的 16bit 单声道 WAV 可附带同名 .txt 标注 "起始秒 结束秒"；
+仓库不附带录音样本，未提供目录或目录中没有 WAV 时使用合成片段（带噪声的谐波语音段，起止已知）
+
+用法:
+  python tests/scripts/benchmark_vad.py [--clips data/voice_samples] [--fixed-seconds 5]
+"""
+
+import os
+import sys
+import math
+import time
+import wave
+import random
+import argparse
+from array import array
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src', 'utils'))
+
+from vad import VoiceActivityDetector, HAS_WEBRTCVAD
+
+RATE = 16000
+CHUNK = 1024
+
+
+def synth_clip(speech_start, speech_end, total, noise=300, seed=0):
+    """合成片段：背景噪声 + 基频抖动的谐波“语音”，字间有短停顿"""
+    rng = random.Random(seed)
+    samples = array('h')
+    phase = 0.0
+    for i in range(int(total * RATE)):
+        t = i / RATE
+        value = rng.gauss(0, noise)
+        if speech_start <= t < speech_end and (t - speech_start) % 0.35 < 0.28:
+            f0 = 180 + 40 * math.sin(2 * math.pi * 3 * t)
+            phase += 2 * math.pi * f0 / RATE
+            value += 4000 * (math.sin(phase) + 0.5 * math.sin(2 * phase) + 0.25 * math.sin(3 * phase))
+        samples.append(max(-32768, min(32767, int(value))))
+    return samples.tobytes()
+
+
+def synthetic_clips():
+    """(名称, PCM, 语音起, 语音止)"""
+    cases = [(1.0, 3.0, 8.0, 300), (0.3, 1.5, 8.0, 200), (2.0, 6.5, 10.0, 600), (0.8, 2.2, 8.0, 1200)]
+    return [(f"合成{i + 1} (噪声{noise})", synth_clip(start, end, total, noise, seed=i), start, end)
+            for i, (start, end, total, noise) in enumerate(cases)]
+
+
+def load_clips(directory):
+    clips = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith('.wav'):
+            continue
+        with wave.open(os.path.join(directory, name), 'rb') as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1 or wav.getframerate() != RATE:
+                print(f"[跳过] {name}: 需要 {RATE}Hz 16bit 单声道")
+                continue
+            pcm = wav.readframes(wav.getnframes())
+        start = end = None
+        label = os.path.join(directory, os.path.splitext(name)[0] + '.txt')
+        if os.path.exists(label):
+            with open(label, encoding='utf-8') as f:
+                start, end = (float(x) for x in f.read().split()[:2])
+        clips.append((name, pcm, start, end))
+    return clips
+
+
+def run_clip(pcm, backend, fixed_seconds):
+    """模拟开发板录音循环，返回结果字典"""
+    vad = VoiceActivityDetector(RATE, backend=backend)
+    chunk_bytes = CHUNK * 2
+    limit = min(len(pcm), int(fixed_seconds * RATE) * 2)
+    voiced = 0
+    stop_at = limit
+    cpu = 0.0
+    for offset in range(0, limit, chunk_bytes):
+        chunk = pcm[offset:min(offset + chunk_bytes, limit)]
+        begin = time.process_time()
+        voiced += len(vad.feed(chunk))
+        cpu += time.process_time() - begin
+        if vad.ended:
+            stop_at = offset + len(chunk)
+            break
+    voiced += len(vad.flush())
+    return {
+        'backend': vad.backend,
+        'fixed_bytes': limit,
+        'voiced_bytes': voiced,
+        'started': vad.started,
+        'start_s': vad.speech_start_ms / 1000 if vad.started else None,
+        'stop_s': stop_at / (RATE * 2),
+        'fixed_s': limit / (RATE * 2),
+        'cpu_ms_per_s': cpu * 1000 / (stop_at / (RATE * 2)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="语音活动检测基准测试")
+    parser.add_argument('--clips', default=os.path.join(ROOT_DIR, 'data', 'voice_samples'),
+                        help="WAV 片段目录（16kHz 16bit 单声道）")
+    parser.add_argument('--fixed-seconds', type=float, default=5.0, help="对比的固定录音时长(秒)")
+    args = parser.parse_args()
+
+    clips = load_clips(args.clips) if os.path.isdir(args.clips) else []
+    if not clips:
+        print(f"[提示] {args.clips} 中没有录音片段，使用合成片段")
+        clips = synthetic_clips()
+
+    backends = ['energy'] + (['webrtc'] if HAS_WEBRTCVAD else [])
+    print(f"[测试] {len(clips)} 个片段, 固定录音 {args.fixed_seconds}s, 后端: {', '.join(backends)}")
+    for backend in backends:
+        totals = {'fixed_bytes': 0, 'voiced_bytes': 0, 'fixed_s': 0.0, 'stop_s': 0.0}
+        print(f"\n=== 后端 {backend} ===")
+        for name, pcm, start, end in clips:
+            r = run_clip(pcm, backend, args.fixed_seconds)
+            for key in totals:
+                totals[key] += r[key]
+            line = (f"{name}: 上传 {r['voiced_bytes']}/{r['fixed_bytes']} 字节, "
+                    f"停止于 {r['stop_s']:.2f}s (固定 {r['fixed_s']:.1f}s), CPU {r['cpu_ms_per_s']:.2f}ms/音频秒")
+            if not r['started']:
+                line += ", 未检测到说话"
+            elif start is not None:
+                # 起点含 300ms 前导保留；停止时刻含结尾静音判定时长
+                line += f", 起点误差 {r['start_s'] - start:+.2f}s, 止点 {r['stop_s'] - end:+.2f}s（含结尾静音判定）"
+            print(line)
+        saved = 1 - totals['voiced_bytes'] / totals['fixed_bytes'] if totals['fixed_bytes'] else 0
+        print(f"[结果] 上传量减少 {saved:.0%}, 平均每次录音少等 "
+              f"{(totals['fixed_s'] - totals['stop_s']) / len(clips):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,12 +11,12 @@ os.environ['KMP_DUPLICATE_LIB_OK'] = 'True'  # 放在所有导入之前
 
 import requests
 from datetime import datetime, timedelta
-from PyQt5.QtCore import Qt, QTimer, QSize, QEvent, QObject, pyqtSignal
+from PyQt5.QtCore import Qt, QTimer, QSize, QEvent, QObject, pyqtSignal, QAbstractTableModel, QModelIndex
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QLabel, QVBoxLayout,
                              QWidget, QPushButton, QHBoxLayout, QMessageBox,
                              QFileDialog, QStatusBar, QGroupBox, QSplitter,
                              QTextEdit, QTabWidget, QScrollArea, QProgressDialog,
-                             QTableWidget, QTableWidgetItem, QHeaderView, QDialog, QGridLayout, QSizePolicy, QLineEdit, QProgressBar, QCheckBox, QShortcut,
+                             QTableWidget, QTableWidgetItem, QTableView, QAbstractItemView, QHeaderView, QDialog, QGridLayout, QSizePolicy, QLineEdit, QProgressBar, QCheckBox, QShortcut,
                              QSlider)
 from PyQt5.QtGui import QImage, QPixmap, QIcon, QPalette, QColor, QFont, QCursor, QBrush, QKeySequence
 from ultralytics import YOLO
@@ -32,7 +32,13 @@ plt.rcParams['savefig.dpi'] = 120
 plt.rcParams['font.size'] = 12    # 统一调大图表中的基础字号
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import uuid
+import queue
+import atexit
+import hashlib
+import importlib.util
 import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
 import speech_recognition as sr
 import pyttsx3
 import threading
@@ -43,7 +49,7 @@ import time
 try:
     from system_config import (
         PC_IP, NETWORK_PORTS, CAMERA_CONFIG, AUDIO_CONFIG, 
-        SYSTEM_CONFIG, connection_manager, get_local_ip
+        SYSTEM_CONFIG, AI_CONFIG, connection_manager, get_local_ip
     )
     print("✅ PC端使用统一配置文件")
     print(f"📡 本机IP: {get_local_ip()}")
@@ -56,76 +62,259 @@ except ImportError:
         "VOICE_SEND_PORT": 5005,
         "VOICE_RECEIVE_PORT": 5006,
     }
+    AI_CONFIG = {
+        "INFERENCE_BACKEND": "auto",
+        "INFERENCE_THREADS": 0,
+        "STREAM_REFRESH_MS": 100,
+        "ADVICE_CACHE_TTL_DAYS": 30,
+        "ADVICE_CACHE_MAX_ENTRIES": 500,
+        "ADVICE_CONFIDENCE_BUCKET": 0.1,
+    }
     connection_manager = None
 
+# ===== 共享网络传输模块 (src/utils) =====
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "utils"))
+from reliable_transport import FragmentReceiver
+from advice_cache import AdviceCache
+from latency_optimizer import OptimizedReceiver, FEEDBACK_INTERVAL, ECHO
+from stream_codec import (StreamDecoder, stream_control_message, REQUEST_KEYFRAME, REQUEST_JPEG,
+                          StreamSequence, KEYFRAME_REQUEST_INTERVAL, STREAM_IDLE_RESET)
+from asr_service import ASRService
+from vad import VoiceActivityDetector
+from llm_client import (LLMClient, LLMError, SummaryFirstReply, SUMMARY_INSTRUCTION,
+                        PRIORITY_VOICE, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+# 流式AI回复刷新界面的最小间隔，避免每个字都重排整段 HTML
+AI_STREAM_REFRESH_INTERVAL = AI_CONFIG.get("STREAM_REFRESH_MS", 100) / 1000
+
 
 # ===== SQLite 历史记录数据库 =====
 class HistoryDB:
-    """轻量级 SQLite 历史记录管理器, 替代 JSON 文件存储"""
+    """轻量级 SQLite 历史记录管理器, 替代 JSON 文件存储
+
+    WAL 模式 + 长连接: 所有写操作经队列交给唯一的写线程执行, 同时排队的写操作合并为一个事务提交;
+    读操作使用独立的只读连接 (WAL 下读写互不阻塞)。SQL 语句固定为类常量, 由连接的语句缓存复用预编译结果。
+    可见记录数由触发器维护在 record_counts 表中, 历史记录界面刷新时无需 COUNT(*) 全表扫描。
+    """
+
+    # 记录类型：检测结果 / 演示数据 / 旧版本遗留的对话记录
+    TYPE_DIAGNOSIS = 'diagnosis'
+    TYPE_DEMO = 'demo'
+    TYPE_CHAT = 'chat'
+    VISIBLE_TYPES = (TYPE_DIAGNOSIS, TYPE_DEMO)   # 历史记录界面与趋势分析展示的类型
+
+    INSERT_SQL = ("INSERT OR REPLACE INTO records (record_id, timestamp, image_path, disease_name, confidence, record_type) "
+                  "VALUES (?,?,?,?,?,?)")
+    # 以下查询的 WHERE 条件与部分索引 idx_visible_timestamp 的条件一致，才能命中该索引
+    SELECT_FIRST_PAGE_SQL = "SELECT * FROM records WHERE record_type != 'chat' ORDER BY timestamp, id LIMIT ?"
+    SELECT_NEXT_PAGE_SQL = ("SELECT * FROM records WHERE record_type != 'chat' "
+                            "AND (timestamp, id) > (?, ?) ORDER BY timestamp, id LIMIT ?")
+    COUNT_VISIBLE_SQL = "SELECT visible FROM record_counts WHERE id = 0"
+    DAILY_COUNTS_SQL = ("SELECT substr(timestamp, 1, 10) AS date, disease_name, COUNT(*) FROM records "
+                        "WHERE record_type != 'chat' GROUP BY date, disease_name")
+    DELETE_SQL = "DELETE FROM records WHERE record_id = ?"
+    UPDATE_ADVICE_SQL = "UPDATE records SET advice = ? WHERE record_id = ?"
+    COUNT_SQL = "SELECT COUNT(*) FROM records"
+    MAX_GROUP_COMMIT = 256   # 单个事务最多合并的写操作数
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            self.db_dir = os.path.join(os.path.expanduser("~"), "EyeDiseaseDetectorHistory")
+            os.makedirs(self.db_dir, exist_ok=True)
+            db_path = os.path.join(self.db_dir, "history.db")
+        else:
+            self.db_dir = os.path.dirname(os.path.abspath(db_path))
+        self.db_path = db_path
 
-    def __init__(self):
-        self.db_dir = os.path.join(os.path.expanduser("~"), "EyeDiseaseDetectorHistory")
-        os.makedirs(self.db_dir, exist_ok=True)
-        self.db_path = os.path.join(self.db_dir, "history.db")
+        self._write_conn = self._connect()
         self._init_db()
+        self._read_conn = self._connect()
+        self._read_conn.row_factory = sqlite3.Row
+        self._read_lock = threading.Lock()
+
+        self._write_queue = queue.Queue()
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")   # WAL 下仅在检查点时 fsync
+        conn.execute("PRAGMA recursive_triggers=ON")  # INSERT OR REPLACE 删除旧行时也触发计数触发器
+        return conn
 
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS records (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    record_id TEXT UNIQUE NOT NULL,
-                    timestamp TEXT NOT NULL,
-                    image_path TEXT,
-                    disease_name TEXT NOT NULL,
-                    confidence REAL NOT NULL
-                )
-            """)
+        conn = self._write_conn
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                record_id TEXT UNIQUE NOT NULL,
+                timestamp TEXT NOT NULL,
+                image_path TEXT,
+                disease_name TEXT NOT NULL,
+                confidence REAL NOT NULL
+            )
+        """)
 
-            # 向后兼容：为旧数据库添加 advice 字段
-            try:
-                conn.execute("ALTER TABLE records ADD COLUMN advice TEXT")
-            except sqlite3.OperationalError:
-                pass  # 字段已存在，忽略
+        # 向后兼容：为旧数据库添加 advice 字段
+        try:
+            conn.execute("ALTER TABLE records ADD COLUMN advice TEXT")
+        except sqlite3.OperationalError:
+            pass  # 字段已存在，忽略
+
+        # 向后兼容：添加 record_type 字段，并按旧的疾病名前缀约定回填
+        try:
+            conn.execute("ALTER TABLE records ADD COLUMN record_type TEXT NOT NULL DEFAULT 'diagnosis'")
+            conn.execute("UPDATE records SET record_type = 'chat' WHERE disease_name LIKE '[对话]%'")
+            conn.execute("UPDATE records SET record_type = 'demo' WHERE disease_name LIKE '[演示]%'")
+        except sqlite3.OperationalError:
+            pass  # 字段已存在，忽略
+
+        # 可见记录计数：首次创建时统计一次，之后由触发器在插入/删除/改类型时增减
+        conn.execute("CREATE TABLE IF NOT EXISTS record_counts (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                     "visible INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO record_counts (id, visible) "
+                     "SELECT 0, COUNT(*) FROM records WHERE record_type != 'chat'")
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_records_count_insert AFTER INSERT ON records
+            WHEN NEW.record_type != 'chat'
+            BEGIN UPDATE record_counts SET visible = visible + 1 WHERE id = 0; END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_records_count_delete AFTER DELETE ON records
+            WHEN OLD.record_type != 'chat'
+            BEGIN UPDATE record_counts SET visible = visible - 1 WHERE id = 0; END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_records_count_type AFTER UPDATE OF record_type ON records
+            BEGIN UPDATE record_counts SET visible = visible + (NEW.record_type != 'chat')
+                - (OLD.record_type != 'chat') WHERE id = 0; END
+        """)
 
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON records(timestamp DESC)")
-            conn.commit()
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON records(timestamp DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_record_type ON records(record_type)")
+        # 可见记录按 (timestamp, id) 键集分页使用的部分索引
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_visible_timestamp ON records(timestamp, id) "
+                     "WHERE record_type != 'chat'")
+        conn.commit()
+
+    @classmethod
+    def record_type_of(cls, disease_name):
+        """根据疾病名前缀推断记录类型（兼容 [对话] / [演示] 约定）"""
+        if disease_name.startswith('[对话]'):
+            return cls.TYPE_CHAT
+        if disease_name.startswith('[演示]'):
+            return cls.TYPE_DEMO
+        return cls.TYPE_DIAGNOSIS
+
+    # ---------- 写线程 ----------
+    def _writer_loop(self):
+        """唯一写线程：取出所有已排队的写操作，在一个事务中执行后统一提交"""
+        running = True
+        while running:
+            task = self._write_queue.get()
+            if task is None:
+                break
+            tasks = [task]
+            while len(tasks) < self.MAX_GROUP_COMMIT:
+                try:
+                    task = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    running = False
+                    break
+                tasks.append(task)
 
+            results = []
+            for func, args, future in tasks:
+                try:
+                    results.append((future, func(self._write_conn, *args), None))
+                except Exception as e:
+                    results.append((future, None, e))
+            try:
+                self._write_conn.commit()
+            except sqlite3.Error as e:
+                self._write_conn.rollback()
+                results = [(future, None, e) for future, _, _ in results]
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+        self._write_conn.close()
+
+    def _write(self, func, *args):
+        """提交写操作并等待其所在事务提交"""
+        future = Future()
+        self._write_queue.put((func, args, future))
+        return future.result()
+
+    def close(self):
+        """停止写线程并关闭连接"""
+        if self._writer_thread.is_alive():
+            self._write_queue.put(None)
+            self._writer_thread.join()
+        with self._read_lock:
+            self._read_conn.close()
+
+    # ---------- 写操作 ----------
     def add(self, record_id, timestamp, image_path, disease_name, confidence):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                "INSERT OR REPLACE INTO records (record_id, timestamp, image_path, disease_name, confidence) VALUES (?,?,?,?,?)",
-                (record_id, timestamp, image_path, disease_name, round(confidence, 4))
-            )
-            conn.commit()
-
-    def get_all(self, limit=10000):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            rows = conn.execute(
-                "SELECT * FROM records WHERE disease_name NOT LIKE '[对话]%' ORDER BY timestamp DESC LIMIT ?", (limit,)
-            ).fetchall()
-        return [dict(r) for r in rows]
+        self._write(lambda conn: conn.execute(
+            self.INSERT_SQL, (record_id, timestamp, image_path, disease_name, round(confidence, 4),
+                              self.record_type_of(disease_name))
+        ))
+
+    def add_many(self, rows):
+        """在一个事务中批量插入记录, rows 为 (record_id, timestamp, image_path, disease_name, confidence) 列表"""
+        rows = [(r[0], r[1], r[2], r[3], round(r[4], 4), self.record_type_of(r[3])) for r in rows]
+        if rows:
+            self._write(lambda conn: conn.executemany(self.INSERT_SQL, rows))
 
     def delete_by_record_id(self, record_id):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM records WHERE record_id = ?", (record_id,))
-            conn.commit()
+        self._write(lambda conn: conn.execute(self.DELETE_SQL, (record_id,)))
+
+    def delete_many(self, record_ids):
+        """在一个事务中删除多条记录"""
+        self._write(lambda conn: conn.executemany(self.DELETE_SQL, [(rid,) for rid in record_ids]))
+
+    def delete_by_type(self, record_type):
+        """删除指定类型的全部记录（如演示数据）"""
+        self._write(lambda conn: conn.execute("DELETE FROM records WHERE record_type = ?", (record_type,)))
 
     def delete_all(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM records")
-            conn.commit()
+        self._write(lambda conn: conn.execute("DELETE FROM records"))
 
     def update_advice(self, record_id, advice):
         """将 AI 建议存入数据库，实现本地缓存"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("UPDATE records SET advice = ? WHERE record_id = ?", (advice, record_id))
-            conn.commit()
+        self._write(lambda conn: conn.execute(self.UPDATE_ADVICE_SQL, (advice, record_id)))
 
+    # ---------- 读操作 ----------
     def count(self):
-        with sqlite3.connect(self.db_path) as conn:
-            return conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        with self._read_lock:
+            return self._read_conn.execute(self.COUNT_SQL).fetchone()[0]
+
+    def get_page(self, after=None, limit=200):
+        """按 (timestamp, id) 升序的键集分页查询可见记录
+
+        :param after: 上一页最后一条记录的 (timestamp, id)，None 表示第一页
+        """
+        with self._read_lock:
+            if after is None:
+                rows = self._read_conn.execute(self.SELECT_FIRST_PAGE_SQL, (limit,)).fetchall()
+            else:
+                rows = self._read_conn.execute(self.SELECT_NEXT_PAGE_SQL, (after[0], after[1], limit)).fetchall()
+        return [dict(r) for r in rows]
+
+    def count_visible(self):
+        """可见记录（检测结果 + 演示数据）总数，读取触发器维护的计数"""
+        with self._read_lock:
+            return self._read_conn.execute(self.COUNT_VISIBLE_SQL).fetchone()[0]
+
+    def daily_disease_counts(self):
+        """按日期和疾病名聚合可见记录数量，返回 [(date, disease_name, count), ...]"""
+        with self._read_lock:
+            return self._read_conn.execute(self.DAILY_COUNTS_SQL).fetchall()
 
     def migrate_from_json(self, json_path):
         """从旧版 JSON 文件迁移数据到 SQLite"""
@@ -133,14 +322,13 @@ class HistoryDB:
             try:
                 with open(json_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                for r in data:
-                    self.add(
-                        r.get("record_id", str(uuid.uuid4())),
-                        r.get("timestamp", ""),
-                        r.get("image_path", ""),
-                        r.get("disease_name", ""),
-                        r.get("confidence", 0)
-                    )
+                self.add_many([(
+                    r.get("record_id", str(uuid.uuid4())),
+                    r.get("timestamp", ""),
+                    r.get("image_path", ""),
+                    r.get("disease_name", ""),
+                    r.get("confidence", 0)
+                ) for r in data])
                 # 迁移后重命名旧文件
                 os.rename(json_path, json_path + ".bak")
                 print(f"[HistoryDB] 已从 JSON 迁移 {len(data)} 条记录到 SQLite")
@@ -148,6 +336,88 @@ class HistoryDB:
                 print(f"[HistoryDB] JSON 迁移失败: {e}")
 
 
+class HistoryTableModel(QAbstractTableModel):
+    """历史记录表格模型：按需分页加载，视图滚动到底部时通过 canFetchMore/fetchMore 取下一页"""
+
+    COLUMNS = ["时间戳", "图像名称", "检测结果", "置信度", "操作"]
+    PAGE_SIZE = 200
+
+    def __init__(self, db, action_color, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.action_color = QColor(action_color)
+        self.records = []
+        self.exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.records[index.row()]
+        col = index.column()
+        if role == Qt.DisplayRole:
+            if col == 0:
+                return record["timestamp"]
+            if col == 1:
+                return os.path.basename(record["image_path"] or "")
+            if col == 2:
+                disease_name = record["disease_name"]
+                return disease_name[4:] if disease_name.startswith("[演示]") else disease_name
+            if col == 3:
+                return f"{record['confidence']:.2f}"
+            return "查看详情"
+        if role == Qt.UserRole:
+            return record["record_id"]
+        if col == 4:
+            if role == Qt.TextAlignmentRole:
+                return Qt.AlignCenter
+            if role == Qt.ForegroundRole:
+                return QBrush(QColor("white"))
+            if role == Qt.BackgroundRole:
+                return QBrush(self.action_color)
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        after = None
+        if self.records:
+            after = (self.records[-1]["timestamp"], self.records[-1]["id"])
+        page = self.db.get_page(after=after, limit=self.PAGE_SIZE)
+        if len(page) < self.PAGE_SIZE:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.records), len(self.records) + len(page) - 1)
+            self.records.extend(page)
+            self.endInsertRows()
+
+    def record(self, row):
+        return self.records[row] if 0 <= row < len(self.records) else None
+
+    def reload(self):
+        """清空已加载的页，视图会重新从第一页开始请求"""
+        self.beginResetModel()
+        self.records = []
+        self.exhausted = False
+        self.endResetModel()
+
+
 _history_db = None
 
 
@@ -155,6 +425,7 @@ def get_history_db():
     global _history_db
     if _history_db is None:
         _history_db = HistoryDB()
+        atexit.register(_history_db.close)
     return _history_db
 # ===== 结束 SQLite =====
 
@@ -189,8 +460,8 @@ class SmartVoiceManager(QObject):
         self.is_recording = False
         self.local_recognizer = None
         self.tts_engine = None
-        self.vosk_model = None
-        self._vosk_json = None
+        self.asr_service = None
+        self.vosk_model_dir = None
         self.recognition_duration = 10  # 默认识别时长为10秒
         self.init_voice_components()
     
@@ -206,53 +477,61 @@ class SmartVoiceManager(QObject):
             print(f"[ERROR] 语音组件初始化失败: {e}")
 
     def _init_vosk(self):
-        """延迟搜索Vosk模型路径,但不立即加载模型"""
+        """使用进程共享的 Vosk 识别服务，启动时在后台预热模型"""
         try:
-            import vosk  # noqa: F401
-            import json as _json
-            
-            # 只搜索模型路径,不立即加载模型
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            candidates = [
-                os.getenv("VOSK_MODEL_PATH", ""),
-                os.path.join(script_dir, "vosk-model-small-cn-0.22"),
-                os.path.join(script_dir, "vosk-model-cn-0.22"),
-                os.path.join(os.getcwd(), "vosk-model-small-cn-0.22"),
-                os.path.join(os.getcwd(), "vosk-model-cn-0.22"),
-            ]
-            
-            candidates = [p for p in candidates if p and os.path.isdir(p)]
-            
-            if candidates:
-                self.vosk_model_dir = candidates[0]
-                self.vosk_model = None  # 不在这里加载模型
-                self._vosk_json = _json
-                print(f"[DEBUG] 找到Vosk模型目录: {self.vosk_model_dir} (将延迟加载)")
+            self.asr_service = ASRService.get_instance()
+            if self.asr_service.is_available():
+                self.vosk_model_dir = self.asr_service.model_dir
+                self.asr_service.preload()
+                print(f"[DEBUG] 找到Vosk模型目录: {self.vosk_model_dir} (后台预加载)")
             else:
-                self.vosk_model = None
                 self.vosk_model_dir = None
-                self._vosk_json = None
                 print("[DEBUG] 未找到Vosk中文模型,将使用在线识别")
-                
         except Exception as e:
-            self.vosk_model = None
+            self.asr_service = None
             self.vosk_model_dir = None
-            self._vosk_json = None
             print(f"[DEBUG] Vosk不可用: {e}")
-            
-    def _load_vosk_model_async(self):
-        """异步加载Vosk模型（只在需要时调用）"""
-        if not self.vosk_model_dir or self.vosk_model is not None:
-            return
-            
+
+    def stream_microphone(self, source, phrase_time_limit, timeout=30, should_continue=None):
+        """边录边识别：VAD 去掉开头静音、检测说完即停止录音，语音段实时送入 Vosk 流式会话
+
+        返回 (text, audio)。text 为 Vosk 结果（模型不可用时为 None），
+        audio 为只含语音段的 sr.AudioData，供在线识别兜底。
+        """
+        session = self.asr_service.open_session(source.SAMPLE_RATE, wait=0) if self.asr_service else None
+        vad = VoiceActivityDetector(source.SAMPLE_RATE)
+
+        frames = []
+        chunk_seconds = source.CHUNK / source.SAMPLE_RATE
+        waited = 0.0
+        spoken = 0.0
         try:
-            from vosk import Model
-            print(f"[DEBUG] 开始异步加载Vosk模型: {self.vosk_model_dir}")
-            self.vosk_model = Model(self.vosk_model_dir)
-            print("[DEBUG] ✅ Vosk中文离线模型异步加载成功")
-        except Exception as e:
-            print(f"[DEBUG] ❌ Vosk模型异步加载失败: {e}")
-            self.vosk_model = None
+            while should_continue is None or should_continue():
+                voiced = vad.feed(source.stream.read(source.CHUNK))
+                if not vad.started:
+                    waited += chunk_seconds
+                    if waited > timeout:
+                        raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                    continue
+                spoken += chunk_seconds
+                if voiced:
+                    frames.append(voiced)
+                    if session is not None:
+                        # Vosk 的句尾只代表一个分句结束，录音何时结束由 VAD 的尾部静音窗口决定
+                        session.feed(voiced)
+                if vad.ended or spoken >= phrase_time_limit:
+                    break
+            rest = vad.flush()
+            if rest:
+                frames.append(rest)
+                if session is not None:
+                    session.feed(rest)
+            text = session.finish() if session is not None else None
+        finally:
+            if session is not None:
+                session.close()
+        audio = sr.AudioData(b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+        return text, audio
     
     def start_voice_recognition(self, duration=None):
         """开始语音识别
@@ -301,45 +580,29 @@ class SmartVoiceManager(QObject):
             
             # 录音
             with sr.Microphone() as source:
-                print("[DEBUG] 🔧 调整环境噪音...")
-                self.local_recognizer.adjust_for_ambient_noise(source, duration=0.8)
+                # VAD 自适应噪声底，无需先花 0.8 秒校准环境噪音
                 print("[DEBUG] 🗣️ 请说话（点击按钮停止录音）...")
                 
                 # 发送录音中信号
                 self.voice_recognized.emit("__RECORDING__")
                 
-                # 用户自定义录音时长,无时间限制
-                audio = self.local_recognizer.listen(source, timeout=30, phrase_time_limit=self.recognition_duration)
+                # 用户自定义录音时长为上限；VAD 检测到说完即停止,本地Vosk可用时边录边识别
+                text, audio = self.stream_microphone(
+                    source, self.recognition_duration, timeout=30,
+                    should_continue=lambda: self.is_recording
+                )
                 print(f"[DEBUG] ✅ 录音完成,音频长度: {len(audio.frame_data)} bytes")
 
+            if not self.is_recording:
+                return  # 用户已取消
+
             # 发送处理中信号
             self.voice_recognized.emit("__PROCESSING__")
             
-            text = None
             recognition_method = ""
-
-            # 优先策略：本地Vosk识别（如果可用）- 中文效果更好
-            if self.vosk_model_dir and self.vosk_model is None:
-                # 如果有模型路径但模型未加载,先尝试异步加载
-                self._load_vosk_model_async()
-                
-            if self.vosk_model is not None:
-                try:
-                    print("[DEBUG] 🏠 使用本地Vosk中文识别...")
-                    from vosk import KaldiRecognizer
-                    rec = KaldiRecognizer(self.vosk_model, audio.sample_rate or 16000)
-                    frame = audio.frame_data
-                    chunk_size = 4000
-                    for i in range(0, len(frame), chunk_size):
-                        rec.AcceptWaveform(frame[i:i+chunk_size])
-                    result_json = rec.FinalResult()
-                    if self._vosk_json is not None:
-                        result_obj = self._vosk_json.loads(result_json)
-                        text = (result_obj.get("text") or "").strip()
-                        recognition_method = "Vosk 本地识别"
-                        print(f"[DEBUG] ✅ Vosk识别结果: '{text}'")
-                except Exception as e:
-                    print(f"[DEBUG] ❌ Vosk识别失败: {e}")
+            if text:
+                recognition_method = "Vosk 流式识别"
+                print(f"[DEBUG] ✅ Vosk识别结果: '{text}'")
 
             # 备用策略：Google API（优化参数）
             if not text or len(text) < 2:
@@ -458,18 +721,10 @@ class MedicalAIService:
         self.api_key = api_key
         self.endpoint = "https://api.deepseek.com/v1/chat/completions"
         self.model = "deepseek-chat"
+        self.client = LLMClient.get_instance()
     
-    def get_custom_advice(self, prompt):
-        """获取自定义医疗建议"""
-        if not self.api_key:
-            return self._get_default_advice(prompt)
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
-        # 构建医疗建议提示词
+    def _build_payload(self, prompt, spoken_summary=False):
+        """构建医疗建议请求；spoken_summary=True 时要求回复首行给出语音摘要（见 SummaryFirstReply）"""
         medical_prompt = f"""
         作为一名专业的眼科医生,请针对患者的问题提供专业的医疗建议。
         
@@ -484,17 +739,23 @@ class MedicalAIService:
         
         请以专业但易懂的语言回答,避免过度专业的术语,同时保持信息的准确性。
         如果症状严重,请明确建议及时就医。
+        {SUMMARY_INSTRUCTION if spoken_summary else ""}
         """
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": medical_prompt}],
+            "temperature": 0.7,
+            "max_tokens": 2000
+        }
+    
+    def get_custom_advice(self, prompt, priority=PRIORITY_INTERACTIVE):
+        """获取自定义医疗建议"""
+        if not self.api_key:
+            return self._get_default_advice(prompt)
         
         try:
-            payload = {
-                "model": self.model,
-                "messages": [{"role": "user", "content": medical_prompt}],
-                "temperature": 0.7,
-                "max_tokens": 2000
-            }
-            
-            response = requests.post(self.endpoint, headers=headers, json=payload, timeout=30)
+            response = self.client.post(self.endpoint, self.api_key, self._build_payload(prompt), timeout=30,
+                                        priority=priority)
             
             if response.status_code == 200:
                 result = response.json()
@@ -512,6 +773,22 @@ class MedicalAIService:
             print(f"AI服务异常: {e}")
             return self._get_default_advice(prompt)
     
+    def stream_custom_advice(self, prompt, spoken_summary=False, priority=PRIORITY_INTERACTIVE):
+        """流式获取自定义医疗建议，逐段产出文本；请求失败且尚未输出时产出默认建议"""
+        if not self.api_key:
+            yield self._get_default_advice(prompt)
+            return
+        
+        stream = self.client.stream(self.endpoint, self.api_key, self._build_payload(prompt, spoken_summary),
+                                    priority=priority)
+        try:
+            yield from stream
+            print(f"AI回复完成: 首字 {stream.ttft_ms:.0f}ms, 总耗时 {stream.total_ms:.0f}ms")
+        except LLMError as e:
+            print(f"AI服务异常: {e}")
+            if not stream.text:
+                yield self._get_default_advice(prompt)
+    
     def _get_default_advice(self, prompt):
         """获取默认建议"""
         return f"""# 🩺 AI医疗咨询建议
@@ -540,31 +817,44 @@ class MedicalAIService:
 *💊 健康提示：早发现、早治疗是眼部疾病防治的关键*"""
 
 
+_advice_cache = None
+_advice_cache_lock = threading.Lock()
+
+
+def get_advice_cache():
+    """进程内共享的建议缓存（界面线程与后台补全线程都会调用）"""
+    global _advice_cache
+    with _advice_cache_lock:
+        if _advice_cache is None:
+            _advice_cache = AdviceCache(
+                ttl_days=AI_CONFIG.get("ADVICE_CACHE_TTL_DAYS", 30),
+                max_entries=AI_CONFIG.get("ADVICE_CACHE_MAX_ENTRIES", 500),
+                bucket_width=AI_CONFIG.get("ADVICE_CONFIDENCE_BUCKET", 0.1),
+            )
+            atexit.register(_advice_cache.close)
+        return _advice_cache
+
+
 class DeepSeekAPI:
     """DeepSeek API接口类,用于获取治疗建议"""
 
+    TREATMENT_TEMPLATE_VERSION = 2   # 治疗建议提示词版本，修改提示词时递增，使旧缓存失效
+
     def __init__(self, api_key=None):
         self.api_key = api_key
         self.endpoint = "https://api.deepseek.com/v1/chat/completions"
         self.model = "deepseek-chat"
+        self.client = LLMClient.get_instance()
 
     def set_api_key(self, api_key):
         """设置API密钥"""
         self.api_key = api_key
 
-    def get_treatment_advice(self, disease_name, confidence):
-        """获取治疗建议"""
-        if not self.api_key:
-            return self._get_default_advice(disease_name)
-
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
-        # 构建提示词
+    def _treatment_payload(self, disease_name, confidence):
+        """构建治疗建议请求；置信度按缓存区间写入提示词，同一区间的提示词完全相同，回复可以复用"""
+        low, high = get_advice_cache().bucket_range(confidence)
         prompt = f"""
-        作为一名专业的眼科医生,请针对患者被检测出的眼部疾病"{disease_name}"（置信度：{confidence:.2f}）提供详细的治疗建议。
+        作为一名专业的眼科医生,请针对患者被检测出的眼部疾病"{disease_name}"（置信度：{low:.1f}~{high:.1f}）提供详细的治疗建议。
 
         请包含以下内容：
         1. 疾病简介：该疾病的基本描述和可能的成因
@@ -574,21 +864,37 @@ class DeepSeekAPI:
 
         请以专业但易懂的语言回答,避免过度专业的术语,同时保持信息的准确性。
         """
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.7,
+            "max_tokens": 2000
+        }
 
-        try:
-            payload = {
-                "model": self.model,
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.7,
-                "max_tokens": 2000
-            }
+    def get_cached_advice(self, disease_name, confidence):
+        """查询建议缓存，未命中返回 None"""
+        return get_advice_cache().get(self.model, self.TREATMENT_TEMPLATE_VERSION, disease_name, confidence)
+
+    def get_treatment_advice(self, disease_name, confidence, priority=PRIORITY_INTERACTIVE):
+        """获取治疗建议（先查缓存，未命中再请求API）"""
+        if not self.api_key:
+            return self._get_default_advice(disease_name)
 
-            response = requests.post(self.endpoint, headers=headers, json=payload, timeout=30)
+        cached = self.get_cached_advice(disease_name, confidence)
+        if cached:
+            return cached
+
+        try:
+            response = self.client.post(self.endpoint, self.api_key,
+                                        self._treatment_payload(disease_name, confidence), timeout=30,
+                                        priority=priority)
 
             if response.status_code == 200:
                 result = response.json()
                 if "choices" in result and len(result["choices"]) > 0:
                     advice = result["choices"][0]["message"]["content"]
+                    get_advice_cache().put(self.model, self.TREATMENT_TEMPLATE_VERSION,
+                                           disease_name, confidence, advice)
                     return advice
                 else:
                     print(f"API响应格式异常: {result}")
@@ -610,31 +916,36 @@ class DeepSeekAPI:
             print(f"获取治疗建议时出错: {e}")
             return self._get_default_advice(disease_name)
 
-    def get_custom_advice(self, prompt):
-        """获取自定义医疗建议（增强版）"""
-        # 输入验证
-        if not self.api_key or self.api_key.strip() == "":
-            return "❌ 请先设置有效的API密钥才能使用AI对话功能。\n\n💡 您可以在右侧AI建议区域的设置按钮中配置DeepSeek API密钥。"
+    def stream_treatment_advice(self, disease_name, confidence):
+        """流式获取治疗建议，逐段产出文本；缓存命中时一次产出，请求失败且尚未输出时产出默认建议"""
+        if not self.api_key:
+            yield self._get_default_advice(disease_name)
+            return
 
-        if not prompt or len(prompt.strip()) < 2:
-            return "❌ 请输入有效的问题内容。"
-        
-        # 限制输入长度
-        if len(prompt) > 4000:
-            prompt = prompt[:4000]
-            print("⚠️ 输入内容过长,已自动截断到4000字符")
+        cached = self.get_cached_advice(disease_name, confidence)
+        if cached:
+            yield cached
+            return
 
-        # 优化请求头
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key.strip()}",
-            "User-Agent": "Medical-AI-Diagnosis-System/2.0",
-            "Accept": "application/json",
-            "Accept-Encoding": "gzip, deflate"
-        }
+        stream = self.client.stream(self.endpoint, self.api_key, self._treatment_payload(disease_name, confidence))
+        try:
+            yield from stream
+            print(f"治疗建议生成完成: 首字 {stream.ttft_ms:.0f}ms, 总耗时 {stream.total_ms:.0f}ms")
+            get_advice_cache().put(self.model, self.TREATMENT_TEMPLATE_VERSION,
+                                   disease_name, confidence, stream.text)
+        except LLMError as e:
+            print(f"获取治疗建议时出错: {e}")
+            if not stream.text:
+                yield self._get_default_advice(disease_name)
+
+    CUSTOM_HEADERS = {
+        "User-Agent": "Medical-AI-Diagnosis-System/2.0",
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate"
+    }
 
-        # 改进的系统提示词
-        system_prompt = """你是一个专业的AI医疗助手,请遵循以下原则：
+    # 改进的系统提示词
+    CUSTOM_SYSTEM_PROMPT = """你是一个专业的AI医疗助手,请遵循以下原则：
 1. 提供准确、专业但易懂的医疗信息
 2. 对于严重症状,明确建议及时就医
 3. 回答简洁明了,控制在150-300字
@@ -642,80 +953,97 @@ class DeepSeekAPI:
 5. 强调这只是辅助参考,不能替代专业医疗诊断
 6. 如果涉及眼部疾病,可以建议使用本系统的图像诊断功能"""
 
-        # 重试配置
-        max_retries = 4  # 增加重试次数
-        base_delay = 1
-        max_delay = 10
-        
-        import time
-        import random
+    def _custom_payload(self, prompt):
+        """构建自定义问答请求"""
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.CUSTOM_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt[:4000]}
+            ],
+            "temperature": 0.3,  # 降低随机性以获得更稳定输出
+            "max_tokens": 2000,
+            "top_p": 0.9,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0
+        }
 
-        for attempt in range(max_retries):
-            try:
-                # 智能退避策略
-                if attempt > 0:
-                    delay = min(base_delay * (2 ** attempt) + random.uniform(0, 1), max_delay)
-                    print(f"⏳ 等待 {delay:.1f} 秒后重试...")
-                    time.sleep(delay)
-
-                # 优化payload
-                payload = {
-                    "model": self.model,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.3,  # 降低随机性以获得更稳定输出
-                    "max_tokens": 2000,
-                    "top_p": 0.9,
-                    "frequency_penalty": 0.0,
-                    "presence_penalty": 0.0,
-                    "stream": False
-                }
+    def stream_custom_advice(self, prompt, fallback=True, priority=PRIORITY_INTERACTIVE):
+        """流式获取自定义医疗建议，逐段产出文本（尚未输出时的重试由 LLMClient 统一处理）
 
-                print(f"🔄 正在连接DeepSeek API (第{attempt + 1}/{max_retries}次)...")
-                
-                # 动态调整超时
-                connect_timeout = 8 + attempt * 2
-                read_timeout = 45 + attempt * 10
-                
-                response = requests.post(
-                    self.endpoint, 
-                    headers=headers, 
-                    json=payload, 
-                    timeout=(connect_timeout, read_timeout),
-                    verify=True
-                )
+        未输出任何内容就失败时：fallback=True 产出备用建议，否则抛出 LLMError
+        """
+        if not self.api_key or self.api_key.strip() == "":
+            yield "❌ 请先设置有效的API密钥才能使用AI对话功能。"
+            return
 
-                # 详细状态码处理
-                if response.status_code == 200:
-                    try:
-                        result = response.json()
-                        if "choices" in result and len(result["choices"]) > 0:
-                            content = result["choices"][0]["message"]["content"]
-                            if content and len(content.strip()) > 10:
-                                print(f"✅ API调用成功 (第{attempt + 1}次尝试)")
-                                
-                                # 内容后处理
-                                processed_content = self._enhance_medical_response(content)
-                                return processed_content
-                            else:
-                                print("⚠️ API返回内容为空或过短,继续重试...")
-                                continue
+        stream = self.client.stream(self.endpoint, self.api_key, self._custom_payload(prompt), priority=priority)
+        try:
+            yield from stream
+            print(f"✅ API流式回复完成: 首字 {stream.ttft_ms:.0f}ms, 总耗时 {stream.total_ms:.0f}ms")
+        except LLMError as e:
+            print(f"❌ API流式调用失败: {e}")
+            if not fallback:
+                raise
+            if not stream.text:
+                yield self._get_enhanced_fallback_advice()
+
+    def get_custom_advice(self, prompt, priority=PRIORITY_INTERACTIVE):
+        """获取自定义医疗建议（增强版）
+
+        429/5xx/超时/连接错误的退避重试由 LLMClient 统一处理（限流时整个令牌桶暂停），
+        这里只发一次并把最终结果转成提示信息，不再在调用线程上循环重试
+        """
+        # 输入验证
+        if not self.api_key or self.api_key.strip() == "":
+            return "❌ 请先设置有效的API密钥才能使用AI对话功能。\n\n💡 您可以在右侧AI建议区域的设置按钮中配置DeepSeek API密钥。"
+
+        if not prompt or len(prompt.strip()) < 2:
+            return "❌ 请输入有效的问题内容。"
+        
+        # 限制输入长度
+        if len(prompt) > 4000:
+            prompt = prompt[:4000]
+            print("⚠️ 输入内容过长,已自动截断到4000字符")
+
+        try:
+            print("🔄 正在连接DeepSeek API...")
+            
+            # 共享会话复用长连接，重试和后续提问不再重新握手
+            response = self.client.post(
+                self.endpoint,
+                self.api_key,
+                self._custom_payload(prompt),
+                timeout=(8, 45),
+                headers=self.CUSTOM_HEADERS,
+                priority=priority
+            )
+
+            # 详细状态码处理
+            if response.status_code == 200:
+                try:
+                    result = response.json()
+                    if "choices" in result and len(result["choices"]) > 0:
+                        content = result["choices"][0]["message"]["content"]
+                        if content and len(content.strip()) > 10:
+                            print("✅ API调用成功")
+                            
+                            # 内容后处理
+                            processed_content = self._enhance_medical_response(content)
+                            return processed_content
                         else:
-                            print(f"⚠️ API响应格式异常: {result}")
-                            if attempt == max_retries - 1:
-                                return "🔧 AI服务响应格式异常,请稍后重试。\n\n💡 如果问题持续,请联系技术支持。"
-                            continue
-                    except (json.JSONDecodeError, KeyError) as e:
-                        print(f"❌ 响应解析失败: {e}")
-                        if attempt == max_retries - 1:
-                            return "🔧 AI服务响应解析失败。\n\n💡 请稍后重试或联系技术支持。"
-                        continue
-
-                elif response.status_code == 401:
-                    print("❌ API密钥认证失败")
-                    return """❌ API密钥无效或已过期
+                            print("⚠️ API返回内容为空或过短")
+                            return self._get_enhanced_fallback_advice()
+                    else:
+                        print(f"⚠️ API响应格式异常: {result}")
+                        return "🔧 AI服务响应格式异常,请稍后重试。\n\n💡 如果问题持续,请联系技术支持。"
+                except (json.JSONDecodeError, KeyError) as e:
+                    print(f"❌ 响应解析失败: {e}")
+                    return "🔧 AI服务响应解析失败。\n\n💡 请稍后重试或联系技术支持。"
+
+            elif response.status_code == 401:
+                print("❌ API密钥认证失败")
+                return """❌ API密钥无效或已过期
                     
 🔧 **解决方案：**
 1. 检查API密钥是否正确复制
@@ -724,16 +1052,10 @@ class DeepSeekAPI:
 4. 重新获取最新的API密钥
 
 💡 **提示：** 可以在DeepSeek官网查看密钥状态和余额"""
-                    
-                elif response.status_code == 429:
-                    print(f"⚠️ API调用频率限制 (第{attempt + 1}次)")
-                    if attempt < max_retries - 1:
-                        wait_time = 8 + attempt * 5
-                        print(f"⏳ 等待 {wait_time} 秒...")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        return """⚠️ API调用频率过高
+                
+            elif response.status_code == 429:
+                print("⚠️ API调用频率限制")
+                return """⚠️ API调用频率过高
                         
 🔧 **解决方案：**
 - 等待1-2分钟后重试
@@ -741,45 +1063,38 @@ class DeepSeekAPI:
 - 考虑升级API套餐
 
 💡 **提示：** 系统已自动重试多次,请稍后再试"""
-                    
-                elif response.status_code in [500, 502, 503, 504]:
-                    print(f"⚠️ 服务器错误 {response.status_code} (第{attempt + 1}次)")
-                    if attempt < max_retries - 1:
-                        time.sleep(3 + attempt * 2)
-                        continue
-                    else:
-                        return f"""🔧 AI服务器暂时不可用 (错误码: {response.status_code})
+                
+            elif response.status_code in [500, 502, 503, 504]:
+                print(f"⚠️ 服务器错误 {response.status_code}")
+                return f"""🔧 AI服务器暂时不可用 (错误码: {response.status_code})
                         
 💡 **建议：**
 - 服务器可能正在维护
 - 请等待5-10分钟后重试
 - 或使用本地模式进行诊断"""
-                        
-                else:
-                    error_detail = ""
-                    try:
-                        error_info = response.json()
-                        if "error" in error_info:
-                            error_detail = error_info["error"].get("message", "")
-                    except:
-                        error_detail = response.text[:150]
                     
-                    print(f"❌ API调用失败: {response.status_code}")
-                    print(f"错误详情: {error_detail}")
-                    
-                    if attempt == max_retries - 1:
-                        return f"""❌ AI服务请求失败 (错误码: {response.status_code})
+            else:
+                error_detail = ""
+                try:
+                    error_info = response.json()
+                    if "error" in error_info:
+                        error_detail = error_info["error"].get("message", "")
+                except:
+                    error_detail = response.text[:150]
+                
+                print(f"❌ API调用失败: {response.status_code}")
+                print(f"错误详情: {error_detail}")
+                
+                return f"""❌ AI服务请求失败 (错误码: {response.status_code})
                         
 🔧 **错误信息：**
 {error_detail}
 
 💡 **建议：** 请稍后重试或联系技术支持"""
-                    continue
 
-            except requests.exceptions.Timeout:
-                print(f"⚠️ 请求超时 (第{attempt + 1}次)")
-                if attempt == max_retries - 1:
-                    return """⏰ AI服务响应超时
+        except requests.exceptions.Timeout:
+            print("⚠️ 请求超时")
+            return """⏰ AI服务响应超时
                     
 🔧 **解决方案：**
 1. 检查网络连接稳定性
@@ -788,12 +1103,22 @@ class DeepSeekAPI:
 4. 稍后重试
 
 💡 **网络诊断：** 可以尝试访问其他网站测试网络"""
-                continue
+            
+        except requests.exceptions.SSLError as e:
+            print(f"❌ SSL证书错误: {e}")
+            return """🔒 SSL连接错误
                 
-            except requests.exceptions.ConnectionError as e:
-                print(f"⚠️ 网络连接错误: {str(e)[:100]}...")
-                if attempt == max_retries - 1:
-                    return f"""🌐 网络连接失败
+🔧 **解决方案：**
+1. 检查系统时间是否正确
+2. 更新浏览器或系统
+3. 暂时禁用SSL验证（不推荐）
+4. 使用VPN重试
+
+💡 **安全提示：** SSL错误可能影响数据安全"""
+            
+        except requests.exceptions.ConnectionError as e:
+            print(f"⚠️ 网络连接错误: {str(e)[:100]}...")
+            return f"""🌐 网络连接失败
                     
 🔧 **可能原因：**
 - 网络连接不稳定
@@ -808,24 +1133,10 @@ class DeepSeekAPI:
 4. 联系网络管理员
 
 🔍 **错误详情：** {str(e)[:100]}"""
-                    continue
-                
-            except requests.exceptions.SSLError as e:
-                print(f"❌ SSL证书错误: {e}")
-                return """🔒 SSL连接错误
-                
-🔧 **解决方案：**
-1. 检查系统时间是否正确
-2. 更新浏览器或系统
-3. 暂时禁用SSL验证（不推荐）
-4. 使用VPN重试
-
-💡 **安全提示：** SSL错误可能影响数据安全"""
-                
-            except Exception as e:
-                print(f"❌ 未知错误: {str(e)[:100]}...")
-                if attempt == max_retries - 1:
-                    return f"""❌ 系统异常
+            
+        except Exception as e:
+            print(f"❌ 未知错误: {str(e)[:100]}...")
+            return f"""❌ 系统异常
                     
 🔧 **错误信息：**
 {str(e)[:200]}
@@ -836,10 +1147,6 @@ class DeepSeekAPI:
 3. 联系技术支持
 
 📧 **支持：** 请保存错误信息以便技术人员分析"""
-                    continue
-
-        # 所有重试都失败
-        return self._get_enhanced_fallback_advice()
     
     def _enhance_medical_response(self, content):
         """增强医疗回复内容"""
@@ -1124,15 +1431,186 @@ class DeepSeekAPI:
 # 删除百度API类,简化代码
 
 
+class PredictionCache:
+    """检测结果缓存：内存 LRU + SQLite 磁盘缓存
+
+    以 图像内容哈希 + 模型权重校验和 为键，只缓存 top-1 (疾病名称, 置信度)。
+    开发板重发同一帧、批量检测重复文件时直接返回，跳过 YOLO 前向推理。
+    磁盘缓存使用一个长连接，所有访问都在 self.lock 内串行执行。
+    """
+
+    def __init__(self, max_memory_entries=512, max_disk_entries=20000, db_path=None):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        if db_path is None:
+            db_dir = os.path.join(os.path.expanduser("~"), "EyeDiseaseDetectorHistory")
+            os.makedirs(db_dir, exist_ok=True)
+            db_path = os.path.join(db_dir, "prediction_cache.db")
+        self.db_path = db_path
+        self.memory = OrderedDict()
+        self.model_key = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.puts_since_trim = 0
+        self.conn = None
+        self.disk_enabled = self._init_db()
+
+    def _init_db(self):
+        try:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            with self.conn as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS predictions (
+                        model_key TEXT NOT NULL,
+                        image_key TEXT NOT NULL,
+                        disease_name TEXT NOT NULL,
+                        confidence REAL NOT NULL,
+                        last_access REAL NOT NULL,
+                        PRIMARY KEY (model_key, image_key)
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON predictions(last_access)")
+            return True
+        except sqlite3.Error as e:
+            print(f"[PredictionCache] 磁盘缓存不可用，仅使用内存缓存: {e}")
+            return False
+
+    @staticmethod
+    def image_key(image):
+        """解码后图像像素的快速哈希（包含尺寸和数据类型）"""
+        array = np.ascontiguousarray(image)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{array.shape}|{array.dtype}".encode())
+        digest.update(array.data)
+        return digest.hexdigest()
+
+    def set_model(self, model_key):
+        """切换模型权重：清空内存缓存并删除其他权重的磁盘缓存"""
+        with self.lock:
+            if model_key == self.model_key:
+                return
+            self.model_key = model_key
+            self.memory.clear()
+            if self.disk_enabled:
+                try:
+                    with self.conn as conn:
+                        conn.execute("DELETE FROM predictions WHERE model_key != ?", (model_key,))
+                except sqlite3.Error as e:
+                    print(f"[PredictionCache] 清理旧模型缓存失败: {e}")
+
+    def get(self, image_key):
+        """返回缓存的 (疾病名称, 置信度)，未命中返回 None"""
+        with self.lock:
+            if self.model_key is None:
+                return None
+            if image_key in self.memory:
+                self.memory.move_to_end(image_key)
+                self.hits += 1
+                return self.memory[image_key]
+            if self.disk_enabled:
+                try:
+                    with self.conn as conn:
+                        row = conn.execute(
+                            "SELECT disease_name, confidence FROM predictions WHERE model_key = ? AND image_key = ?",
+                            (self.model_key, image_key)
+                        ).fetchone()
+                        if row:
+                            conn.execute(
+                                "UPDATE predictions SET last_access = ? WHERE model_key = ? AND image_key = ?",
+                                (time.time(), self.model_key, image_key)
+                            )
+                except sqlite3.Error as e:
+                    print(f"[PredictionCache] 读取磁盘缓存失败: {e}")
+                    row = None
+                if row:
+                    entry = (row[0], float(row[1]))
+                    self._remember(image_key, entry)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, image_key, disease_name, confidence):
+        """写入一条检测结果"""
+        entry = (disease_name, float(confidence))
+        with self.lock:
+            if self.model_key is None:
+                return
+            self._remember(image_key, entry)
+            if not self.disk_enabled:
+                return
+            try:
+                with self.conn as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO predictions (model_key, image_key, disease_name, confidence, last_access) "
+                        "VALUES (?,?,?,?,?)",
+                        (self.model_key, image_key, disease_name, entry[1], time.time())
+                    )
+                    self.puts_since_trim += 1
+                    if self.puts_since_trim >= 64:
+                        self.puts_since_trim = 0
+                        self._trim_disk(conn)
+            except sqlite3.Error as e:
+                print(f"[PredictionCache] 写入磁盘缓存失败: {e}")
+
+    def _remember(self, image_key, entry):
+        self.memory[image_key] = entry
+        self.memory.move_to_end(image_key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def _trim_disk(self, conn):
+        """磁盘缓存超出上限时按最近访问时间淘汰"""
+        count = conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM predictions WHERE rowid IN "
+                "(SELECT rowid FROM predictions ORDER BY last_access ASC LIMIT ?)", (excess,)
+            )
+
+    def close(self):
+        """关闭磁盘缓存连接"""
+        with self.lock:
+            self.disk_enabled = False
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self.memory),
+            }
+
+
 class EyeDiseaseDetector:
     """眼部疾病检测器,包含结果解析所需的映射关系"""
     
     # 类级别的模型缓存,避免重复加载同一模型
     _model_cache = {}
+    # 模型权重校验和缓存: 路径 -> (文件大小, 修改时间, 校验和)
+    _checksum_cache = {}
     
-    def __init__(self):
+    def __init__(self, backend=None, num_threads=None):
         self.model = None
         self.current_model_path = None
+        self.result_cache = PredictionCache()  # 检测结果缓存,切换权重时自动失效
+        
+        # 推理后端配置: auto / openvino / onnx / pytorch
+        self.backend = backend or AI_CONFIG.get("INFERENCE_BACKEND", "auto")
+        self.num_threads = AI_CONFIG.get("INFERENCE_THREADS", 0) if num_threads is None else num_threads
+        self.active_backend = None  # 当前模型实际使用的后端
+        # YOLO predictor 非线程安全：批量检测线程与界面/开发板诊断共用同一模型
+        self.predict_lock = threading.Lock()
         
         # 类别索引到疾病名称的映射
         self.class_names = {
@@ -1158,23 +1636,35 @@ class EyeDiseaseDetector:
         }
 
     def load_model(self, model_path):
-        """加载模型,使用缓存机制提高性能"""
+        """加载模型,使用缓存机制提高性能；.pt 权重按配置自动导出为 ONNX / OpenVINO 后端"""
         try:
             # 如果已经加载了相同的模型,直接返回
             if self.current_model_path == model_path and self.model is not None:
                 print(f"[DEBUG] 模型已加载,跳过重复加载: {model_path}")
                 return True
             
+            backend = self.resolve_backend(model_path)
+            load_path = model_path
+            if model_path.endswith('.pt') and backend != 'pytorch':
+                load_path = self.export_model(model_path, backend)
+                if load_path is None:
+                    backend, load_path = 'pytorch', model_path
+            cache_key = (model_path, backend)
+            
             # 检查缓存
-            if model_path in self._model_cache:
-                print(f"[DEBUG] 从缓存加载模型: {model_path}")
-                self.model = self._model_cache[model_path]
-                self.current_model_path = model_path
+            if cache_key in self._model_cache:
+                print(f"[DEBUG] 从缓存加载模型: {model_path} ({backend})")
+                self.model = self._model_cache[cache_key]
+                self._set_current_model(model_path, backend)
                 return True
             
             # 加载新模型
-            print(f"[DEBUG] 正在加载新模型: {model_path}")
-            model = YOLO(model_path)
+            print(f"[DEBUG] 正在加载新模型: {load_path} ({backend})")
+            if backend == 'pytorch':
+                model = YOLO(load_path)
+            else:
+                model = YOLO(load_path, task='classify')
+                self.configure_backend(model, backend)
             
             # 缓存模型（限制缓存大小,避免内存过度使用）
             if len(self._model_cache) >= 3:  # 最多缓存3个模型
@@ -1183,24 +1673,160 @@ class EyeDiseaseDetector:
                 del self._model_cache[oldest_key]
                 print(f"[DEBUG] 清理缓存中的旧模型: {oldest_key}")
             
-            self._model_cache[model_path] = model
+            self._model_cache[cache_key] = model
             self.model = model
-            self.current_model_path = model_path
-            print(f"[DEBUG] 模型加载成功并已缓存: {model_path}")
+            self._set_current_model(model_path, backend)
+            print(f"[DEBUG] 模型加载成功并已缓存: {model_path} ({backend})")
             return True
             
         except Exception as e:
             print(f"[ERROR] 模型加载失败: {e}")
             return False
 
+    def _set_current_model(self, model_path, backend):
+        self.current_model_path = model_path
+        self.active_backend = backend
+        # 不同后端的数值结果可能略有差异，结果缓存按 权重+后端 区分
+        self.result_cache.set_model(f"{self.model_checksum(model_path)}|{backend}")
+
+    @staticmethod
+    def backend_of(model_path):
+        """根据模型文件判断其推理后端"""
+        path = model_path.rstrip('/\\')
+        if path.endswith('.onnx'):
+            return 'onnx'
+        if path.endswith('_openvino_model') or path.endswith('.xml'):
+            return 'openvino'
+        return 'pytorch'
+
+    def resolve_backend(self, model_path):
+        """确定实际使用的后端：已导出的模型按文件类型，.pt 按配置（auto 时选择已安装的最快后端）"""
+        if not model_path.endswith('.pt'):
+            return self.backend_of(model_path)
+        if self.backend != 'auto':
+            return self.backend
+        if importlib.util.find_spec('openvino'):
+            return 'openvino'
+        if importlib.util.find_spec('onnxruntime') and importlib.util.find_spec('onnx'):
+            return 'onnx'
+        return 'pytorch'
+
+    @staticmethod
+    def export_path(model_path, backend):
+        """导出产物路径（与权重同目录，加 _cpu 后缀避免覆盖开发板使用的 best.onnx）"""
+        stem = os.path.splitext(model_path)[0] + '_cpu'
+        return f"{stem}.onnx" if backend == 'onnx' else f"{stem}_openvino_model"
+
+    def export_model(self, model_path, backend):
+        """通过 ultralytics 导出器将 .pt 导出为 ONNX / OpenVINO，权重未更新时复用已导出的产物"""
+        artifact = self.export_path(model_path, backend)
+        if os.path.exists(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(model_path):
+            return artifact
+        try:
+            print(f"[DEBUG] 首次加载,正在导出 {backend} 推理模型: {artifact}")
+            source = YOLO(model_path)
+            # 导出器根据 pt_path 决定输出文件名
+            source.model.pt_path = os.path.splitext(model_path)[0] + '_cpu.pt'
+            # 动态 batch 以支持 predict_batch 的批量推理
+            exported = source.export(format=backend, dynamic=True, simplify=(backend == 'onnx'), verbose=False)
+            return str(exported).rstrip('/\\')
+        except Exception as e:
+            print(f"[WARN] {backend} 导出失败,回退到 PyTorch 推理: {e}")
+            return None
+
+    def configure_backend(self, model, backend):
+        """预热导出模型（创建推理会话），并按配置重建带线程设置的 ONNX Runtime / OpenVINO 会话"""
+        model.predict(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False)
+        if not self.num_threads:
+            return
+        autobackend = model.predictor.model
+        if backend == 'onnx':
+            if not autobackend.dynamic:
+                print("[WARN] 静态形状 ONNX 模型使用 IO binding,保持默认线程设置")
+                return
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.num_threads
+            options.inter_op_num_threads = 1
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+            autobackend.session = onnxruntime.InferenceSession(
+                str(autobackend.w), options, providers=["CPUExecutionProvider"]
+            )
+        elif backend == 'openvino':
+            import openvino as ov
+            core = ov.Core()
+            ov_model = core.read_model(model=str(autobackend.w), weights=autobackend.w.with_suffix(".bin"))
+            autobackend.ov_compiled_model = core.compile_model(
+                ov_model,
+                device_name="CPU",
+                config={"PERFORMANCE_HINT": autobackend.inference_mode,
+                        "INFERENCE_NUM_THREADS": self.num_threads},
+            )
+        print(f"[DEBUG] {backend} 推理线程数: {self.num_threads}")
+
     def predict(self, image):
         try:
-            results = self.model.predict(image, conf=0.5)
+            with self.predict_lock:
+                results = self.model.predict(image, conf=0.5)
             return results
         except Exception as e:
             print(f"Prediction error: {e}")
             return None
 
+    def predict_batch(self, images):
+        """批量推理：一次 YOLO.predict 调用处理多张图像，返回与输入顺序一致的结果列表"""
+        try:
+            with self.predict_lock:
+                return self.model.predict(list(images), conf=0.5, verbose=False)
+        except Exception as e:
+            print(f"Batch prediction error: {e}")
+            return None
+
+    @classmethod
+    def model_checksum(cls, model_path):
+        """模型键: 绝对路径 + 权重文件内容校验和（同路径覆盖新权重时也会变化）"""
+        path = os.path.abspath(model_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return path
+        cached = cls._checksum_cache.get(path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime):
+            return f"{path}:{cached[2]}"
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        checksum = digest.hexdigest()
+        cls._checksum_cache[path] = (stat.st_size, stat.st_mtime, checksum)
+        return f"{path}:{checksum}"
+
+    def top1(self, model_results):
+        """从单张图像的 YOLO 结果中取 top-1 (疾病名称, 置信度)，无分类概率时返回 None"""
+        if hasattr(model_results, 'probs') and model_results.probs is not None:
+            top_class_idx = int(model_results.probs.top1)
+            return self.class_names.get(top_class_idx, "未知"), float(model_results.probs.top1conf)
+        return None
+
+    def classify(self, image):
+        """单张图像分类，返回 (疾病名称, 置信度)，失败返回 None；命中缓存时不做推理"""
+        return self.classify_batch([image])[0]
+
+    def classify_batch(self, images):
+        """批量分类：先查结果缓存，只对未命中的图像做一次批量推理"""
+        keys = [self.result_cache.image_key(image) for image in images]
+        outputs = [self.result_cache.get(key) for key in keys]
+        missing = [i for i, output in enumerate(outputs) if output is None]
+        if missing:
+            results = self.predict_batch([images[i] for i in missing])
+            if results is not None:
+                for i, model_results in zip(missing, results):
+                    output = self.top1(model_results)
+                    if output is not None:
+                        self.result_cache.put(keys[i], *output)
+                    outputs[i] = output
+        return outputs
+
 
 class ResultProcessor:
     """检测结果处理工具类,负责解析、展示和格式化结果"""
@@ -1326,6 +1952,137 @@ class ResultProcessor:
 
 
 
+# ============================================================
+#  批量检测引擎
+# ============================================================
+class BatchDetectionEngine(QObject):
+    """后台批量检测: 解码线程池预取 → 批量推理 → 单一写入线程批量入库
+
+    所有进度通过 Qt 信号投递到界面线程, 每批只发一次信号; 取消在当前批结束后生效。
+    """
+    progress = pyqtSignal(int, int, str)   # 已完成数, 总数, 当前文件名
+    batch_finished = pyqtSignal(list)      # 本批结果 [{'path','disease_name','confidence','error'}]
+    finished = pyqtSignal(bool)            # 是否被取消
+
+    BATCH_SIZE = 8          # 每次推理的图像数
+    DECODE_WORKERS = 4      # 解码线程数（cv2.imread 会释放 GIL）
+    PREFETCH_BATCHES = 2    # 推理当前批时预先解码的批数
+
+    def __init__(self, detector, history_db):
+        super().__init__()
+        self.detector = detector
+        self.history_db = history_db
+        self.cancel_event = threading.Event()
+        self.write_queue = queue.Queue()
+        self.worker_thread = None
+        self.writer_thread = None
+
+    def start(self, image_paths):
+        """启动后台批量检测"""
+        self.cancel_event.clear()
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.worker_thread = threading.Thread(target=self._run, args=(list(image_paths),), daemon=True)
+        self.writer_thread.start()
+        self.worker_thread.start()
+
+    def cancel(self):
+        """请求取消，当前批推理完成后停止"""
+        self.cancel_event.set()
+
+    def is_running(self):
+        return self.worker_thread is not None and self.worker_thread.is_alive()
+
+    @staticmethod
+    def _decode(image_path):
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError("图像读取失败")
+        return image
+
+    def _run(self, image_paths):
+        batches = [image_paths[i:i + self.BATCH_SIZE] for i in range(0, len(image_paths), self.BATCH_SIZE)]
+        done = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.DECODE_WORKERS) as pool:
+                pending = []    # 已提交解码的批: [(路径, future), ...]
+                next_batch = 0
+                while next_batch < len(batches) or pending:
+                    # 保持预取深度，推理当前批时后续批已在解码
+                    while next_batch < len(batches) and len(pending) <= self.PREFETCH_BATCHES:
+                        pending.append([(path, pool.submit(self._decode, path)) for path in batches[next_batch]])
+                        next_batch += 1
+                    if self.cancel_event.is_set():
+                        for _, future in (item for batch in pending for item in batch):
+                            future.cancel()
+                        break
+
+                    batch = pending.pop(0)
+                    results = self._process_batch(batch)
+                    done += len(results)
+                    self.batch_finished.emit(results)
+                    self.progress.emit(done, len(image_paths), os.path.basename(batch[-1][0]))
+        except Exception as e:
+            print(f"[批量检测] 后台处理出错: {e}")
+        finally:
+            self.write_queue.put(None)
+            self.writer_thread.join()
+            self.finished.emit(self.cancel_event.is_set())
+
+    def _process_batch(self, batch):
+        """等待本批解码完成并批量推理，返回结果列表并交给写入线程"""
+        results = []
+        images = []
+        for path, future in batch:
+            result = {'path': path, 'disease_name': "未知", 'confidence': 0.0, 'error': None}
+            try:
+                images.append((result, future.result()))
+            except Exception as e:
+                result['error'] = str(e)
+            results.append(result)
+
+        if images:
+            try:
+                outputs = self.detector.classify_batch([image for _, image in images])
+            except Exception as e:
+                outputs = [None] * len(images)
+                for result, _ in images:
+                    result['error'] = str(e)
+            for (result, _), output in zip(images, outputs):
+                if output:
+                    result['disease_name'], result['confidence'] = output
+
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.write_queue.put([
+            (str(uuid.uuid4()), timestamp, r['path'], r['disease_name'], r['confidence'])
+            for r in results if r['error'] is None
+        ])
+        return results
+
+    def _writer_loop(self):
+        """单一写入线程：合并已到达的批次，一个事务写入"""
+        while True:
+            rows = self.write_queue.get()
+            if rows is None:
+                return
+            stop = False
+            while True:
+                try:
+                    more = self.write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    stop = True
+                    break
+                rows.extend(more)
+            if rows:
+                try:
+                    self.history_db.add_many(rows)
+                except Exception as e:
+                    print(f"[批量检测] 写入历史记录失败: {e}")
+            if stop:
+                return
+
+
 # ============================================================
 #  摄像头接收器
 # ============================================================
@@ -1410,11 +2167,16 @@ class BoardCameraReceiver(QObject):
         self.socket = None
         self.is_receiving = False
         self.receiving_thread = None
-        self.packet_buffer = {}  # 用于重组分片数据
+        self.fragment_receiver = FragmentReceiver(send_fn=self._send_ack)  # 分片重组与ACK回复
         self.request_headers = {}  # 存储请求头信息
-        self.packet_to_request = {}  # 存储packet_id到request_id的映射
         self.last_heartbeat = 0
         self.connection_active = False
+        # 视频流反馈：按流序号统计丢帧，定期回报开发板调整质量/分辨率/帧率
+        self.stream_reporter = OptimizedReceiver(FEEDBACK_INTERVAL)
+        self.stream_addr = None
+        self.stream_sequence = StreamSequence()  # 按流序号统计丢帧，识别迟到帧与开发板重启
+        self.stream_decoder = StreamDecoder()  # 按负载识别 JPEG / H.264
+        self.last_stream_request = 0
         
     def start_receiving(self, port=5002):
         """启动数据接收"""
@@ -1455,10 +2217,15 @@ class BoardCameraReceiver(QObject):
         """接收循环"""
         while self.is_receiving:
             try:
-                data, addr = self.socket.recvfrom(4096)
+                # recvfrom_into 写入复用缓冲区，不为每个数据报分配新对象
+                data, addr = self.fragment_receiver.receive_into(self.socket)
                 self._process_received_data(data, addr)
+                self._send_stream_feedback()
                 
             except socket.timeout:
+                # 空闲时也定时清理过期的残缺帧
+                self.fragment_receiver.maybe_expire()
+                self._send_stream_feedback()
                 continue
             except Exception as e:
                 print(f"[开发板] 接收数据错误: {e}")
@@ -1467,112 +2234,76 @@ class BoardCameraReceiver(QObject):
     def _process_received_data(self, data, addr):
         """处理接收到的数据"""
         try:
-            print(f"[调试] 收到数据包,总长度: {len(data)} 字节")
-            print(f"[调试] 数据包前20字节: {data[:20].hex() if len(data) >= 20 else data.hex()}")
-            
-            # 检查是否是心跳包
-            if len(data) >= 9:
-                packet_id = int.from_bytes(data[0:4], 'big')
-                packet_index = int.from_bytes(data[4:6], 'big')
-                total_packets = int.from_bytes(data[6:8], 'big')
-                
-                if packet_id == 0 and packet_index == 0 and total_packets == 0:
-                    self._handle_heartbeat(data, addr)
-                    return
-            
-            # 检查是否是简化的图像保存数据包
-            if len(data) >= 4:  # 至少包含包索引和总包数
-                try:
-                    # 尝试解析为简化格式：[2字节包索引][2字节总包数][图像数据]
-                    packet_index = int.from_bytes(data[0:2], 'big')
-                    total_packets = int.from_bytes(data[2:4], 'big')
-                    packet_data = data[4:]
-                    
-                    print(f"[调试] 简化图像包 - 包索引: {packet_index}, 总包数: {total_packets}")
-                    
-                    # 生成一个临时的packet_id用于重组
-                    temp_packet_id = hash(f"temp_save_{time.time()}") & 0xFFFFFFFF
-                    
-                    # 重组分片数据
-                    if temp_packet_id not in self.packet_buffer:
-                        self.packet_buffer[temp_packet_id] = [None] * total_packets
-                    
-                    self.packet_buffer[temp_packet_id][packet_index] = packet_data
-                    
-                    # 检查是否所有包都已接收
-                    if all(packet is not None for packet in self.packet_buffer[temp_packet_id]):
-                        self._process_saved_image(temp_packet_id, addr)
-                    
-                    return
-                    
-                except Exception as e:
-                    print(f"[调试] 简化格式解析失败: {e}")
-            
-            # 原有的复杂格式处理（保留兼容性）
-            if len(data) < 9:  # 最小包头长度
-                print(f"[调试] 数据包太短,长度: {len(data)},需要至少9字节")
+            # 开发板对视频流反馈的回显（用于测RTT），比任何分片包头都短
+            if len(data) == ECHO.size and self.stream_reporter.on_control(bytes(data)):
                 return
             
-            # 解析包头：[4字节请求ID哈希][2字节包索引][2字节总包数][1字节标志位][数据]
-            packet_id = int.from_bytes(data[0:4], 'big')
-            packet_index = int.from_bytes(data[4:6], 'big')
-            total_packets = int.from_bytes(data[6:8], 'big')
-            is_last = bool(data[8])
-            
-            print(f"[调试] 标准包头解析 - packet_id: {packet_id}, packet_index: {packet_index}, total_packets: {total_packets}, is_last: {is_last}")
-            
-            # 处理第一个包中的request_id信息
-            if packet_index == 0:
-                print(f"[调试] 处理第一个包,数据总长度: {len(data)}")
-                
-                if len(data) >= 11:
-                    # 第一个包包含request_id信息：[包头][2字节长度][request_id][图像数据]
-                    request_id_len = int.from_bytes(data[9:11], 'big')
-                    print(f"[调试] request_id长度: {request_id_len}")
-                    print(f"[调试] 需要的总长度: {11 + request_id_len}, 实际长度: {len(data)}")
-                    
-                    if len(data) >= 11 + request_id_len:
-                        try:
-                            request_id = data[11:11+request_id_len].decode('utf-8')
-                            packet_data = data[11+request_id_len:]
-                            
-                            # 存储request_id到packet_id的映射
-                            self.packet_to_request[packet_id] = request_id
-                            print(f"[开发板] 收到图像包,packet_id: {packet_id}, request_id: {request_id}")
-                            print(f"[开发板] 映射关系已存储,当前映射数量: {len(self.packet_to_request)}")
-                            print(f"[开发板] 当前请求头数量: {len(self.request_headers)}")
-                        except UnicodeDecodeError as e:
-                            print(f"[调试] request_id解码失败: {e}")
-                            print(f"[调试] 原始字节: {data[11:11+request_id_len].hex()}")
-                            packet_data = data[9:]
-                    else:
-                        packet_data = data[9:]
-                        print(f"[调试] 第一个包数据长度不足,无法提取request_id")
-                        print(f"[调试] 需要: {11 + request_id_len}, 实际: {len(data)}")
-                else:
-                    packet_data = data[9:]
-                    print(f"[调试] 第一个包长度不足11字节,无法读取request_id长度")
-            else:
-                packet_data = data[9:]
-            
-            # 重组分片数据
-            if packet_id not in self.packet_buffer:
-                self.packet_buffer[packet_id] = [None] * total_packets
-            
-            self.packet_buffer[packet_id][packet_index] = packet_data
+            # 检查是否是心跳包（包ID、包索引、总包数均为0）
+            if len(data) >= 9 and data[0:8] == b'\x00' * 8:
+                self._handle_heartbeat(data, addr)
+                return
             
-            # 检查是否所有包都已接收
-            if is_last and all(packet is not None for packet in self.packet_buffer[packet_id]):
-                self._reconstruct_and_process_image(packet_id, addr)
+            # 分片重组：[4字节请求ID哈希][2字节包索引][2字节总包数][1字节标志位][数据]
+            frame = self.fragment_receiver.handle_datagram(data, addr)
+            if frame:
+                self._process_complete_frame(frame)
                 
         except Exception as e:
             print(f"[开发板] 数据处理错误: {e}")
     
+    def _count_stream_frame(self, stream_id, addr):
+        """按开发板递增的流序号统计收到/丢失的视频流帧（流中断或序号大幅跳变视为开发板重启），迟到的旧帧返回 False"""
+        if not self.stream_sequence.accept(stream_id):
+            return False
+        if self.stream_sequence.broken:
+            self.stream_decoder.lost()  # H.264 参考帧缺失，等待关键帧
+        self.stream_addr = addr
+        return True
+    
+    def _process_stream_frame(self, frame):
+        """解码视频流帧（JPEG 或 H.264）并发出 frame_received；packet_id 为开发板的流序号"""
+        addr = frame['addr']
+        if not self._count_stream_frame(frame['packet_id'], addr):
+            return  # 迟到的旧帧：H.264 不能乱序解码，JPEG 显示旧画面也没有意义
+        decode_start = time.perf_counter()
+        image = self.stream_decoder.decode(frame['data'])
+        self.stream_reporter.record_decode((time.perf_counter() - decode_start) * 1000)
+        if image is not None:
+            self.frame_received.emit(image)
+            return
+        
+        # 不能显示：本机没有 PyAV 时请开发板改用 JPEG，H.264 丢帧后请求关键帧
+        request = (REQUEST_JPEG if self.stream_decoder.stats['unsupported'] else
+                   REQUEST_KEYFRAME if self.stream_decoder.needs_keyframe else None)
+        if request and time.time() - self.last_stream_request >= KEYFRAME_REQUEST_INTERVAL:
+            self.last_stream_request = time.time()
+            try:
+                self.socket.sendto(stream_control_message(request), addr)
+            except OSError as e:
+                print(f"[开发板] 视频流控制消息发送失败: {e}")
+    
+    def _send_stream_feedback(self):
+        """视频流进行中时，每 FEEDBACK_INTERVAL 向开发板发送一次反馈"""
+        if self.stream_addr is None or time.time() - self.stream_sequence.last_time > STREAM_IDLE_RESET:
+            return
+        if not self.stream_reporter.due():
+            return
+        try:
+            self.socket.sendto(self.stream_reporter.feedback(self.stream_sequence.frames, self.stream_sequence.lost_frames),
+                               self.stream_addr)
+        except OSError as e:
+            print(f"[开发板] 视频流反馈发送失败: {e}")
+    
+    def _send_ack(self, ack_data, addr):
+        """向开发板回复分片ACK"""
+        if self.socket:
+            self.socket.sendto(ack_data, addr)
+    
     def _handle_heartbeat(self, data, addr):
         """处理心跳包"""
         try:
             # 解析心跳数据
-            heartbeat_data = data[9:].decode('utf-8')
+            heartbeat_data = bytes(data[9:]).decode('utf-8')
             heartbeat = json.loads(heartbeat_data)
             
             if heartbeat.get('type') == 'heartbeat':
@@ -1595,127 +2326,79 @@ class BoardCameraReceiver(QObject):
         except Exception as e:
             print(f"[开发板] 心跳处理错误: {e}")
     
-    def _reconstruct_and_process_image(self, packet_id, addr):
-        """重组并处理图像"""
+    def _process_complete_frame(self, frame):
+        """处理重组完成的图像：视频流帧、诊断请求或保存请求"""
         try:
-            # 重组图像数据
-            image_data = b''.join(self.packet_buffer[packet_id])
+            addr = frame['addr']
+            request_id = frame['request_id']
             
-            # 解码图像
-            image_array = np.frombuffer(image_data, dtype=np.uint8)
+            if request_id is None:
+                # 视频流帧不携带 request_id
+                self._process_stream_frame(frame)
+                return
+            
+            # 解码图像（frame['data'] 是重组缓冲区的视图，frombuffer 不拷贝）
+            image_array = np.frombuffer(frame['data'], dtype=np.uint8)
             image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
             
-            if image is not None:
-                print(f"[开发板] 图像重组成功,大小: {image.shape}")
-                
-                # 查找对应的request_id
-                request_id = self.packet_to_request.get(packet_id)
-                print(f"[开发板] 查找request_id映射,packet_id: {packet_id}, found: {request_id is not None}")
-                print(f"[开发板] 当前映射关系: {list(self.packet_to_request.keys())}")
-                print(f"[开发板] 当前请求头: {list(self.request_headers.keys())}")
-                
-                if request_id:
-                    # 查找对应的请求头信息
-                    request_header = self.request_headers.get(request_id)
-                    print(f"[开发板] 查找请求头信息,request_id: {request_id}, found: {request_header is not None}")
-                    
-                    if request_header:
-                        # 发送诊断请求信号
-                        self.diagnosis_request_received.emit({
-                            "image": image,
-                            "header": request_header,
-                            "source": "board_camera",
-                            "addr": addr
-                        })
-                        
-                        # 清理缓存
-                        del self.packet_buffer[packet_id]
-                        del self.request_headers[request_id]
-                        del self.packet_to_request[packet_id]
-                        print(f"[开发板] 图像处理完成,request_id: {request_id}")
-                    else:
-                        print(f"[开发板] 未找到请求头信息,request_id: {request_id}")
-                        # 清理包缓存,但保留映射关系以便调试
-                        if packet_id in self.packet_buffer:
-                            del self.packet_buffer[packet_id]
-                else:
-                    print(f"[开发板] 未找到request_id映射,packet_id: {packet_id}")
-                    # 清理包缓存
-                    if packet_id in self.packet_buffer:
-                        del self.packet_buffer[packet_id]
-            else:
+            if image is None:
                 print(f"[开发板] 图像解码失败")
+                return
+            
+            print(f"[开发板] 图像重组成功,大小: {image.shape}, request_id: {request_id}")
+            request_header = self.request_headers.pop(request_id, None)
+            
+            if request_id.startswith("save_") or (request_header and request_header.get('type') == 'image_save_request'):
+                self._process_saved_image(image, request_id, request_header, addr)
+            elif request_header:
+                # 发送诊断请求信号
+                self.diagnosis_request_received.emit({
+                    "image": image,
+                    "header": request_header,
+                    "source": "board_camera",
+                    "addr": addr
+                })
+                print(f"[开发板] 图像处理完成,request_id: {request_id}")
+            else:
+                print(f"[开发板] 未找到请求头信息,request_id: {request_id}")
                 
         except Exception as e:
             print(f"[开发板] 图像重组处理错误: {e}")
     
-    def _process_saved_image(self, packet_id, addr):
-        """处理保存的图像（简化格式）"""
+    def _process_saved_image(self, image, request_id, save_request_header, addr):
+        """处理保存请求的图像"""
         try:
-            # 重组图像数据
-            image_data = b''.join(self.packet_buffer[packet_id])
-            
-            # 解码图像
-            image_array = np.frombuffer(image_data, dtype=np.uint8)
-            image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-            
-            if image is not None:
-                print(f"[保存] 图像重组成功,大小: {image.shape}")
-                
-                # 查找对应的保存请求头
-                save_request_header = None
-                save_request_id = None
+            if save_request_header:
+                # 保存图像到PC端
+                pc_save_path = save_request_header.get('pc_save_path', '')
+                filename = save_request_header.get('filename', f'saved_image_{int(time.time())}.jpg')
                 
-                # 遍历所有请求头,找到保存请求
-                for req_id, header in self.request_headers.items():
-                    if header.get('type') == 'image_save_request':
-                        save_request_header = header
-                        save_request_id = req_id
-                        break
+                print(f"[保存] 找到保存请求,文件名: {filename}")
+                print(f"[保存] 保存路径: {pc_save_path}")
                 
-                if save_request_header:
-                    # 保存图像到PC端
-                    pc_save_path = save_request_header.get('pc_save_path', '')
-                    filename = save_request_header.get('filename', f'saved_image_{int(time.time())}.jpg')
-                    
-                    print(f"[保存] 找到保存请求,文件名: {filename}")
-                    print(f"[保存] 保存路径: {pc_save_path}")
+                if pc_save_path:
+                    success = self._save_image_to_pc_direct(image, filename, pc_save_path)
                     
-                    if pc_save_path:
-                        success = self._save_image_to_pc_direct(image, filename, pc_save_path)
-                        
-                        if success:
-                            print(f"✅ [保存] 图像已保存到PC端: {filename}")
-                            
-                            # 发送保存成功响应到开发板
-                            self._send_save_response(save_request_id, True, filename, addr)
-                        else:
-                            print(f"❌ [保存] 图像保存失败")
-                            self._send_save_response(save_request_id, False, filename, addr)
-                        
-                        # 清理缓存
-                        del self.packet_buffer[packet_id]
-                        if save_request_id in self.request_headers:
-                            del self.request_headers[save_request_id]
-                    else:
-                        print("[保存] 未找到PC端保存路径")
-                        self._send_save_response(save_request_id, False, filename, addr)
-                else:
-                    print("[保存] 未找到保存请求头,使用默认路径保存")
-                    
-                    # 使用默认路径保存
-                    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "medical_images")
-                    filename = f'auto_saved_{int(time.time())}.jpg'
-                    
-                    success = self._save_image_to_pc_direct(image, filename, default_path)
                     if success:
-                        print(f"✅ [保存] 图像已自动保存: {filename}")
-                    
-                    # 清理缓存
-                    del self.packet_buffer[packet_id]
+                        print(f"✅ [保存] 图像已保存到PC端: {filename}")
+                    else:
+                        print(f"❌ [保存] 图像保存失败")
                     
+                    # 发送保存结果响应到开发板
+                    self._send_save_response(request_id, success, filename, addr)
+                else:
+                    print("[保存] 未找到PC端保存路径")
+                    self._send_save_response(request_id, False, filename, addr)
             else:
-                print(f"[保存] 图像解码失败")
+                print("[保存] 未找到保存请求头,使用默认路径保存")
+                
+                # 使用默认路径保存
+                default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "medical_images")
+                filename = f'auto_saved_{int(time.time())}.jpg'
+                
+                success = self._save_image_to_pc_direct(image, filename, default_path)
+                if success:
+                    print(f"✅ [保存] 图像已自动保存: {filename}")
                 
         except Exception as e:
             print(f"[保存] 图像保存处理错误: {e}")
@@ -1782,7 +2465,7 @@ class BoardCameraReceiver(QObject):
             "active": self.connection_active,
             "last_heartbeat": self.last_heartbeat,
             "time_since_heartbeat": current_time - self.last_heartbeat if self.last_heartbeat > 0 else float('inf'),
-            "buffered_packets": len(self.packet_buffer),
+            "buffered_packets": self.fragment_receiver.pending_count(),
             "pending_requests": len(self.request_headers)
         }
 
@@ -1904,6 +2587,10 @@ class MainWindow(QMainWindow):
         
         # AI对话历史上下文
         self.chat_history = []
+        self._chat_stream_base = None   # 流式回复显示期间，不含回复块的对话内容
+        self._chat_summary_spoken = False   # 本轮语音摘要是否已提前播报
+        self._advice_thread = None          # 正在生成治疗建议的后台线程
+        self._advice_pending = False        # 生成期间又请求了建议：结束后按最新检测结果重新生成
         
         # 延迟加载保存的API密钥
         QTimer.singleShot(100, self.load_saved_api_key)
@@ -1915,7 +2602,7 @@ class MainWindow(QMainWindow):
         self.status_bar.showMessage("正在初始化系统组件...")
         
         # 异步加载历史记录
-        QTimer.singleShot(500, self.load_history_records)
+        QTimer.singleShot(500, self.migrate_history_json)
 
         # 启动时清理过期临时图像 (7天前)
         QTimer.singleShot(1000, self._cleanup_temp_images)
@@ -3203,7 +3890,7 @@ class MainWindow(QMainWindow):
         """
         if model_path is None:           # 来自按钮点击
             model_path, _ = QFileDialog.getOpenFileName(
-                self, "选择或切换模型", "", "模型文件 (*.pt)"
+                self, "选择或切换模型", "", "模型文件 (*.pt *.onnx)"
             )
             if not model_path:           # 用户取消
                 return
@@ -3250,6 +3937,13 @@ class MainWindow(QMainWindow):
         try:
             self.status_bar.showMessage("正在检测,请稍候...")
             QApplication.processEvents()  # 更新UI
+            # 同一图像在当前权重下已检测过：直接使用缓存的 top-1，跳过推理
+            result_cache = self.detector.result_cache
+            image_key = result_cache.image_key(self.current_image)
+            cached = result_cache.get(image_key)
+            if cached is not None:
+                self.show_cached_detection(*cached)
+                return
             # 捕获标准输出
             output_buffer = io.StringIO()
             with redirect_stdout(output_buffer):
@@ -3282,30 +3976,50 @@ class MainWindow(QMainWindow):
                 self.current_disease = disease_name
                 self.current_confidence = confidence
                 self.prediction_output = prediction_output
+                top1 = self.detector.top1(current_results)
+                if top1 is not None:
+                    result_cache.put(image_key, *top1)
 
                 # 显示检测结果
                 self.parse_and_show_results(results)
-                # 启用结果按钮
-                self.results_button.setEnabled(True)
-                self.advice_button.setEnabled(True)
-                self.status_bar.showMessage("检测完成")
-                # 保存到历史记录（图像统一存至 medical_images）
-                os.makedirs("medical_images", exist_ok=True)
-                temp_image_path = f"medical_images/temp_image_{datetime.now().strftime('%Y%m%d%H%M%S')}.png"
-                cv2.imwrite(temp_image_path, self.current_image)
-                self.save_to_history(os.path.abspath(temp_image_path), disease_name, confidence)
-
-                # 自动弹出 DeepSeek 报告
-                QTimer.singleShot(300, lambda: self.advice_button.click())
+                self.finish_detection(disease_name, confidence)
             else:
                 self.show_message_box("警告", "模型未能生成检测结果！", QMessageBox.Warning)
         except Exception as e:
             self.show_message_box("错误", f"检测过程中发生错误: {str(e)}", QMessageBox.Critical)
 
+    def show_cached_detection(self, disease_name, confidence):
+        """显示缓存命中的检测结果：缓存只保存 top-1，没有标注图和各类别置信度"""
+        self.current_results = None
+        self.current_disease = disease_name
+        self.current_confidence = confidence
+        self.all_classes_confidence = {}
+        self.display_image(self.current_image, self.detected_image_label)
+        self.show_disease_result(disease_name, confidence)
+        self.finish_detection(disease_name, confidence)
+
+    def finish_detection(self, disease_name, confidence):
+        """单张检测完成后启用按钮、保存历史记录并自动弹出 DeepSeek 报告"""
+        # 启用结果按钮
+        self.results_button.setEnabled(True)
+        self.advice_button.setEnabled(self._advice_thread is None)
+        self.status_bar.showMessage("检测完成")
+        # 保存到历史记录（图像统一存至 medical_images）
+        os.makedirs("medical_images", exist_ok=True)
+        temp_image_path = f"medical_images/temp_image_{datetime.now().strftime('%Y%m%d%H%M%S')}.png"
+        cv2.imwrite(temp_image_path, self.current_image)
+        self.save_to_history(os.path.abspath(temp_image_path), disease_name, confidence)
+
+        # 自动弹出 DeepSeek 报告（上一份建议仍在生成时排队）
+        QTimer.singleShot(300, self.show_ai_advice)
+
     def batch_process(self):
         if not hasattr(self, 'detector') or self.detector.model is None:
             self.show_message_box("错误", "请先加载模型!", QMessageBox.Critical)
             return
+        if getattr(self, 'batch_engine', None) is not None and self.batch_engine.is_running():
+            self.show_message_box("提示", "批量处理正在进行中", QMessageBox.Information)
+            return
 
         file_dialog = QFileDialog()
         file_dialog.setFileMode(QFileDialog.ExistingFiles)
@@ -3341,48 +4055,42 @@ class MainWindow(QMainWindow):
 
         results_summary = []
         disease_counter = {}
+        cache_hits_before = self.detector.result_cache.stats()['hits']
 
-        try:
-            # 使用 YOLO stream 模式，底层 C++ 批处理+Pipeline，极致性能
-            results_generator = self.detector.model.predict(
-                source=image_paths, stream=True, conf=0.5
-            )
-
-            for i, (image_path, current_results) in enumerate(zip(image_paths, results_generator)):
-                if progress_dialog.wasCanceled():
-                    break
-
-                progress_dialog.setValue(i)
-                progress_dialog.setLabelText(f"正在处理 ({i+1}/{len(image_paths)}): {os.path.basename(image_path)}")
-                QApplication.processEvents()
-
-                disease_name = "未知"
-                confidence = 0.0
-
-                try:
-                    # 直接读 API 属性，不走 redirect_stdout + 正则
-                    if hasattr(current_results, 'probs') and current_results.probs is not None:
-                        top_class_idx = int(current_results.probs.top1)
-                        confidence = float(current_results.probs.top1conf)
-                        disease_name = self.detector.class_names.get(top_class_idx, "未知")
-
-                    # 只统计有效疾病
-                    if disease_name != "未知":
-                        disease_counter[disease_name] = disease_counter.get(disease_name, 0) + 1
-
-                    self.save_to_history(image_path, disease_name, confidence)
-                    results_summary.append(f"✅ 图像 {os.path.basename(image_path)}: 检测结果 - {disease_name} (置信度: {confidence:.2f})")
-
-                except Exception as e:
-                    results_summary.append(f"❌ 图像 {os.path.basename(image_path)} 处理出错: {str(e)}")
-
-        except Exception as e:
-            self.show_message_box("错误", f"批量处理失败: {str(e)}", QMessageBox.Critical)
-            return
-
-        progress_dialog.setValue(len(image_paths))
-        self.show_batch_report(disease_counter, results_summary)
-        self.status_bar.showMessage("批量处理完成")
+        def on_batch_finished(results):
+            for result in results:
+                name = os.path.basename(result['path'])
+                if result['error']:
+                    results_summary.append(f"❌ 图像 {name} 处理出错: {result['error']}")
+                    continue
+                disease_name = result['disease_name']
+                # 只统计有效疾病
+                if disease_name != "未知":
+                    disease_counter[disease_name] = disease_counter.get(disease_name, 0) + 1
+                results_summary.append(f"✅ 图像 {name}: 检测结果 - {disease_name} (置信度: {result['confidence']:.2f})")
+
+        def on_progress(done, total, current_name):
+            progress_dialog.setValue(done)
+            progress_dialog.setLabelText(f"正在处理 ({done}/{total}): {current_name}")
+
+        def on_finished(cancelled):
+            progress_dialog.setValue(len(image_paths))
+            self.batch_button.setEnabled(True)
+            self.batch_engine = None
+            self.show_batch_report(disease_counter, results_summary)
+            cache_hits = self.detector.result_cache.stats()['hits'] - cache_hits_before
+            state = "已取消" if cancelled else "完成"
+            self.status_bar.showMessage(f"批量处理{state}（{len(results_summary)} 张，结果缓存命中 {cache_hits} 张）")
+
+        # 后台引擎：解码/推理/入库均不占用界面线程
+        self.batch_engine = BatchDetectionEngine(self.detector, get_history_db())
+        self.batch_engine.batch_finished.connect(on_batch_finished)
+        self.batch_engine.progress.connect(on_progress)
+        self.batch_engine.finished.connect(on_finished)
+        progress_dialog.canceled.connect(self.batch_engine.cancel)
+        self.batch_button.setEnabled(False)
+        self.status_bar.showMessage(f"正在批量处理 {len(image_paths)} 张图像...")
+        self.batch_engine.start(image_paths)
 
     def show_batch_report(self, disease_counter, results_summary):
         dialog = QDialog(self)
@@ -3544,19 +4252,16 @@ class MainWindow(QMainWindow):
             print(f"保存历史记录失败: {e}")
             return False
 
-    def load_history_records(self):
-        """加载历史记录 (SQLite, 首次自动迁移旧 JSON)"""
+    def migrate_history_json(self):
+        """首次使用时自动迁移旧版 JSON 历史记录"""
         try:
             db = get_history_db()
-            # 首次使用自动迁移旧数据
             history_dir = os.path.join(os.path.expanduser("~"), "EyeDiseaseDetectorHistory")
             json_path = os.path.join(history_dir, "history.json")
             if os.path.exists(json_path):
                 db.migrate_from_json(json_path)
-            return db.get_all()
         except Exception as e:
-            print(f"加载历史记录失败: {e}")
-            return []
+            print(f"迁移历史记录失败: {e}")
 
     def show_history(self):
         """显示历史记录对话框"""
@@ -3589,9 +4294,9 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(title_label)
 
         # 创建表格视图
-        self.history_table = QTableWidget()
+        self.history_table = QTableView()
         self.history_table.setStyleSheet(f"""
-            QTableWidget {{
+            QTableView {{
                 background-color: {self.secondary_bg};
                 color: {self.text_color};
                 border: 1px solid #3b4252;
@@ -3599,7 +4304,7 @@ class MainWindow(QMainWindow):
                 gridline-color: #2c323c;
                 outline: none;
             }}
-            QTableWidget::item:focus {{
+            QTableView::item:focus {{
                 outline: none;
             }}
             QHeaderView::section {{
@@ -3612,60 +4317,73 @@ class MainWindow(QMainWindow):
                 font-weight: bold;
                 font-size: 13pt;
             }}
-            QTableWidget::item {{
+            QTableView::item {{
                 padding: 8px;
                 border-bottom: 1px solid #3b4252;
             }}
-            QTableWidget::item:selected {{
+            QTableView::item:selected {{
                 background-color: rgba(0, 181, 216, 0.35);
                 color: white;
             }}
-            QTableWidget::item:selected:!active {{
+            QTableView::item:selected:!active {{
                 background-color: rgba(0, 181, 216, 0.25);
                 color: #E5E9F0;
             }}
-            QTableWidget::item:alternate {{
+            QTableView::item:alternate {{
                 background-color: #262B33;
             }}
-            QTableWidget::item:alternate:selected {{
+            QTableView::item:alternate:selected {{
                 background-color: rgba(0, 181, 216, 0.35);
                 color: white;
             }}
         """)
         # 整行选择样式
         self.history_table.setStyleSheet(self.history_table.styleSheet() + f"""
-            QTableWidget {{
+            QTableView {{
                 selection-background-color: rgba(0, 181, 216, 0.35);
                 selection-color: white;
             }}
         """)
 
-        # 隐藏行号列,设置行高
+        # 隐藏行号列,设置行高（固定行高，避免按内容计算行高时遍历所有已加载行）
         self.history_table.verticalHeader().setVisible(False)
-        self.history_table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)  # 根据字体自动调整行高
-        self.history_table.verticalHeader().setMinimumSectionSize(45)  # 设置最小行高
-
-        # 设置表格列
-        columns = ["时间戳", "图像名称", "检测结果", "置信度", "操作"]
-        self.history_table.setColumnCount(len(columns))
-        self.history_table.setHorizontalHeaderLabels(columns)
+        self.history_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.history_table.verticalHeader().setDefaultSectionSize(45)
+
+        # 分页加载的表格模型，滚动到底部时自动取下一页
+        self.migrate_history_json()
+        self.history_model = HistoryTableModel(get_history_db(), self.accent_color, history_dialog)
+        self.history_table.setModel(self.history_model)
+
+        # 列宽设置
+        header = self.history_table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.Fixed)
+        header.setSectionResizeMode(1, QHeaderView.Stretch)
+        header.setSectionResizeMode(2, QHeaderView.Fixed)
+        header.setSectionResizeMode(3, QHeaderView.Fixed)
+        header.setSectionResizeMode(4, QHeaderView.Fixed)
+        self.history_table.setColumnWidth(0, 180)
+        self.history_table.setColumnWidth(2, 200)
+        self.history_table.setColumnWidth(3, 100)
+        self.history_table.setColumnWidth(4, 120)
 
-        # 加载历史记录并填充表格
+        # 加载第一页
         self._populate_history_table()
 
         main_layout.addWidget(self.history_table)
         
         # 优化表格显示
         self.history_table.setAlternatingRowColors(True)  # 交替行颜色
-        self.history_table.setSelectionBehavior(QTableWidget.SelectRows)  # 整行选择
-        self.history_table.setSelectionMode(QTableWidget.ExtendedSelection)  # 多行选择
+        self.history_table.setSelectionBehavior(QAbstractItemView.SelectRows)  # 整行选择
+        self.history_table.setSelectionMode(QAbstractItemView.ExtendedSelection)  # 多行选择
 
         # 单元格点击 → 查看详情（替代逐个创建 QPushButton）
-        def on_cell_clicked(row, col):
-            if col == 4 and hasattr(self, '_history_records_cache'):
-                if 0 <= row < len(self._history_records_cache):
-                    self.view_history_record(self._history_records_cache[row])
-        self.history_table.cellClicked.connect(on_cell_clicked)
+        def on_cell_clicked(index):
+            if index.column() == 4:
+                record = self.history_model.record(index.row())
+                if record:
+                    self.view_history_record(record)
+        self.history_table.clicked.connect(on_cell_clicked)
 
         # 创建按钮布局
         button_layout = QHBoxLayout()
@@ -3964,7 +4682,7 @@ class MainWindow(QMainWindow):
                 else:
                     # 无缓存 → 调 API 生成
                     raw_advice = self.deepseek_api.get_treatment_advice(
-                        disease_display, record['confidence'])
+                        disease_display, record['confidence'], priority=PRIORITY_BACKGROUND)
                     if raw_advice and raw_advice.strip():
                         formatted_html = self.format_advice_html(raw_advice)
                         get_history_db().update_advice(record['record_id'], raw_advice)
@@ -4062,115 +4780,24 @@ class MainWindow(QMainWindow):
         self.status_bar.showMessage("就绪")
 
     def _populate_history_table(self):
-        """刷新历史记录表格数据（极速渲染 + 进度条弹窗）"""
-        self.status_bar.showMessage("正在加载历史记录...")
-        QApplication.processEvents()
-
-        history = self.load_history_records()
-        total_records = len(history)
-
+        """刷新历史记录表格：只重新加载第一页，其余页在滚动时按需加载"""
+        self.history_model.reload()
+        if self.history_model.canFetchMore():
+            self.history_model.fetchMore()
+        total_records = get_history_db().count_visible()
         if total_records == 0:
-            self.history_table.setRowCount(0)
             self.status_bar.showMessage("暂无历史记录")
-            return
-
-        # 1. 进度条弹窗（仅在数据量较大时显示，避免小数据量时进度条本身成为瓶颈）
-        SHOW_PROGRESS = total_records > 500
-        progress_dialog = None
-        if SHOW_PROGRESS:
-            progress_dialog = QProgressDialog(
-                "正在渲染数据到表格...", "⏹ 取消加载", 0, total_records, self)
-            progress_dialog.setWindowTitle("⏳ 正在加载")
-            progress_dialog.setWindowModality(Qt.WindowModal)
-            progress_dialog.setMinimumWidth(450)
-            progress_dialog.setStyleSheet(f"""
-                QProgressDialog {{ background-color: {self.secondary_bg}; border: 1px solid {self.accent_color}; }}
-                QLabel {{ font-size: 13pt; font-weight: bold; color: #81A1C1; margin-top: 10px; margin-bottom: 15px; }}
-                QProgressBar {{ border: 1px solid #3b4252; border-radius: 8px; background-color: #1a1e24;
-                    text-align: center; color: white; font-weight: bold; font-size: 11pt; height: 24px; }}
-                QProgressBar::chunk {{ background-color: {self.accent_color}; border-radius: 7px; width: 20px; }}
-                QPushButton {{ background-color: transparent; color: #FF5252; border: 1px solid #FF5252;
-                    padding: 6px 20px; border-radius: 6px; font-weight: bold; margin-top: 10px; }}
-                QPushButton:hover {{ background-color: rgba(255, 82, 82, 0.15); }}
-            """)
-            progress_dialog.setWindowFlags(
-                progress_dialog.windowFlags() & ~Qt.WindowContextHelpButtonHint & ~Qt.WindowCloseButtonHint)
-            progress_dialog.setAutoClose(True)
-            progress_dialog.setAutoReset(True)
-            progress_dialog.show()
-
-        # 2. 暂停表格重绘（核心性能优化）
-        self.history_table.setUpdatesEnabled(False)
-        self.history_table.setRowCount(total_records)
-        self.history_table.clearSelection()
-
-        self._history_records_cache = list(reversed(history))
-
-        # 3. 批量构建数据
-        for row, record in enumerate(self._history_records_cache):
-            if progress_dialog and progress_dialog.wasCanceled():
-                self.history_table.setRowCount(row)
-                self.status_bar.showMessage(f"已取消加载，当前显示部分数据 ({row}/{total_records})")
-                break
-
-            timestamp_item = QTableWidgetItem(record["timestamp"])
-            path_item = QTableWidgetItem(os.path.basename(record["image_path"]))
-
-            disease_name_display = record["disease_name"]
-            if disease_name_display.startswith("[演示]"):
-                disease_name_display = disease_name_display[4:]
-
-            disease_item = QTableWidgetItem(disease_name_display)
-            confidence_item = QTableWidgetItem(f"{record['confidence']:.2f}")
-            timestamp_item.setData(Qt.UserRole, record["record_id"])
-
-            for item in [timestamp_item, path_item, disease_item, confidence_item]:
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-
-            view_item = QTableWidgetItem("查看详情")
-            view_item.setTextAlignment(Qt.AlignCenter)
-            view_item.setForeground(QBrush(QColor("white")))
-            view_item.setBackground(QBrush(QColor(self.accent_color)))
-            view_item.setFlags(view_item.flags() & ~Qt.ItemIsEditable)
-
-            self.history_table.setItem(row, 0, timestamp_item)
-            self.history_table.setItem(row, 1, path_item)
-            self.history_table.setItem(row, 2, disease_item)
-            self.history_table.setItem(row, 3, confidence_item)
-            self.history_table.setItem(row, 4, view_item)
-
-            # 大数据量时才刷新进度条（每 200 条一次，减少 UI 开销）
-            if progress_dialog and (row % 200 == 0 or row == total_records - 1):
-                progress_dialog.setValue(row + 1)
-                progress_dialog.setLabelText(f"正在极速渲染数据... ({row + 1} / {total_records})")
-                QApplication.processEvents()
-
-        # 4. 列宽设置
-        self.history_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Fixed)
-        self.history_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
-        self.history_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Fixed)
-        self.history_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.Fixed)
-        self.history_table.horizontalHeader().setSectionResizeMode(4, QHeaderView.Fixed)
-        self.history_table.setColumnWidth(0, 180)
-        self.history_table.setColumnWidth(2, 200)
-        self.history_table.setColumnWidth(3, 100)
-        self.history_table.setColumnWidth(4, 120)
-
-        # 5. 恢复表格重绘
-        self.history_table.setUpdatesEnabled(True)
-
-        if not (progress_dialog and progress_dialog.wasCanceled()):
+        else:
             self.status_bar.showMessage(f"历史记录加载完成（共 {total_records} 条）")
 
     def delete_selected_history(self):
         """删除选中的历史记录 (SQLite)"""
         # 直接从表格行中取出 record_id，避免索引映射错误
         record_ids_to_delete = set()
-        for item in self.history_table.selectedItems():
-            if item.column() == 0:  # 只处理第一列（时间戳列，存了 record_id）
-                rid = item.data(Qt.UserRole)
-                if rid:
-                    record_ids_to_delete.add(rid)
+        for index in self.history_table.selectionModel().selectedRows(0):
+            rid = index.data(Qt.UserRole)
+            if rid:
+                record_ids_to_delete.add(rid)
 
         if not record_ids_to_delete:
             self.show_message_box("提示", "请先选择要删除的记录！")
@@ -4184,13 +4811,8 @@ class MainWindow(QMainWindow):
         if reply == QMessageBox.Yes:
             try:
                 db = get_history_db()
-                deleted_count = 0
-                for record_id in record_ids_to_delete:
-                    try:
-                        db.delete_by_record_id(record_id)
-                        deleted_count += 1
-                    except Exception as e:
-                        print(f"[ERROR] 删除记录失败 (id={record_id}): {e}")
+                db.delete_many(record_ids_to_delete)
+                deleted_count = len(record_ids_to_delete)
                 self._populate_history_table()
                 self.show_message_box("成功", f"已成功删除 {deleted_count} 条记录！")
             except Exception as e:
@@ -4224,12 +4846,10 @@ class MainWindow(QMainWindow):
         weights = [50, 20, 15, 5, 4, 3, 3, 2]
 
         base_date = datetime.now() - timedelta(days=30)
-        # 清除旧的演示数据（直接用 SQL，避开 get_all 的 LIMIT 500 限制）
-        with sqlite3.connect(db.db_path) as conn:
-            conn.execute("DELETE FROM records WHERE disease_name LIKE '[演示]%'")
-            conn.commit()
+        # 清除旧的演示数据
+        db.delete_by_type(HistoryDB.TYPE_DEMO)
 
-        records_added = 0
+        rows = []
         for day_offset in range(30):
             date = base_date + timedelta(days=day_offset)
             # 每天 15-30 条记录，周末少一些
@@ -4238,22 +4858,27 @@ class MainWindow(QMainWindow):
                 disease = random.choices(diseases, weights=weights, k=1)[0]
                 confidence = round(random.uniform(0.82, 0.99), 4)
                 timestamp = date.strftime("%Y-%m-%d") + f" {random.randint(8,18):02d}:{random.randint(0,59):02d}:{random.randint(0,59):02d}"
-                db.add(
-                    record_id=str(uuid.uuid4()),
-                    timestamp=timestamp,
-                    image_path=f"demo/eye_scan_{day_offset}_{records_added}.jpg",
-                    disease_name=f"[演示]{disease}",
-                    confidence=confidence
-                )
-                records_added += 1
+                rows.append((
+                    str(uuid.uuid4()),
+                    timestamp,
+                    f"demo/eye_scan_{day_offset}_{len(rows)}.jpg",
+                    f"[演示]{disease}",
+                    confidence
+                ))
 
-        return records_added
+        db.add_many(rows)
+        return len(rows)
 
     def show_trend_analysis(self):
         """显示病情趋势分析"""
-        # 加载历史记录
-        history = self.load_history_records()
-        if not history:
+        # 在数据库中按日期和疾病聚合，不再逐条加载记录
+        self.migrate_history_json()
+        try:
+            daily_counts = get_history_db().daily_disease_counts()
+        except Exception as e:
+            print(f"加载历史记录失败: {e}")
+            daily_counts = []
+        if not daily_counts:
             self.show_message_box("提示", "暂无历史记录,无法分析趋势。")
             return
 
@@ -4262,10 +4887,9 @@ class MainWindow(QMainWindow):
         disease_count = {}
         date_disease = {}  # 按日期和疾病分类
 
-        for rec in history:
+        for date, disease, count in daily_counts:
             try:
-                date = datetime.strptime(rec['timestamp'], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-                disease = rec['disease_name']
+                date = datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d")
 
                 # 去掉演示标记前缀
                 if disease.startswith('[演示]'):
@@ -4275,15 +4899,15 @@ class MainWindow(QMainWindow):
                     continue
 
                 # 统计每日总数
-                date_count[date] = date_count.get(date, 0) + 1
+                date_count[date] = date_count.get(date, 0) + count
 
                 # 统计疾病总数
-                disease_count[disease] = disease_count.get(disease, 0) + 1
+                disease_count[disease] = disease_count.get(disease, 0) + count
 
                 # 统计每日各疾病数量
                 if date not in date_disease:
                     date_disease[date] = {}
-                date_disease[date][disease] = date_disease[date].get(disease, 0) + 1
+                date_disease[date][disease] = date_disease[date].get(disease, 0) + count
 
             except Exception as e:
                 print(f"解析历史记录错误: {e}")
@@ -4834,6 +5458,9 @@ class MainWindow(QMainWindow):
         """显示检测结果"""
         if hasattr(self, 'current_results') and self.current_results:
             self.parse_and_show_results(self.current_results)
+        elif getattr(self, 'current_disease', None) and self.results_button.isEnabled():
+            # 缓存命中的检测只有 top-1 结果
+            self.show_disease_result(self.current_disease, self.current_confidence)
         else:
             self.show_message_box("提示", "请先完成检测")
 
@@ -4896,10 +5523,14 @@ class MainWindow(QMainWindow):
             self.status_bar.showMessage("已禁用DeepSeek API,将使用默认建议")
 
     def show_ai_advice(self):
-        """获取并显示AI治疗建议"""
+        """获取并显示AI治疗建议：请求在后台线程中流式执行，经 AIResponseEvent 刷新界面"""
         if not self.current_disease:
             self.show_message_box("提示", "请先完成检测")
             return
+        if self._advice_thread is not None:
+            # 上一份建议仍在生成（自动弹出与点击重入）：结束后按最新检测结果再生成一次
+            self._advice_pending = True
+            return
         
         # 显示加载状态
         self.advice_text.setHtml(f"""
@@ -4936,32 +5567,68 @@ class MainWindow(QMainWindow):
         
         # 更新状态栏
         self.status_bar.showMessage("正在生成AI治疗建议,请稍候...")
-        QApplication.processEvents()
 
         try:
             # 确保DeepSeek API已初始化
             if self.deepseek_api is None:
                 self.deepseek_api = DeepSeekAPI()
-            
-            # 检查是否启用API并且有有效密钥
-            if (self.use_api_checkbox.isChecked() and 
-                hasattr(self.deepseek_api, 'api_key') and 
-                self.deepseek_api.api_key):
-                # 使用API获取建议
-                advice = self.deepseek_api.get_treatment_advice(self.current_disease, self.current_confidence)
-                self.status_bar.showMessage("AI治疗建议生成完成")
+        except Exception as e:
+            self.status_bar.showMessage(f"获取AI建议失败: {str(e)}")
+            self.advice_text.setHtml(self.format_advice_html(self._advice_unavailable_text(self.current_disease)))
+            return
+
+        # 检查是否启用API并且有有效密钥
+        use_api = (self.use_api_checkbox.isChecked() and
+                   hasattr(self.deepseek_api, 'api_key') and
+                   bool(self.deepseek_api.api_key))
+        self.advice_button.setEnabled(False)
+        self._advice_thread = threading.Thread(
+            target=self.process_advice_response,
+            args=(self.current_disease, self.current_confidence, use_api), daemon=True)
+        self._advice_thread.start()
+
+    def process_advice_response(self, disease, confidence, use_api):
+        """在后台生成治疗建议：边生成边发送 advice_partial，结束时发送 advice_completed (建议, 状态栏文字)"""
+        try:
+            if use_api:
+                advice = ""
+                last_update = 0.0
+                for delta in self.deepseek_api.stream_treatment_advice(disease, confidence):
+                    advice += delta
+                    if time.time() - last_update >= AI_STREAM_REFRESH_INTERVAL:
+                        last_update = time.time()
+                        QApplication.postEvent(self, AIResponseEvent("advice_partial", advice))
+                cache_stats = get_advice_cache().stats()
+                status = (f"AI治疗建议生成完成 | 建议缓存命中率 {cache_stats['hit_rate']:.0%} "
+                          f"({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})")
             else:
                 # 使用默认建议
-                advice = self.deepseek_api._get_default_advice(self.current_disease)
-                self.status_bar.showMessage("使用默认治疗建议")
-            
-            # 直接在主界面显示建议
-            self.advice_text.setHtml(self.format_advice_html(advice))
-            
+                advice = self.deepseek_api._get_default_advice(disease)
+                status = "使用默认治疗建议"
         except Exception as e:
-            self.status_bar.showMessage(f"获取AI建议失败: {str(e)}")
-            # 设置默认建议文本
-            default_advice = f"""# {self.current_disease} - AI治疗建议
+            advice = self._advice_unavailable_text(disease)
+            status = f"获取AI建议失败: {str(e)}"
+        QApplication.postEvent(self, AIResponseEvent("advice_completed", (advice, status)))
+
+    def handle_advice_event(self, event):
+        """处理治疗建议的流式刷新与完成事件"""
+        if event.event_type == "advice_partial":
+            self.advice_text.setHtml(self.format_advice_html(event.data))
+            return
+
+        advice, status = event.data
+        # 直接在主界面显示建议
+        self.advice_text.setHtml(self.format_advice_html(advice))
+        self.status_bar.showMessage(status)
+        self._advice_thread = None
+        self.advice_button.setEnabled(True)
+        if self._advice_pending:
+            self._advice_pending = False
+            self.show_ai_advice()
+
+    def _advice_unavailable_text(self, disease):
+        """无法获取AI建议时显示的默认建议"""
+        return f"""# {disease} - AI治疗建议
 
 无法连接到AI服务,请检查您的API密钥或网络连接。
 
@@ -4980,9 +5647,6 @@ class MainWindow(QMainWindow):
 - 眼红持续不退
 - 闪光或飞蚊症
 """
-            
-            # 显示错误信息
-            self.advice_text.setHtml(self.format_advice_html(default_advice))
 
     def show_fullscreen_advice(self):
         """全屏显示DeepSeek AI诊疗建议"""
@@ -5399,32 +6063,21 @@ class MainWindow(QMainWindow):
                 current_duration = self.duration_slider.value() if hasattr(self, 'duration_slider') else 10
                 recognition_duration = self.voice_manager.recognition_duration if self.voice_manager else current_duration
                 print(f"[DEBUG] 🕒 备用识别器使用时长: {recognition_duration}秒")
-                audio = self.recognizer.listen(source, timeout=30, phrase_time_limit=recognition_duration)
+                if self.voice_manager:
+                    # 与主识别器共用 Vosk 流式会话
+                    text, audio = self.voice_manager.stream_microphone(source, recognition_duration, timeout=30)
+                else:
+                    text = None
+                    audio = self.recognizer.listen(source, timeout=30, phrase_time_limit=recognition_duration)
                 print(f"[DEBUG] ✅ 录音完成,音频长度: {len(audio.frame_data)} bytes")
                 
             # 发送处理中状态
             QApplication.postEvent(self, VoiceRecognitionEvent("completed", "__PROCESSING__"))
             
-            text = None
             recognition_method = ""
-
-            # 优先策略：本地Vosk识别（如果可用）
-            if hasattr(self, 'voice_manager') and hasattr(self.voice_manager, 'vosk_model') and self.voice_manager.vosk_model:
-                try:
-                    print("[DEBUG] 🏠 使用本地Vosk中文识别...")
-                    from vosk import KaldiRecognizer
-                    rec = KaldiRecognizer(self.voice_manager.vosk_model, audio.sample_rate or 16000)
-                    frame = audio.frame_data
-                    chunk_size = 4000
-                    for i in range(0, len(frame), chunk_size):
-                        rec.AcceptWaveform(frame[i:i+chunk_size])
-                    result_json = rec.FinalResult()
-                    result_obj = self.voice_manager._vosk_json.loads(result_json)
-                    text = (result_obj.get("text") or "").strip()
-                    recognition_method = "Vosk 本地识别"
-                    print(f"[DEBUG] ✅ Vosk识别结果: '{text}'")
-                except Exception as e:
-                    print(f"[DEBUG] ❌ Vosk识别失败: {e}")
+            if text:
+                recognition_method = "Vosk 流式识别"
+                print(f"[DEBUG] ✅ Vosk识别结果: '{text}'")
 
             # 备用策略：Google API（优化参数）
             if not text or len(text) < 2:
@@ -5684,7 +6337,6 @@ class MainWindow(QMainWindow):
                     pass
             if not api_key:
                 QApplication.postEvent(self, AIResponseEvent("progress", "生成默认建议...", 60))
-                time.sleep(0.3)
                 response = """# 🩺 AI医疗咨询建议
 
 ## 💡 一般建议
@@ -5707,28 +6359,26 @@ class MainWindow(QMainWindow):
 
 *💊 健康提示: 早发现、早治疗是眼部疾病防治的关键*"""
                 QApplication.postEvent(self, AIResponseEvent("progress", "完成", 100))
-                time.sleep(0.2)
                 QApplication.postEvent(self, AIResponseEvent("completed", response))
                 return
 
             QApplication.postEvent(self, AIResponseEvent("progress", "正在请求 AI 分析...", 50))
             ai_service = MedicalAIService(api_key)
-            # 请求详细回复
-            response = ai_service.get_custom_advice(message)
-
-            # 同时让 AI 生成一个100字左右的简短摘要用于语音播报
-            tts_summary = response  # 兜底
-            try:
-                summary_prompt = f"请用100字以内简短总结以下医疗建议的核心要点，不要扩展：" + message
-                tts_summary = ai_service.get_custom_advice(summary_prompt)
-                if not tts_summary or len(tts_summary) > 200:
-                    tts_summary = response
-            except Exception:
-                pass
+            # 一次流式请求同时得到语音摘要（首行）与详细回答：摘要一到即开始播报，详细回答边生成边显示
+            reply = SummaryFirstReply()
+            last_update = 0.0
+            for delta in ai_service.stream_custom_advice(message, spoken_summary=True):
+                summary = reply.feed(delta)
+                if summary:
+                    QApplication.postEvent(self, AIResponseEvent("summary", tts=summary))
+                if reply.body and time.time() - last_update >= AI_STREAM_REFRESH_INTERVAL:
+                    last_update = time.time()
+                    QApplication.postEvent(self, AIResponseEvent("partial", reply.body))
+            tts_summary = reply.finish()   # 未按格式输出时为 None，由界面从回复中提取
+            response = reply.body
 
             if not response or "请先设置有效的API密钥" in response:
                 QApplication.postEvent(self, AIResponseEvent("progress", "生成默认建议...", 85))
-                time.sleep(0.2)
                 response = """# 🩺 AI医疗咨询建议
 
 ## 💡 一般建议
@@ -5742,11 +6392,8 @@ class MainWindow(QMainWindow):
 
 ---
 💡 **提示：** 可以在DeepSeek官网查看密钥状态和余额"""
-            QApplication.postEvent(self, AIResponseEvent("progress", "正在组织回复...", 85))
-            time.sleep(0.3)
 
             QApplication.postEvent(self, AIResponseEvent("progress", "完成", 100))
-            time.sleep(0.2)
             QApplication.postEvent(self, AIResponseEvent("completed", response, tts=tts_summary))
 
         except Exception as e:
@@ -5759,6 +6406,8 @@ class MainWindow(QMainWindow):
         elif isinstance(event, AIResponseEvent):
             if event.event_type == "tts_ready":
                 self._play_next_tts()
+            elif event.event_type.startswith("advice_"):
+                self.handle_advice_event(event)
             else:
                 self.handle_ai_response_event(event)
         else:
@@ -5920,11 +6569,51 @@ class MainWindow(QMainWindow):
             }
         """)
 
+    def _ai_reply_block(self, ai_msg, title):
+        """对话框中的一条 AI 回复块"""
+        return f"""
+            <div style='margin-bottom: 20px; padding: 12px; background-color: #1E222A; border-radius: 8px; border-left: 3px solid #00B5D8;'>
+                <div style='color: #00B5D8; font-weight: bold; margin-bottom: 6px;'>🩺 {title}:</div>
+                <div style='color: #E5E9F0; padding-left: 10px; line-height: 1.6;'>
+                    {self.format_advice_html(ai_msg)}
+                </div>
+            </div>
+            """
+
+    def _chat_html_without_placeholder(self):
+        """当前对话内容，去掉 thinking 占位块"""
+        current_html = self.chat_display.toHtml()
+        marker = 'AI 正在回复...'
+        if marker in current_html:
+            idx = current_html.find(marker)
+            if idx > 0:
+                start = current_html.rfind("<div style='margin-bottom:", 0, idx)
+                if start >= 0 and start < idx:
+                    end1 = current_html.find("</div>", idx)
+                    if end1 >= 0:
+                        end2 = current_html.find("</div>", end1 + 6)
+                        if end2 >= 0:
+                            return current_html[:start] + current_html[end2 + 6:]
+        return current_html
+
     def handle_ai_response_event(self, event):
         """处理AI回复事件——一问一答追加模式"""
         if event.event_type == "progress":
             self.update_ai_progress(event.progress, event.data)
 
+        elif event.event_type == "summary":
+            # 语音摘要先于详细回答生成完毕，立即开始播报
+            if self.voice_chat_enabled.isChecked():
+                self.speak_text(event.tts)
+                self._chat_summary_spoken = True
+
+        elif event.event_type == "partial":
+            # 流式回复：用已生成的内容替换“正在回复”占位块
+            if self._chat_stream_base is None:
+                self._chat_stream_base = self._chat_html_without_placeholder()
+            block = self._ai_reply_block(event.data, "AI 回复中")
+            self.chat_display.setHtml(self._chat_stream_base.replace("</body>", block + "</body>"))
+
         elif event.event_type == "completed":
             self.show_ai_progress(False)
 
@@ -5939,29 +6628,12 @@ class MainWindow(QMainWindow):
                 self.chat_history = self.chat_history[-50:]
 
             # 构建 AI 回复块
-            ai_block = f"""
-            <div style='margin-bottom: 20px; padding: 12px; background-color: #1E222A; border-radius: 8px; border-left: 3px solid #00B5D8;'>
-                <div style='color: #00B5D8; font-weight: bold; margin-bottom: 6px;'>🩺 AI 回复 ({self.chat_history[-1]['timestamp']}):</div>
-                <div style='color: #E5E9F0; padding-left: 10px; line-height: 1.6;'>
-                    {self.format_advice_html(ai_msg)}
-                </div>
-            </div>
-            """
+            ai_block = self._ai_reply_block(ai_msg, f"AI 回复 ({self.chat_history[-1]['timestamp']})")
 
-            current_html = self.chat_display.toHtml()
-            # 移除之前追加的 thinking 占位块
-            marker = 'AI 正在回复...'
-            clean = current_html
-            if marker in current_html:
-                idx = current_html.find(marker)
-                if idx > 0:
-                    start = current_html.rfind("<div style='margin-bottom:", 0, idx)
-                    if start >= 0 and start < idx:
-                        end1 = current_html.find("</div>", idx)
-                        if end1 >= 0:
-                            end2 = current_html.find("</div>", end1 + 6)
-                            if end2 >= 0:
-                                clean = current_html[:start] + current_html[end2 + 6:]
+            # 移除 thinking 占位块或流式显示中的回复块
+            clean = self._chat_stream_base if self._chat_stream_base is not None \
+                else self._chat_html_without_placeholder()
+            self._chat_stream_base = None
 
             if len(clean) < 500:
                 wrapper = f"<html><body style='color:{self.text_color}; background:{self.primary_color}; font-family:Microsoft YaHei;'>{ai_block}</body></html>"
@@ -5973,14 +6645,18 @@ class MainWindow(QMainWindow):
             self.status_bar.showMessage("对话完成")
 
             if self.voice_chat_enabled.isChecked():
-                # AI 生成的简短摘要优先，否则用本地截取
-                tts_text = event.tts if event.tts else self._summarize_for_tts(ai_msg)
-                self.speak_text(tts_text)
+                if not self._chat_summary_spoken:
+                    # AI 生成的简短摘要优先，否则用本地截取
+                    tts_text = event.tts if event.tts else self._summarize_for_tts(ai_msg)
+                    self.speak_text(tts_text)
             else:
                 # 用户取消勾选 → 停止正在播放的 TTS
                 self.stop_speaking()
+            self._chat_summary_spoken = False
 
         elif event.event_type == "error":
+            self._chat_stream_base = None
+            self._chat_summary_spoken = False
             self.show_ai_progress(False)
             self.status_bar.showMessage("AI回复失败")
             self.show_message_box("错误", f"AI回复失败：{event.data}", QMessageBox.Critical)
@@ -6100,13 +6776,13 @@ class MainWindow(QMainWindow):
             # 执行AI诊断
             if hasattr(self, 'detector') and self.detector:
                 try:
-                    # 进行预测
-                    results = self.detector.predict(image)
+                    # 进行预测（开发板重发同一帧时命中结果缓存）
+                    top1 = self.detector.classify(image)
                     
                     # 解析结果
-                    if results:
+                    if top1:
                         # 获取疾病名称和置信度
-                        disease_name, confidence = self.parse_detection_results(results)
+                        disease_name, confidence = top1
                         
                         # 生成建议
                         advice = self.generate_medical_advice(disease_name, confidence)
@@ -6575,7 +7251,7 @@ class MainWindow(QMainWindow):
                 def process_ai_response():
                     try:
                         # 获取AI回复
-                        ai_response = self.deepseek_api.get_custom_advice(text)
+                        ai_response = self.deepseek_api.get_custom_advice(text, priority=PRIORITY_VOICE)
                         
                         # 发送AI回复到开发板
                         self.send_ai_response_to_board(ai_response, addr)